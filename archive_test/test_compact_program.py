@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+from Desim import SimSession
+
+from nandmachine.commands.macro import (
+    AllReduceOp,
+    KVCacheAppend,
+    MatMulOp,
+    SramPrefetch,
+    SramPrefetchRelease,
+    VectorOp,
+)
+from nandmachine.simulator.hardware.program import CompactProgram, OpKind
+from nandmachine.simulator.hardware.repeat import find_repeated_triple_runs
+from nandmachine.simulator.hardware.vallina_xpu import VallinaXPU
+from nandmachine.simulator.hardware.xpu import xPU
+from test_hw_pipeline_flow import make_config, make_hbm_bandwidth_bytes_per_sec
+
+
+def _matmul_triple(n: int = 8):
+    prefetch = SramPrefetch(num_prefetch_pages=4)
+    matmul = MatMulOp(dim=(2, 16, n), weight_bits=16).with_inputs(prefetch)
+    return [prefetch, matmul, SramPrefetchRelease().with_inputs(matmul)]
+
+
+def _build_layer():
+    vector_norm = VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+    triples = [op for n in (8, 8, 8, 8, 8, 16) for op in _matmul_triple(n)]
+    all_reduce = AllReduceOp(num_ranks=2, data_size=64, weight_bits=16).with_inputs(triples[-2])
+    return [vector_norm, *triples, all_reduce]
+
+
+def test_from_macro_ops_stores_kinds_shapes_and_csr_dependencies():
+    command_list = _build_layer()
+    program = CompactProgram.from_macro_ops(command_list)
+
+    assert len(program) == 20
+    assert program.kinds[:4].tolist() == [
+        OpKind.COMPUTE,
+        OpKind.PREFETCH,
+        OpKind.COMPUTE,
+        OpKind.RELEASE,
+    ]
+    assert program.kinds[-1] == OpKind.TRANSFER
+    assert program.op_ids.tolist() == [command.id for command in command_list]
+    # vector、prefetch、两种 matmul、release、all reduce
+    assert len(program.shapes) == 6
+    assert program.shape_ids[2] == program.shape_ids[14]
+    assert program.shape_ids[2] != program.shape_ids[17]
+    assert program.input_positions(0).tolist() == []
+    assert program.input_positions(2).tolist() == [1]
+    assert program.input_positions(19).tolist() == [17]
+    assert program.payloads == command_list
+
+
+def test_from_macro_ops_validates_the_program():
+    prefetch, matmul, release = _matmul_triple()
+    with pytest.raises(ValueError):
+        CompactProgram.from_macro_ops([prefetch, matmul, matmul])
+    with pytest.raises(KeyError):
+        CompactProgram.from_macro_ops([matmul, release])
+    with pytest.raises(NotImplementedError):
+        CompactProgram.from_macro_ops(
+            [prefetch, matmul, release, VectorOp("silu_mul", [2, 8], 16).with_inputs(release)]
+        )
+
+
+def test_tile_shares_payloads_and_offsets_dependencies():
+    command_list = _build_layer()
+    program = CompactProgram.from_macro_ops(command_list)
+    tiled = program.tile(3)
+
+    assert len(tiled) == 60
+    assert tiled.op_ids[:20].tolist() == program.op_ids.tolist()
+    assert len(set(tiled.op_ids.tolist())) == 60
+    assert tiled.payloads[40] is command_list[0]
+    assert tiled.shapes is program.shapes
+    assert tiled.input_positions(42).tolist() == [41]
+    assert tiled.input_positions(59).tolist() == [57]
+    # 后续层开头的 vector op 依赖上一层最后的 matmul，prefetch 仍然没有输入
+    assert tiled.input_positions(0).tolist() == []
+    assert tiled.input_positions(20).tolist() == [17]
+    assert tiled.input_positions(40).tolist() == [37]
+    assert tiled.input_positions(41).tolist() == []
+    assert np.array_equal(tiled.kinds[20:40], program.kinds)
+    with pytest.raises(ValueError):
+        program.tile(0)
+
+
+def test_program_triple_runs_match_the_macro_op_list():
+    vector_norm = VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+    first_run = [op for _ in range(5) for op in _matmul_triple()]
+    vector_act = VectorOp(
+        vector_op_type="silu_mul", vector_shape=[2, 8], weight_bits=16
+    ).with_inputs(first_run[3 * 3 + 1])
+    second_run = [op for _ in range(4) for op in _matmul_triple()]
+    short_run = [op for _ in range(3) for op in _matmul_triple(n=4)]
+    command_list = [vector_norm, *first_run, *second_run, *short_run, vector_act]
+    program = CompactProgram.from_macro_ops(command_list)
+
+    for min_repeat_count in (1, 3, 4):
+        assert program.find_repeated_triple_runs(min_repeat_count) == (
+            find_repeated_triple_runs(command_list, min_repeat_count)
+        )
+    assert program.tile(2).find_repeated_triple_runs(3)[-1].start_index == 28 + len(command_list)
+
+
+def test_load_program_matches_load_command_of_cloned_layers():
+    SimSession.reset()
+    SimSession.init()
+
+    layer = _build_layer()
+    program = CompactProgram.from_macro_ops(layer).tile(2)
+    sim_xpu = xPU(make_config(), hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec())
+    sim_xpu.load_program(program)
+
+    # 每层 5 次相同的迭代合并成 3 个 slot；两层之间的 triple 形状不同，不会跨层合并
+    assert sim_xpu.collapsed_iteration_count == 4
+    assert [slot.repeat_count for slot in sim_xpu.compute_engine.command_queue] == [
+        1, 1, 1, 3, 1, 1, 1, 1, 3, 1
+    ]
+    assert len(sim_xpu.command_slots) == 2 * (20 - 6)
+    second_layer_all_reduce = sim_xpu.transfer_engine.transfer_command_queue[1]
+    assert second_layer_all_reduce.payload is layer[-1]
+    assert second_layer_all_reduce.input_slots == [sim_xpu.compute_engine.command_queue[-1]]
+    assert sim_xpu.command_slots[int(program.op_ids[-1])] is second_layer_all_reduce
+    SimSession.reset()
+
+
+def test_slots_finished_at_load_do_not_create_events():
+    SimSession.reset()
+    SimSession.init()
+
+    command_list = _matmul_triple()
+    command_list.append(KVCacheAppend(2).with_inputs(command_list[1]))
+    sim_xpu = VallinaXPU(make_config(), hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec())
+    sim_xpu.load_command(command_list)
+
+    release_slot = sim_xpu.command_slots[command_list[2].id]
+    kv_append_slot = sim_xpu.command_slots[command_list[3].id]
+    assert release_slot.is_finished and kv_append_slot.is_finished
+    assert release_slot._finish_event is None
+    assert kv_append_slot._finish_event is None
+    SimSession.reset()
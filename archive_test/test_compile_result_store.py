@@ -0,0 +1,167 @@
+import multiprocessing
+
+import pytest
+
+import nandmachine.simulator.software.compile_result_store as store_module
+from nandmachine.config.config import NandConfig
+from nandmachine.config.hardware_config import A100_80GB_FP16, H100_SXM_FP16
+from nandmachine.simulator.software.compile_result_store import (
+    COMPILE_RESULT_STORE_DIR_ENV_VAR,
+    CompileResultStore,
+    build_compile_result_key,
+    get_compile_result_store,
+    set_compile_result_store,
+)
+from nandmachine.simulator.software.matmul import (
+    MatMul_Simulation,
+    _build_bandwidth_config_key_or_raise,
+)
+
+
+def make_nand_config() -> NandConfig:
+    return NandConfig(
+        num_channels=1,
+        num_plane=2,
+        num_block=8,
+        num_pages=32,
+        tRead=4.0,
+        tWrite=8.0,
+        tErase=16.0,
+        page_size=16,
+        sram_threshold=64,
+    )
+
+
+@pytest.fixture(autouse=True)
+def isolated_store(monkeypatch):
+    monkeypatch.setattr(store_module, "_store", None)
+    monkeypatch.setattr(store_module, "_store_is_explicit", False)
+    monkeypatch.delenv(COMPILE_RESULT_STORE_DIR_ENV_VAR, raising=False)
+    MatMul_Simulation.clear_caches()
+    yield
+    MatMul_Simulation.clear_caches()
+
+
+def _build_key(**overrides) -> str:
+    fields = {
+        "shape": (4, 8, 16),
+        "weight_bits": 16,
+        "matmul_type": None,
+        "pcb_module": A100_80GB_FP16,
+        "bandwidth_config_key": _build_bandwidth_config_key_or_raise(
+            make_nand_config(), A100_80GB_FP16.io_module.bandwidth
+        ),
+        "compile_mode": "heuristic-GPU",
+        "lut_policy": "exact",
+    }
+    fields.update(overrides)
+    return build_compile_result_key("matmul", **fields)
+
+
+def test_compile_result_key_depends_on_every_field(monkeypatch):
+    base_key = _build_key()
+
+    assert base_key == _build_key()
+    assert base_key != _build_key(shape=(4, 8, 32))
+    assert base_key != _build_key(weight_bits=8)
+    assert base_key != _build_key(matmul_type="QK")
+    assert base_key != _build_key(pcb_module=H100_SXM_FP16)
+    assert base_key != _build_key(compile_mode="exhaustive")
+    assert base_key != _build_key(lut_policy="surrogate")
+    assert base_key != _build_key(
+        bandwidth_config_key=_build_bandwidth_config_key_or_raise(
+            make_nand_config(), A100_80GB_FP16.io_module.bandwidth / 2
+        )
+    )
+
+    monkeypatch.setattr(store_module, "COST_MODEL_VERSION", 2)
+    assert base_key != _build_key()
+
+
+def test_compile_result_store_round_trip(tmp_path):
+    store = CompileResultStore(tmp_path)
+    result = MatMul_Simulation.CompileResult(
+        best_mapping=None, best_cycle_count=7, best_time_ns=5
+    )
+
+    assert store.get("ab" * 32) is None
+    store.put("ab" * 32, result)
+
+    assert store.get("ab" * 32) == result
+    assert CompileResultStore(tmp_path).get("ab" * 32) == result
+    assert CompileResultStore(tmp_path, version=2).get("ab" * 32) is None
+    assert store.stats() == {"hits": 1, "misses": 1, "writes": 1}
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+def test_compile_result_store_treats_corrupt_entry_as_miss(tmp_path):
+    store = CompileResultStore(tmp_path)
+    entry_path = store._entry_path("cd" * 32)
+    entry_path.parent.mkdir(parents=True)
+    entry_path.write_bytes(b"")
+
+    assert store.get("cd" * 32) is None
+
+
+def test_store_is_configured_from_env(tmp_path, monkeypatch):
+    assert get_compile_result_store() is None
+
+    monkeypatch.setenv(COMPILE_RESULT_STORE_DIR_ENV_VAR, str(tmp_path))
+    store = get_compile_result_store()
+
+    assert store is not None
+    assert store.root_dir == tmp_path
+    assert get_compile_result_store() is store
+
+    set_compile_result_store(None)
+    assert get_compile_result_store() is None
+
+
+def test_matmul_compile_result_survives_in_process_cache_clear(tmp_path, monkeypatch):
+    set_compile_result_store(tmp_path)
+    compile_kwargs = {
+        "pcb_module": A100_80GB_FP16,
+        "nand_config": make_nand_config(),
+        "hbm_bandwidth_bytes_per_sec": A100_80GB_FP16.io_module.bandwidth,
+        "compile_mode": "heuristic-GPU",
+    }
+    first_cycles = MatMul_Simulation.get_instance(
+        dim=(9, 1, 11), weight_bits=16
+    ).compile_and_simulate(**compile_kwargs)
+
+    MatMul_Simulation.clear_caches()
+
+    def fail_build(*args, **kwargs):
+        raise AssertionError("compile result should come from the disk store")
+
+    monkeypatch.setattr(MatMul_Simulation, "_build_compile_result", fail_build)
+    second_cycles = MatMul_Simulation.get_instance(
+        dim=(9, 1, 11), weight_bits=16
+    ).compile_and_simulate(**compile_kwargs)
+
+    assert second_cycles == first_cycles
+
+
+def _put_entries(root_dir: str, worker_index: int) -> None:
+    store = CompileResultStore(root_dir)
+    for entry_index in range(20):
+        store.put(f"{entry_index:064x}", (entry_index, worker_index))
+
+
+def test_compile_result_store_parallel_writers(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=_put_entries, args=(str(tmp_path), worker_index))
+        for worker_index in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    store = CompileResultStore(tmp_path)
+    for entry_index in range(20):
+        entry_value, _ = store.get(f"{entry_index:064x}")
+        assert entry_value == entry_index
+    assert not list(tmp_path.rglob("*.tmp"))
@@ -0,0 +1,166 @@
+import gc
+
+import pytest
+
+import nandmachine.simulator.software.cost_model_cache as cache_module
+import nandmachine.simulator.software.systolic_lut as systolic_lut_module
+from nandmachine.config.config import NandConfig
+from nandmachine.config.hardware_config import A100_80GB_FP16, Device
+from nandmachine.simulator.software.compile_result_store import (
+    COMPILE_RESULT_STORE_DIR_ENV_VAR,
+)
+from nandmachine.simulator.software.cost_model_cache import (
+    COST_MODEL_CACHE_MAX_BYTES_ENV_VAR,
+    COST_MODEL_CACHE_MAX_ENTRIES_ENV_VAR,
+    DEFAULT_COST_MODEL_CACHE_MAX_ENTRIES,
+    CostModelCache,
+    get_cost_model_cache_limits,
+    set_cost_model_cache_limits,
+)
+from nandmachine.simulator.software.matmul import MatMul_Simulation
+
+
+def make_nand_config() -> NandConfig:
+    return NandConfig(
+        num_channels=1,
+        num_plane=2,
+        num_block=8,
+        num_pages=32,
+        tRead=4.0,
+        tWrite=8.0,
+        tErase=16.0,
+        page_size=16,
+        sram_threshold=64,
+    )
+
+
+@pytest.fixture(autouse=True)
+def default_cache_limits(monkeypatch):
+    monkeypatch.setattr(cache_module, "_limits", None)
+    monkeypatch.delenv(COST_MODEL_CACHE_MAX_ENTRIES_ENV_VAR, raising=False)
+    monkeypatch.delenv(COST_MODEL_CACHE_MAX_BYTES_ENV_VAR, raising=False)
+    monkeypatch.delenv(COMPILE_RESULT_STORE_DIR_ENV_VAR, raising=False)
+    MatMul_Simulation.clear_caches()
+    yield
+    MatMul_Simulation.clear_caches()
+
+
+def _compile_gemv(instance: MatMul_Simulation, pcb_module: Device = A100_80GB_FP16):
+    return instance.compile_and_simulate(
+        pcb_module=pcb_module,
+        nand_config=make_nand_config(),
+        hbm_bandwidth_bytes_per_sec=pcb_module.io_module.bandwidth,
+        compile_mode="heuristic-GPU",
+    )
+
+
+def test_compile_result_survives_instance_eviction():
+    set_cost_model_cache_limits(2)
+    first = MatMul_Simulation.get_instance(dim=(9, 1, 11))
+    cycles = _compile_gemv(first)
+    MatMul_Simulation.get_instance(dim=(9, 1, 13))
+    MatMul_Simulation.get_instance(dim=(9, 1, 15))
+    second = MatMul_Simulation.get_instance(dim=(9, 1, 11))
+
+    assert second is not first
+    assert _compile_gemv(second) == cycles
+    assert second.best_cycle_count == cycles
+    cache_info = MatMul_Simulation.compile_and_simulate.cache_info()
+    assert (cache_info.hits, cache_info.misses, cache_info.evictions) == (1, 1, 0)
+
+    cache_stats = MatMul_Simulation.clear_caches()
+    assert cache_stats["instance"].evictions == 2
+    assert cache_stats["compile_result"].hits == 1
+    assert MatMul_Simulation.compile_and_simulate.cache_info().currsize == 0
+
+
+def test_compile_result_is_keyed_by_device_value():
+    compute_module = A100_80GB_FP16.compute_module
+    device_copy = Device(
+        compute_module=compute_module,
+        io_module=A100_80GB_FP16.io_module,
+        memory_capacity_bytes=A100_80GB_FP16.memory_capacity_bytes,
+        hbm_stack_count=A100_80GB_FP16.hbm_stack_count,
+    )
+    _compile_gemv(MatMul_Simulation(dim=(9, 1, 11)), A100_80GB_FP16)
+    _compile_gemv(MatMul_Simulation(dim=(9, 1, 11)), device_copy)
+
+    assert MatMul_Simulation.compile_and_simulate.cache_info().hits == 1
+
+
+def test_compile_result_is_keyed_by_lut_policy(monkeypatch):
+    monkeypatch.setattr(systolic_lut_module, "_policy", None)
+    monkeypatch.delenv(systolic_lut_module.SYSTOLIC_LUT_POLICY_ENV_VAR, raising=False)
+    _compile_gemv(MatMul_Simulation(dim=(9, 1, 11)))
+    systolic_lut_module.set_systolic_lut_policy("surrogate")
+    _compile_gemv(MatMul_Simulation(dim=(9, 1, 11)))
+
+    cache_info = MatMul_Simulation.compile_and_simulate.cache_info()
+    assert (cache_info.hits, cache_info.misses) == (0, 2)
+
+
+def test_cache_evicts_least_recently_used_entries_by_size():
+    set_cost_model_cache_limits(8, max_bytes=10)
+    cache = CostModelCache("test", size_of=len)
+    cache.get_or_build("a", lambda: "aaaa")
+    cache.get_or_build("b", lambda: "bbbb")
+    assert cache.get_or_build("a", lambda: "unused") == "aaaa"
+    cache.get_or_build("c", lambda: "cccc")
+
+    assert cache.get_or_build("b", lambda: "BBBB") == "BBBB"
+    assert cache.get_or_build("too_large", lambda: "x" * 11) == "x" * 11
+    cache_info = cache.cache_info()
+    assert len(cache) == 2
+    assert cache_info.current_bytes == 8
+    assert (cache_info.hits, cache_info.misses) == (1, 5)
+    assert cache_info.evictions == 3
+
+
+def test_cache_measures_values_only_with_a_byte_limit():
+    measured_values = []
+
+    def size_of(value):
+        measured_values.append(value)
+        return len(value)
+
+    cache = CostModelCache("test", size_of=size_of)
+    cache.get_or_build("a", lambda: "aaaa")
+    cache.get_or_build("b", lambda: "bbbb")
+    assert measured_values == []
+    assert cache.cache_info().current_bytes == 0
+
+    # 设上限后补测已有条目，再按字节数淘汰
+    set_cost_model_cache_limits(8, max_bytes=6)
+    assert measured_values == ["aaaa", "bbbb"]
+    assert len(cache) == 1
+    assert cache.cache_info().current_bytes == 4
+
+
+def test_device_keys_do_not_keep_devices_alive():
+    device = Device(
+        compute_module=A100_80GB_FP16.compute_module,
+        io_module=A100_80GB_FP16.io_module,
+        memory_capacity_bytes=A100_80GB_FP16.memory_capacity_bytes,
+        hbm_stack_count=A100_80GB_FP16.hbm_stack_count,
+    )
+    _compile_gemv(MatMul_Simulation(dim=(9, 1, 11)), device)
+    assert device in cache_module._device_keys
+
+    device_count = len(cache_module._device_keys)
+    del device
+    gc.collect()
+    assert len(cache_module._device_keys) == device_count - 1
+
+
+def test_cache_limits_are_validated(monkeypatch):
+    assert get_cost_model_cache_limits() == (DEFAULT_COST_MODEL_CACHE_MAX_ENTRIES, None)
+    monkeypatch.setenv(COST_MODEL_CACHE_MAX_ENTRIES_ENV_VAR, "16")
+    monkeypatch.setenv(COST_MODEL_CACHE_MAX_BYTES_ENV_VAR, "4096")
+    assert get_cost_model_cache_limits() == (16, 4096)
+
+    with pytest.raises(ValueError):
+        set_cost_model_cache_limits(0)
+    monkeypatch.setenv(COST_MODEL_CACHE_MAX_ENTRIES_ENV_VAR, "0")
+    with pytest.raises(ValueError):
+        get_cost_model_cache_limits()
+    monkeypatch.delenv(COST_MODEL_CACHE_MAX_ENTRIES_ENV_VAR)
@@ -0,0 +1,209 @@
+import pytest
+from Desim import SimSession
+
+import nandmachine.simulator.hardware.analytic as analytic_module
+from nandmachine.commands.macro import (
+    FlashAttnOp,
+    KVCacheAppend,
+    MatMulOp,
+    SramPrefetch,
+    SramPrefetchRelease,
+    VectorOp,
+)
+from nandmachine.simulator.entry_point import run_layers_to_steady_state, run_macro_ops
+from nandmachine.simulator.hardware.analytic import (
+    DES_FAST_PATH_ENV_VAR,
+    get_des_fast_path_mode,
+    run_analytic_fast_path,
+    set_des_fast_path_mode,
+)
+from nandmachine.simulator.hardware.vallina_xpu import VallinaXPU
+from nandmachine.simulator.hardware.xpu import xPU
+from test_hw_pipeline_flow import (
+    _build_repeated_matmul_triples,
+    make_config,
+    make_hbm_bandwidth_bytes_per_sec,
+)
+
+
+@pytest.fixture(autouse=True)
+def enable_fast_path(monkeypatch):
+    # 不受外部环境变量影响，固定为默认的 auto 后与 DES 对比
+    monkeypatch.setattr(analytic_module, "_mode", None)
+    monkeypatch.setenv(DES_FAST_PATH_ENV_VAR, "auto")
+
+
+def _build_attention_pipeline():
+    vector_norm = VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+    prefetch_linear = SramPrefetch(num_prefetch_pages=4)
+    matmul = MatMulOp(dim=(2, 16, 8), weight_bits=16).with_inputs(prefetch_linear)
+    command_list = [vector_norm, prefetch_linear, matmul]
+    for _ in range(3):
+        # 与 kernel lowering 一致，prefetch 不依赖计算结果
+        prefetch_attn = SramPrefetch(num_prefetch_pages=2)
+        flash_attn = FlashAttnOp(
+            qk_bmm_shape=(4, 2, 4, 2),
+            sv_bmm_shape=(4, 2, 2, 4),
+            softmax_shape=(2, 2),
+            weight_bits=16,
+        ).with_inputs(prefetch_attn, matmul)
+        command_list.extend(
+            [prefetch_attn, flash_attn, SramPrefetchRelease().with_inputs(flash_attn)]
+        )
+    command_list.append(
+        VectorOp(vector_op_type="silu_mul", vector_shape=[2, 8], weight_bits=16).with_inputs(
+            command_list[-2]
+        )
+    )
+    return command_list
+
+
+def _simulate(monkeypatch, xpu_factory, command_list, matmul_time_ns: float, use_fast_path: bool):
+    SimSession.reset()
+    SimSession.init()
+
+    sim_xpu = xpu_factory()
+    sim_xpu.load_command(command_list)
+    monkeypatch.setattr(
+        sim_xpu.compute_engine,
+        "execute_macro_op",
+        lambda macro_op: matmul_time_ns if isinstance(macro_op, MatMulOp) else 3.0,
+    )
+    monkeypatch.setattr(
+        sim_xpu.compute_engine,
+        "_estimate_flashattn_component_times_ns",
+        lambda macro_op: (5, 2, 3),
+    )
+    if use_fast_path:
+        fast_path_result = run_analytic_fast_path(sim_xpu)
+        assert fast_path_result.fallback_reason is None
+        final_time_ns = fast_path_result.time_ns
+    else:
+        SimSession.scheduler.run()
+        final_time_ns = int(SimSession.sim_time.cycle)
+
+    finish_cycles = {
+        macro_op_id: slot.finish_cycle for macro_op_id, slot in sim_xpu.command_slots.items()
+    }
+    SimSession.reset()
+    return sim_xpu, final_time_ns, finish_cycles
+
+
+@pytest.mark.parametrize("collapse_repeats", [True, False])
+@pytest.mark.parametrize("matmul_time_ns", [3.0, 20.0])
+@pytest.mark.parametrize(
+    "build_command_list",
+    [_build_attention_pipeline, lambda: _build_repeated_matmul_triples(repeat_count=12)],
+)
+def test_fast_path_matches_des_on_default_xpu(
+    monkeypatch, collapse_repeats, matmul_time_ns, build_command_list
+):
+    command_list = build_command_list()
+
+    def xpu_factory():
+        return xPU(
+            make_config(),
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+            collapse_repeats=collapse_repeats,
+        )
+
+    fast_xpu, fast_time_ns, fast_finish_cycles = _simulate(
+        monkeypatch, xpu_factory, command_list, matmul_time_ns, use_fast_path=True
+    )
+    des_xpu, des_time_ns, des_finish_cycles = _simulate(
+        monkeypatch, xpu_factory, command_list, matmul_time_ns, use_fast_path=False
+    )
+
+    assert fast_time_ns == des_time_ns
+    assert fast_finish_cycles == des_finish_cycles
+    assert fast_xpu.prefetch_engine.sram_peak_pages == des_xpu.prefetch_engine.sram_peak_pages
+
+
+def test_fast_path_matches_des_on_vallina_xpu(monkeypatch):
+    command_list = _build_attention_pipeline()
+
+    def xpu_factory():
+        return VallinaXPU(
+            make_config(),
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        )
+
+    _, fast_time_ns, _ = _simulate(monkeypatch, xpu_factory, command_list, 7.0, use_fast_path=True)
+    _, des_time_ns, _ = _simulate(monkeypatch, xpu_factory, command_list, 7.0, use_fast_path=False)
+
+    assert fast_time_ns == des_time_ns
+
+
+def test_fast_path_matches_des_across_layers():
+    layer_commands = _build_repeated_matmul_triples(repeat_count=2)
+    kwargs = dict(
+        num_hidden_layers=32,
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+    )
+
+    fast_result = run_layers_to_steady_state(make_config(), layer_commands, **kwargs)
+    set_des_fast_path_mode("off")
+    des_result = run_layers_to_steady_state(make_config(), layer_commands, **kwargs)
+
+    assert fast_result.used_fast_path
+    assert not des_result.used_fast_path
+    assert fast_result.layer_end_time_ns == des_result.layer_end_time_ns
+    assert fast_result.model_latency_ns == des_result.model_latency_ns
+
+
+def test_run_macro_ops_reports_fallback_to_des():
+    matched = run_macro_ops(
+        make_config(),
+        _build_repeated_matmul_triples(repeat_count=3),
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+    )
+    assert matched.used_fast_path
+    assert matched.fast_path_fallback_reason is None
+    assert matched.time_ns == int(SimSession.sim_time.cycle)
+
+    # KV 追加写入与 prefetch 共享 plane，只能由 DES 仿真
+    command_list = _build_repeated_matmul_triples(repeat_count=3)
+    command_list.insert(4, KVCacheAppend(2).with_inputs(command_list[2]))
+    fallback = run_macro_ops(
+        make_config(),
+        command_list,
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+    )
+    assert not fallback.used_fast_path
+    assert "KVCacheAppend" in fallback.fast_path_fallback_reason
+    assert fallback.time_ns == int(SimSession.sim_time.cycle)
+
+
+def test_same_ns_dependency_falls_back_to_des():
+    SimSession.reset()
+    SimSession.init()
+
+    # 被跳过的第一个 prefetch 在 0ns 完成，matmul 也在 0ns 检查它：结果取决于协程的调度顺序
+    prefetch = SramPrefetch(num_prefetch_pages=4)
+    matmul = MatMulOp(dim=(2, 16, 8), weight_bits=16).with_inputs(prefetch)
+    sim_xpu = xPU(make_config(), hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec())
+    sim_xpu.load_command([prefetch, matmul, SramPrefetchRelease().with_inputs(matmul)])
+
+    fast_path_result = run_analytic_fast_path(sim_xpu)
+    assert not fast_path_result.used_fast_path
+    assert "same ns" in fast_path_result.fallback_reason
+    assert not any(slot.is_finished for slot in sim_xpu.command_slots.values())
+    SimSession.reset()
+
+
+def test_des_fast_path_mode_is_validated(monkeypatch):
+    monkeypatch.delenv(DES_FAST_PATH_ENV_VAR)
+    assert get_des_fast_path_mode() == "auto"
+    monkeypatch.setenv(DES_FAST_PATH_ENV_VAR, "off")
+    assert get_des_fast_path_mode() == "off"
+    monkeypatch.setenv(DES_FAST_PATH_ENV_VAR, "auto")
+    assert get_des_fast_path_mode() == "auto"
+    set_des_fast_path_mode("off")
+    assert get_des_fast_path_mode() == "off"
+
+    with pytest.raises(ValueError):
+        set_des_fast_path_mode("always")
+    set_des_fast_path_mode(None)
+    monkeypatch.setenv(DES_FAST_PATH_ENV_VAR, "always")
+    with pytest.raises(ValueError):
+        get_des_fast_path_mode()
@@ -0,0 +1,140 @@
+import pytest
+
+import nandmachine.simulator.hardware.repeat as repeat_module
+from nandmachine.commands.macro import (
+    FlashAttnOp,
+    KVCacheAppend,
+    MatMulOp,
+    SramPrefetch,
+    SramPrefetchRelease,
+    VectorOp,
+)
+from nandmachine.config.config import NandConfig
+from nandmachine.kernels.attention import GQANandKernel
+from nandmachine.kernels.lieanr import LinearNandKernel
+from nandmachine.simulator.hardware.repeat import (
+    DES_REPEAT_MODE_ENV_VAR,
+    RepeatedTripleRun,
+    find_repeated_triple_runs,
+    get_des_repeat_mode,
+    set_des_repeat_mode,
+)
+
+
+@pytest.fixture(autouse=True)
+def default_repeat_mode(monkeypatch):
+    monkeypatch.setattr(repeat_module, "_mode", None)
+    monkeypatch.delenv(DES_REPEAT_MODE_ENV_VAR, raising=False)
+
+
+def make_config() -> NandConfig:
+    return NandConfig(
+        num_channels=1,
+        num_plane=2,
+        num_block=8,
+        num_pages=32,
+        tRead=4.0,
+        tWrite=8.0,
+        tErase=16.0,
+        page_size=16,
+        sram_threshold=1,
+    )
+
+
+def _matmul_triple(n: int = 8):
+    prefetch = SramPrefetch(num_prefetch_pages=4)
+    matmul = MatMulOp(dim=(2, 16, n), weight_bits=16).with_inputs(prefetch)
+    return [prefetch, matmul, SramPrefetchRelease().with_inputs(matmul)]
+
+
+def test_linear_kernel_lowering_collapses_to_one_run_per_slice_shape():
+    command_list = LinearNandKernel.lowering(
+        m=2, k=64, n=100, weight_bits=16, input_bits=16, nand_config=make_config()
+    )
+
+    # n_slice=8：12 个完整切片组成一个 run，最后 n=4 的切片形状不同
+    assert len(command_list) == 13 * 3
+    assert find_repeated_triple_runs(command_list) == [
+        RepeatedTripleRun(start_index=0, repeat_count=12)
+    ]
+
+
+def test_gqa_kernel_lowering_collapses_all_hyper_pages():
+    command_list = GQANandKernel.lowering(
+        group_size=4,
+        num_kv_heads=2,
+        head_dim=8,
+        num_kv_blocks=40,
+        kv_block_size=4,
+        block_bytes=8192,
+        kv_cache_bits=16,
+        input_bits=16,
+        nand_config=make_config(),
+    )
+
+    # 一个 hyper page 32KB 放 4 个 block，40 个 block 对应 10 次相同的迭代
+    assert isinstance(command_list[1], FlashAttnOp)
+    assert find_repeated_triple_runs(command_list) == [
+        RepeatedTripleRun(start_index=0, repeat_count=10)
+    ]
+
+
+def test_gqa_kernel_kv_append_keeps_remaining_iterations_collapsible():
+    command_list = GQANandKernel.lowering(
+        group_size=4,
+        num_kv_heads=2,
+        head_dim=8,
+        num_kv_blocks=40,
+        kv_block_size=4,
+        block_bytes=8192,
+        kv_cache_bits=16,
+        input_bits=16,
+        nand_config=make_config(),
+        kv_append_bytes=40000,
+    )
+
+    # 16KB page：40000 bytes 需要写 3 个 page，写入依赖第一个 attention op
+    kv_append = command_list[-1]
+    assert isinstance(kv_append, KVCacheAppend)
+    assert kv_append.num_write_pages == 3
+    assert kv_append.input_ops == [command_list[1]]
+    assert find_repeated_triple_runs(command_list) == [
+        RepeatedTripleRun(start_index=3, repeat_count=9)
+    ]
+
+
+def test_runs_stop_at_external_dependencies_and_shape_changes():
+    vector_norm = VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+    first_run = [op for _ in range(5) for op in _matmul_triple()]
+    # 中间迭代的 matmul 被外部依赖时，run 在这次迭代结束
+    vector_act = VectorOp(
+        vector_op_type="silu_mul", vector_shape=[2, 8], weight_bits=16
+    ).with_inputs(first_run[3 * 3 + 1])
+    second_run = [op for _ in range(4) for op in _matmul_triple()]
+    short_run = [op for _ in range(3) for op in _matmul_triple(n=4)]
+    command_list = [vector_norm, *first_run, *second_run, *short_run, vector_act]
+
+    assert find_repeated_triple_runs(command_list) == [
+        RepeatedTripleRun(start_index=1, repeat_count=4),
+        RepeatedTripleRun(start_index=13, repeat_count=5),
+    ]
+    assert find_repeated_triple_runs(command_list, min_repeat_count=3)[-1] == (
+        RepeatedTripleRun(start_index=28, repeat_count=3)
+    )
+    with pytest.raises(ValueError):
+        find_repeated_triple_runs(command_list, min_repeat_count=0)
+
+
+def test_des_repeat_mode_is_validated(monkeypatch):
+    assert get_des_repeat_mode() == "collapse"
+    monkeypatch.setenv(DES_REPEAT_MODE_ENV_VAR, "full")
+    assert get_des_repeat_mode() == "full"
+    set_des_repeat_mode("collapse")
+    assert get_des_repeat_mode() == "collapse"
+
+    with pytest.raises(ValueError):
+        set_des_repeat_mode("fast")
+    set_des_repeat_mode(None)
+    monkeypatch.setenv(DES_REPEAT_MODE_ENV_VAR, "fast")
+    with pytest.raises(ValueError):
+        get_des_repeat_mode()
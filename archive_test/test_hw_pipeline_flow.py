@@ -5,9 +5,13 @@ from pathlib import Path
 import pytest
 from Desim import SimSession
 
+import nandmachine.simulator.entry_point as entry_point_module
+import nandmachine.simulator.hardware.repeat as repeat_module
+
 from nandmachine.commands.macro import (
     All2AllOp,
     FlashAttnOp,
+    KVCacheAppend,
     MatMulOp,
     SramPrefetch,
     SramPrefetchRelease,
@@ -15,7 +19,19 @@ from nandmachine.commands.macro import (
 )
 from nandmachine.config.config import NandConfig
 from nandmachine.config.hardware_config import get_device_or_raise
-from nandmachine.simulator.entry_point import MacroSimResult, run_macro_ops
+from nandmachine.simulator.entry_point import (
+    DEFAULT_MAX_SIMULATED_LAYERS,
+    MIN_SIMULATED_LAYERS,
+    MacroSimResult,
+    run_layers_to_steady_state,
+    run_macro_ops,
+    run_multi_rank_macro_ops,
+)
+from nandmachine.simulator.hardware.analytic import DES_FAST_PATH_ENV_VAR, run_analytic_fast_path
+from nandmachine.simulator.hardware.collective import CollectiveBarrier
+from nandmachine.simulator.hardware.nand import NandSimCoreSimple, build_nand_sim_core
+from nandmachine.simulator.hardware.nand_timing import NandSimCoreChannel
+from nandmachine.simulator.hardware.repeat import set_des_repeat_mode
 from nandmachine.simulator.hardware.xpu import xPU
 
 
@@ -131,6 +147,463 @@ def test_hw_pipeline_flow_runs_with_current_macro_ops():
     assert result.time_ns > 0
 
 
+def _build_repeated_matmul_triples(repeat_count: int, num_prefetch_pages: int = 4):
+    vector_norm = VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+    command_list = [vector_norm]
+    for _ in range(repeat_count):
+        prefetch = SramPrefetch(num_prefetch_pages=num_prefetch_pages)
+        matmul = MatMulOp(dim=(2, 16, 8), weight_bits=16).with_inputs(prefetch)
+        command_list.extend([prefetch, matmul, SramPrefetchRelease().with_inputs(matmul)])
+    vector_act = VectorOp(vector_op_type="silu_mul", vector_shape=[2, 8], weight_bits=16).with_inputs(
+        command_list[-2]
+    )
+    command_list.append(vector_act)
+    return command_list
+
+
+def _run_repeated_matmul_triples(
+    monkeypatch,
+    collapse_repeats: bool,
+    matmul_time_ns: float,
+    command_list=None,
+    **xpu_kwargs,
+):
+    SimSession.reset()
+    SimSession.init()
+
+    sim_xpu = xPU(
+        make_config(),
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        collapse_repeats=collapse_repeats,
+        **xpu_kwargs,
+    )
+    if command_list is None:
+        command_list = _build_repeated_matmul_triples(repeat_count=12)
+    sim_xpu.load_command(command_list)
+    monkeypatch.setattr(
+        sim_xpu.compute_engine,
+        "execute_macro_op",
+        lambda macro_op, **cost_kwargs: matmul_time_ns if isinstance(macro_op, MatMulOp) else 3.0,
+    )
+    SimSession.scheduler.run()
+
+    final_time_ns = int(SimSession.sim_time.cycle)
+    SimSession.reset()
+    return sim_xpu, final_time_ns
+
+
+@pytest.mark.parametrize("matmul_time_ns", [3.0, 20.0])
+def test_collapsed_repeated_triples_match_full_simulation(monkeypatch, matmul_time_ns):
+    collapsed_xpu, collapsed_time_ns = _run_repeated_matmul_triples(
+        monkeypatch, True, matmul_time_ns
+    )
+    full_xpu, full_time_ns = _run_repeated_matmul_triples(
+        monkeypatch, False, matmul_time_ns
+    )
+
+    assert len(collapsed_xpu.prefetch_engine.prefetch_command_queue) == 3
+    assert [slot.repeat_count for slot in collapsed_xpu.compute_engine.command_queue] == [
+        1, 1, 1, 10, 1,
+    ]
+    assert collapsed_xpu.collapsed_iteration_count == 9
+    assert len(full_xpu.prefetch_engine.prefetch_command_queue) == 12
+    assert full_xpu.collapsed_iteration_count == 0
+    assert abs(collapsed_time_ns - full_time_ns) <= 12
+    assert collapsed_xpu.collapse_fallback_reason is None
+
+
+def test_collapse_falls_back_to_full_simulation_with_prefetch_lookahead(monkeypatch):
+    # 1 page 的请求可以在两个 plane 上重叠，lookahead 填满前后的发射间隔不同
+    command_list = _build_repeated_matmul_triples(repeat_count=12, num_prefetch_pages=1)
+    collapsed_xpu, collapsed_time_ns = _run_repeated_matmul_triples(
+        monkeypatch, True, 1.0, command_list, prefetch_lookahead_depth=2
+    )
+    full_xpu, full_time_ns = _run_repeated_matmul_triples(
+        monkeypatch, False, 1.0, command_list, prefetch_lookahead_depth=2
+    )
+
+    assert collapsed_xpu.collapsed_iteration_count == 0
+    assert "lookahead" in collapsed_xpu.collapse_fallback_reason
+    assert full_xpu.collapse_fallback_reason is None
+    assert collapsed_time_ns == full_time_ns
+
+
+def test_collapse_falls_back_to_full_simulation_with_kv_cache_writes(monkeypatch):
+    command_list = _build_repeated_matmul_triples(repeat_count=40)
+    # 写入依赖第一个 compute op，落在合并时测量稳态周期的迭代中
+    command_list.insert(4, KVCacheAppend(8).with_inputs(command_list[2]))
+    collapsed_xpu, collapsed_time_ns = _run_repeated_matmul_triples(
+        monkeypatch, True, 1.0, command_list
+    )
+    full_xpu, full_time_ns = _run_repeated_matmul_triples(monkeypatch, False, 1.0, command_list)
+
+    assert collapsed_xpu.collapsed_iteration_count == 0
+    assert "KVCacheAppend" in collapsed_xpu.collapse_fallback_reason
+    assert collapsed_time_ns == full_time_ns
+
+
+@pytest.mark.parametrize(
+    "xpu_kwargs",
+    [
+        {"collective_barrier": CollectiveBarrier(1)},
+        {"limit_sram_capacity": True},
+        {"prefetch_lookahead_depth": 2},
+        {"compute_issue_window": 4},
+        {"compute_streams": 2},
+        {"memory_arbitration": "fair"},
+    ],
+)
+def test_collapse_and_fast_path_fall_back_on_the_same_features(monkeypatch, xpu_kwargs):
+    monkeypatch.setenv(DES_FAST_PATH_ENV_VAR, "auto")
+    SimSession.reset()
+    SimSession.init()
+    sim_xpu = xPU(
+        make_config(),
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        collapse_repeats=True,
+        **xpu_kwargs,
+    )
+    sim_xpu.load_command(_build_repeated_matmul_triples(repeat_count=12))
+    fast_path_result = run_analytic_fast_path(sim_xpu)
+    SimSession.reset()
+
+    assert sim_xpu.collapsed_iteration_count == 0
+    assert sim_xpu.collapse_fallback_reason is not None
+    assert fast_path_result.fallback_reason == sim_xpu.collapse_fallback_reason
+
+
+def test_multi_layer_simulation_extrapolates_steady_state_layers(monkeypatch):
+    layer_commands = _build_repeated_matmul_triples(repeat_count=2)
+    simulated_layer_counts = []
+    run_layers_with_xpu = entry_point_module._run_layers_with_xpu
+
+    def recording_run_layers_with_xpu(nand_config, layer_program, num_layers, **kwargs):
+        simulated_layer_counts.append(num_layers)
+        return run_layers_with_xpu(nand_config, layer_program, num_layers, **kwargs)
+
+    monkeypatch.setattr(
+        entry_point_module, "_run_layers_with_xpu", recording_run_layers_with_xpu
+    )
+
+    result = run_layers_to_steady_state(
+        make_config(),
+        layer_commands,
+        num_hidden_layers=32,
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+    )
+
+    layer_end_time_ns = result.layer_end_time_ns
+    assert simulated_layer_counts == [MIN_SIMULATED_LAYERS]
+    assert result.steady_state_reached
+    assert result.steady_state_layer_count == MIN_SIMULATED_LAYERS
+    assert result.collapse_fallback_reason is None
+    assert result.simulated_layer_count == MIN_SIMULATED_LAYERS
+    assert result.layer_latency_ns == layer_end_time_ns[-1] - layer_end_time_ns[-2]
+    # 第一层的 prefetch 无法与上一层重叠
+    assert layer_end_time_ns[0] >= result.layer_latency_ns
+    assert result.model_latency_ns == (
+        layer_end_time_ns[-1] + (32 - MIN_SIMULATED_LAYERS) * result.layer_latency_ns
+    )
+
+    # 最少层数内未达到稳态时才用更大的窗口重新仿真，其前缀与第一次仿真一致
+    simulated_layer_counts.clear()
+    monkeypatch.setattr(
+        entry_point_module, "_find_steady_layer_count", lambda layer_end_time_ns: None
+    )
+    unsteady_result = run_layers_to_steady_state(
+        make_config(),
+        layer_commands,
+        num_hidden_layers=32,
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+    )
+    assert simulated_layer_counts == [MIN_SIMULATED_LAYERS, DEFAULT_MAX_SIMULATED_LAYERS]
+    assert not unsteady_result.steady_state_reached
+    assert unsteady_result.simulated_layer_count == DEFAULT_MAX_SIMULATED_LAYERS
+    assert unsteady_result.layer_end_time_ns[:MIN_SIMULATED_LAYERS] == layer_end_time_ns
+
+    short_result = run_layers_to_steady_state(
+        make_config(),
+        layer_commands,
+        num_hidden_layers=2,
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+    )
+    assert short_result.simulated_layer_count == 2
+    assert short_result.model_latency_ns == short_result.layer_end_time_ns[-1]
+
+
+def test_multi_layer_simulation_reports_collapse_fallback():
+    layer_commands = _build_repeated_matmul_triples(repeat_count=4)
+    layer_commands.insert(4, KVCacheAppend(8).with_inputs(layer_commands[2]))
+
+    result = run_layers_to_steady_state(
+        make_config(),
+        layer_commands,
+        num_hidden_layers=4,
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+    )
+
+    assert "KVCacheAppend" in result.collapse_fallback_reason
+
+
+def test_compute_issue_window_does_not_run_next_layer_head_early():
+    layer_commands = _build_repeated_matmul_triples(repeat_count=2)
+    results = {
+        issue_window: run_layers_to_steady_state(
+            make_config(),
+            layer_commands,
+            num_hidden_layers=4,
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+            compute_issue_window=issue_window,
+        )
+        for issue_window in (1, 4)
+    }
+
+    # 下一层开头的 rms_norm 没有显式输入，但必须等上一层最后的 compute op 完成
+    assert results[4].compute_reordered_ops == 0
+    assert results[4].layer_end_time_ns == results[1].layer_end_time_ns
+
+
+def test_sram_capacity_blocks_prefetch_until_release():
+    # sram_threshold=64KB，page_size=16KB：SRAM 只能放下一次 4 page 的 prefetch
+    unlimited = run_macro_ops(
+        make_config(),
+        _build_repeated_matmul_triples(repeat_count=3),
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+    )
+    limited = run_macro_ops(
+        make_config(),
+        _build_repeated_matmul_triples(repeat_count=3),
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        limit_sram_capacity=True,
+    )
+
+    assert unlimited.sram_peak_pages == 8
+    assert unlimited.sram_stall_time_ns == 0
+    assert limited.sram_peak_pages == 4
+    assert limited.sram_stall_time_ns > 0
+    assert limited.time_ns > unlimited.time_ns
+
+
+def test_collapse_falls_back_to_full_simulation_with_limited_sram(monkeypatch):
+    # prefetch 受 NAND 限制，稳态下每次 prefetch 都要等上一次 release 腾出 SRAM
+    collapsed_xpu, collapsed_time_ns = _run_repeated_matmul_triples(
+        monkeypatch, True, 1.0, limit_sram_capacity=True
+    )
+    full_xpu, full_time_ns = _run_repeated_matmul_triples(
+        monkeypatch, False, 1.0, limit_sram_capacity=True
+    )
+
+    assert collapsed_xpu.collapsed_iteration_count == 0
+    assert collapsed_xpu.collapse_fallback_reason == "SRAM capacity is limited"
+    assert full_xpu.prefetch_engine.sram_stall_time_ns > 0
+    assert collapsed_xpu.prefetch_engine.sram_stall_time_ns == (
+        full_xpu.prefetch_engine.sram_stall_time_ns
+    )
+    assert collapsed_time_ns == full_time_ns
+
+
+def test_prefetch_lookahead_overlaps_small_nand_requests(monkeypatch):
+    final_time_ns = {}
+    for lookahead_depth in (1, 2):
+        SimSession.reset()
+        SimSession.init()
+        sim_xpu = xPU(
+            make_config(),
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+            collapse_repeats=False,
+            prefetch_lookahead_depth=lookahead_depth,
+        )
+        # 1 page 的请求只占用 2 个 plane 中的一个，窗口为 2 时两个请求可以并行
+        sim_xpu.load_command(_build_repeated_matmul_triples(repeat_count=9, num_prefetch_pages=1))
+        monkeypatch.setattr(sim_xpu.compute_engine, "execute_macro_op", lambda macro_op: 1.0)
+        SimSession.scheduler.run()
+        final_time_ns[lookahead_depth] = int(SimSession.sim_time.cycle)
+        SimSession.reset()
+
+    assert final_time_ns[2] < final_time_ns[1]
+
+
+def test_compute_issue_window_runs_ready_ops_ahead_of_late_prefetch(monkeypatch):
+    final_time_ns = {}
+    reordered_op_count = {}
+    for issue_window in (1, 3):
+        SimSession.reset()
+        SimSession.init()
+        sim_xpu = xPU(
+            make_config(),
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+            collapse_repeats=False,
+            compute_issue_window=issue_window,
+        )
+        # 第二次 matmul 要等 NAND 读取；末尾不依赖它的 vector op 在窗口为 3 时可以先执行
+        command_list = _build_repeated_matmul_triples(repeat_count=2)
+        independent_op = VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+        command_list.append(independent_op)
+        sim_xpu.load_command(command_list)
+        monkeypatch.setattr(
+            sim_xpu.compute_engine,
+            "execute_macro_op",
+            lambda macro_op: 50.0 if macro_op is independent_op else 1.0,
+        )
+        SimSession.scheduler.run()
+        final_time_ns[issue_window] = int(SimSession.sim_time.cycle)
+        reordered_op_count[issue_window] = sim_xpu.compute_engine.reordered_op_count
+        SimSession.reset()
+
+    assert reordered_op_count == {1: 0, 3: 1}
+    assert final_time_ns[3] < final_time_ns[1]
+
+
+def _run_with_des_repeat_modes(monkeypatch, command_list, matmul_time_ns, **xpu_kwargs):
+    # collapse_repeats 为 None 时 xPU 跟随 set_des_repeat_mode
+    monkeypatch.setattr(repeat_module, "_mode", None)
+    results = {}
+    for mode in ("full", "collapse"):
+        set_des_repeat_mode(mode)
+        results[mode] = _run_repeated_matmul_triples(
+            monkeypatch, None, matmul_time_ns, command_list, **xpu_kwargs
+        )
+    return results
+
+
+def test_collapse_falls_back_to_full_simulation_with_compute_issue_window(monkeypatch):
+    # 末尾的独立 vector op 在窗口内越过等待 prefetch 的 matmul；合并后的 slot 只占一个窗口位置
+    command_list = _build_repeated_matmul_triples(repeat_count=30)[:-1] + [
+        VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+        for _ in range(6)
+    ]
+    results = _run_with_des_repeat_modes(
+        monkeypatch, command_list, 1.0, compute_issue_window=4
+    )
+    (full_xpu, full_time_ns), (collapsed_xpu, collapsed_time_ns) = (
+        results["full"],
+        results["collapse"],
+    )
+
+    assert full_xpu.compute_engine.reordered_op_count > 0
+    assert collapsed_xpu.collapsed_iteration_count == 0
+    assert collapsed_xpu.collapse_fallback_reason == "compute issue window is larger than 1"
+    assert collapsed_xpu.compute_engine.reordered_op_count == (
+        full_xpu.compute_engine.reordered_op_count
+    )
+    assert collapsed_time_ns == full_time_ns
+
+
+def test_compute_issue_window_falls_back_to_des_and_is_validated(monkeypatch):
+    monkeypatch.setenv(DES_FAST_PATH_ENV_VAR, "auto")
+    in_order = run_macro_ops(
+        make_config(),
+        _build_repeated_matmul_triples(repeat_count=3),
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+    )
+    windowed = run_macro_ops(
+        make_config(),
+        _build_repeated_matmul_triples(repeat_count=3),
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        compute_issue_window=4,
+    )
+
+    # 每个 matmul 只依赖自己的 prefetch，没有可以提前的 op，窗口不改变结果
+    assert not windowed.used_fast_path
+    assert "issue window" in windowed.fast_path_fallback_reason
+    assert windowed.compute_reordered_ops == 0
+    assert windowed.time_ns == in_order.time_ns
+
+    SimSession.reset()
+    SimSession.init()
+    with pytest.raises(ValueError):
+        xPU(
+            make_config(),
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+            compute_issue_window=0,
+        )
+    SimSession.reset()
+
+
+def test_kv_append_write_delays_prefetch_on_shared_planes(monkeypatch):
+    final_time_ns = {}
+    for num_write_pages in (0, 2):
+        SimSession.reset()
+        SimSession.init()
+        sim_xpu = xPU(
+            make_config(),
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+            collapse_repeats=False,
+        )
+        command_list = _build_repeated_matmul_triples(repeat_count=3)
+        if num_write_pages:
+            # 第一次 matmul 之后写回 KV，第三次 prefetch 要等写入占用的 plane
+            command_list.insert(
+                4, KVCacheAppend(num_write_pages).with_inputs(command_list[2])
+            )
+        sim_xpu.load_command(command_list)
+        monkeypatch.setattr(sim_xpu.compute_engine, "execute_macro_op", lambda macro_op: 1.0)
+        SimSession.scheduler.run()
+        final_time_ns[num_write_pages] = int(SimSession.sim_time.cycle)
+        SimSession.reset()
+
+    nand_controller = sim_xpu.nand_controller
+    assert nand_controller.num_write_bytes == 2 * make_config().page_size_bytes
+    assert nand_controller.num_interfered_reads == 1
+    assert nand_controller.read_interference_ns > 0
+    assert final_time_ns[2] > final_time_ns[0]
+
+
+def _build_rank_commands(num_extra_vector_ops: int):
+    command_list = [
+        VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+        for _ in range(1 + num_extra_vector_ops)
+    ]
+    transfer = All2AllOp(num_gpus=2, data_size=128, weight_bits=16).with_inputs(command_list[-1])
+    vector_act = VectorOp(
+        vector_op_type="silu_mul", vector_shape=[2, 8], weight_bits=16
+    ).with_inputs(transfer)
+    return [*command_list, transfer, vector_act]
+
+
+def test_multi_rank_collective_waits_for_slowest_rank():
+    result = run_multi_rank_macro_ops(
+        make_config(),
+        [_build_rank_commands(0), _build_rank_commands(8)],
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+    )
+
+    assert result.num_ranks == 2
+    # rank 0 先到达 all2all，要等 rank 1；之后两个 rank 同时完成
+    assert result.rank_collective_wait_ns[0] > 0
+    assert result.rank_collective_wait_ns[1] == 0
+    assert result.rank_time_ns[0] == result.rank_time_ns[1] == result.time_ns
+
+    with pytest.raises(ValueError):
+        run_multi_rank_macro_ops(
+            make_config(),
+            [_build_rank_commands(0), _build_rank_commands(0)[:1]],
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        )
+
+
+def test_nand_core_shares_planes_between_outstanding_requests():
+    core = NandSimCoreSimple(make_config())
+
+    assert core.handle_request(1, 0.0) == 4.0
+    assert core.handle_request(1, 0.0) == 4.0
+    assert core.handle_request(1, 1.0) == 8.0
+    # 4 page 需要全部 plane，等两个 plane 都空闲后再读 2 轮
+    assert core.handle_request(4, 2.0) == 16.0
+
+
+def test_nand_timing_model_is_selected_from_config():
+    config = make_config()
+    assert isinstance(build_nand_sim_core(config), NandSimCoreSimple)
+
+    config.timing_model = "channel"
+    assert isinstance(build_nand_sim_core(config), NandSimCoreChannel)
+
+    config.timing_model = "detailed"
+    with pytest.raises(ValueError):
+        build_nand_sim_core(config)
+
+
 def test_hw_pipeline_flow_runs_without_prefetch_or_release():
     config = make_config()
 
@@ -0,0 +1,627 @@
+from math import ceil
+
+import numpy as np
+import pytest
+
+from nandmachine.config.config import NandConfig
+from nandmachine.config.hardware_config import (
+    A100_80GB_FP16,
+    ComputeModule,
+    Core,
+    Device,
+)
+import nandmachine.simulator.software.matmul as matmul_module
+import nandmachine.simulator.software.systolic_lut as systolic_lut_module
+from nandmachine.simulator.software.flash_attention import (
+    FlashAttn_BatchedMatMul_Simulation,
+    FlashMLA_BatchedMatMul_Simulation,
+)
+from nandmachine.simulator.software.matmul import (
+    MatMul_Simulation,
+    _build_bandwidth_config_key_or_raise,
+)
+from nandmachine.simulator.software.systolic_lut import (
+    measure_look_up_table_coverage,
+    prewarm_systolic_look_up_tables,
+)
+
+
+def make_nand_config() -> NandConfig:
+    return NandConfig(
+        num_channels=1,
+        num_plane=2,
+        num_block=8,
+        num_pages=32,
+        tRead=4.0,
+        tWrite=8.0,
+        tErase=16.0,
+        page_size=16,
+        sram_threshold=64,
+    )
+
+
+def _fake_l2_tile_compute_cycle_count(
+    self, M, N, K, precision, mapping, chiplet_module, look_up_table
+):
+    # 与形状相关但不依赖查找表的确定性代价，专门用来检验L2流水记账
+    return 3 * M * N * K // 7 + M + 2 * N
+
+
+def _reference_l2_pipeline_cycle_count(
+    instance: MatMul_Simulation,
+    mapping: MatMul_Simulation.Mapping,
+    bandwidth_config_key,
+) -> int:
+    # 逐tile的标量流水记账，与向量化实现之前的 simulate 主循环逐行对应
+    M, N, K = instance.M, instance.N, instance.K
+    loop_M = ceil(M / mapping.l2_tile_M)
+    loop_N = ceil(N / mapping.l2_tile_N)
+    loop_K = ceil(K / mapping.l2_tile_K)
+    tile_cache = {}
+
+    def l2_tile(m, n, k):
+        shape = (
+            min(mapping.l2_tile_M, M - m * mapping.l2_tile_M),
+            min(mapping.l2_tile_N, N - n * mapping.l2_tile_N),
+            min(mapping.l2_tile_K, K - k * mapping.l2_tile_K),
+        )
+        if shape not in tile_cache:
+            tile_cache[shape] = MatMul_Simulation.L2TileSimulator(
+                *shape,
+                instance.precision,
+                mapping,
+                A100_80GB_FP16,
+                bandwidth_config_key,
+                None,
+            )
+        return tile_cache[shape]
+
+    total_cycle_count = l2_tile(0, 0, 0).get_main_memory_read_cycle_count(
+        read_mk=True, read_kn=True, read_mn=False
+    )
+    previous_m = previous_n = previous_k = 0
+    for m, n, k in MatMul_Simulation.generate_tile_loops(
+        loop_M, loop_N, loop_K, mapping.l2_loop_order
+    ):
+        if m == 0 and n == 0 and k == 0:
+            continue
+        previous_l2_tile = l2_tile(previous_m, previous_n, previous_k)
+        if m == previous_m and k == previous_k:
+            read_mk, read_kn = False, True
+        elif n == previous_n and k == previous_k:
+            read_mk, read_kn = True, False
+        else:
+            read_mk, read_kn = True, True
+        read_cycle_count = l2_tile(m, n, k).get_main_memory_read_cycle_count(
+            read_mk=read_mk,
+            read_kn=read_kn,
+            read_mn=k > 0 and not (m == previous_m and n == previous_n),
+        )
+        compute_cycle_count = previous_l2_tile.compute_cycle_count
+        if previous_k > 0:
+            compute_cycle_count += previous_l2_tile.K_reduction_cycle_count
+        write_cycle_count = previous_l2_tile.get_main_memory_write_cycle_count(
+            write_mn=not (m == previous_m and n == previous_n)
+        )
+        if mapping.is_l2_double_buffering:
+            total_cycle_count += max(read_cycle_count, compute_cycle_count) + write_cycle_count
+        else:
+            total_cycle_count += read_cycle_count + compute_cycle_count + write_cycle_count
+        previous_m, previous_n, previous_k = m, n, k
+
+    last_l2_tile = l2_tile(loop_M - 1, loop_N - 1, loop_K - 1)
+    total_cycle_count += (
+        last_l2_tile.get_main_memory_write_cycle_count(write_mn=True)
+        + last_l2_tile.compute_cycle_count
+    )
+    if previous_k > 0:
+        total_cycle_count += ceil(last_l2_tile.K_reduction_cycle_count)
+    return total_cycle_count
+
+
+@pytest.mark.parametrize("loop_order", ["mkn", "mnk", "nkm", "nmk", "knm", "kmn"])
+def test_tile_index_arrays_follow_generate_tile_loops(loop_order):
+    m_index, n_index, k_index = MatMul_Simulation.generate_tile_index_arrays(
+        3, 4, 2, loop_order
+    )
+
+    assert list(zip(m_index.tolist(), n_index.tolist(), k_index.tolist())) == list(
+        MatMul_Simulation.generate_tile_loops(3, 4, 2, loop_order)
+    )
+
+
+@pytest.mark.parametrize("loop_order", ["mkn", "mnk", "nkm", "nmk", "knm", "kmn"])
+@pytest.mark.parametrize("is_l2_double_buffering", [True, False])
+@pytest.mark.parametrize(
+    ("dim", "l2_tile"),
+    [
+        ((64, 64, 64), (32, 32, 32)),
+        ((77, 333, 1000), (32, 64, 128)),
+        ((5, 17, 9), (8, 4, 4)),
+        ((1, 40, 96), (1, 16, 32)),
+        ((48, 48, 48), (64, 64, 64)),
+    ],
+)
+def test_vectorized_l2_pipeline_matches_scalar_loop(
+    monkeypatch, loop_order, is_l2_double_buffering, dim, l2_tile
+):
+    monkeypatch.setattr(
+        MatMul_Simulation.L2TileSimulator,
+        "simulate_l2_tile_compute_cycle_count",
+        _fake_l2_tile_compute_cycle_count,
+    )
+    instance = MatMul_Simulation(dim=dim, weight_bits=16)
+    instance.look_up_table = object()  # 跳过查找表的懒加载
+    bandwidth_config_key = _build_bandwidth_config_key_or_raise(
+        make_nand_config(),
+        A100_80GB_FP16.io_module.bandwidth,
+    )
+    mapping = MatMul_Simulation.Mapping(
+        *l2_tile,
+        is_l2_double_buffering,
+        16,
+        16,
+        16,
+        loop_order,
+        "mnk",
+        1,
+        1,
+        1,
+    )
+    M, K, N = dim
+    computational_graph = MatMul_Simulation.ComputationalGraph(
+        M, N, K, instance.precision
+    )
+
+    vectorized_cycle_count = instance.simulate(
+        computational_graph, mapping, A100_80GB_FP16, bandwidth_config_key
+    )
+
+    assert isinstance(vectorized_cycle_count, int)
+    assert vectorized_cycle_count == _reference_l2_pipeline_cycle_count(
+        instance, mapping, bandwidth_config_key
+    )
+
+
+def _fake_l1_tile_compute_cycle_count(
+    self, M, N, K, precision, mapping, chiplet_module, look_up_table
+):
+    return 5 * M * N * K // 11 + 3 * M + N
+
+
+def _make_device_with_core_count(core_count: int) -> Device:
+    compute_module = A100_80GB_FP16.compute_module
+    return Device(
+        compute_module=ComputeModule(
+            core=compute_module.core,
+            core_count=core_count,
+            clock_freq=compute_module.clock_freq,
+            l2_size=compute_module.l2_size,
+            l2_bandwidth_per_cycle=compute_module.l2_bandwidth_per_cycle,
+        ),
+        io_module=A100_80GB_FP16.io_module,
+        memory_capacity_bytes=A100_80GB_FP16.memory_capacity_bytes,
+    )
+
+
+def _reference_l2_tile_compute_cycle_count(
+    M, N, K, precision, mapping, chiplet_module
+) -> int:
+    # 逐batch重新分配状态矩阵的原始L1记账，用于校验增量实现
+    l1_tile_M, l1_tile_N, l1_tile_K = (
+        mapping.l1_tile_M,
+        mapping.l1_tile_N,
+        mapping.l1_tile_K,
+    )
+    loop_M, loop_N, loop_K = (
+        ceil(M / l1_tile_M),
+        ceil(N / l1_tile_N),
+        ceil(K / l1_tile_K),
+    )
+    effective_vector_flops_per_cycle = (
+        MatMul_Simulation._get_core_vector_flops_per_cycle(
+            chiplet_module, precision.weight_bits
+        )
+    )
+    l2_bandwidth_per_cycle = chiplet_module.compute_module.l2_bandwidth_per_cycle
+    word_size = precision.word_size
+    tile_cache = {}
+
+    def l1_tile(m, n, k):
+        shape = (
+            min(l1_tile_M, M - m * l1_tile_M),
+            min(l1_tile_N, N - n * l1_tile_N),
+            min(l1_tile_K, K - k * l1_tile_K),
+        )
+        if shape not in tile_cache:
+            tile_cache[shape] = MatMul_Simulation.L1TileSimulator(
+                *shape, precision, mapping, chiplet_module, None
+            )
+        return tile_cache[shape]
+
+    M_K_tile_size = np.array(
+        [[l1_tile(m, 0, k).M * l1_tile(m, 0, k).K for k in range(loop_K)] for m in range(loop_M)]
+    )
+    K_N_tile_size = np.array(
+        [[l1_tile(0, n, k).K * l1_tile(0, n, k).N for n in range(loop_N)] for k in range(loop_K)]
+    )
+    M_N_tile_size = np.array(
+        [[l1_tile(m, n, 0).M * l1_tile(m, n, 0).N for n in range(loop_N)] for m in range(loop_M)]
+    )
+
+    total_cycle_count = 0
+    previous_Read_M_K = np.zeros([loop_M, loop_K], dtype=bool)
+    previous_Read_K_N = np.zeros([loop_K, loop_N], dtype=bool)
+    previous_Read_M_N = np.zeros([loop_M, loop_N], dtype=bool)
+    previous_Write_M_N = np.zeros([loop_M, loop_N], dtype=bool)
+    previous_compute_cycle_count = 0
+    active_tiles = []
+    for m, n, k in MatMul_Simulation.generate_tile_loops(
+        loop_M, loop_N, loop_K, mapping.l1_loop_order
+    ):
+        active_tiles.append((m, n, k))
+        is_last = m == loop_M - 1 and n == loop_N - 1 and k == loop_K - 1
+        if not is_last and len(active_tiles) < chiplet_module.compute_module.core_count:
+            continue
+        current_Read_M_K = np.zeros([loop_M, loop_K], dtype=bool)
+        current_Read_K_N = np.zeros([loop_K, loop_N], dtype=bool)
+        current_Read_M_N = np.zeros([loop_M, loop_N], dtype=bool)
+        current_Write_M_N = np.zeros([loop_M, loop_N], dtype=bool)
+        current_compute_cycle_count = 0
+        for temp_m, temp_n, temp_k in active_tiles:
+            current_Read_M_K[temp_m, temp_k] = 1
+            current_Read_K_N[temp_k, temp_n] = 1
+            current_Read_M_N[temp_m, temp_n] = temp_k > 0
+            current_Write_M_N[temp_m, temp_n] = 1
+            tile = l1_tile(temp_m, temp_n, temp_k)
+            tile_cycle_count = tile.compute_cycle_count
+            if temp_k > 0:
+                tile_cycle_count += ceil(
+                    tile.M * tile.N / effective_vector_flops_per_cycle
+                )
+            current_compute_cycle_count = max(
+                current_compute_cycle_count, tile_cycle_count
+            )
+        read_count = (
+            np.sum((current_Read_M_K * ~previous_Read_M_K) * M_K_tile_size)
+            + np.sum((current_Read_K_N * ~previous_Read_K_N) * K_N_tile_size)
+            + np.sum(
+                (current_Read_M_N * ~(previous_Read_M_N + previous_Write_M_N))
+                * M_N_tile_size
+            )
+        )
+        write_count = np.sum((previous_Write_M_N * ~current_Read_M_N) * M_N_tile_size)
+        total_cycle_count += max(
+            ceil(read_count * word_size / l2_bandwidth_per_cycle),
+            previous_compute_cycle_count,
+        ) + ceil(write_count * word_size / l2_bandwidth_per_cycle)
+        previous_compute_cycle_count = current_compute_cycle_count
+        previous_Read_M_K = current_Read_M_K
+        previous_Read_K_N = current_Read_K_N
+        previous_Read_M_N = current_Read_M_N
+        previous_Write_M_N = current_Write_M_N
+        active_tiles = []
+
+    total_cycle_count += previous_compute_cycle_count + ceil(
+        np.sum(previous_Write_M_N * M_N_tile_size)
+        * word_size
+        / l2_bandwidth_per_cycle
+    )
+    return total_cycle_count
+
+
+@pytest.mark.parametrize("l1_loop_order", ["mkn", "mnk", "nkm", "nmk", "knm", "kmn"])
+@pytest.mark.parametrize("core_count", [1, 3, 8, 108])
+@pytest.mark.parametrize(
+    ("l2_tile", "l1_tile"),
+    [
+        ((64, 64, 64), (32, 32, 32)),
+        ((100, 70, 300), (32, 32, 64)),
+        ((256, 128, 512), (64, 32, 32)),
+        ((7, 96, 40), (4, 32, 16)),
+        ((16, 16, 16), (32, 32, 32)),
+    ],
+)
+def test_incremental_l1_batch_accounting_matches_reference(
+    monkeypatch, l1_loop_order, core_count, l2_tile, l1_tile
+):
+    monkeypatch.setattr(
+        MatMul_Simulation.L1TileSimulator,
+        "simulate_l1_tile_compute_cycle_count",
+        _fake_l1_tile_compute_cycle_count,
+    )
+    device = _make_device_with_core_count(core_count)
+    precision = MatMul_Simulation.PrecisionContext(weight_bits=16, word_size=2)
+    mapping = MatMul_Simulation.Mapping(
+        *l2_tile,
+        True,
+        *l1_tile,
+        "mnk",
+        l1_loop_order,
+        1,
+        1,
+        1,
+    )
+    bandwidth_config_key = _build_bandwidth_config_key_or_raise(
+        make_nand_config(),
+        A100_80GB_FP16.io_module.bandwidth,
+    )
+
+    l2_tile_simulator = MatMul_Simulation.L2TileSimulator(
+        *l2_tile,
+        precision,
+        mapping,
+        device,
+        bandwidth_config_key,
+        None,
+    )
+
+    assert l2_tile_simulator.compute_cycle_count == _reference_l2_tile_compute_cycle_count(
+        *l2_tile, precision, mapping, device
+    )
+
+
+def _fake_systolic_array_cycle_count(
+    look_up_table, M, N, K, array_height, array_width, mac_per_clock, dataflow="os"
+):
+    # 按输出折叠数计的确定性代价，代替查表/ScaleSim
+    return ceil(
+        ceil(M / array_height)
+        * ceil(N / array_width)
+        * (K + array_height + array_width)
+        / mac_per_clock
+    )
+
+
+def _make_small_search_device() -> Device:
+    compute_module = A100_80GB_FP16.compute_module
+    return Device(
+        compute_module=ComputeModule(
+            core=Core(
+                vector_unit=compute_module.core.vector_unit,
+                systolic_array=compute_module.core.systolic_array,
+                systolic_array_count=2,
+                SRAM_size=32 * 1024,
+            ),
+            core_count=4,
+            clock_freq=compute_module.clock_freq,
+            l2_size=256 * 1024,
+            l2_bandwidth_per_cycle=compute_module.l2_bandwidth_per_cycle,
+        ),
+        io_module=A100_80GB_FP16.io_module,
+        memory_capacity_bytes=A100_80GB_FP16.memory_capacity_bytes,
+    )
+
+
+@pytest.mark.parametrize("dim", [(8, 64, 96), (12, 48, 40)])
+def test_exhaustive_search_pruning_keeps_best_mapping(monkeypatch, dim):
+    monkeypatch.setattr(
+        MatMul_Simulation,
+        "simulate_systolic_array_cycle_count",
+        staticmethod(_fake_systolic_array_cycle_count),
+    )
+    device = _make_small_search_device()
+    bandwidth_config_key = _build_bandwidth_config_key_or_raise(
+        make_nand_config(), device.io_module.bandwidth
+    )
+    results = {}
+    for is_pruning_enabled in (False, True):
+        monkeypatch.setattr(
+            matmul_module, "ENABLE_EXHAUSTIVE_SEARCH_PRUNING", is_pruning_enabled
+        )
+        results[is_pruning_enabled] = MatMul_Simulation(
+            dim=dim
+        )._build_compile_result(device, bandwidth_config_key, "exhaustive")
+
+    full_result, pruned_result = results[False], results[True]
+    assert pruned_result.best_cycle_count == full_result.best_cycle_count
+    assert vars(pruned_result.best_mapping) == vars(full_result.best_mapping)
+    assert full_result.search_report.pruned_count == 0
+    report = pruned_result.search_report
+    assert report.candidate_count == full_result.search_report.candidate_count
+    assert report.simulated_count + report.pruned_count == report.candidate_count
+    assert report.pruned_count > 0
+
+
+def test_lower_bound_does_not_exceed_simulated_cycle_count(monkeypatch):
+    monkeypatch.setattr(
+        MatMul_Simulation,
+        "simulate_systolic_array_cycle_count",
+        staticmethod(_fake_systolic_array_cycle_count),
+    )
+    device = _make_small_search_device()
+    bandwidth_config_key = _build_bandwidth_config_key_or_raise(
+        make_nand_config(), device.io_module.bandwidth
+    )
+    instance = MatMul_Simulation(dim=(100, 200, 72))
+    for l1_loop_order in ("mnk", "kmn", "nkm"):
+        mapping = MatMul_Simulation.Mapping(
+            64, 64, 64, True, 16, 32, 32, "knm", l1_loop_order, 2, 1, 1
+        )
+        lower_bound = instance.simulate(
+            instance.computational_graph,
+            mapping,
+            device,
+            bandwidth_config_key,
+            is_lower_bound=True,
+        )
+        cycle_count = instance.simulate(
+            instance.computational_graph, mapping, device, bandwidth_config_key
+        )
+        assert 0 < lower_bound <= cycle_count
+
+
+@pytest.mark.parametrize(
+    ("compile_mode", "is_pruning_enabled"),
+    [("exhaustive", True), ("exhaustive", False), ("heuristic-GPU", False)],
+)
+def test_parallel_mapping_search_matches_serial_search(
+    monkeypatch, compile_mode, is_pruning_enabled
+):
+    monkeypatch.setattr(
+        MatMul_Simulation,
+        "simulate_systolic_array_cycle_count",
+        staticmethod(_fake_systolic_array_cycle_count),
+    )
+    monkeypatch.setattr(
+        matmul_module, "ENABLE_EXHAUSTIVE_SEARCH_PRUNING", is_pruning_enabled
+    )
+    monkeypatch.setattr(matmul_module, "MAPPING_SEARCH_CHUNK_SIZE", 97)
+    device = _make_small_search_device()
+    bandwidth_config_key = _build_bandwidth_config_key_or_raise(
+        make_nand_config(), device.io_module.bandwidth
+    )
+    results = {}
+    for worker_count in ("1", "3"):
+        monkeypatch.setenv(matmul_module.MAPPING_SEARCH_WORKERS_ENV_VAR, worker_count)
+        results[worker_count] = MatMul_Simulation(
+            dim=(12, 48, 40)
+        )._build_compile_result(device, bandwidth_config_key, compile_mode)
+
+    serial_result, parallel_result = results["1"], results["3"]
+    assert parallel_result.best_cycle_count == serial_result.best_cycle_count
+    assert vars(parallel_result.best_mapping) == vars(serial_result.best_mapping)
+    assert (
+        parallel_result.search_report.candidate_count
+        == serial_result.search_report.candidate_count
+    )
+
+
+def test_mapping_search_worker_count_must_be_positive(monkeypatch):
+    monkeypatch.setenv(matmul_module.MAPPING_SEARCH_WORKERS_ENV_VAR, "0")
+
+    with pytest.raises(ValueError):
+        matmul_module.get_mapping_search_worker_count()
+
+
+@pytest.mark.parametrize("compile_mode", ["exhaustive", "heuristic-GPU"])
+def test_prewarmed_look_up_table_covers_mapping_search(
+    tmp_path, monkeypatch, compile_mode
+):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(systolic_lut_module, "_look_up_tables", {})
+    monkeypatch.setattr(systolic_lut_module, "_policy", None)
+    monkeypatch.delenv(systolic_lut_module.SYSTOLIC_LUT_POLICY_ENV_VAR, raising=False)
+    monkeypatch.delenv(matmul_module.MAPPING_SEARCH_WORKERS_ENV_VAR, raising=False)
+    simulated_keys = []
+
+    def fake_run_scalesim_gemm(M, N, K, array_height, array_width, dataflow):
+        simulated_keys.append((M, N, K, array_height, array_width, dataflow))
+        cycle_count, util_rate = systolic_lut_module.estimate_systolic_array_cycle_count(
+            M, N, K, array_height, array_width, dataflow
+        )
+        # 与代理估计不同，剪枝搜索查询的形状随补齐的精确值变化
+        return cycle_count + M * K, util_rate
+
+    monkeypatch.setattr(
+        systolic_lut_module, "run_scalesim_gemm", fake_run_scalesim_gemm
+    )
+    device = _make_small_search_device()
+    nand_config = make_nand_config()
+
+    def collect_keys():
+        return MatMul_Simulation(
+            dim=(12, 48, 40)
+        ).collect_systolic_look_up_table_keys(
+            device, nand_config, device.io_module.bandwidth, compile_mode
+        )
+
+    keys = collect_keys()
+    assert keys
+    assert measure_look_up_table_coverage(keys).hit_count == 0
+    assert prewarm_systolic_look_up_tables(keys) == len(simulated_keys)
+    assert len(simulated_keys) <= len(keys)
+    coverage = measure_look_up_table_coverage(keys)
+    assert coverage.hit_count == coverage.shape_count == len(keys)
+    # 与预热脚本一样重复收集，直到收集到的形状全部命中
+    keys = collect_keys()
+    while measure_look_up_table_coverage(keys).miss_count > 0:
+        prewarm_systolic_look_up_tables(keys)
+        keys = collect_keys()
+
+    simulated_keys.clear()
+    MatMul_Simulation(dim=(12, 48, 40))._build_compile_result(
+        device,
+        _build_bandwidth_config_key_or_raise(nand_config, device.io_module.bandwidth),
+        compile_mode,
+    )
+    assert simulated_keys == []
+
+
+@pytest.mark.parametrize(
+    "build_sim",
+    [
+        lambda: FlashAttn_BatchedMatMul_Simulation(
+            dim=(2, 12, 48, 40), matmul_type="QK"
+        ),
+        lambda: FlashAttn_BatchedMatMul_Simulation(
+            dim=(2, 12, 40, 48), matmul_type="SV"
+        ),
+        lambda: FlashMLA_BatchedMatMul_Simulation(
+            qk_latent_dim=(2, 12, 48, 40),
+            qk_rope_dim=(2, 12, 32, 40),
+            sv_latent_dim=(2, 12, 40, 48),
+            softmax_dim=(24, 40),
+        ),
+    ],
+    ids=["flashattn_qk", "flashattn_sv", "flashmla"],
+)
+def test_prewarmed_look_up_table_covers_flash_attention_search(
+    tmp_path, monkeypatch, build_sim
+):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(systolic_lut_module, "_look_up_tables", {})
+    monkeypatch.setattr(systolic_lut_module, "_policy", None)
+    monkeypatch.delenv(systolic_lut_module.SYSTOLIC_LUT_POLICY_ENV_VAR, raising=False)
+    simulated_keys = []
+
+    def fake_run_scalesim_gemm(M, N, K, array_height, array_width, dataflow):
+        simulated_keys.append((M, N, K, array_height, array_width, dataflow))
+        return systolic_lut_module.estimate_systolic_array_cycle_count(
+            M, N, K, array_height, array_width, dataflow
+        )
+
+    monkeypatch.setattr(
+        systolic_lut_module, "run_scalesim_gemm", fake_run_scalesim_gemm
+    )
+    device = _make_small_search_device()
+    nand_config = make_nand_config()
+
+    keys = build_sim().collect_systolic_look_up_table_keys(
+        device, nand_config, device.io_module.bandwidth, "exhaustive"
+    )
+    assert keys
+    assert measure_look_up_table_coverage(keys).hit_count == 0
+    prewarm_systolic_look_up_tables(keys)
+    assert measure_look_up_table_coverage(keys).miss_count == 0
+
+    # flash-attention 的搜索不剪枝，一轮收集后编译不再调用ScaleSim
+    simulated_keys.clear()
+    build_sim().compile_and_simulate(
+        device, nand_config, device.io_module.bandwidth, "exhaustive"
+    )
+    assert simulated_keys == []
+
+
+def test_collected_look_up_table_keys_follow_exhaustive_pruning(
+    tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(systolic_lut_module, "_look_up_tables", {})
+    device = _make_small_search_device()
+    nand_config = make_nand_config()
+
+    def collect_keys(is_pruning_enabled):
+        monkeypatch.setattr(
+            matmul_module, "ENABLE_EXHAUSTIVE_SEARCH_PRUNING", is_pruning_enabled
+        )
+        return MatMul_Simulation(
+            dim=(12, 48, 40)
+        ).collect_systolic_look_up_table_keys(
+            device, nand_config, device.io_module.bandwidth, "exhaustive"
+        )
+
+    pruned_keys = collect_keys(True)
+    unpruned_keys = collect_keys(False)
+
+    assert pruned_keys < unpruned_keys
@@ -0,0 +1,135 @@
+import pytest
+from Desim import SimSession
+
+from nandmachine.commands.macro import MatMulOp, VectorOp
+from nandmachine.simulator.entry_point import run_macro_ops
+from nandmachine.simulator.hardware.analytic import DES_FAST_PATH_ENV_VAR
+from nandmachine.simulator.hardware.memory_bandwidth import MemoryBandwidthArbiter
+from nandmachine.simulator.hardware.xpu import ComputeEngine, xPU
+from test_hw_pipeline_flow import (
+    _build_repeated_matmul_triples,
+    make_config,
+    make_hbm_bandwidth_bytes_per_sec,
+)
+
+
+def _simulate(
+    monkeypatch,
+    memory_arbitration,
+    collapse_repeats=False,
+    prefetch_lookahead_depth=2,
+    repeat_count=6,
+):
+    SimSession.reset()
+    SimSession.init()
+    sim_xpu = xPU(
+        make_config(),
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        collapse_repeats=collapse_repeats,
+        prefetch_lookahead_depth=prefetch_lookahead_depth,
+        memory_arbitration=memory_arbitration,
+    )
+    sim_xpu.load_command(
+        _build_repeated_matmul_triples(repeat_count=repeat_count, num_prefetch_pages=1)
+    )
+    hbf_bandwidth_shares = []
+
+    # matmul 完全受 HBF 带宽限制：分到一半带宽时耗时翻倍
+    def fake_execute_macro_op(macro_op, hbf_bandwidth_share=1.0):
+        hbf_bandwidth_shares.append(hbf_bandwidth_share)
+        return 20.0 / hbf_bandwidth_share if isinstance(macro_op, MatMulOp) else 1.0
+
+    monkeypatch.setattr(sim_xpu.compute_engine, "execute_macro_op", fake_execute_macro_op)
+    SimSession.scheduler.run()
+    final_time_ns = int(SimSession.sim_time.cycle)
+    SimSession.reset()
+    return sim_xpu, final_time_ns, hbf_bandwidth_shares
+
+
+def test_arbiter_splits_bandwidth_only_while_the_other_side_is_busy():
+    arbiter = MemoryBandwidthArbiter("fair")
+    assert arbiter.share("compute", 0) == 1.0
+    # 独占时 10ns 的 NAND 请求，在 compute op 执行期间拉长为 20ns
+    arbiter.reserve("compute", 30, 30)
+    assert arbiter.stretch("nand", 0, 10) == 20
+    assert arbiter.stretch_time_ns == {"compute": 0, "nand": 10}
+    assert arbiter.share("compute", 19) == 0.5
+    assert arbiter.share("compute", 20) == 1.0
+    assert arbiter.share("nand", 30) == 1.0
+
+    priority_arbiter = MemoryBandwidthArbiter("compute_priority")
+    priority_arbiter.reserve("nand", 10, 10)
+    priority_arbiter.reserve("compute", 10, 10)
+    assert priority_arbiter.share("compute", 0) == 0.75
+    assert priority_arbiter.share("nand", 0) == 0.25
+    with pytest.raises(ValueError):
+        MemoryBandwidthArbiter("round_robin")
+
+
+def test_shared_hbf_bandwidth_scales_the_cost_model_nand_config():
+    SimSession.reset()
+    SimSession.init()
+    engine = ComputeEngine(make_config(), hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec())
+
+    assert engine._nand_config_for_hbf_share(1.0) is engine.config
+    half_config = engine._nand_config_for_hbf_share(0.5)
+    assert half_config.tRead == 2 * engine.config.tRead
+    assert half_config.num_plane == engine.config.num_plane
+    assert engine._nand_config_for_hbf_share(0.5) is half_config
+    with pytest.raises(ValueError):
+        engine._nand_config_for_hbf_share(0.0)
+    SimSession.reset()
+
+
+def test_overlapped_prefetches_and_matmuls_stretch_each_other(monkeypatch):
+    _, unshared_time_ns, unshared_shares = _simulate(monkeypatch, memory_arbitration=None)
+    fair_xpu, fair_time_ns, fair_shares = _simulate(monkeypatch, memory_arbitration="fair")
+    priority_xpu, _, priority_shares = _simulate(
+        monkeypatch, memory_arbitration="compute_priority"
+    )
+
+    assert set(unshared_shares) == {1.0}
+    assert 0.5 in fair_shares
+    assert 0.75 in priority_shares
+    assert fair_xpu.memory_arbiter.stretch_time_ns["compute"] > 0
+    assert fair_xpu.memory_arbiter.stretch_time_ns["nand"] > 0
+    assert (
+        priority_xpu.memory_arbiter.stretch_time_ns["compute"]
+        < fair_xpu.memory_arbiter.stretch_time_ns["compute"]
+    )
+    assert fair_time_ns > unshared_time_ns
+
+
+def test_arbitrated_runs_are_not_collapsed(monkeypatch):
+    run_kwargs = dict(memory_arbitration="fair", prefetch_lookahead_depth=1, repeat_count=40)
+    collapsed_xpu, collapsed_time_ns, _ = _simulate(monkeypatch, collapse_repeats=True, **run_kwargs)
+    _, full_time_ns, _ = _simulate(monkeypatch, **run_kwargs)
+
+    assert collapsed_xpu.collapsed_iteration_count == 0
+    assert collapsed_xpu.collapse_fallback_reason == "HBF bandwidth is arbitrated between engines"
+    assert collapsed_time_ns == full_time_ns
+
+
+def test_run_macro_ops_reports_memory_stretch_and_falls_back_to_des(monkeypatch):
+    monkeypatch.setenv(DES_FAST_PATH_ENV_VAR, "auto")
+    result = run_macro_ops(
+        make_config(),
+        [VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)],
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        memory_arbitration="fair",
+    )
+
+    assert not result.used_fast_path
+    assert "bandwidth is arbitrated" in result.fast_path_fallback_reason
+    assert result.compute_memory_stretch_ns == 0
+    assert result.nand_memory_stretch_ns == 0
+
+    SimSession.reset()
+    SimSession.init()
+    with pytest.raises(ValueError):
+        xPU(
+            make_config(),
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+            memory_arbitration="round_robin",
+        )
+    SimSession.reset()
@@ -0,0 +1,201 @@
+import pytest
+from Desim import SimSession
+
+from nandmachine.commands.macro import MatMulOp, SramPrefetch, SramPrefetchRelease, VectorOp
+from nandmachine.config.hardware_config import get_device_or_raise
+from nandmachine.simulator.entry_point import run_macro_ops
+from nandmachine.simulator.hardware.analytic import DES_FAST_PATH_ENV_VAR
+from nandmachine.simulator.hardware.repeat import macro_op_signature
+from nandmachine.simulator.hardware.xpu import ComputeEngine, MultiStreamComputeEngine, xPU
+from test_hw_pipeline_flow import make_config, make_hbm_bandwidth_bytes_per_sec
+
+
+def _vector_ops(count: int, stream: int = 0) -> list[VectorOp]:
+    return [
+        VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16).with_stream(stream)
+        for _ in range(count)
+    ]
+
+
+def _simulate(command_list, monkeypatch, compute_streams: int, collapse_repeats=None):
+    SimSession.reset()
+    SimSession.init()
+    sim_xpu = xPU(
+        make_config(),
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        compute_streams=compute_streams,
+        collapse_repeats=collapse_repeats,
+    )
+    sim_xpu.load_command(command_list)
+    core_counts = []
+
+    # 代价与分到的 core 数成反比，整卡执行一个 op 需要 40ns
+    def fake_execute_macro_op(macro_op, core_count=None):
+        core_counts.append(core_count)
+        total_core_count = sim_xpu.compute_engine.device.compute_module.core_count
+        return 40.0 * total_core_count / (core_count or total_core_count)
+
+    monkeypatch.setattr(sim_xpu.compute_engine, "execute_macro_op", fake_execute_macro_op)
+    SimSession.scheduler.run()
+    final_time_ns = int(SimSession.sim_time.cycle)
+    SimSession.reset()
+    return sim_xpu, final_time_ns, core_counts
+
+
+def test_device_with_core_count_scales_only_the_cores():
+    device = get_device_or_raise("A100_80GB")
+    core_count = device.compute_module.core_count
+    half_device = device.with_core_count(core_count // 2)
+
+    assert half_device.compute_module.core_count == core_count // 2
+    assert half_device.compute_module.get_total_vector_flops_per_cycle(16) == (
+        device.compute_module.core.vector_unit.get_total_vector_flops_per_cycle(16)
+        * (core_count // 2)
+    )
+    assert half_device.compute_module.l2_size == device.compute_module.l2_size
+    assert half_device.io_module is device.io_module
+    assert device.compute_module.core_count == core_count
+    with pytest.raises(ValueError):
+        device.with_core_count(0)
+    with pytest.raises(ValueError):
+        device.with_core_count(core_count + 1)
+
+
+def test_stream_is_macro_op_metadata():
+    vector_op = VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+    assert vector_op.stream == 0
+    assert vector_op.with_stream(1) is vector_op
+    assert vector_op.stream == 1
+    # 不同 stream 上的 op 不会被合并成同一个重复迭代
+    assert macro_op_signature(vector_op) != macro_op_signature(_vector_ops(1)[0])
+    with pytest.raises(ValueError):
+        vector_op.with_stream(-1)
+
+
+def test_partitioned_cost_is_recomputed_for_the_reduced_core_count():
+    SimSession.reset()
+    SimSession.init()
+    engine = ComputeEngine(make_config(), hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec())
+    vector_op = VectorOp(vector_op_type="rms_norm", vector_shape=[64, 8192], weight_bits=16)
+    core_count = engine.device.compute_module.core_count
+
+    full_time_ns = engine.execute_macro_op(vector_op)
+    assert engine.execute_macro_op(vector_op, core_count=core_count) == full_time_ns
+    assert engine.execute_macro_op(vector_op, core_count=core_count // 4) > full_time_ns
+    assert engine._device_for_core_count(core_count // 4) is engine._device_for_core_count(
+        core_count // 4
+    )
+    SimSession.reset()
+
+
+def test_independent_streams_share_the_cores(monkeypatch):
+    single_xpu, single_time_ns, single_core_counts = _simulate(
+        _vector_ops(4), monkeypatch, compute_streams=1
+    )
+    multi_xpu, multi_time_ns, multi_core_counts = _simulate(
+        [*_vector_ops(4, stream=0), *_vector_ops(4, stream=1)], monkeypatch, compute_streams=2
+    )
+
+    core_count = multi_xpu.compute_engine.total_core_count
+    assert single_core_counts == [None] * 4
+    # 两个 stream 同时就绪，各分到一半的 core，每个 op 需要 80ns
+    assert multi_core_counts == [core_count // 2] * 8
+    assert multi_xpu.compute_engine.peak_concurrent_op_count == 2
+    assert multi_xpu.compute_engine.core_wait_time_ns == 0
+    assert multi_xpu.compute_engine.free_core_count == core_count
+    assert single_time_ns == 4 * 41
+    assert multi_time_ns == 4 * 81
+
+
+def test_cores_are_split_again_when_a_dependent_stream_becomes_ready(monkeypatch):
+    first_op, second_op = _vector_ops(2, stream=0)
+    dependent_op = _vector_ops(1, stream=1)[0].with_inputs(first_op)
+    sim_xpu, final_time_ns, core_counts = _simulate(
+        [first_op, second_op, dependent_op], monkeypatch, compute_streams=2
+    )
+
+    core_count = sim_xpu.compute_engine.total_core_count
+    first_slot = sim_xpu.command_slots[first_op.id]
+    second_slot = sim_xpu.command_slots[second_op.id]
+    dependent_slot = sim_xpu.command_slots[dependent_op.id]
+    # 第一个 op 独占整卡；之后两个 stream 同时就绪，平分 core
+    assert core_counts == [core_count, core_count // 2, core_count // 2]
+    assert first_slot.finish_cycle == 41
+    assert second_slot.finish_cycle == dependent_slot.finish_cycle == 41 + 81
+    assert final_time_ns == 41 + 81
+
+
+def test_collapse_falls_back_to_full_simulation_with_multiple_streams(monkeypatch):
+    # stream 0 上的重复迭代与 stream 1 上的 vector op 同时就绪，平分 core
+    command_list = []
+    for _ in range(20):
+        prefetch = SramPrefetch(num_prefetch_pages=4)
+        matmul = MatMulOp(dim=(2, 16, 8), weight_bits=16).with_inputs(prefetch)
+        command_list.extend([prefetch, matmul, SramPrefetchRelease().with_inputs(matmul)])
+    command_list.extend(_vector_ops(12, stream=1))
+    collapsed_xpu, collapsed_time_ns, _ = _simulate(
+        command_list, monkeypatch, compute_streams=2, collapse_repeats=True
+    )
+    full_xpu, full_time_ns, _ = _simulate(
+        command_list, monkeypatch, compute_streams=2, collapse_repeats=False
+    )
+
+    assert collapsed_xpu.collapsed_iteration_count == 0
+    assert collapsed_xpu.collapse_fallback_reason == "compute engine runs multiple streams"
+    assert collapsed_xpu.compute_engine.core_wait_time_ns == (
+        full_xpu.compute_engine.core_wait_time_ns
+    )
+    assert collapsed_time_ns == full_time_ns
+
+
+def test_multi_stream_configuration_is_validated():
+    SimSession.reset()
+    SimSession.init()
+    with pytest.raises(ValueError):
+        xPU(
+            make_config(),
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+            compute_streams=0,
+        )
+    with pytest.raises(ValueError):
+        xPU(
+            make_config(),
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+            compute_streams=2,
+            compute_issue_window=2,
+        )
+
+    sim_xpu = xPU(
+        make_config(),
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        compute_streams=2,
+    )
+    assert isinstance(sim_xpu.compute_engine, MultiStreamComputeEngine)
+    assert sim_xpu.compute_engine.cost_model_kwargs()["num_streams"] == 2
+    with pytest.raises(ValueError):
+        sim_xpu.load_command(_vector_ops(1, stream=2))
+    SimSession.reset()
+
+
+def test_run_macro_ops_with_streams_falls_back_to_des(monkeypatch):
+    monkeypatch.setenv(DES_FAST_PATH_ENV_VAR, "auto")
+    prefetch = SramPrefetch(num_prefetch_pages=4)
+    matmul = MatMulOp(dim=(2, 16, 8), weight_bits=16).with_inputs(prefetch)
+    command_list = [
+        *_vector_ops(1, stream=1),
+        *_vector_ops(1, stream=0),
+        prefetch,
+        matmul,
+        SramPrefetchRelease().with_inputs(matmul),
+    ]
+    result = run_macro_ops(
+        make_config(),
+        command_list,
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        compute_streams=2,
+    )
+
+    assert not result.used_fast_path
+    assert "multiple streams" in result.fast_path_fallback_reason
+    assert result.compute_peak_concurrent_ops == 2
+    assert result.time_ns == int(SimSession.sim_time.cycle)
@@ -0,0 +1,114 @@
+import random
+
+import pytest
+
+from nandmachine.config.config import NandConfig
+from nandmachine.simulator.hardware.nand_timing import NandSimCoreChannel, count_block_erases
+
+
+def make_config(t_transfer: float = 0.0) -> NandConfig:
+    return NandConfig(
+        num_channels=2,
+        num_plane=2,
+        num_block=16,
+        num_pages=256,
+        tRead=10.0,
+        tWrite=100.0,
+        tErase=1000.0,
+        page_size=16,
+        sram_threshold=64,
+        timing_model="channel",
+        tTransfer=t_transfer,
+    )
+
+
+def _reference_finish_times(config: NandConfig, requests: list[tuple[int, float]]) -> list[float]:
+    # 逐 page 的参考实现
+    num_units = config.num_channels * config.num_plane
+    plane_free = {}
+    bus_free = [0.0] * config.num_channels
+    next_unit = 0
+    finish_times = []
+    for access_num_pages, arrive_time in requests:
+        pages_by_channel: dict[int, list[float]] = {}
+        for _ in range(access_num_pages):
+            channel, plane = next_unit % config.num_channels, next_unit // config.num_channels
+            read_done = max(arrive_time, plane_free.get((channel, plane), 0.0)) + config.tRead
+            plane_free[(channel, plane)] = read_done
+            pages_by_channel.setdefault(channel, []).append(read_done)
+            next_unit = (next_unit + 1) % num_units
+
+        finish_time = 0.0
+        for channel, read_done_list in pages_by_channel.items():
+            for read_done in sorted(read_done_list):
+                if config.tTransfer > 0:
+                    bus_free[channel] = max(bus_free[channel], read_done) + config.tTransfer
+                    read_done = bus_free[channel]
+                finish_time = max(finish_time, read_done)
+        finish_times.append(finish_time)
+    return finish_times
+
+
+def test_idle_request_matches_strict_plane_formula():
+    core = NandSimCoreChannel(make_config())
+
+    assert core.handle_request(5, 0.0) == 20.0
+    # 条带从上一个请求结束的 unit 继续，(channel=1, plane=0) 只读过 1 个 page
+    assert core.handle_request(1, 0.0) == 20.0
+    assert core.handle_request(2, 0.0) == 20.0
+    assert core.handle_request(1, 0.0) == 30.0
+
+
+def test_channel_bus_serializes_page_transfers():
+    core = NandSimCoreChannel(make_config(t_transfer=3.0))
+
+    # 每个 channel 的 2 个 page 同时读完，bus 依次传输
+    assert core.handle_request(4, 0.0) == 16.0
+    assert core.handle_request(2, 0.0) == 23.0
+
+
+@pytest.mark.parametrize("t_transfer", [0.0, 3.0, 12.0])
+def test_vectorized_schedule_matches_per_page_reference(t_transfer):
+    config = make_config(t_transfer)
+    core = NandSimCoreChannel(config)
+    rng = random.Random(0)
+    requests = []
+    arrive_time = 0.0
+    for _ in range(50):
+        arrive_time += rng.choice([0.0, 1.0, 7.0, 40.0])
+        requests.append((rng.randint(1, 11), arrive_time))
+
+    assert [
+        core.handle_request(access_num_pages, arrive_time)
+        for access_num_pages, arrive_time in requests
+    ] == _reference_finish_times(config, requests)
+
+    core.reset()
+    assert core.handle_request(4, 0.0) == _reference_finish_times(config, [(4, 0.0)])[0]
+
+
+def test_invalid_requests_raise_value_error():
+    with pytest.raises(ValueError):
+        NandSimCoreChannel(make_config(t_transfer=-1.0))
+    with pytest.raises(ValueError):
+        NandSimCoreChannel(make_config()).handle_request(0, 0.0)
+
+
+def test_block_erases_are_counted_when_a_new_block_is_started():
+    # 仿真开始时正在写入的 block 视为已擦除
+    assert count_block_erases([0, 0, 3, 4, 7], [1, 4, 1, 1, 9], 4).tolist() == [0, 0, 0, 1, 2]
+    assert count_block_erases([5], 0, 4).tolist() == [0]
+
+
+def test_writes_occupy_planes_and_delay_reads():
+    config = make_config()
+    config.num_pages = 2
+    core = NandSimCoreChannel(config)
+
+    # 4 个 plane 各写 1 个 page；再写 4 个 page 时每个 plane 写满 block，第三轮需要先擦除
+    assert core.handle_write(4, 0.0) == 100.0
+    assert core.handle_write(4, 0.0) == 200.0
+    assert core.handle_write(1, 0.0) == 1300.0
+    # 读请求落在正在写入的 plane 上，要等写入完成
+    assert core.handle_request(2, 150.0) == 1310.0
+    assert core.handle_request(2, 150.0) == 210.0
@@ -0,0 +1,139 @@
+import pytest
+from Desim import SimSession
+
+from nandmachine.commands.macro import (
+    AllReduceOp,
+    FlashAttnOp,
+    MatMulOp,
+    SramPrefetch,
+    SramPrefetchRelease,
+    VectorOp,
+)
+from nandmachine.simulator.hardware.op_cost import (
+    OP_COST_WORKERS_ENV_VAR,
+    get_op_cost_worker_count,
+    precompute_op_costs,
+)
+from nandmachine.simulator.hardware.repeat import macro_op_signature
+from nandmachine.simulator.hardware.xpu import xPU
+from test_hw_pipeline_flow import make_config, make_hbm_bandwidth_bytes_per_sec
+
+
+@pytest.fixture(autouse=True)
+def default_op_cost_workers(monkeypatch):
+    monkeypatch.delenv(OP_COST_WORKERS_ENV_VAR, raising=False)
+
+
+class ShapeCostEngine:
+    # 模块级定义，worker 进程可以按名字重建
+    def __init__(self, scale: int = 1):
+        self.scale = scale
+        self.op_cost_table = {}
+
+    def estimate_op_cost(self, macro_op):
+        assert macro_op.input_ops == []
+        m, k, n = macro_op.shape
+        return self.scale * m * k * n
+
+    def cost_model_kwargs(self) -> dict:
+        return dict(scale=self.scale)
+
+
+def _build_program():
+    vector_norm = VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+    command_list = [vector_norm]
+    for n in (8, 8, 16, 8):
+        prefetch = SramPrefetch(num_prefetch_pages=4)
+        matmul = MatMulOp(dim=(2, 16, n), weight_bits=16).with_inputs(prefetch)
+        command_list.extend([prefetch, matmul, SramPrefetchRelease().with_inputs(matmul)])
+    prefetch_attn = SramPrefetch(num_prefetch_pages=2)
+    flash_attn = FlashAttnOp(
+        qk_bmm_shape=(4, 2, 4, 2),
+        sv_bmm_shape=(4, 2, 2, 4),
+        softmax_shape=(2, 2),
+        weight_bits=16,
+    ).with_inputs(prefetch_attn, command_list[-2])
+    command_list.extend([prefetch_attn, flash_attn, SramPrefetchRelease().with_inputs(flash_attn)])
+    command_list.append(
+        AllReduceOp(num_ranks=2, data_size=64, weight_bits=16).with_inputs(flash_attn)
+    )
+    return command_list
+
+
+def test_precompute_deduplicates_ops_across_workers():
+    prefetch = SramPrefetch(num_prefetch_pages=4)
+    macro_ops = [
+        MatMulOp(dim=(2, 4, 8), weight_bits=16).with_inputs(prefetch),
+        MatMulOp(dim=(2, 4, 8), weight_bits=16),
+        MatMulOp(dim=(2, 4, 16), weight_bits=16),
+        MatMulOp(dim=(4, 4, 16), weight_bits=16),
+    ]
+    engine = ShapeCostEngine(scale=3)
+
+    assert precompute_op_costs(engine, macro_ops, max_workers=2) == 3
+    assert engine.op_cost_table == {
+        macro_op_signature(macro_ops[0]): 3 * 64,
+        macro_op_signature(macro_ops[2]): 3 * 128,
+        macro_op_signature(macro_ops[3]): 3 * 256,
+    }
+    # 发给 worker 的是去掉依赖的副本，原 op 不变
+    assert macro_ops[0].input_ops == [prefetch]
+    # 已经在表中的 key 不会重复计算
+    assert precompute_op_costs(engine, macro_ops, max_workers=2) == 0
+    with pytest.raises(ValueError):
+        precompute_op_costs(engine, macro_ops, max_workers=0)
+
+
+def _simulate(command_list, op_cost_workers: int):
+    SimSession.reset()
+    SimSession.init()
+    sim_xpu = xPU(
+        make_config(),
+        hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+        op_cost_workers=op_cost_workers,
+    )
+    sim_xpu.load_command(command_list)
+    compute_table = dict(sim_xpu.compute_engine.op_cost_table)
+    transfer_table = dict(sim_xpu.transfer_engine.op_cost_table)
+    SimSession.scheduler.run()
+    finish_cycles = {
+        macro_op_id: slot.finish_cycle for macro_op_id, slot in sim_xpu.command_slots.items()
+    }
+    SimSession.reset()
+    return compute_table, transfer_table, finish_cycles
+
+
+def test_precomputed_op_costs_match_lazy_evaluation():
+    command_list = _build_program()
+
+    lazy_compute_table, lazy_transfer_table, lazy_finish_cycles = _simulate(
+        command_list, op_cost_workers=1
+    )
+    compute_table, transfer_table, finish_cycles = _simulate(command_list, op_cost_workers=2)
+
+    assert lazy_compute_table == {}
+    assert lazy_transfer_table == {}
+    # 两种 matmul 形状 + 一个 flash attention；vector op 不预计算
+    assert len(compute_table) == 3
+    assert isinstance(compute_table[macro_op_signature(command_list[-3])], tuple)
+    assert list(transfer_table) == [macro_op_signature(command_list[-1])]
+    assert finish_cycles == lazy_finish_cycles
+
+
+def test_op_cost_worker_count_is_validated(monkeypatch):
+    assert get_op_cost_worker_count() == 1
+    monkeypatch.setenv(OP_COST_WORKERS_ENV_VAR, "4")
+    assert get_op_cost_worker_count() == 4
+    monkeypatch.setenv(OP_COST_WORKERS_ENV_VAR, "0")
+    with pytest.raises(ValueError):
+        get_op_cost_worker_count()
+
+    SimSession.reset()
+    SimSession.init()
+    with pytest.raises(ValueError):
+        xPU(
+            make_config(),
+            hbm_bandwidth_bytes_per_sec=make_hbm_bandwidth_bytes_per_sec(),
+            op_cost_workers=0,
+        )
+    SimSession.reset()
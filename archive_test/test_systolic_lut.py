@@ -0,0 +1,324 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+import nandmachine.simulator.software.systolic_lut as systolic_lut_module
+from nandmachine.simulator.software.systolic_lut import (
+    PROJECT_ROOT,
+    SYSTOLIC_LUT_POLICY_ENV_VAR,
+    LookUpTableCoverage,
+    SystolicLookUpTable,
+    SystolicShapeRecorder,
+    calibrate_surrogate_model,
+    compact_look_up_table_file,
+    estimate_systolic_array_cycle_count,
+    get_systolic_lut_policy,
+    measure_look_up_table_coverage,
+    pack_look_up_table_key,
+    prewarm_systolic_look_up_tables,
+    set_systolic_lut_policy,
+)
+
+
+@pytest.fixture(autouse=True)
+def default_lut_policy(monkeypatch):
+    monkeypatch.setattr(systolic_lut_module, "_policy", None)
+    monkeypatch.delenv(SYSTOLIC_LUT_POLICY_ENV_VAR, raising=False)
+
+
+def _write_lines(path, lines):
+    path.write_text("".join(f"{line}\n" for line in lines))
+
+
+def test_look_up_table_keeps_first_duplicate_and_ignores_partial_line(tmp_path):
+    lut_path = tmp_path / "look_up_table_32_32.csv"
+    lut_path.write_text(
+        "32,16,1024,32,32,os,1085,47.189\n"
+        "32,16,1024,32,32,os,9999,1.000\n"
+        "8,32,1024,32,32,os,1085,23.594\n"
+        "64,64,"
+    )
+
+    look_up_table = SystolicLookUpTable(str(lut_path))
+
+    assert len(look_up_table) == 2
+    assert look_up_table.get(32, 16, 1024, 32, 32, "os") == 1085
+    assert look_up_table.get(16, 32, 1024, 32, 32, "os") is None
+
+    with lut_path.open("a") as f:
+        f.write("1024,32,32,os,2048,99.000\n")
+    look_up_table.refresh()
+
+    assert look_up_table.get(64, 64, 1024, 32, 32, "os") == 2048
+
+
+def test_get_or_simulate_shares_entries_between_tables(tmp_path, monkeypatch):
+    lut_path = tmp_path / "look_up_table_32_32.csv"
+    simulated_shapes = []
+
+    def fake_run_scalesim_gemm(M, N, K, array_height, array_width, dataflow):
+        simulated_shapes.append((M, N, K))
+        return M + N + K, 50.0
+
+    monkeypatch.setattr(
+        systolic_lut_module, "run_scalesim_gemm", fake_run_scalesim_gemm
+    )
+    first_worker = SystolicLookUpTable(str(lut_path))
+    second_worker = SystolicLookUpTable(str(lut_path))
+
+    assert first_worker.get_or_simulate(8, 16, 64, 32, 32, "os") == 88
+    assert second_worker.get_or_simulate(8, 16, 64, 32, 32, "os") == 88
+    assert second_worker.get_or_simulate(16, 8, 64, 32, 32, "os") == 88
+    assert simulated_shapes == [(8, 16, 64)]
+    assert lut_path.read_text() == "8,16,64,32,32,os,88,50.000\n"
+
+
+def test_compact_sorts_and_deduplicates(tmp_path):
+    lut_path = tmp_path / "look_up_table_32_32.csv"
+    _write_lines(
+        lut_path,
+        [
+            "64,32,128,32,32,os,300,10.000",
+            "8,32,128,32,32,os,100,20.000",
+            "64,32,128,32,32,os,999,10.000",
+        ],
+    )
+    lut_path.chmod(0o644)
+    reader = SystolicLookUpTable(str(lut_path))
+
+    assert compact_look_up_table_file(str(lut_path)) == 2
+    assert lut_path.read_text().splitlines() == [
+        "8,32,128,32,32,os,100,20.000",
+        "64,32,128,32,32,os,300,10.000",
+    ]
+    assert lut_path.stat().st_mode & 0o777 == 0o644
+
+    with lut_path.open("a") as f:
+        f.write("128,32,128,32,32,os,500,30.000\n")
+    reader.refresh()
+
+    assert len(reader) == 3
+    assert reader.get(64, 32, 128, 32, 32, "os") == 300
+
+
+def test_compact_leaves_shipped_tables_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        systolic_lut_module, "SHIPPED_LOOK_UP_TABLE_DIRS", (str(tmp_path),)
+    )
+    lut_path = tmp_path / "look_up_table_32_32.csv"
+    lines = [
+        "64,32,128,32,32,os,300,10.000",
+        "64,32,128,32,32,os,300,10.000",
+    ]
+    _write_lines(lut_path, lines)
+    look_up_table = SystolicLookUpTable(str(lut_path))
+    look_up_table.compact()
+
+    assert lut_path.read_text().splitlines() == lines
+    assert len(look_up_table) == 1
+
+
+def _simulate_shared_shape(lut_path: str, log_path: str) -> None:
+    def fake_run_scalesim_gemm(M, N, K, array_height, array_width, dataflow):
+        with open(log_path, "a") as f:
+            f.write(f"{M},{N},{K}\n")
+        time.sleep(0.2)
+        return 4242, 75.0
+
+    systolic_lut_module.run_scalesim_gemm = fake_run_scalesim_gemm
+    look_up_table = SystolicLookUpTable(lut_path)
+    assert look_up_table.get_or_simulate(24, 40, 512, 32, 32, "os") == 4242
+
+
+def test_concurrent_misses_run_scalesim_once(tmp_path):
+    lut_path = tmp_path / "look_up_table_32_32.csv"
+    log_path = tmp_path / "scalesim_calls.log"
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(
+            target=_simulate_shared_shape, args=(str(lut_path), str(log_path))
+        )
+        for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    assert log_path.read_text().splitlines() == ["24,40,512"]
+    assert lut_path.read_text().splitlines() == ["24,40,512,32,32,os,4242,75.000"]
+
+
+def test_verify_thread_and_caller_miss_on_the_same_shape_once(tmp_path, monkeypatch):
+    lut_path = tmp_path / "look_up_table_32_32.csv"
+    simulated_shapes = []
+
+    def fake_run_scalesim_gemm(M, N, K, array_height, array_width, dataflow):
+        simulated_shapes.append((M, N, K))
+        time.sleep(0.2)
+        return 4242, 75.0
+
+    monkeypatch.setattr(
+        systolic_lut_module, "run_scalesim_gemm", fake_run_scalesim_gemm
+    )
+    look_up_table = SystolicLookUpTable(str(lut_path))
+    # fcntl 锁对同一进程的线程不互斥，这里模拟后台核对线程与调用方同时未命中
+    verify_thread = threading.Thread(
+        target=look_up_table._get_or_run_scalesim, args=((24, 40, 512, 32, 32, "os"),)
+    )
+    verify_thread.start()
+    time.sleep(0.05)
+    assert look_up_table.get_or_simulate(40, 24, 512, 32, 32, "os") == 4242
+    verify_thread.join()
+
+    assert simulated_shapes == [(24, 40, 512)]
+    assert look_up_table.simulate_count == 1
+    assert lut_path.read_text().splitlines() == ["24,40,512,32,32,os,4242,75.000"]
+
+
+def test_packed_keys_are_distinct_and_bounded():
+    base_key = pack_look_up_table_key(32, 16, 1024, 32, 32, "os")
+
+    assert base_key == pack_look_up_table_key(32, 16, 1024, 32, 32, "os")
+    assert base_key != pack_look_up_table_key(16, 32, 1024, 32, 32, "os")
+    assert base_key != pack_look_up_table_key(32, 16, 1024, 32, 32, "ws")
+    assert base_key != pack_look_up_table_key(32, 16, 1024, 16, 64, "os")
+    with pytest.raises(ValueError):
+        pack_look_up_table_key(1 << 32, 16, 1024, 32, 32, "os")
+
+
+def test_lookup_resolves_transposed_entry(tmp_path):
+    lut_path = tmp_path / "look_up_table_32_32.csv"
+    _write_lines(lut_path, ["8,32,1024,32,32,os,1085,23.594"])
+    look_up_table = SystolicLookUpTable(str(lut_path))
+
+    assert look_up_table.lookup(8, 32, 1024, 32, 32, "os") == 1085
+    assert look_up_table.lookup(32, 8, 1024, 32, 32, "os") == 1085
+    assert look_up_table.get(32, 8, 1024, 32, 32, "os") is None
+    assert look_up_table.lookup(32, 8, 2048, 32, 32, "os") is None
+    assert len(look_up_table) == 1
+
+
+def test_shape_recorder_answers_hits_from_look_up_table(tmp_path):
+    lut_path = tmp_path / "look_up_table_32_32.csv"
+    _write_lines(lut_path, ["8,32,1024,32,32,os,1085,23.594"])
+    recorder = SystolicShapeRecorder(SystolicLookUpTable(str(lut_path)))
+
+    assert recorder.lookup(32, 8, 1024, 32, 32, "os") == 1085
+    assert recorder.lookup(16, 16, 64, 32, 32, "os") is None
+    assert recorder.get_or_simulate(16, 16, 64, 32, 32, "os") == (
+        estimate_systolic_array_cycle_count(16, 16, 64, 32, 32, "os")[0]
+    )
+    assert recorder.keys == {
+        (32, 8, 1024, 32, 32, "os"),
+        (16, 16, 64, 32, 32, "os"),
+    }
+    assert SystolicShapeRecorder().lookup(32, 8, 1024, 32, 32, "os") is None
+
+
+def test_surrogate_model_reproduces_shipped_look_up_table():
+    calibration = calibrate_surrogate_model(
+        os.path.join(PROJECT_ROOT, "systolic_array_model", "look_up_table_32_32.csv")
+    )
+
+    assert calibration.shape_count == 797
+    assert calibration.exact_match_count == calibration.shape_count
+    assert calibration.max_relative_error == 0.0
+    assert estimate_systolic_array_cycle_count(32, 16, 1024, 32, 32, "os") == (
+        1085,
+        pytest.approx(47.189, abs=1e-3),
+    )
+
+
+def test_lut_policy_is_validated(monkeypatch):
+    assert get_systolic_lut_policy() == "exact"
+    monkeypatch.setenv(SYSTOLIC_LUT_POLICY_ENV_VAR, "surrogate")
+    assert get_systolic_lut_policy() == "surrogate"
+    set_systolic_lut_policy("surrogate-verify")
+    assert get_systolic_lut_policy() == "surrogate-verify"
+
+    with pytest.raises(ValueError):
+        set_systolic_lut_policy("fast")
+    set_systolic_lut_policy(None)
+    monkeypatch.setenv(SYSTOLIC_LUT_POLICY_ENV_VAR, "fast")
+    with pytest.raises(ValueError):
+        get_systolic_lut_policy()
+
+
+def test_surrogate_policy_skips_scalesim(tmp_path, monkeypatch):
+    lut_path = tmp_path / "look_up_table_32_32.csv"
+    _write_lines(lut_path, ["8,32,1024,32,32,os,1,1.000"])
+
+    def fail_run_scalesim_gemm(*args):
+        raise AssertionError("surrogate policy must not run ScaleSim")
+
+    monkeypatch.setattr(
+        systolic_lut_module, "run_scalesim_gemm", fail_run_scalesim_gemm
+    )
+    set_systolic_lut_policy("surrogate")
+    look_up_table = SystolicLookUpTable(str(lut_path))
+
+    assert look_up_table.get_or_simulate(32, 8, 1024, 32, 32, "os") == 1
+    assert look_up_table.get_or_simulate(24, 40, 512, 32, 32, "os") == 1147
+    assert look_up_table.surrogate_count == 1
+    assert lut_path.read_text() == "8,32,1024,32,32,os,1,1.000\n"
+
+
+def test_surrogate_verify_policy_records_scalesim_result(tmp_path, monkeypatch):
+    lut_path = tmp_path / "look_up_table_32_32.csv"
+
+    def fake_run_scalesim_gemm(M, N, K, array_height, array_width, dataflow):
+        return 1200, 40.0
+
+    monkeypatch.setattr(
+        systolic_lut_module, "run_scalesim_gemm", fake_run_scalesim_gemm
+    )
+    set_systolic_lut_policy("surrogate-verify")
+    look_up_table = SystolicLookUpTable(str(lut_path))
+
+    assert look_up_table.get_or_simulate(24, 40, 512, 32, 32, "os") == 1147
+    look_up_table.wait_for_verification()
+
+    assert look_up_table.verify_count == 1
+    assert look_up_table.verify_mismatch_count == 1
+    assert look_up_table.max_verify_relative_error == pytest.approx(53 / 1200)
+    assert look_up_table.get_or_simulate(24, 40, 512, 32, 32, "os") == 1200
+    assert lut_path.read_text() == "24,40,512,32,32,os,1200,40.000\n"
+
+
+def test_prewarm_fills_missing_shapes_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(systolic_lut_module, "_look_up_tables", {})
+    lut_path = tmp_path / "systolic_array_model" / "look_up_table_32_32.csv"
+    lut_path.parent.mkdir()
+    _write_lines(lut_path, ["8,32,1024,32,32,os,1085,23.594"])
+
+    def fake_run_scalesim_gemm(M, N, K, array_height, array_width, dataflow):
+        return M + N + K, 50.0
+
+    monkeypatch.setattr(
+        systolic_lut_module, "run_scalesim_gemm", fake_run_scalesim_gemm
+    )
+    keys = [
+        (32, 8, 1024, 32, 32, "os"),
+        (24, 40, 512, 32, 32, "os"),
+        (40, 24, 512, 32, 32, "os"),
+        (16, 16, 64, 32, 32, "os"),
+    ]
+
+    assert measure_look_up_table_coverage(keys) == LookUpTableCoverage(
+        shape_count=4, hit_count=1, miss_count=3
+    )
+    assert prewarm_systolic_look_up_tables(keys, max_workers=2) == 2
+    assert measure_look_up_table_coverage(keys).miss_count == 0
+    assert lut_path.read_text().splitlines() == [
+        "8,32,1024,32,32,os,1085,23.594",
+        "16,16,64,32,32,os,96,50.000",
+        "24,40,512,32,32,os,576,50.000",
+    ]
+    with pytest.raises(ValueError):
+        prewarm_systolic_look_up_tables(keys, max_workers=0)
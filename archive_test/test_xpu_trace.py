@@ -1,3 +1,4 @@
+import gzip
 import json
 
 import pytest
@@ -6,6 +7,13 @@ from Desim import SimSession, SimTime
 from nandmachine.commands.macro import All2AllOp, SramPrefetch, VectorOp
 from nandmachine.config.config import NandConfig
 from nandmachine.config.hardware_config import get_device_or_raise
+from nandmachine.simulator.hardware.trace_writer import (
+    TRACE_LEVEL_ENV_VAR,
+    OpTraceStats,
+    StreamingTraceWriter,
+    TraceAggregator,
+    iter_trace_events,
+)
 from nandmachine.simulator.hardware.vallina_xpu import VallinaXPU
 from nandmachine.simulator.hardware.xpu import xPU
 
@@ -140,3 +148,202 @@ def test_vallina_xpu_trace_uses_same_save_interface(tmp_path, monkeypatch):
     assert output_path.exists()
 
     SimSession.reset()
+
+
+def test_streaming_trace_writer_flushes_chunks_and_keeps_only_counters(tmp_path):
+    trace_path = tmp_path / "stream_trace.json"
+    writer = StreamingTraceWriter(str(trace_path), ns_per_cycle=1.0, chunk_size=2)
+    module = writer.register_module("xPU:0")
+    track = writer.register_track("compute_engine", module)
+    assert writer.flushed_event_count == 2
+
+    for start_cycle in range(0, 15, 3):
+        writer.complete_event(
+            track, start_ts=float(start_cycle), end_ts=float(start_cycle + 3), name="op", category="compute"
+        )
+    # 最多只有 chunk_size - 1 条事件留在内存中
+    assert writer.flushed_event_count == 6
+    assert len(writer._chunk) == 1
+    assert writer.event_count == 7
+    assert writer.complete_event_count == 5
+    assert writer.complete_event_count_by_category == {"compute": 5}
+
+    moved_path = tmp_path / "moved" / "stream_trace.json"
+    moved_path.parent.mkdir()
+    writer.save(str(moved_path))
+    assert writer.closed and not trace_path.exists()
+    with pytest.raises(RuntimeError):
+        writer.complete_event(track, start_ts=0.0, end_ts=1.0, name="op", category="compute")
+
+    with moved_path.open("r", encoding="utf-8") as fh:
+        trace_doc = json.load(fh)
+    assert trace_doc["displayTimeUnit"] == "ns"
+    assert trace_doc["traceEvents"] == list(iter_trace_events(str(moved_path)))
+    complete_events = [event for event in trace_doc["traceEvents"] if event["ph"] == "X"]
+    assert [event["ts"] for event in complete_events] == [
+        pytest.approx(0.003 * index) for index in range(5)
+    ]
+    assert [event["dur"] for event in complete_events] == [pytest.approx(0.003)] * 5
+    assert {event["tid"] for event in complete_events} == {track.tid}
+
+    with pytest.raises(ValueError):
+        StreamingTraceWriter(str(tmp_path / "bad.json"), chunk_size=0)
+
+
+def test_xpu_streams_gzip_trace_during_simulation(tmp_path, monkeypatch):
+    SimSession.reset()
+    SimSession.init()
+
+    vector_norm = VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+    prefetch = SramPrefetch(num_prefetch_pages=2).with_inputs(vector_norm)
+    transfer = All2AllOp(num_gpus=4, data_size=128, weight_bits=16).with_inputs(prefetch)
+
+    trace_path = tmp_path / "xpu_trace.json.gz"
+    sim_xpu = xPU(
+        make_config(),
+        hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec(),
+        enable_trace=True,
+        trace_stream_path=str(trace_path),
+        skip_first_prefetch=False,
+    )
+    assert isinstance(sim_xpu.tracer, StreamingTraceWriter)
+    sim_xpu.load_command([vector_norm, prefetch, transfer])
+
+    monkeypatch.setattr(sim_xpu.compute_engine, "execute_macro_op", lambda macro_op: 3.0)
+    monkeypatch.setattr(sim_xpu.transfer_engine, "execute_macro_op", lambda macro_op: 5.0)
+
+    def fake_handle_request(request_slot):
+        request_slot.is_finished = True
+        request_slot.finish_event.notify(SimTime(4))
+
+    monkeypatch.setattr(sim_xpu.nand_controller, "handle_request", fake_handle_request)
+
+    SimSession.scheduler.run()
+
+    assert sim_xpu.save_trace_file(str(trace_path)) == str(trace_path)
+    with gzip.open(trace_path, "rt", encoding="utf-8") as fh:
+        trace_doc = json.load(fh)
+    events = trace_doc["traceEvents"]
+    assert len(events) == sim_xpu.tracer.event_count
+    assert {
+        event["args"]["name"] for event in events if event["ph"] == "M" and event["name"] == "thread_name"
+    } == {"prefetch_engine", "compute_engine", "transfer_engine"}
+    complete_events = [event for event in events if event["ph"] == "X"]
+    assert [event["cat"] for event in complete_events] == ["compute", "prefetch", "transfer"]
+    assert sim_xpu.tracer.complete_event_count == 3
+
+    with pytest.raises(ValueError):
+        xPU(
+            make_config(),
+            hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec(),
+            trace_stream_path=str(tmp_path / "disabled_trace.json"),
+        )
+
+    SimSession.reset()
+
+
+def test_op_trace_stats_buckets_per_op_latency_on_a_log2_scale():
+    stats = OpTraceStats()
+    stats.add(3.0)
+    stats.add(5.0)
+    # 合并的 4 次迭代共 24ns，按单次 6ns 计入
+    stats.add(24.0, repeat_count=4)
+
+    assert stats.to_dict() == {
+        "count": 6,
+        "total_ns": 32.0,
+        "mean_ns": pytest.approx(32.0 / 6),
+        "min_ns": 3.0,
+        "max_ns": 6.0,
+        "histogram_ns": {"[2, 4)": 1, "[4, 8)": 5},
+    }
+
+
+def test_xpu_aggregate_trace_level_summarizes_ops_without_events(tmp_path, monkeypatch):
+    SimSession.reset()
+    SimSession.init()
+
+    first_norm = VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+    second_norm = VectorOp(vector_op_type="rms_norm", vector_shape=[2, 16], weight_bits=16)
+    act = VectorOp(vector_op_type="silu_mul", vector_shape=[2, 8], weight_bits=16)
+    prefetch = SramPrefetch(num_prefetch_pages=2).with_inputs(act)
+    transfer = All2AllOp(num_gpus=4, data_size=128, weight_bits=16).with_inputs(prefetch)
+
+    monkeypatch.setenv(TRACE_LEVEL_ENV_VAR, "aggregate")
+    sim_xpu = xPU(
+        make_config(),
+        hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec(),
+        enable_trace=True,
+        skip_first_prefetch=False,
+    )
+    assert sim_xpu.trace_level == "aggregate"
+    assert isinstance(sim_xpu.tracer, TraceAggregator)
+    sim_xpu.load_command([first_norm, second_norm, act, prefetch, transfer])
+
+    monkeypatch.setattr(
+        sim_xpu.compute_engine,
+        "execute_macro_op",
+        lambda macro_op: 3.0 if macro_op.vector_op_type == "rms_norm" else 9.0,
+    )
+    monkeypatch.setattr(sim_xpu.transfer_engine, "execute_macro_op", lambda macro_op: 5.0)
+
+    def fake_handle_request(request_slot):
+        request_slot.is_finished = True
+        request_slot.finish_event.notify(SimTime(4))
+
+    monkeypatch.setattr(sim_xpu.nand_controller, "handle_request", fake_handle_request)
+
+    SimSession.scheduler.run()
+
+    summary = sim_xpu.tracer.summary()
+    assert summary["complete_event_count"] == 5
+    assert summary["engines"] == {
+        "prefetch_engine": {"busy_time_ns": 4.0, "op_count": 1},
+        "compute_engine": {"busy_time_ns": 15.0, "op_count": 3},
+        "transfer_engine": {"busy_time_ns": 5.0, "op_count": 1},
+    }
+    compute_ops = [op for op in summary["ops"] if op["engine"] == "compute_engine"]
+    # 同形状的两个 rms_norm 合为一项；按总耗时从大到小排列
+    assert [(op["op_class"], op["shape"], op["count"]) for op in compute_ops] == [
+        ("VectorOp", "Vector[type=silu_mul,shape=2x8,bits=16]", 1),
+        ("VectorOp", "Vector[type=rms_norm,shape=2x16,bits=16]", 2),
+    ]
+    assert compute_ops[1]["histogram_ns"] == {"[2, 4)": 2}
+
+    summary_path = tmp_path / "trace_summary.json"
+    assert sim_xpu.save_trace_file(str(summary_path)) == str(summary_path)
+    with summary_path.open("r", encoding="utf-8") as fh:
+        assert json.load(fh) == json.loads(json.dumps(summary))
+
+    SimSession.reset()
+
+
+def test_trace_level_is_validated(tmp_path, monkeypatch):
+    SimSession.reset()
+    SimSession.init()
+
+    def make_xpu(**kwargs):
+        return xPU(make_config(), hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec(), **kwargs)
+
+    with pytest.raises(ValueError):
+        make_xpu(enable_trace=True, trace_level="histogram")
+    with pytest.raises(ValueError):
+        make_xpu(trace_level="aggregate")
+    with pytest.raises(ValueError):
+        make_xpu(
+            enable_trace=True,
+            trace_level="aggregate",
+            trace_stream_path=str(tmp_path / "aggregate_trace.json"),
+        )
+
+    # 环境变量只在打开 trace 时生效
+    monkeypatch.setenv(TRACE_LEVEL_ENV_VAR, "aggregate")
+    assert make_xpu().tracer is None
+    monkeypatch.setenv(TRACE_LEVEL_ENV_VAR, "histogram")
+    with pytest.raises(ValueError):
+        make_xpu(enable_trace=True)
+    assert isinstance(
+        make_xpu(enable_trace=True, trace_level="aggregate").tracer, TraceAggregator
+    )
+
+    SimSession.reset()
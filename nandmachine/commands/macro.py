@@ -15,6 +15,8 @@ LogicAddr: TypeAlias = int
 class MacroOp:
     id: int = field(init=False)
     input_ops: list[MacroOp] = field(default_factory=list, init=False)
+    # 多 stream compute engine 上执行该 op 的 stream，单 stream 时忽略
+    stream: int = field(default=0, init=False)
 
     _global_id_counter: ClassVar[int] = 0
 
@@ -23,6 +25,15 @@ class MacroOp:
         MacroOp._global_id_counter += 1
         return MacroOp._global_id_counter
 
+    @classmethod
+    def reserve_ids(cls, count: int) -> int:
+        # 为不构造 MacroOp 对象的 op（例如 CompactProgram.tile 的副本）预留连续的 id，返回第一个 id
+        if count < 0:
+            raise ValueError(f"count must be >= 0, got {count}")
+        first_id = MacroOp._global_id_counter + 1
+        MacroOp._global_id_counter += count
+        return first_id
+
     def __post_init__(self) -> None:
         self.id = self._next_id()
 
@@ -34,6 +45,12 @@ class MacroOp:
         self.input_ops.extend(ops)
         return self
 
+    def with_stream(self, stream: int) -> MacroOp:
+        if stream < 0:
+            raise ValueError(f"stream must be >= 0, got {stream}")
+        self.stream = stream
+        return self
+
 @dataclass
 class RuntimeCall(MacroOp):
     pass
@@ -51,6 +68,13 @@ class SramPrefetch(RuntimeCall):
 class SramPrefetchRelease(RuntimeCall):
     pass
 
+
+# -------- Write Operations -----------
+
+@dataclass
+class KVCacheAppend(RuntimeCall):
+    num_write_pages: int # decode 每一步新生成的 KV 写回 HBF 占用的 page 数
+
 # -------- Compute Operations ---------
 @dataclass
 class MatMulOp(MacroOp):
@@ -200,6 +224,7 @@ __all__ = [
     "RuntimeCall",
     "SramPrefetch",
     "SramPrefetchRelease",
+    "KVCacheAppend",
     "MatMulOp",
     "FlashAttnOp",
     "FlashMLAOp",
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import copy
+
 
 class VectorUnit:
     def __init__(
@@ -98,6 +100,20 @@ class ComputeModule:
             )
         return self.total_vector_flops_per_cycle_by_weight_bits[weight_bits]
 
+    def with_core_count(self, core_count: int) -> ComputeModule:
+        # 只缩放 core 数，L2 与时钟仍按整卡共享
+        if not 0 < core_count <= self.core_count:
+            raise ValueError(
+                f"core_count must be in [1, {self.core_count}], got {core_count}"
+            )
+        return ComputeModule(
+            core=self.core,
+            core_count=core_count,
+            clock_freq=self.clock_freq,
+            l2_size=self.l2_size,
+            l2_bandwidth_per_cycle=self.l2_bandwidth_per_cycle,
+        )
+
 
 class IOModule:
     def __init__(
@@ -178,3 +194,9 @@ class Device:
 
         # Keep the legacy field as an alias of total memory capacity.
         self.memory_capacity_bytes = self.total_memory_capacity_bytes
+
+    def with_core_count(self, core_count: int) -> Device:
+        # 多 stream 并发时，一个 op 只分到部分 core；内存与 IO 配置不变
+        partitioned_device = copy.copy(self)
+        partitioned_device.compute_module = self.compute_module.with_core_count(core_count)
+        return partitioned_device
@@ -24,6 +24,13 @@ class NandConfig(MemoryConfig):
 
     enable_strict:bool = False 
 
+    # DES 中 NAND 的时序模型："simple" 按 plane 数平均分摊；"channel" 按 (channel, plane) 条带化并建模 channel bus
+    timing_model:str = "simple"
+    tTransfer: float = 0.0 # ns, 一个 page 经 channel bus 传到 base die 的时间，仅 "channel" 模型使用
+
+    # decode 时 attention kernel 是否把每一步新增的 KV 写回 HBF
+    enable_kv_append_write:bool = False
+
     @property
     def page_size_bytes(self) -> int:
         """Page size in bytes."""
@@ -8,7 +8,12 @@ import logging
 import torch.fx as fx
 from torch.fx import GraphModule
 
-from nandmachine.commands.macro import MacroOp, SramPrefetch, SramPrefetchRelease
+from nandmachine.commands.macro import (
+    KVCacheAppend,
+    MacroOp,
+    SramPrefetch,
+    SramPrefetchRelease,
+)
 from nandmachine.frontend.core.graph.base import NxGraphMeta
 from nandmachine.frontend.core.passes.base import GraphPass
 
@@ -39,7 +44,9 @@ class CodeGenPass(GraphPass):
             node.meta['marco_op_list'] = copy.deepcopy(validated_ops)
             # 打补丁，解决 all reduce 的问题
             last_non_release_op = lambda ops: next(
-                op for op in reversed(ops) if not isinstance(op, SramPrefetchRelease)
+                op
+                for op in reversed(ops)
+                if not isinstance(op, (SramPrefetchRelease, KVCacheAppend))
             )
             first_non_prefetch_op = lambda ops: next(
                 op for op in ops if not isinstance(op, SramPrefetch)
@@ -10,6 +10,7 @@ import torch.nn.functional as F
 from nandmachine.commands.macro import (
     All2AllOp,
     AllReduceOp,
+    KVCacheAppend,
     MacroOp,
     MatMulOp,
     SramPrefetch,
@@ -318,7 +319,9 @@ class Attention(HookModuleBase):
         backend = get_kernel_backend(graph_meta)
 
         if backend == "nand":
-            return GQANandKernel.lowering(*params)
+            return GQANandKernel.lowering(
+                *params, kv_append_bytes=self._kv_append_bytes(graph_meta)
+            )
         if backend == "hbm":
             return GQAHBMKernel.lowering(*params)
         raise AssertionError(f"Unhandled memory_backend: {backend}")
@@ -327,6 +330,16 @@ class Attention(HookModuleBase):
 
 
 
+    def _kv_append_bytes(self, graph_meta: NxGraphMeta) -> int:
+        # 打开 enable_kv_append_write 时，decode 每一步把新 token 的 KV 写回 HBF
+        if not graph_meta.nand_config.enable_kv_append_write:
+            return 0
+        per_token_kv_value_count = self.local_num_kv_heads * self.head_dim * 2
+        per_token_kv_bytes = ceil_div(
+            per_token_kv_value_count * graph_meta.inference_config.kv_cache_bits, 8
+        )
+        return graph_meta.batch_size * per_token_kv_bytes
+
     def build_gqa_kernel_param(self,graph_meta:NxGraphMeta):
         model_config = graph_meta.model_config
         inference_config = graph_meta.inference_config
@@ -510,7 +523,9 @@ class MLAAttention(HookModuleBase):
         )
         backend = get_kernel_backend(graph_meta)
         if backend == "nand":
-            kernel_macro_ops = MLANandKernel.lowering(*kernel_params)
+            kernel_macro_ops = MLANandKernel.lowering(
+                *kernel_params, kv_append_bytes=self._kv_append_bytes(graph_meta)
+            )
         elif backend == "hbm":
             kernel_macro_ops = MLAHBMKernel.lowering(*kernel_params)
         else:
@@ -523,7 +538,7 @@ class MLAAttention(HookModuleBase):
             (
                 macro_op
                 for macro_op in reversed(kernel_macro_ops)
-                if not isinstance(macro_op, SramPrefetchRelease)
+                if not isinstance(macro_op, (SramPrefetchRelease, KVCacheAppend))
             ),
             None,
         )
@@ -541,6 +556,16 @@ class MLAAttention(HookModuleBase):
 
         return [absorb_matmul, *kernel_macro_ops, up_proj_matmul]
 
+    def _kv_append_bytes(self, graph_meta: NxGraphMeta) -> int:
+        if not graph_meta.nand_config.enable_kv_append_write:
+            return 0
+        per_token_kv_bytes = ceil_div(
+            (self.kv_lora_rank + self.qk_rope_head_dim)
+            * graph_meta.inference_config.kv_cache_bits,
+            8,
+        )
+        return graph_meta.batch_size * per_token_kv_bytes
+
     def build_mla_kernel_param(self, graph_meta: NxGraphMeta):
         model_config = graph_meta.model_config
         inference_config = graph_meta.inference_config
@@ -841,7 +866,9 @@ class FusedMoE(HookModuleBase):
             macro_op_list.append(op)
 
         last_non_release_op = lambda ops: next(
-            op for op in reversed(ops) if not isinstance(op, SramPrefetchRelease)
+            op
+            for op in reversed(ops)
+            if not isinstance(op, (SramPrefetchRelease, KVCacheAppend))
         )
         first_non_prefetch_op = lambda ops: next(
             op for op in ops if not isinstance(op, SramPrefetch)
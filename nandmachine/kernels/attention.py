@@ -7,6 +7,7 @@ import torch.fx as fx
 from nandmachine.commands.macro import (
     FlashAttnOp,
     FlashMLAOp,
+    KVCacheAppend,
     MacroOp,
     SramPrefetch,
     SramPrefetchRelease,
@@ -15,6 +16,31 @@ from nandmachine.config.config import NandConfig
 from nandmachine.kernels.base import HBMKernelBase, NandKernelBase
 
 
+def _append_kv_cache_write(
+    macro_op_list: list[MacroOp],
+    kv_append_bytes: int,
+    nand_config: NandConfig,
+) -> None:
+    # 新 token 的 KV 在 attention 开始时已经就绪，写回与剩余的 KV 读取重叠；
+    # 写入不阻塞后续计算，只占用 NAND plane
+    if kv_append_bytes < 0:
+        raise ValueError(f"kv_append_bytes must be >= 0, got {kv_append_bytes}")
+    if kv_append_bytes == 0:
+        return
+    first_compute_op = next(
+        (
+            macro_op
+            for macro_op in macro_op_list
+            if not isinstance(macro_op, (SramPrefetch, SramPrefetchRelease))
+        ),
+        None,
+    )
+    if first_compute_op is None:
+        raise ValueError("KV cache append requires at least one attention compute op")
+    num_write_pages = math.ceil(kv_append_bytes / nand_config.page_size_bytes)
+    macro_op_list.append(KVCacheAppend(num_write_pages).with_inputs(first_compute_op))
+
+
 class GQANandKernel(NandKernelBase):
     def __int__(self):
         super().__init__()
@@ -32,7 +58,9 @@ class GQANandKernel(NandKernelBase):
 
             kv_cache_bits:int,
             input_bits:int,
-            nand_config:NandConfig
+            nand_config:NandConfig,
+
+            kv_append_bytes:int = 0, # decode 每一步新增的 KV bytes，> 0 时写回 HBF
 
     )->list[MacroOp]:
 
@@ -71,7 +99,8 @@ class GQANandKernel(NandKernelBase):
                 flash_attn,
                 sram_release,
             ])
-        
+
+        _append_kv_cache_write(macro_op_list, kv_append_bytes, nand_config)
         return macro_op_list
         
 
@@ -190,6 +219,7 @@ class MLANandKernel(NandKernelBase):
         kv_cache_bits: int,
         input_bits: int,
         nand_config: NandConfig,
+        kv_append_bytes: int = 0,
     ) -> list[MacroOp]:
         del input_bits
 
@@ -291,4 +321,5 @@ class MLANandKernel(NandKernelBase):
             sram_release = SramPrefetchRelease().with_inputs(flash_mla)
             macro_op_list.extend([sram_prefetch, flash_mla, sram_release])
 
+        _append_kv_cache_write(macro_op_list, kv_append_bytes, nand_config)
         return macro_op_list
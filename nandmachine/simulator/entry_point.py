@@ -2,8 +2,9 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from math import ceil
-from typing import Literal
+from typing import Literal, Sequence
 
+import numpy as np
 from Desim import SimSession
 
 from nandmachine.commands.macro import MacroOp
@@ -13,14 +14,37 @@ from nandmachine.config.hardware_config import get_device_or_raise
 from nandmachine.config.inference_config import InferenceConfig
 from nandmachine.config.model_config import ModelConfigBase
 from nandmachine.frontend.utlis import build_kv_cache_state
+from nandmachine.simulator.hardware.analytic import FastPathResult, run_analytic_fast_path
+from nandmachine.simulator.hardware.collective import CollectiveBarrier
+from nandmachine.simulator.hardware.program import CompactProgram
 from nandmachine.simulator.hardware.vallina_xpu import VallinaXPU
-from nandmachine.simulator.hardware.xpu import xPU
+from nandmachine.simulator.hardware.xpu import TRANSFER_OP_TYPES, xPU
 
 
 @dataclass(frozen=True)
 class MacroSimResult:
     cycle: int
     time_ns: int
+    # 只有 default xPU 统计 SRAM 占用
+    sram_peak_pages: int = 0
+    sram_stall_time_ns: int = 0
+    # compute engine 越过更老的未就绪 op 先发射的次数（compute_issue_window > 1）
+    compute_reordered_ops: int = 0
+    # 多 stream compute 时就绪的 op 等待空闲 core 的累计时间，以及同时执行的 op 数峰值
+    compute_core_wait_time_ns: int = 0
+    compute_peak_concurrent_ops: int = 1
+    # HBF 带宽仲裁时，compute op 与 NAND 请求因共享带宽多花的时间
+    compute_memory_stretch_ns: int = 0
+    nand_memory_stretch_ns: int = 0
+    # KV 追加写入 NAND 的总量，以及写入让 prefetch 读请求多等待的时间
+    nand_write_bytes: int = 0
+    nand_write_bandwidth_bytes_per_sec: float = 0.0
+    nand_read_interference_ns: int = 0
+    # 没有走解析快速路径、回退到 DES 时记录原因
+    used_fast_path: bool = False
+    fast_path_fallback_reason: str | None = None
+    # 打开了重复迭代合并、但当前配置不支持而逐次仿真时记录原因
+    collapse_fallback_reason: str | None = None
 
 
 XPUType = Literal["default", "vallina"]
@@ -42,8 +66,36 @@ def _run_macro_ops_with_xpu(
     device_name: str,
     compile_mode: str,
     xpu_type: XPUType,
+    limit_sram_capacity: bool = False,
+    prefetch_lookahead_depth: int = 1,
+    compute_issue_window: int = 1,
+    compute_streams: int = 1,
+    memory_arbitration: str | None = None,
 ) -> MacroSimResult:
     sim_xpu_class = _get_xpu_class(xpu_type)
+    xpu_kwargs = {}
+    if limit_sram_capacity:
+        if xpu_type != "default":
+            raise ValueError("limit_sram_capacity is only supported with xpu_type='default'")
+        xpu_kwargs["limit_sram_capacity"] = True
+    if prefetch_lookahead_depth != 1:
+        if xpu_type != "default":
+            raise ValueError(
+                "prefetch_lookahead_depth is only supported with xpu_type='default'"
+            )
+        xpu_kwargs["prefetch_lookahead_depth"] = prefetch_lookahead_depth
+    if compute_issue_window != 1:
+        if xpu_type != "default":
+            raise ValueError("compute_issue_window is only supported with xpu_type='default'")
+        xpu_kwargs["compute_issue_window"] = compute_issue_window
+    if compute_streams != 1:
+        if xpu_type != "default":
+            raise ValueError("compute_streams is only supported with xpu_type='default'")
+        xpu_kwargs["compute_streams"] = compute_streams
+    if memory_arbitration is not None:
+        if xpu_type != "default":
+            raise ValueError("memory_arbitration is only supported with xpu_type='default'")
+        xpu_kwargs["memory_arbitration"] = memory_arbitration
 
     SimSession.reset()
     SimSession.init()
@@ -53,14 +105,237 @@ def _run_macro_ops_with_xpu(
         hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
         device_name=device_name,
         compile_mode=compile_mode,
+        **xpu_kwargs,
     )
     sim_xpu.load_command(commands)
-    SimSession.scheduler.run()
+    fast_path_result = run_analytic_fast_path(sim_xpu)
+    if fast_path_result.used_fast_path:
+        final_time_ns = fast_path_result.time_ns
+    else:
+        SimSession.scheduler.run()
+        final_time_ns = int(SimSession.sim_time.cycle)
 
-    final_time_ns = int(SimSession.sim_time.cycle)
     device = get_device_or_raise(device_name)
     final_cycle = ceil(final_time_ns * device.compute_module.clock_freq / 1e9)
-    return MacroSimResult(cycle=final_cycle, time_ns=final_time_ns)
+    if xpu_type != "default":
+        return MacroSimResult(
+            cycle=final_cycle,
+            time_ns=final_time_ns,
+            used_fast_path=fast_path_result.used_fast_path,
+            fast_path_fallback_reason=fast_path_result.fallback_reason,
+        )
+    return MacroSimResult(
+        cycle=final_cycle,
+        time_ns=final_time_ns,
+        sram_peak_pages=sim_xpu.prefetch_engine.sram_peak_pages,
+        sram_stall_time_ns=sim_xpu.prefetch_engine.sram_stall_time_ns,
+        compute_reordered_ops=sim_xpu.compute_engine.reordered_op_count,
+        compute_core_wait_time_ns=(
+            sim_xpu.compute_engine.core_wait_time_ns if compute_streams > 1 else 0
+        ),
+        compute_peak_concurrent_ops=(
+            sim_xpu.compute_engine.peak_concurrent_op_count if compute_streams > 1 else 1
+        ),
+        compute_memory_stretch_ns=(
+            sim_xpu.memory_arbiter.stretch_time_ns["compute"] if sim_xpu.memory_arbiter else 0
+        ),
+        nand_memory_stretch_ns=(
+            sim_xpu.memory_arbiter.stretch_time_ns["nand"] if sim_xpu.memory_arbiter else 0
+        ),
+        nand_write_bytes=sim_xpu.nand_controller.num_write_bytes,
+        nand_write_bandwidth_bytes_per_sec=(
+            sim_xpu.nand_controller.num_write_bytes * 1e9 / final_time_ns
+            if final_time_ns > 0
+            else 0.0
+        ),
+        nand_read_interference_ns=ceil(sim_xpu.nand_controller.read_interference_ns),
+        used_fast_path=fast_path_result.used_fast_path,
+        fast_path_fallback_reason=fast_path_result.fallback_reason,
+        collapse_fallback_reason=sim_xpu.collapse_fallback_reason,
+    )
+
+
+LayerMode = Literal["single", "multi"]
+
+# 第一层、一次层间边界和一个稳态层
+MIN_SIMULATED_LAYERS = 3
+DEFAULT_MAX_SIMULATED_LAYERS = 12
+LAYER_STEADY_STATE_RTOL = 1e-3
+
+
+@dataclass(frozen=True)
+class MultiLayerSimResult:
+    layer_end_time_ns: tuple[int, ...]
+    layer_latency_ns: int
+    model_latency_ns: int
+    steady_state_reached: bool
+    # 相邻两层延迟首次一致时已仿真的层数；未达到稳态时为 None
+    steady_state_layer_count: int | None = None
+    # 多层仿真中 compute engine 乱序发射的次数
+    compute_reordered_ops: int = 0
+    # 多层仿真是否走了解析快速路径
+    used_fast_path: bool = False
+    fast_path_fallback_reason: str | None = None
+    collapse_fallback_reason: str | None = None
+
+    @property
+    def simulated_layer_count(self) -> int:
+        return len(self.layer_end_time_ns)
+
+
+def _run_layers_with_xpu(
+    nand_config: NandConfig,
+    layer_program: CompactProgram,
+    num_layers: int,
+    *,
+    hbm_bandwidth_bytes_per_sec: float,
+    device_name: str,
+    compile_mode: str,
+    compute_issue_window: int = 1,
+) -> tuple[list[int], FastPathResult, xPU]:
+    SimSession.reset()
+    SimSession.init()
+
+    # 下一层不依赖输入的 prefetch 会在本层尾部就开始发射，
+    # 因此不再需要跳过第一个 prefetch 的近似
+    sim_xpu = xPU(
+        nand_config,
+        hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+        device_name=device_name,
+        compile_mode=compile_mode,
+        skip_first_prefetch=False,
+        compute_issue_window=compute_issue_window,
+    )
+    # 每一层是一个副本：新的 op id，依赖关系映射到同一层内的副本；
+    # 层开头无输入的 op 依赖上一层最后的 compute op，发射窗口不会跨层提前执行它们
+    program = layer_program.tile(num_layers)
+    sim_xpu.load_program(program)
+    fast_path_result = run_analytic_fast_path(sim_xpu)
+    if not fast_path_result.used_fast_path:
+        SimSession.scheduler.run()
+
+    layer_end_time_ns: list[int] = []
+    for layer_op_ids in np.split(program.op_ids, num_layers):
+        finish_cycles = [
+            slot.finish_cycle
+            for op_id in layer_op_ids.tolist()
+            if (slot := sim_xpu.command_slots.get(op_id)) is not None
+            and slot.finish_cycle is not None
+        ]
+        if not finish_cycles:
+            raise ValueError("Each simulated layer must contain at least one executed macro op")
+        previous_end_time_ns = layer_end_time_ns[-1] if layer_end_time_ns else 0
+        layer_end_time_ns.append(max(previous_end_time_ns, *finish_cycles))
+    return layer_end_time_ns, fast_path_result, sim_xpu
+
+
+def _find_steady_layer_count(layer_end_time_ns: list[int]) -> int | None:
+    # 第一层包含冷启动，只比较之后相邻两层的增量；返回首次一致的前缀层数
+    layer_latency_ns = np.diff(layer_end_time_ns)
+    for num_layers in range(MIN_SIMULATED_LAYERS, len(layer_end_time_ns) + 1):
+        last_latency_ns = int(layer_latency_ns[num_layers - 2])
+        previous_latency_ns = int(layer_latency_ns[num_layers - 3])
+        if abs(last_latency_ns - previous_latency_ns) <= LAYER_STEADY_STATE_RTOL * last_latency_ns:
+            return num_layers
+    return None
+
+
+def run_layers_to_steady_state(
+    nand_config: NandConfig,
+    commands: list[MacroOp],
+    *,
+    num_hidden_layers: int,
+    hbm_bandwidth_bytes_per_sec: float,
+    device_name: str = "A100_80GB",
+    compile_mode: str = "heuristic-GPU",
+    max_simulated_layers: int = DEFAULT_MAX_SIMULATED_LAYERS,
+    compute_issue_window: int = 1,
+) -> MultiLayerSimResult:
+    """Simulate consecutive copies of one decoder layer and extrapolate the rest.
+
+    `commands` is one layer. The next layer's prefetches overlap the current
+    layer's tail, so the first layer and the layer boundaries are modeled
+    explicitly. `MIN_SIMULATED_LAYERS` layers are simulated first; only when
+    their last two layer latencies differ by more than `LAYER_STEADY_STATE_RTOL`
+    is the run repeated with `min(num_hidden_layers, max_simulated_layers)`
+    layers, where steady state is the shortest prefix whose last two layer
+    latencies agree. The remaining layers are extrapolated with the last
+    simulated layer latency.
+    """
+    if num_hidden_layers <= 0:
+        raise ValueError(f"num_hidden_layers must be > 0, got {num_hidden_layers}")
+    if max_simulated_layers <= 0:
+        raise ValueError(f"max_simulated_layers must be > 0, got {max_simulated_layers}")
+
+    layer_program = CompactProgram.from_macro_ops(commands)
+    max_num_layers = min(num_hidden_layers, max_simulated_layers)
+    # 大多数层在最少的层数内就达到稳态，只有未达到时才用更大的窗口重新仿真
+    num_layers = min(max_num_layers, MIN_SIMULATED_LAYERS)
+    while True:
+        layer_end_time_ns, fast_path_result, sim_xpu = _run_layers_with_xpu(
+            nand_config,
+            layer_program,
+            num_layers,
+            hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+            device_name=device_name,
+            compile_mode=compile_mode,
+            compute_issue_window=compute_issue_window,
+        )
+        steady_layer_count = _find_steady_layer_count(layer_end_time_ns)
+        if steady_layer_count is not None or num_layers == max_num_layers:
+            break
+        num_layers = max_num_layers
+    if num_layers > 1:
+        layer_latency_ns = layer_end_time_ns[-1] - layer_end_time_ns[-2]
+    else:
+        layer_latency_ns = layer_end_time_ns[-1]
+
+    return MultiLayerSimResult(
+        layer_end_time_ns=tuple(layer_end_time_ns),
+        layer_latency_ns=layer_latency_ns,
+        model_latency_ns=layer_end_time_ns[-1]
+        + (num_hidden_layers - num_layers) * layer_latency_ns,
+        steady_state_reached=steady_layer_count is not None,
+        steady_state_layer_count=steady_layer_count,
+        compute_reordered_ops=sim_xpu.compute_engine.reordered_op_count,
+        used_fast_path=fast_path_result.used_fast_path,
+        fast_path_fallback_reason=fast_path_result.fallback_reason,
+        collapse_fallback_reason=sim_xpu.collapse_fallback_reason,
+    )
+
+
+def compare_compute_issue_windows(
+    nand_config: NandConfig,
+    commands: list[MacroOp],
+    *,
+    num_hidden_layers: int,
+    hbm_bandwidth_bytes_per_sec: float,
+    issue_windows: Sequence[int] = (1, 2, 4, 8),
+    device_name: str = "A100_80GB",
+    compile_mode: str = "heuristic-GPU",
+    max_simulated_layers: int = DEFAULT_MAX_SIMULATED_LAYERS,
+) -> dict[int, MultiLayerSimResult]:
+    """Run `run_layers_to_steady_state` once per compute issue window.
+
+    Window 1 is the in-order baseline; comparing `layer_latency_ns` of the
+    other entries against it shows how much out-of-order issue hides late
+    prefetches in this layer.
+    """
+    if not issue_windows:
+        raise ValueError("issue_windows must not be empty")
+    return {
+        issue_window: run_layers_to_steady_state(
+            nand_config,
+            commands,
+            num_hidden_layers=num_hidden_layers,
+            hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+            device_name=device_name,
+            compile_mode=compile_mode,
+            max_simulated_layers=max_simulated_layers,
+            compute_issue_window=issue_window,
+        )
+        for issue_window in issue_windows
+    }
 
 
 def run_macro_ops(
@@ -70,6 +345,11 @@ def run_macro_ops(
     hbm_bandwidth_bytes_per_sec: float,
     device_name: str = "A100_80GB",
     compile_mode: str = "heuristic-GPU",
+    limit_sram_capacity: bool = False,
+    prefetch_lookahead_depth: int = 1,
+    compute_issue_window: int = 1,
+    compute_streams: int = 1,
+    memory_arbitration: str | None = None,
 ) -> MacroSimResult:
     return _run_macro_ops_with_xpu(
         nand_config,
@@ -78,6 +358,101 @@ def run_macro_ops(
         device_name=device_name,
         compile_mode=compile_mode,
         xpu_type="default",
+        limit_sram_capacity=limit_sram_capacity,
+        prefetch_lookahead_depth=prefetch_lookahead_depth,
+        compute_issue_window=compute_issue_window,
+        compute_streams=compute_streams,
+        memory_arbitration=memory_arbitration,
+    )
+
+
+@dataclass(frozen=True)
+class MultiRankSimResult:
+    rank_time_ns: tuple[int, ...]
+    # 每个 rank 在 collective 上等待其他 rank 到达的总时间
+    rank_collective_wait_ns: tuple[int, ...]
+
+    @property
+    def num_ranks(self) -> int:
+        return len(self.rank_time_ns)
+
+    @property
+    def time_ns(self) -> int:
+        # 最慢的 rank 决定这一层的延迟
+        return max(self.rank_time_ns)
+
+
+def _validate_rank_collectives(rank_commands: Sequence[list[MacroOp]]) -> None:
+    # 各 rank 的第 k 个通信指令视为同一个 collective，顺序和类型必须一致
+    collective_types = [
+        [type(command) for command in commands if isinstance(command, TRANSFER_OP_TYPES)]
+        for commands in rank_commands
+    ]
+    for rank, rank_collective_types in enumerate(collective_types[1:], start=1):
+        if rank_collective_types != collective_types[0]:
+            raise ValueError(
+                f"rank {rank} collectives {[t.__name__ for t in rank_collective_types]} "
+                f"do not match rank 0 collectives {[t.__name__ for t in collective_types[0]]}"
+            )
+
+
+def run_multi_rank_macro_ops(
+    nand_config: NandConfig,
+    rank_commands: Sequence[list[MacroOp]],
+    *,
+    hbm_bandwidth_bytes_per_sec: float,
+    device_name: str = "A100_80GB",
+    compile_mode: str = "heuristic-GPU",
+) -> MultiRankSimResult:
+    """Simulate one xPU per rank in a single session with collectives as barriers.
+
+    Every rank runs its own program on its own NAND state. The k-th transfer op
+    of every rank is treated as one collective: it starts when the slowest rank
+    arrives and then takes the analytic collective cost, so imbalance between
+    ranks (uneven KV cache or expert load) delays all of them.
+    """
+    if not rank_commands:
+        raise ValueError("rank_commands must not be empty")
+    if any(not commands for commands in rank_commands):
+        raise ValueError("Each rank must have at least one macro op")
+    _validate_rank_collectives(rank_commands)
+
+    SimSession.reset()
+    SimSession.init()
+
+    collective_barrier = CollectiveBarrier(len(rank_commands))
+    rank_xpus: list[xPU] = []
+    for commands in rank_commands:
+        sim_xpu = xPU(
+            nand_config,
+            hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+            device_name=device_name,
+            compile_mode=compile_mode,
+            collective_barrier=collective_barrier,
+        )
+        sim_xpu.load_command(commands)
+        rank_xpus.append(sim_xpu)
+    SimSession.scheduler.run()
+
+    if collective_barrier.num_pending_collectives:
+        raise RuntimeError("Some ranks never reached their collectives")
+
+    rank_time_ns = tuple(
+        max(
+            (
+                slot.finish_cycle
+                for slot in sim_xpu.command_slots.values()
+                if slot.finish_cycle is not None
+            ),
+            default=0,
+        )
+        for sim_xpu in rank_xpus
+    )
+    return MultiRankSimResult(
+        rank_time_ns=rank_time_ns,
+        rank_collective_wait_ns=tuple(
+            sim_xpu.transfer_engine.collective_wait_time_ns for sim_xpu in rank_xpus
+        ),
     )
 
 
@@ -90,6 +465,12 @@ class SimResult:
 
     kv_cache_total_size_GB: float  # Total KV cache size across all layers.
 
+    simulated_layer_count: int = 1
+    steady_state_reached: bool | None = None  # 只有 multi layer mode 会检测稳态
+    # 只有 single layer mode 统计，均为单层的数值
+    nand_write_bandwidth_bytes_per_sec: float = 0.0
+    nand_read_interference_ns: int = 0
+
 
 def _validate_run_sim_inputs(
     model_config: ModelConfigBase,
@@ -150,10 +531,15 @@ def _build_sim_result(
     nand_config: NandConfig,
     model_config: ModelConfigBase,
     inference_config: InferenceConfig,
-    macro_result: MacroSimResult,
+    layer_latency_ns: int,
+    model_latency_ns: int,
     num_ranks: int,
     num_hidden_layers: int,
     kv_cache_state: KVCacheState | None,
+    simulated_layer_count: int = 1,
+    steady_state_reached: bool | None = None,
+    nand_write_bandwidth_bytes_per_sec: float = 0.0,
+    nand_read_interference_ns: int = 0,
 ) -> SimResult:
     resolved_kv_cache_state = _resolve_kv_cache_state(
         nand_config,
@@ -175,8 +561,6 @@ def _build_sim_result(
             f"got {total_kv_cache_size_per_layer}"
         )
 
-    layer_latency_ns = macro_result.time_ns
-    model_latency_ns = layer_latency_ns * num_hidden_layers
     if model_latency_ns <= 0:
         raise ValueError(
             f"model_latency_ns must be > 0, got {model_latency_ns}"
@@ -193,6 +577,10 @@ def _build_sim_result(
         model_throughput=model_throughput,
         throughput_per_GPU=throughput_per_gpu,
         kv_cache_total_size_GB=kv_cache_total_size_gb,
+        simulated_layer_count=simulated_layer_count,
+        steady_state_reached=steady_state_reached,
+        nand_write_bandwidth_bytes_per_sec=nand_write_bandwidth_bytes_per_sec,
+        nand_read_interference_ns=nand_read_interference_ns,
     )
 
 
@@ -207,28 +595,87 @@ def universe_run_sim(
     compile_mode: str = "heuristic-GPU",
     xpu_type: XPUType = "default",
     kv_cache_state: KVCacheState | None = None,
+    layer_mode: LayerMode = "single",
+    max_simulated_layers: int = DEFAULT_MAX_SIMULATED_LAYERS,
+    rank_commands: Sequence[list[MacroOp]] | None = None,
 ) -> SimResult:
     num_ranks, num_hidden_layers = _validate_run_sim_inputs(
         model_config,
         inference_config,
         commands,
     )
-    macro_result = _run_macro_ops_with_xpu(
+    if rank_commands is not None:
+        # 每个 rank 单独仿真一层，collective 在最慢的 rank 到达后才开始；
+        # commands 仍作为代表 rank 参与输入校验
+        if layer_mode != "single":
+            raise ValueError("rank_commands is only supported with layer_mode='single'")
+        if xpu_type != "default":
+            raise ValueError("rank_commands is only supported with xpu_type='default'")
+        multi_rank_result = run_multi_rank_macro_ops(
+            nand_config,
+            rank_commands,
+            hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+            device_name=device_name,
+            compile_mode=compile_mode,
+        )
+        return _build_sim_result(
+            nand_config=nand_config,
+            model_config=model_config,
+            inference_config=inference_config,
+            layer_latency_ns=multi_rank_result.time_ns,
+            model_latency_ns=multi_rank_result.time_ns * num_hidden_layers,
+            num_ranks=num_ranks,
+            num_hidden_layers=num_hidden_layers,
+            kv_cache_state=kv_cache_state,
+        )
+    if layer_mode == "single":
+        # 只仿真一层，总延迟按层数线性放大
+        macro_result = _run_macro_ops_with_xpu(
+            nand_config,
+            commands,
+            hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+            device_name=device_name,
+            compile_mode=compile_mode,
+            xpu_type=xpu_type,
+        )
+        return _build_sim_result(
+            nand_config=nand_config,
+            model_config=model_config,
+            inference_config=inference_config,
+            layer_latency_ns=macro_result.time_ns,
+            model_latency_ns=macro_result.time_ns * num_hidden_layers,
+            num_ranks=num_ranks,
+            num_hidden_layers=num_hidden_layers,
+            kv_cache_state=kv_cache_state,
+            nand_write_bandwidth_bytes_per_sec=macro_result.nand_write_bandwidth_bytes_per_sec,
+            nand_read_interference_ns=macro_result.nand_read_interference_ns,
+        )
+
+    if layer_mode != "multi":
+        raise ValueError(f"Unsupported layer_mode: {layer_mode}")
+    if xpu_type != "default":
+        raise ValueError("layer_mode='multi' is only supported with xpu_type='default'")
+
+    multi_layer_result = run_layers_to_steady_state(
         nand_config,
         commands,
+        num_hidden_layers=num_hidden_layers,
         hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
         device_name=device_name,
         compile_mode=compile_mode,
-        xpu_type=xpu_type,
+        max_simulated_layers=max_simulated_layers,
     )
     return _build_sim_result(
         nand_config=nand_config,
         model_config=model_config,
         inference_config=inference_config,
-        macro_result=macro_result,
+        layer_latency_ns=multi_layer_result.layer_latency_ns,
+        model_latency_ns=multi_layer_result.model_latency_ns,
         num_ranks=num_ranks,
         num_hidden_layers=num_hidden_layers,
         kv_cache_state=kv_cache_state,
+        simulated_layer_count=multi_layer_result.simulated_layer_count,
+        steady_state_reached=multi_layer_result.steady_state_reached,
     )
 
 
@@ -256,8 +703,12 @@ def run_sim(
 
 __all__ = [
     "MacroSimResult",
+    "MultiLayerSimResult",
+    "MultiRankSimResult",
     "SimResult",
+    "run_layers_to_steady_state",
     "run_macro_ops",
+    "run_multi_rank_macro_ops",
     "run_sim",
     "universe_run_sim",
 ]
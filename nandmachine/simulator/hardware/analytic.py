@@ -0,0 +1,324 @@
+"""Analytic fast path that evaluates a loaded xPU program without the DES.
+
+Unsupported programs fall back to the DES with a reason;
+`NANDMACHINE_DES_FAST_PATH=off` always runs the DES.
+"""
+
+from __future__ import annotations
+
+import copy
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from Desim import SimSession
+
+from nandmachine.commands.macro import FlashAttnOp, MacroOp
+from nandmachine.simulator.hardware.utils import DepSlot
+from nandmachine.simulator.hardware.vallina_xpu import VallinaXPU
+from nandmachine.simulator.hardware.xpu import (
+    _normalize_time_ns,
+    find_unsupported_feature,
+    xPU,
+)
+
+DES_FAST_PATH_ENV_VAR = "NANDMACHINE_DES_FAST_PATH"
+DES_FAST_PATH_MODES = ("auto", "off")
+
+
+_mode: Optional[str] = None
+
+
+def set_des_fast_path_mode(mode: Optional[str]) -> None:
+    # 显式配置优先于环境变量；传 None 恢复为读取环境变量
+    global _mode
+    if mode is not None and mode not in DES_FAST_PATH_MODES:
+        raise ValueError(f"DES fast path mode must be one of {DES_FAST_PATH_MODES}, got {mode}")
+    _mode = mode
+
+
+def get_des_fast_path_mode() -> str:
+    if _mode is not None:
+        return _mode
+    # 默认打开：不支持的程序会自动回退到 DES
+    mode = os.environ.get(DES_FAST_PATH_ENV_VAR) or "auto"
+    if mode not in DES_FAST_PATH_MODES:
+        raise ValueError(
+            f"{DES_FAST_PATH_ENV_VAR}={mode} is not one of {DES_FAST_PATH_MODES}"
+        )
+    return mode
+
+
+@dataclass(frozen=True)
+class FastPathResult:
+    # time_ns 为 None 时表示回退到 DES，fallback_reason 说明原因
+    time_ns: Optional[int]
+    fallback_reason: Optional[str] = None
+
+    @property
+    def used_fast_path(self) -> bool:
+        return self.time_ns is not None
+
+
+class _FastPathUnsupported(Exception):
+    pass
+
+
+@dataclass
+class _SlotTiming:
+    # is_finished 被置位的时间，None 表示 load 时已完成
+    finished_ns: Optional[int]
+    # finish_event 触发的时间，None 表示不会通知
+    event_ns: Optional[int]
+    # 置位 is_finished 的协程；同一协程内按程序顺序执行，不存在同一时刻的竞争
+    coroutine: str
+    finish_cycle: Optional[int] = None
+
+
+class _AnalyticSchedule:
+    def __init__(self, sim_xpu: xPU) -> None:
+        self.sim_xpu = sim_xpu
+        self.is_vallina = isinstance(sim_xpu, VallinaXPU)
+        self.timings: dict[int, _SlotTiming] = {}
+        # 各协程当前所在的时间
+        self.coroutine_time_ns: dict[str, int] = {
+            "prefetch": 0,
+            "compute": 0,
+            "transfer": 0,
+            "release": 0,
+        }
+
+        compute_queue = sim_xpu.compute_engine.command_queue
+        self.flash_op_count = sum(
+            slot.repeat_count for slot in compute_queue if isinstance(slot.payload, FlashAttnOp)
+        )
+        self.flash_op_index = 0
+
+        self.slot_kinds: dict[int, str] = {}
+        for slot in sim_xpu.prefetch_engine.prefetch_command_queue:
+            self.slot_kinds[id(slot)] = "prefetch"
+        for slot in compute_queue:
+            self.slot_kinds[id(slot)] = "compute"
+        for slot in sim_xpu.transfer_engine.transfer_command_queue:
+            self.slot_kinds[id(slot)] = "transfer"
+
+        if self.is_vallina:
+            return
+
+        prefetch_engine = sim_xpu.prefetch_engine
+        for slot in prefetch_engine.release_command_queue:
+            self.slot_kinds[id(slot)] = "release"
+        self.nand_sim_core = copy.deepcopy(sim_xpu.nand_controller.nand_sim_core)
+        self.skip_first_prefetch = prefetch_engine.is_first_prefetch
+        self.last_ready_cycle = prefetch_engine.last_ready_cycle
+        self.last_prefetch_period_ns = prefetch_engine.last_prefetch_period_ns
+        self.last_request_finish_ns: Optional[int] = None
+        # (时间, page 数)：prefetch 发射时分配 SRAM，release 时释放
+        self.sram_allocations: list[tuple[int, int]] = []
+        self.sram_frees: list[tuple[int, int]] = []
+        self.sram_resident_pages = dict(prefetch_engine.sram_resident_pages)
+
+    def check_supported(self) -> None:
+        sim_xpu = self.sim_xpu
+        if sim_xpu.tracer is not None:
+            raise _FastPathUnsupported("tracing is enabled")
+        if any(
+            slot.is_finished
+            for slot in sim_xpu.command_slots.values()
+            if id(slot) in self.slot_kinds
+        ):
+            raise _FastPathUnsupported("the program has already been simulated")
+        if self.is_vallina:
+            return
+        # 与合并重复迭代共用同一张不支持特性表
+        reason = find_unsupported_feature(sim_xpu)
+        if reason is not None:
+            raise _FastPathUnsupported(reason)
+
+    def evaluate(self) -> int:
+        self.check_supported()
+        for slot in self.sim_xpu.command_slots.values():
+            kind = self.slot_kinds.get(id(slot))
+            if kind is None:
+                # vallina xPU 在 load 时直接完成 release / KV 追加
+                if not slot.is_finished:
+                    raise _FastPathUnsupported(
+                        f"{type(slot.payload).__name__} is not handled by any engine"
+                    )
+                self.timings[id(slot)] = _SlotTiming(None, None, "load")
+            elif kind == "prefetch":
+                self._evaluate_prefetch(slot)
+            elif kind == "compute":
+                self._evaluate_compute(slot)
+            elif kind == "transfer":
+                self._evaluate_transfer(slot)
+            else:
+                self._evaluate_release(slot)
+
+        if not self.is_vallina:
+            self.sram_peak_pages = self._sram_peak_pages()
+        return max(
+            (timing.event_ns for timing in self.timings.values() if timing.event_ns is not None),
+            default=0,
+        )
+
+    def _input_ready_ns(self, slot: DepSlot[MacroOp], check_ns: int, coroutine: str) -> int:
+        # 与 engine 的 `if not is_finished: wait(finish_event)` 一致：
+        # 检查时已完成则立刻继续，否则在 finish_event 触发时继续
+        for input_slot in slot.input_slots:
+            timing = self.timings[id(input_slot)]
+            if timing.finished_ns is None or timing.coroutine == coroutine:
+                continue
+            if check_ns < timing.finished_ns:
+                check_ns = timing.event_ns
+            elif check_ns == timing.finished_ns:
+                raise _FastPathUnsupported(
+                    f"macro op {input_slot.payload.id} finishes in the same ns "
+                    f"({check_ns}) its consumer {slot.payload.id} checks it"
+                )
+        return check_ns
+
+    def _evaluate_compute(self, slot: DepSlot[MacroOp]) -> None:
+        compute_engine = self.sim_xpu.compute_engine
+        current_ns = self.coroutine_time_ns["compute"]
+        if slot.repeat_count > 1:
+            # 被合并的迭代背靠背执行，每次包含 1ns 的完成通知
+            collapsed_count = slot.repeat_count - 1
+            collapsed_time_ns = compute_engine._estimate_execute_time_ns(
+                slot.payload, self.flash_op_index, self.flash_op_count
+            )
+            if isinstance(slot.payload, FlashAttnOp):
+                self.flash_op_index += collapsed_count
+            current_ns += collapsed_count * (collapsed_time_ns + 1)
+
+        current_ns = self._input_ready_ns(slot, current_ns, "compute")
+        execute_time_ns = compute_engine._estimate_execute_time_ns(
+            slot.payload, self.flash_op_index, self.flash_op_count
+        )
+        if isinstance(slot.payload, FlashAttnOp):
+            self.flash_op_index += 1
+        finish_ns = current_ns + execute_time_ns + 1
+        self.timings[id(slot)] = _SlotTiming(finish_ns, finish_ns, "compute", finish_ns)
+        self.coroutine_time_ns["compute"] = finish_ns
+
+    def _evaluate_transfer(self, slot: DepSlot[MacroOp]) -> None:
+        current_ns = self._input_ready_ns(slot, self.coroutine_time_ns["transfer"], "transfer")
+        execute_time_ns = _normalize_time_ns(
+            self.sim_xpu.transfer_engine.execute_macro_op(slot.payload), "execute_time_ns"
+        )
+        finish_ns = current_ns + execute_time_ns + 1
+        self.timings[id(slot)] = _SlotTiming(finish_ns, finish_ns, "transfer", finish_ns)
+        self.coroutine_time_ns["transfer"] = finish_ns
+
+    def _evaluate_prefetch(self, slot: DepSlot[MacroOp]) -> None:
+        current_ns = self._input_ready_ns(slot, self.coroutine_time_ns["prefetch"], "prefetch")
+        if self.is_vallina:
+            # vallina prefetch 固定 1ns
+            end_ns = current_ns + 1
+            self.timings[id(slot)] = _SlotTiming(end_ns, end_ns + 1, "prefetch", end_ns)
+            self.coroutine_time_ns["prefetch"] = end_ns
+            return
+
+        if self.skip_first_prefetch:
+            self.skip_first_prefetch = False
+            self.timings[id(slot)] = _SlotTiming(current_ns, current_ns + 1, "prefetch", current_ns)
+            self.coroutine_time_ns["prefetch"] = current_ns
+            return
+
+        # lookahead 深度为 1：等上一个 NAND 请求完成后再发射
+        if self.last_request_finish_ns is not None:
+            current_ns = max(current_ns, self.last_request_finish_ns)
+        ready_ns = current_ns
+        if slot.repeat_count > 1:
+            if self.last_ready_cycle is None:
+                raise _FastPathUnsupported(
+                    "collapsed prefetch slot has no simulated steady-state iteration"
+                )
+            self.last_prefetch_period_ns = ready_ns - self.last_ready_cycle
+            if self.last_prefetch_period_ns > 0:
+                current_ns += (slot.repeat_count - 1) * self.last_prefetch_period_ns
+        self.last_ready_cycle = ready_ns
+
+        num_pages = slot.payload.num_prefetch_pages
+        self.sram_allocations.append((current_ns, num_pages))
+        self.sram_resident_pages[id(slot)] = num_pages
+
+        # controller 在发射 1ns 后处理请求，完成时间按整数 ns 截断
+        arrive_ns = current_ns + 1
+        delay_ns = int(self.nand_sim_core.handle_request(num_pages, arrive_ns) - arrive_ns)
+        if delay_ns < 1:
+            raise _FastPathUnsupported(f"NAND request of macro op {slot.payload.id} takes < 1ns")
+        finish_ns = arrive_ns + delay_ns
+        self.last_request_finish_ns = finish_ns
+        self.timings[id(slot)] = _SlotTiming(
+            finish_ns, finish_ns + 1, "prefetch_completion", finish_ns
+        )
+        self.coroutine_time_ns["prefetch"] = current_ns
+
+    def _evaluate_release(self, slot: DepSlot[MacroOp]) -> None:
+        current_ns = self._input_ready_ns(slot, self.coroutine_time_ns["release"], "release")
+        for input_slot in slot.input_slots:
+            for prefetch_slot in input_slot.input_slots:
+                num_pages = self.sram_resident_pages.pop(id(prefetch_slot), 0)
+                if num_pages:
+                    self.sram_frees.append((current_ns, num_pages))
+        self.timings[id(slot)] = _SlotTiming(current_ns, None, "release", current_ns)
+        self.coroutine_time_ns["release"] = current_ns
+
+    def _sram_peak_pages(self) -> int:
+        # 同一时刻的分配与释放由不同协程完成，先后顺序不同峰值不同时无法确定
+        def peak_pages(free_first: bool) -> int:
+            free_order = 0 if free_first else 1
+            events = sorted(
+                [(time_ns, 1 - free_order, pages) for time_ns, pages in self.sram_allocations]
+                + [(time_ns, free_order, -pages) for time_ns, pages in self.sram_frees]
+            )
+            occupied_pages = self.sim_xpu.prefetch_engine.sram_occupied_pages
+            peak = self.sim_xpu.prefetch_engine.sram_peak_pages
+            for _, _, pages in events:
+                occupied_pages += pages
+                peak = max(peak, occupied_pages)
+            return peak
+
+        peak = peak_pages(free_first=True)
+        if peak != peak_pages(free_first=False):
+            raise _FastPathUnsupported("SRAM allocation and release happen in the same ns")
+        return peak
+
+    def apply(self) -> None:
+        for slot in self.sim_xpu.command_slots.values():
+            timing = self.timings[id(slot)]
+            slot.is_finished = True
+            if timing.finish_cycle is not None:
+                slot.finish_cycle = timing.finish_cycle
+        if self.is_vallina:
+            return
+
+        prefetch_engine = self.sim_xpu.prefetch_engine
+        prefetch_engine.is_first_prefetch = self.skip_first_prefetch
+        prefetch_engine.last_ready_cycle = self.last_ready_cycle
+        prefetch_engine.last_prefetch_period_ns = self.last_prefetch_period_ns
+        prefetch_engine.sram_peak_pages = self.sram_peak_pages
+        prefetch_engine.sram_resident_pages = self.sram_resident_pages
+        prefetch_engine.sram_occupied_pages = sum(self.sram_resident_pages.values())
+        self.sim_xpu.nand_controller.nand_sim_core = self.nand_sim_core
+
+
+def run_analytic_fast_path(sim_xpu: xPU) -> FastPathResult:
+    """Evaluate the program loaded into `sim_xpu` without running the DES.
+
+    Returns the final simulation time on success. Otherwise `sim_xpu` is left
+    untouched and the result carries the reason the caller has to run
+    `SimSession.scheduler.run()` instead.
+    """
+    if get_des_fast_path_mode() == "off":
+        return FastPathResult(None, "the fast path is disabled")
+    schedule = _AnalyticSchedule(sim_xpu)
+    try:
+        time_ns = schedule.evaluate()
+    except _FastPathUnsupported as error:
+        return FastPathResult(None, str(error))
+    schedule.apply()
+    # 与 scheduler.run() 结束时一样推进会话时间，读 SimSession.sim_time 的调用方无需区分两条路径
+    SimSession.sim_time.cycle = time_ns
+    return FastPathResult(time_ns)
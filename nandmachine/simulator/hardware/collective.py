@@ -0,0 +1,49 @@
+"""Barrier that synchronizes collectives across xPUs in one `SimSession`.
+
+With several simulated ranks, the k-th transfer op of every rank is the same
+collective. Each rank's `TransferEngine` waits in `arrive_and_wait` until the
+slowest participant arrives, and only then starts the analytic collective
+cost, so imbalance between ranks delays everyone. A single-rank simulation
+does not use a barrier and keeps the previous timing.
+"""
+
+from __future__ import annotations
+
+from Desim import Event, SimModule, SimSession, SimTime
+
+
+class CollectiveBarrier:
+    def __init__(self, num_ranks: int) -> None:
+        if num_ranks <= 0:
+            raise ValueError(f"num_ranks must be > 0, got {num_ranks}")
+        self.num_ranks = num_ranks
+
+        # collective 序号 -> 已到达的 rank 数 / 所有 rank 等待的 event
+        self._arrived_ranks: dict[int, int] = {}
+        self._release_events: dict[int, Event] = {}
+        # collective 序号 -> 最后一个 rank 到达的时间 (ns)
+        self.release_cycles: dict[int, int] = {}
+
+    def arrive_and_wait(self, collective_index: int) -> None:
+        if collective_index in self.release_cycles:
+            raise RuntimeError(
+                f"Collective {collective_index} was already released; "
+                "every rank must issue the same collectives"
+            )
+        release_event = self._release_events.setdefault(collective_index, Event())
+        arrived_ranks = self._arrived_ranks.get(collective_index, 0) + 1
+        self._arrived_ranks[collective_index] = arrived_ranks
+
+        if arrived_ranks == self.num_ranks:
+            # 最后一个到达的 rank 唤醒所有 rank，包括自己，保证各 rank 同时开始通信
+            self.release_cycles[collective_index] = int(SimSession.sim_time.cycle)
+            del self._arrived_ranks[collective_index]
+            release_event.notify(SimTime(1))
+        SimModule.wait(release_event)
+        if arrived_ranks == self.num_ranks:
+            del self._release_events[collective_index]
+
+    @property
+    def num_pending_collectives(self) -> int:
+        # 仿真结束后仍不为 0 说明某些 rank 没有到达对应的 collective
+        return len(self._arrived_ranks)
@@ -0,0 +1,56 @@
+"""Weighted arbitration of the HBF bandwidth between compute ops and NAND requests.
+
+A share is fixed when the op or request starts, because Desim cannot shorten a
+scheduled wait.
+"""
+
+from __future__ import annotations
+
+from math import ceil
+from typing import Literal
+
+MemoryRequester = Literal["compute", "nand"]
+
+# 策略 -> (compute 权重, NAND 请求权重)；双方同时忙时按权重分 HBF 带宽
+MEMORY_ARBITRATION_POLICIES: dict[str, tuple[int, int]] = {
+    "fair": (1, 1),
+    "compute_priority": (3, 1),
+    "nand_priority": (1, 3),
+}
+
+
+class MemoryBandwidthArbiter:
+    def __init__(self, policy: str = "fair"):
+        if policy not in MEMORY_ARBITRATION_POLICIES:
+            raise ValueError(
+                f"Unsupported memory arbitration policy: {policy}, "
+                f"expected one of {sorted(MEMORY_ARBITRATION_POLICIES)}"
+            )
+        self.policy = policy
+        compute_weight, nand_weight = MEMORY_ARBITRATION_POLICIES[policy]
+        self._weights: dict[MemoryRequester, int] = {
+            "compute": compute_weight,
+            "nand": nand_weight,
+        }
+        # 每一方已开始、尚未结束的访问的结束时间 (ns)
+        self._busy_until_ns: dict[MemoryRequester, list[int]] = {"compute": [], "nand": []}
+        # 因为共享带宽，比独占带宽多花的时间
+        self.stretch_time_ns: dict[MemoryRequester, int] = {"compute": 0, "nand": 0}
+
+    def share(self, requester: MemoryRequester, now_ns: int) -> float:
+        other: MemoryRequester = "nand" if requester == "compute" else "compute"
+        busy_until_ns = [end_ns for end_ns in self._busy_until_ns[other] if end_ns > now_ns]
+        self._busy_until_ns[other] = busy_until_ns
+        if not busy_until_ns:
+            return 1.0
+        return self._weights[requester] / (self._weights[requester] + self._weights[other])
+
+    def stretch(self, requester: MemoryRequester, now_ns: int, duration_ns: int) -> int:
+        # NAND 请求的时长按分到的带宽拉长，并登记为占用
+        shared_duration_ns = ceil(duration_ns / self.share(requester, now_ns))
+        self.reserve(requester, now_ns + shared_duration_ns, now_ns + duration_ns)
+        return shared_duration_ns
+
+    def reserve(self, requester: MemoryRequester, end_ns: int, unshared_end_ns: int) -> None:
+        self._busy_until_ns[requester].append(end_ns)
+        self.stretch_time_ns[requester] += end_ns - unshared_end_ns
@@ -1,4 +1,5 @@
 from collections import deque
+import copy
 import math
 from typing import Optional
 
@@ -18,6 +19,12 @@ from nandmachine.commands.micro import (
     SramPageWrite,
 )
 from nandmachine.config.config import NandConfig
+from nandmachine.simulator.hardware.nand_timing import (
+    NAND_TIMING_MODELS,
+    NandSimCoreChannel,
+    count_block_erases,
+)
+from nandmachine.simulator.hardware.memory_bandwidth import MemoryBandwidthArbiter
 from nandmachine.simulator.hardware.utils import DepSlot
 from nandmachine.simulator.runtime.addr import NandAddress
 from nandmachine.simulator.runtime.tables import DeviceType
@@ -25,18 +32,31 @@ from nandmachine.simulator.runtime.tables import DeviceType
 
 
 class NandController(SimModule):
-    def __init__(self,nand_config:NandConfig):
+    def __init__(
+        self,
+        nand_config:NandConfig,
+        memory_arbiter:Optional[MemoryBandwidthArbiter] = None,
+    ):
         super().__init__()
 
         self.nand_config = nand_config
+        # 非空时与 compute engine 共享 HBF 带宽，compute op 执行期间的请求会被拉长
+        self.memory_arbiter = memory_arbiter
 
         self.waiting_requests_queue:deque[DepSlot[int]] = deque()
+        self.waiting_write_requests_queue:deque[DepSlot[int]] = deque()
 
 
         self.core_event_queue:EventQueue = EventQueue()
 
 
-        self.nand_sim_core_simple:NandSimCoreSimple = NandSimCoreSimple(self.nand_config)
+        self.nand_sim_core:NandSimCoreSimple | NandSimCoreChannel = build_nand_sim_core(self.nand_config)
+        # 第一次写入时复制出只处理读请求的 core，读请求在两者上的完成时间差即写入造成的干扰
+        self.read_only_sim_core:Optional[NandSimCoreSimple | NandSimCoreChannel] = None
+
+        self.num_write_pages = 0
+        self.read_interference_ns = 0.0
+        self.num_interfered_reads = 0
 
 
         self.register_coroutine(self.process)
@@ -55,49 +75,144 @@ class NandController(SimModule):
 
 
                 current_time_ns = SimSession.sim_time.cycle
-                finish_time_ns = self.nand_sim_core_simple.handle_request(
+                finish_time_ns = self.nand_sim_core.handle_request(
                     access_num_pages,
                     current_time_ns,
                 )
+                if self.read_only_sim_core is not None:
+                    read_only_finish_time_ns = self.read_only_sim_core.handle_request(
+                        access_num_pages,
+                        current_time_ns,
+                    )
+                    if finish_time_ns > read_only_finish_time_ns:
+                        self.read_interference_ns += finish_time_ns - read_only_finish_time_ns
+                        self.num_interfered_reads += 1
+
+                self._finish_request(cur_slot, current_time_ns, finish_time_ns)
+
+            while self.waiting_write_requests_queue:
+                cur_slot = self.waiting_write_requests_queue.popleft()
+
+                if self.read_only_sim_core is None:
+                    self.read_only_sim_core = copy.deepcopy(self.nand_sim_core)
 
-                cur_slot.is_finished = True
-                cur_slot.finish_event.notify(
-                    SimTime(int(finish_time_ns - current_time_ns))
+                current_time_ns = SimSession.sim_time.cycle
+                finish_time_ns = self.nand_sim_core.handle_write(
+                    cur_slot.payload,
+                    current_time_ns,
                 )
+                self.num_write_pages += cur_slot.payload
+                self._finish_request(cur_slot, current_time_ns, finish_time_ns)
+
+    def _finish_request(
+        self,
+        cur_slot:DepSlot[int],
+        current_time_ns:int,
+        finish_time_ns:float,
+    ) -> None:
+        delay_ns = int(finish_time_ns - current_time_ns)
+        if self.memory_arbiter is not None:
+            delay_ns = self.memory_arbiter.stretch("nand", current_time_ns, delay_ns)
+        cur_slot.is_finished = True
+        # 发射方据此判断请求是否已经完成，无需重复等待已触发的 event
+        cur_slot.finish_cycle = current_time_ns + delay_ns
+        cur_slot.finish_event.notify(SimTime(delay_ns))
         
 
     def handle_request(self,nand_request_slot:DepSlot[int]):
         self.waiting_requests_queue.append(nand_request_slot)
         self.core_event_queue.next_notify(SimTime(1))
 
+    def handle_write_request(self,nand_request_slot:DepSlot[int]):
+        # payload 为写入的 page 数；与读请求共享 plane，按到达顺序排队
+        self.waiting_write_requests_queue.append(nand_request_slot)
+        self.core_event_queue.next_notify(SimTime(1))
+
+    @property
+    def num_write_bytes(self) -> int:
+        return self.num_write_pages * self.nand_config.page_size_bytes
+
 
 class NandSimCoreSimple:
     def __init__(self,nand_config:NandConfig) -> None:
         
         self.nand_config = nand_config
 
+        # 每个 (channel, plane) 的下一次空闲时间；多个请求同时在途时共享这些 plane
+        self.plane_free_time_ns: list[float] = [0.0] * (
+            self.nand_config.num_plane * self.nand_config.num_channels
+        )
+        # 每个 plane 已经写入的 page 数，用于判断何时需要擦除新的 block
+        self.programmed_pages: list[int] = [0] * len(self.plane_free_time_ns)
+
         
     def handle_request(self, access_num_pages:int, arrive_time_ns: float) -> float:
         
         # plane level 并行 
         # latency_ns = math.ceil(access_num_pages/(self.nand_config.num_plane*self.nand_config.num_channels)) * self.nand_config.tRead
         
-        if access_num_pages < self.nand_config.num_plane * self.nand_config.num_channels:
-            latency_ns = self.nand_config.tRead
+        latency_ns = self._striped_latency_ns(access_num_pages, self.nand_config.tRead)
+        used_planes = self._select_planes(access_num_pages)
+        start_time_ns = max(
+            arrive_time_ns,
+            max(self.plane_free_time_ns[plane] for plane in used_planes),
+        )
+
+        finish_time_ns = latency_ns + start_time_ns
+        for plane in used_planes:
+            self.plane_free_time_ns[plane] = finish_time_ns
+        return finish_time_ns
+
+    def handle_write(self, access_num_pages:int, arrive_time_ns: float) -> float:
+        # 与读共享 plane：写入期间同一 plane 上的读请求要排队
+        latency_ns = self._striped_latency_ns(access_num_pages, self.nand_config.tWrite)
+        used_planes = self._select_planes(access_num_pages)
+        pages_per_plane = math.ceil(access_num_pages / len(used_planes))
+        num_erases = count_block_erases(
+            [self.programmed_pages[plane] for plane in used_planes],
+            pages_per_plane,
+            self.nand_config.num_pages,
+        )
+        start_time_ns = max(
+            arrive_time_ns,
+            max(self.plane_free_time_ns[plane] for plane in used_planes),
+        )
+
+        finish_time_ns = start_time_ns + int(num_erases.max()) * self.nand_config.tErase + latency_ns
+        for plane in used_planes:
+            self.plane_free_time_ns[plane] = finish_time_ns
+            self.programmed_pages[plane] += pages_per_plane
+        return finish_time_ns
+
+    def _striped_latency_ns(self, access_num_pages:int, t_op_ns: float) -> float:
+        num_planes = self.nand_config.num_plane * self.nand_config.num_channels
+        if access_num_pages < num_planes:
+            latency_ns = t_op_ns
         else:
-            latency_ns = (
-                access_num_pages
-                / (self.nand_config.num_plane * self.nand_config.num_channels)
-                * self.nand_config.tRead
-            )
+            latency_ns = access_num_pages / num_planes * t_op_ns
 
         if  self.nand_config.enable_strict:
-            latency_ns = math.ceil( access_num_pages / (self.nand_config.num_plane * self.nand_config.num_channels)) \
-                            * self.nand_config.tRead
-            
-        
-        finish_time_ns = latency_ns + arrive_time_ns
-        return finish_time_ns
+            latency_ns = math.ceil(access_num_pages / num_planes) * t_op_ns
+        return latency_ns
+
+    def _select_planes(self, access_num_pages:int) -> list[int]:
+        # 请求占用最早空闲的 min(pages, planes) 个 plane；所有 plane 空闲时退化为原公式
+        num_used_planes = max(1, min(access_num_pages, len(self.plane_free_time_ns)))
+        return sorted(
+            range(len(self.plane_free_time_ns)),
+            key=lambda plane: self.plane_free_time_ns[plane],
+        )[:num_used_planes]
+
+
+def build_nand_sim_core(nand_config:NandConfig) -> NandSimCoreSimple | NandSimCoreChannel:
+    # 由 NandConfig.timing_model 选择 NAND 时序模型
+    if nand_config.timing_model == "simple":
+        return NandSimCoreSimple(nand_config)
+    if nand_config.timing_model == "channel":
+        return NandSimCoreChannel(nand_config)
+    raise ValueError(
+        f"nand_config.timing_model must be one of {NAND_TIMING_MODELS}, got {nand_config.timing_model}"
+    )
 
 
 
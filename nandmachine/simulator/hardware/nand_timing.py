@@ -0,0 +1,163 @@
+"""Array-backed NAND timing core that stripes pages over (channel, plane) units.
+
+Selected with `NandConfig.timing_model="channel"`; writes and reads share the
+plane and channel-bus free times.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from nandmachine.config.config import NandConfig
+
+NAND_TIMING_MODELS = ("simple", "channel")
+
+
+def count_block_erases(
+    programmed_pages: np.ndarray | list[int],
+    new_pages: np.ndarray | int,
+    pages_per_block: int,
+) -> np.ndarray:
+    # 每写满一个 block，在写入下一个 block 的第一个 page 前擦除一次；
+    # 仿真开始时正在写入的 block 视为已擦除。programmed_pages 为此前已写入的 page 数
+    if pages_per_block <= 0:
+        raise ValueError(f"pages_per_block must be > 0, got {pages_per_block}")
+    programmed_pages = np.asarray(programmed_pages, dtype=np.int64)
+    new_pages = np.broadcast_to(np.asarray(new_pages, dtype=np.int64), programmed_pages.shape)
+    num_erases = (programmed_pages + new_pages - 1) // pages_per_block - (
+        np.maximum(programmed_pages, 1) - 1
+    ) // pages_per_block
+    return np.where(new_pages > 0, num_erases, 0)
+
+
+class NandSimCoreChannel:
+    def __init__(self, nand_config: NandConfig) -> None:
+        if nand_config.num_channels <= 0 or nand_config.num_plane <= 0:
+            raise ValueError(
+                "num_channels and num_plane must be > 0, got "
+                f"{nand_config.num_channels} and {nand_config.num_plane}"
+            )
+        if nand_config.tTransfer < 0:
+            raise ValueError(f"tTransfer must be >= 0, got {nand_config.tTransfer}")
+
+        self.nand_config = nand_config
+        self.num_units = nand_config.num_channels * nand_config.num_plane
+
+        # 按 (channel, plane) / channel 记录下一次空闲时间 (ns)
+        self.plane_free_time_ns = np.zeros(
+            (nand_config.num_channels, nand_config.num_plane), dtype=np.float64
+        )
+        self.bus_free_time_ns = np.zeros(nand_config.num_channels, dtype=np.float64)
+
+        # 条带化的起点，下一个请求从上一个请求结束的 unit 继续；读写各自维护
+        self.next_unit = 0
+        self.next_write_unit = 0
+        self.programmed_pages = np.zeros(
+            (nand_config.num_channels, nand_config.num_plane), dtype=np.int64
+        )
+
+        # 第 u 个 unit 对应 channel = u % C, plane = u // C，相邻 page 优先分散到不同 channel
+        unit_index = np.arange(self.num_units)
+        self._unit_channel = unit_index % nand_config.num_channels
+        self._unit_plane = unit_index // nand_config.num_channels
+
+    def handle_request(self, access_num_pages: int, arrive_time_ns: float) -> float:
+        if access_num_pages <= 0:
+            raise ValueError(f"access_num_pages must be > 0, got {access_num_pages}")
+
+        t_read = self.nand_config.tRead
+        t_transfer = self.nand_config.tTransfer
+        num_channels = self.nand_config.num_channels
+
+        # 每个 page 落在哪个 unit，以及它是该 unit 上的第几个 page
+        page_index = np.arange(access_num_pages)
+        page_unit = (self.next_unit + page_index) % self.num_units
+        page_rank = page_index // self.num_units
+        page_channel = self._unit_channel[page_unit]
+        page_plane = self._unit_plane[page_unit]
+
+        # plane 串行读取自己的 page
+        plane_start_ns = np.maximum(
+            arrive_time_ns, self.plane_free_time_ns[page_channel, page_plane]
+        )
+        read_done_ns = plane_start_ns + (page_rank + 1) * t_read
+
+        # plane 读完最后一个 page 后即可服务下一个请求
+        np.maximum.at(
+            self.plane_free_time_ns, (page_channel, page_plane), read_done_ns
+        )
+        self.next_unit = int((self.next_unit + access_num_pages) % self.num_units)
+        if t_transfer == 0:
+            return float(read_done_ns.max())
+
+        # channel bus 按读完的先后顺序串行传输：
+        # end_k = (k + 1) * t + max(bus_free, max_{m <= k}(read_done_m - m * t))
+        order = np.lexsort((read_done_ns, page_channel))
+        sorted_channel = page_channel[order]
+        sorted_read_done_ns = read_done_ns[order]
+        pages_per_channel = np.bincount(sorted_channel, minlength=num_channels)
+        channel_begin = np.cumsum(pages_per_channel) - pages_per_channel
+        bus_rank = page_index - channel_begin[sorted_channel]
+
+        ready_ns = np.full((num_channels, int(pages_per_channel.max())), -np.inf)
+        ready_ns[sorted_channel, bus_rank] = sorted_read_done_ns - bus_rank * t_transfer
+        ready_ns = np.maximum.accumulate(ready_ns, axis=1)
+        transfer_done_ns = (bus_rank + 1) * t_transfer + np.maximum(
+            self.bus_free_time_ns[sorted_channel], ready_ns[sorted_channel, bus_rank]
+        )
+
+        np.maximum.at(self.bus_free_time_ns, sorted_channel, transfer_done_ns)
+        return float(transfer_done_ns.max())
+
+    def handle_write(self, access_num_pages: int, arrive_time_ns: float) -> float:
+        if access_num_pages <= 0:
+            raise ValueError(f"access_num_pages must be > 0, got {access_num_pages}")
+
+        t_transfer = self.nand_config.tTransfer
+        num_channels = self.nand_config.num_channels
+
+        page_unit = (self.next_write_unit + np.arange(access_num_pages)) % self.num_units
+        self.next_write_unit = int(
+            (self.next_write_unit + access_num_pages) % self.num_units
+        )
+        pages_per_unit = np.bincount(page_unit, minlength=self.num_units)
+        used_unit = np.flatnonzero(pages_per_unit)
+        unit_pages = pages_per_unit[used_unit]
+        unit_channel = self._unit_channel[used_unit]
+        unit_plane = self._unit_plane[used_unit]
+
+        # 写入数据先整体经 channel bus 传到 plane
+        data_ready_ns = np.full(num_channels, float(arrive_time_ns))
+        if t_transfer > 0:
+            pages_per_channel = np.bincount(unit_channel, weights=unit_pages, minlength=num_channels)
+            data_ready_ns = (
+                np.maximum(arrive_time_ns, self.bus_free_time_ns) + pages_per_channel * t_transfer
+            )
+            self.bus_free_time_ns = np.where(
+                pages_per_channel > 0, data_ready_ns, self.bus_free_time_ns
+            )
+
+        # plane 先擦除新用到的 block，再逐 page 编程
+        num_erases = count_block_erases(
+            self.programmed_pages[unit_channel, unit_plane],
+            unit_pages,
+            self.nand_config.num_pages,
+        )
+        program_done_ns = (
+            np.maximum(
+                self.plane_free_time_ns[unit_channel, unit_plane],
+                data_ready_ns[unit_channel],
+            )
+            + num_erases * self.nand_config.tErase
+            + unit_pages * self.nand_config.tWrite
+        )
+        self.plane_free_time_ns[unit_channel, unit_plane] = program_done_ns
+        self.programmed_pages[unit_channel, unit_plane] += unit_pages
+        return float(program_done_ns.max())
+
+    def reset(self) -> None:
+        self.plane_free_time_ns.fill(0.0)
+        self.bus_free_time_ns.fill(0.0)
+        self.programmed_pages.fill(0)
+        self.next_unit = 0
+        self.next_write_unit = 0
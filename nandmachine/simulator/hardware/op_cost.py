@@ -0,0 +1,99 @@
+"""Parallel evaluation of macro op costs before the DES event loop.
+
+By default `ComputeEngine` and `TransferEngine` call `compile_and_simulate`
+lazily from inside their coroutines, so the whole cost-model phase runs on one
+core. With `NANDMACHINE_OP_COST_WORKERS` (or `xPU(op_cost_workers=...)`) above
+1, `xPU.load_command` collects the distinct ops of the program, evaluates them
+across a process pool and stores the results in each engine's
+`op_cost_table`; the coroutines then only look the costs up.
+
+Ops are keyed by `macro_op_signature`, i.e. every field except the id and the
+dependencies. Flash attention stores its three component times, because the
+pipelined execute time depends on the op's position in the program.
+"""
+
+from __future__ import annotations
+
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Hashable, Iterable, Optional
+
+from Desim import SimSession
+
+from nandmachine.commands.macro import MacroOp
+from nandmachine.simulator.hardware.repeat import macro_op_signature
+from nandmachine.simulator.software.systolic_lut import compact_systolic_look_up_tables
+
+OP_COST_WORKERS_ENV_VAR = "NANDMACHINE_OP_COST_WORKERS"
+
+
+def get_op_cost_worker_count() -> int:
+    # 默认 1：不做预计算，engine 在仿真过程中按需计算
+    worker_count = int(os.environ.get(OP_COST_WORKERS_ENV_VAR, "1"))
+    if worker_count < 1:
+        raise ValueError(f"{OP_COST_WORKERS_ENV_VAR} must be >= 1, got {worker_count}")
+    return worker_count
+
+
+_worker_engine = None
+
+
+def _init_op_cost_worker(engine_class: type, engine_kwargs: dict) -> None:
+    # 每个 worker 只构造一次 engine，复用其中的仿真实例缓存
+    global _worker_engine
+    SimSession.reset()
+    SimSession.init()
+    _worker_engine = engine_class(**engine_kwargs)
+
+
+def _evaluate_op_cost(macro_op: MacroOp) -> object:
+    return _worker_engine.estimate_op_cost(macro_op)
+
+
+def precompute_op_costs(
+    engine,
+    macro_ops: Iterable[MacroOp],
+    max_workers: int = 1,
+) -> int:
+    """Fill `engine.op_cost_table` with the cost of every distinct op in `macro_ops`.
+
+    `engine` is a `ComputeEngine` or `TransferEngine`; workers rebuild it from
+    `engine.cost_model_kwargs()`. Returns the number of newly evaluated keys.
+    """
+    if max_workers < 1:
+        raise ValueError(f"max_workers must be >= 1, got {max_workers}")
+    op_cost_table: dict[Hashable, object] = engine.op_cost_table
+    pending_ops: dict[Hashable, MacroOp] = {}
+    for macro_op in macro_ops:
+        key = macro_op_signature(macro_op)
+        if key in op_cost_table or key in pending_ops:
+            continue
+        # 去掉依赖再发给 worker，避免把整张指令图 pickle 过去
+        detached_op = copy.copy(macro_op)
+        detached_op.input_ops = []
+        pending_ops[key] = detached_op
+
+    if max_workers == 1 or len(pending_ops) <= 1:
+        for key, macro_op in pending_ops.items():
+            op_cost_table[key] = engine.estimate_op_cost(macro_op)
+        return len(pending_ops)
+
+    with ProcessPoolExecutor(
+        max_workers=min(max_workers, len(pending_ops)),
+        initializer=_init_op_cost_worker,
+        initargs=(type(engine), engine.cost_model_kwargs()),
+    ) as executor:
+        for key, op_cost in zip(
+            pending_ops, executor.map(_evaluate_op_cost, pending_ops.values())
+        ):
+            op_cost_table[key] = op_cost
+    # worker 进程退出时不会执行 atexit，由主进程统一压缩查找表
+    compact_systolic_look_up_tables()
+    return len(pending_ops)
+
+
+def lookup_op_cost(op_cost_table: dict[Hashable, object], macro_op: MacroOp) -> Optional[object]:
+    if not op_cost_table:
+        return None
+    return op_cost_table.get(macro_op_signature(macro_op))
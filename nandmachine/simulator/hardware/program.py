@@ -0,0 +1,268 @@
+"""Array-backed macro op program: parallel NumPy arrays with CSR dependencies.
+
+`xPU.load_program` still builds one `DepSlot` per kept op, so only the program
+itself shrinks.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Hashable, Optional
+
+import numpy as np
+
+from nandmachine.commands.macro import (
+    All2AllOp,
+    AllGatherOp,
+    AllReduceOp,
+    KVCacheAppend,
+    MacroOp,
+    ReduceScatterOp,
+    SramPrefetch,
+    SramPrefetchRelease,
+)
+from nandmachine.simulator.hardware.repeat import (
+    MIN_COLLAPSED_REPEAT_COUNT,
+    RepeatedTripleRun,
+    macro_op_signature,
+)
+from nandmachine.simulator.hardware.utils import DepSlot
+
+TRANSFER_OP_TYPES = (AllReduceOp, AllGatherOp, ReduceScatterOp, All2AllOp)
+
+
+class OpKind(IntEnum):
+    PREFETCH = 0
+    RELEASE = 1
+    KV_APPEND = 2
+    TRANSFER = 3
+    COMPUTE = 4
+
+
+def op_kind(macro_op: MacroOp) -> OpKind:
+    # 与 xPU.load_command 分发到各 engine 的规则一致
+    if isinstance(macro_op, SramPrefetch):
+        return OpKind.PREFETCH
+    if isinstance(macro_op, SramPrefetchRelease):
+        return OpKind.RELEASE
+    if isinstance(macro_op, KVCacheAppend):
+        return OpKind.KV_APPEND
+    if isinstance(macro_op, TRANSFER_OP_TYPES):
+        return OpKind.TRANSFER
+    return OpKind.COMPUTE
+
+
+@dataclass(frozen=True, eq=False)
+class CompactProgram:
+    # 每个 op 所属 engine 的 OpKind 编码
+    kinds: np.ndarray
+    op_ids: np.ndarray
+    # shapes 的下标：macro_op_signature 相同的 op 共用一个代表 op
+    shape_ids: np.ndarray
+    # CSR 形式的依赖关系，值为 op 在程序中的位置
+    input_offsets: np.ndarray
+    input_indices: np.ndarray
+    # tile 生成的各层副本引用同一个 payload，不复制 op 对象
+    payloads: list[MacroOp]
+    shapes: list[MacroOp]
+
+    def __post_init__(self) -> None:
+        num_ops = len(self.kinds)
+        if not (len(self.op_ids) == len(self.shape_ids) == len(self.payloads) == num_ops):
+            raise ValueError("kinds, op_ids, shape_ids and payloads must have the same length")
+        if len(self.input_offsets) != num_ops + 1:
+            raise ValueError(
+                f"input_offsets must have {num_ops + 1} entries, got {len(self.input_offsets)}"
+            )
+        if np.any(self.kinds[self.input_indices] == OpKind.RELEASE):
+            raise NotImplementedError("SramPrefetchRelease cannot be used as a dependency yet")
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @classmethod
+    def from_macro_ops(cls, command_list: list[MacroOp]) -> CompactProgram:
+        position_by_id: dict[int, int] = {}
+        for position, command in enumerate(command_list):
+            if command.id in position_by_id:
+                raise ValueError(f"Duplicate macro op id detected: {command.id}")
+            position_by_id[command.id] = position
+
+        shape_id_by_signature: dict[Hashable, int] = {}
+        shapes: list[MacroOp] = []
+        shape_ids: list[int] = []
+        input_counts: list[int] = []
+        input_indices: list[int] = []
+        for command in command_list:
+            signature = macro_op_signature(command)
+            shape_id = shape_id_by_signature.get(signature)
+            if shape_id is None:
+                shape_id = shape_id_by_signature[signature] = len(shapes)
+                shapes.append(command)
+            shape_ids.append(shape_id)
+
+            input_counts.append(len(command.input_ops))
+            for input_op in command.input_ops:
+                input_position = position_by_id.get(input_op.id)
+                if input_position is None:
+                    raise KeyError(
+                        f"Input macro op id {input_op.id} was not provided to the program"
+                    )
+                input_indices.append(input_position)
+
+        input_offsets = np.zeros(len(command_list) + 1, dtype=np.int64)
+        np.cumsum(input_counts, out=input_offsets[1:])
+        return cls(
+            kinds=np.array([op_kind(command) for command in command_list], dtype=np.uint8),
+            op_ids=np.array([command.id for command in command_list], dtype=np.int64),
+            shape_ids=np.array(shape_ids, dtype=np.int32),
+            input_offsets=input_offsets,
+            input_indices=np.array(input_indices, dtype=np.int32),
+            payloads=list(command_list),
+            shapes=shapes,
+        )
+
+    def tile(self, num_copies: int) -> CompactProgram:
+        """Concatenate `num_copies` copies of the program, as consecutive layers.
+
+        Dependencies are mapped into the same copy. In addition, every op of
+        copy k+1 that has no inputs and is not a prefetch depends on the last
+        compute op of copy k, so a layer's head waits for the previous layer's
+        output while its weight prefetches may still start early. The first
+        copy keeps the op ids; the others get fresh ids but share the payload
+        objects.
+        """
+        if num_copies <= 0:
+            raise ValueError(f"num_copies must be > 0, got {num_copies}")
+        num_ops = len(self)
+        num_edges = len(self.input_indices)
+        first_id = MacroOp.reserve_ids(num_ops * (num_copies - 1))
+        fresh_ids = np.arange(first_id, first_id + num_ops * (num_copies - 1), dtype=np.int64)
+
+        # 后续副本的依赖：层头部（无输入且不是 prefetch）的 op 依赖上一副本最后一个 compute op，
+        # 这里先记为相对本副本的位置 last_compute - num_ops
+        compute_positions = np.flatnonzero(self.kinds == OpKind.COMPUTE)
+        head_positions = np.flatnonzero(
+            (np.diff(self.input_offsets) == 0) & (self.kinds != OpKind.PREFETCH)
+        )
+        chained_offsets, chained_indices = self.input_offsets, self.input_indices.astype(np.int64)
+        if len(compute_positions) > 0 and len(head_positions) > 0:
+            chained_counts = np.diff(self.input_offsets)
+            chained_counts[head_positions] += 1
+            chained_offsets = np.zeros(num_ops + 1, dtype=np.int64)
+            np.cumsum(chained_counts, out=chained_offsets[1:])
+            chained_indices = np.insert(
+                chained_indices,
+                self.input_offsets[head_positions],
+                compute_positions[-1] - num_ops,
+            )
+        num_chained_edges = len(chained_indices)
+        later_copy_indices = np.arange(1, num_copies, dtype=np.int64)
+        later_edge_starts = num_edges + num_chained_edges * (later_copy_indices - 1)
+        return CompactProgram(
+            kinds=np.tile(self.kinds, num_copies),
+            op_ids=np.concatenate([self.op_ids, fresh_ids]),
+            shape_ids=np.tile(self.shape_ids, num_copies),
+            input_offsets=np.concatenate(
+                [
+                    self.input_offsets[:-1],
+                    (chained_offsets[:-1] + later_edge_starts[:, None]).ravel(),
+                    [num_edges + num_chained_edges * (num_copies - 1)],
+                ]
+            ),
+            input_indices=np.concatenate(
+                [
+                    self.input_indices,
+                    (chained_indices + num_ops * later_copy_indices[:, None]).ravel(),
+                ]
+            ).astype(np.int32),
+            payloads=self.payloads * num_copies,
+            shapes=self.shapes,
+        )
+
+    def input_positions(self, position: int) -> np.ndarray:
+        return self.input_indices[self.input_offsets[position] : self.input_offsets[position + 1]]
+
+    def find_repeated_triple_runs(
+        self,
+        min_repeat_count: int = MIN_COLLAPSED_REPEAT_COUNT,
+    ) -> list[RepeatedTripleRun]:
+        # 与 repeat.find_repeated_triple_runs 的规则相同，在数组上判断 triple
+        if min_repeat_count < 1:
+            raise ValueError(f"min_repeat_count must be >= 1, got {min_repeat_count}")
+        num_ops = len(self)
+        if num_ops < 3:
+            return []
+
+        num_inputs = np.diff(self.input_offsets)
+        reference_counts = np.bincount(self.input_indices, minlength=num_ops)
+        first_input = np.full(num_ops, -1, dtype=np.int64)
+        has_inputs = num_inputs > 0
+        first_input[has_inputs] = self.input_indices[self.input_offsets[:-1][has_inputs]]
+
+        positions = np.arange(num_ops - 2)
+        is_triple = (
+            (self.kinds[:-2] == OpKind.PREFETCH)
+            & (num_inputs[:-2] == 0)
+            & (self.kinds[1:-1] == OpKind.COMPUTE)
+            & (num_inputs[1:-1] == 1)
+            & (first_input[1:-1] == positions)
+            & (self.kinds[2:] == OpKind.RELEASE)
+            & (num_inputs[2:] == 1)
+            & (first_input[2:] == positions + 1)
+            # 被合并掉的 prefetch 不能被 triple 之外的指令依赖
+            & (reference_counts[:-2] == 1)
+        ).tolist()
+        signatures = (
+            self.shape_ids[:-2].astype(np.int64) * len(self.shapes) + self.shape_ids[1:-1]
+        ).tolist()
+        reference_counts = reference_counts.tolist()
+
+        runs: list[RepeatedTripleRun] = []
+        next_index = 0
+        for index in np.flatnonzero(is_triple).tolist():
+            if index < next_index:
+                continue
+            repeat_count = 1
+            next_index = index + 3
+            # 只有 run 的最后一次迭代的 compute op 可以被后续指令依赖
+            while (
+                next_index < num_ops - 2
+                and reference_counts[next_index - 2] == 1
+                and is_triple[next_index]
+                and signatures[next_index] == signatures[index]
+            ):
+                repeat_count += 1
+                next_index += 3
+
+            if repeat_count >= min_repeat_count:
+                runs.append(RepeatedTripleRun(start_index=index, repeat_count=repeat_count))
+
+        return runs
+
+    def build_slots(
+        self,
+        positions: np.ndarray,
+        repeat_counts: Optional[np.ndarray] = None,
+    ) -> list[Optional[DepSlot[MacroOp]]]:
+        # 只为 positions 中的 op 建 slot，其余位置为 None；依赖必须都在 positions 中
+        slots: list[Optional[DepSlot[MacroOp]]] = [None] * len(self)
+        positions = positions.tolist()
+        for position in positions:
+            repeat_count = 1 if repeat_counts is None else int(repeat_counts[position])
+            slots[position] = DepSlot(self.payloads[position], repeat_count=repeat_count)
+
+        input_offsets = self.input_offsets.tolist()
+        input_indices = self.input_indices.tolist()
+        for position in positions:
+            start, stop = input_offsets[position], input_offsets[position + 1]
+            if start == stop:
+                continue
+            input_slots = [slots[index] for index in input_indices[start:stop]]
+            if any(input_slot is None for input_slot in input_slots):
+                raise KeyError(
+                    f"Macro op id {int(self.op_ids[position])} depends on an op that was not loaded"
+                )
+            slots[position].input_slots = input_slots
+        return slots
@@ -0,0 +1,154 @@
+"""Detection of repeated prefetch/compute/release triples that the DES collapses.
+
+`NANDMACHINE_DES_REPEAT_MODE=full` simulates every iteration;
+`xpu.UNSUPPORTED_FEATURES` lists the automatic fallbacks.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+from nandmachine.commands.macro import (
+    AllGatherOp,
+    AllReduceOp,
+    All2AllOp,
+    KVCacheAppend,
+    MacroOp,
+    ReduceScatterOp,
+    SramPrefetch,
+    SramPrefetchRelease,
+)
+
+DES_REPEAT_MODE_ENV_VAR = "NANDMACHINE_DES_REPEAT_MODE"
+DES_REPEAT_MODES = ("collapse", "full")
+
+# warm-up 一次 + 稳态一次；之后的迭代按稳态周期解析累加
+REPEAT_SIMULATED_ITERATIONS = 2
+# 至少要有两次迭代被合并到最后一个 slot 中，合并才有意义
+MIN_COLLAPSED_REPEAT_COUNT = REPEAT_SIMULATED_ITERATIONS + 2
+
+_NON_COMPUTE_OP_TYPES = (
+    SramPrefetch,
+    SramPrefetchRelease,
+    KVCacheAppend,
+    AllReduceOp,
+    AllGatherOp,
+    ReduceScatterOp,
+    All2AllOp,
+)
+
+
+_mode: Optional[str] = None
+
+
+def set_des_repeat_mode(mode: Optional[str]) -> None:
+    # 显式配置优先于环境变量；传 None 恢复为读取环境变量
+    global _mode
+    if mode is not None and mode not in DES_REPEAT_MODES:
+        raise ValueError(f"DES repeat mode must be one of {DES_REPEAT_MODES}, got {mode}")
+    _mode = mode
+
+
+def get_des_repeat_mode() -> str:
+    if _mode is not None:
+        return _mode
+    mode = os.environ.get(DES_REPEAT_MODE_ENV_VAR) or "collapse"
+    if mode not in DES_REPEAT_MODES:
+        raise ValueError(
+            f"{DES_REPEAT_MODE_ENV_VAR}={mode} is not one of {DES_REPEAT_MODES}"
+        )
+    return mode
+
+
+@dataclass(frozen=True)
+class RepeatedTripleRun:
+    # start_index 指向第一个 SramPrefetch，run 在 command list 中连续占 3 * repeat_count 个位置
+    start_index: int
+    repeat_count: int
+
+    @property
+    def stop_index(self) -> int:
+        return self.start_index + 3 * self.repeat_count
+
+
+def _freeze_field(value: object) -> Hashable:
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze_field(item) for item in value)
+    return value
+
+
+def macro_op_signature(macro_op: MacroOp) -> Hashable:
+    # id 与依赖关系之外的字段都相同，才视为同一次迭代；也是 op 代价表的 key
+    return (
+        type(macro_op),
+        tuple(
+            (field.name, _freeze_field(getattr(macro_op, field.name)))
+            for field in dataclasses.fields(macro_op)
+            if field.name not in ("id", "input_ops")
+        ),
+    )
+
+
+def _triple_signature(
+    command_list: list[MacroOp],
+    index: int,
+    reference_counts: Counter[int],
+) -> Optional[Hashable]:
+    if index + 3 > len(command_list):
+        return None
+    prefetch, compute, release = command_list[index : index + 3]
+    if not isinstance(prefetch, SramPrefetch) or prefetch.input_ops:
+        return None
+    if isinstance(compute, _NON_COMPUTE_OP_TYPES):
+        return None
+    if [input_op.id for input_op in compute.input_ops] != [prefetch.id]:
+        return None
+    if not isinstance(release, SramPrefetchRelease):
+        return None
+    if [input_op.id for input_op in release.input_ops] != [compute.id]:
+        return None
+    # 被合并掉的 prefetch 不能被 triple 之外的指令依赖
+    if reference_counts[prefetch.id] != 1:
+        return None
+    return prefetch.num_prefetch_pages, macro_op_signature(compute)
+
+
+def find_repeated_triple_runs(
+    command_list: list[MacroOp],
+    min_repeat_count: int = MIN_COLLAPSED_REPEAT_COUNT,
+) -> list[RepeatedTripleRun]:
+    if min_repeat_count < 1:
+        raise ValueError(f"min_repeat_count must be >= 1, got {min_repeat_count}")
+
+    reference_counts: Counter[int] = Counter(
+        input_op.id for command in command_list for input_op in command.input_ops
+    )
+
+    runs: list[RepeatedTripleRun] = []
+    index = 0
+    while index < len(command_list):
+        signature = _triple_signature(command_list, index, reference_counts)
+        if signature is None:
+            index += 1
+            continue
+
+        repeat_count = 1
+        next_index = index + 3
+        # 只有 run 的最后一次迭代的 compute op 可以被后续指令依赖
+        while (
+            reference_counts[command_list[next_index - 2].id] == 1
+            and _triple_signature(command_list, next_index, reference_counts) == signature
+        ):
+            repeat_count += 1
+            next_index += 3
+
+        if repeat_count >= min_repeat_count:
+            runs.append(RepeatedTripleRun(start_index=index, repeat_count=repeat_count))
+        index = next_index
+
+    return runs
+
@@ -0,0 +1,301 @@
+"""Perfetto trace sink that streams events to disk, and the `aggregate` trace summary.
+
+Events are written in chunks, one JSON line each (gzipped for `.gz`), so memory
+does not grow with the trace.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import math
+import os
+import shutil
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Hashable, Iterator, Optional, TextIO
+
+from nandmachine.commands.macro import MacroOp
+from nandmachine.simulator.hardware.repeat import macro_op_signature
+
+TRACE_LEVEL_ENV_VAR = "NANDMACHINE_TRACE_LEVEL"
+TRACE_LEVELS = ("timeline", "aggregate")
+
+_TRACE_HEADER = '{"displayTimeUnit": "ns", "traceEvents": [\n'
+_TRACE_FOOTER = "\n]}\n"
+
+
+def get_trace_level() -> str:
+    # 默认 timeline：逐个 op 记录 Perfetto 事件
+    trace_level = os.environ.get(TRACE_LEVEL_ENV_VAR) or "timeline"
+    if trace_level not in TRACE_LEVELS:
+        raise ValueError(f"{TRACE_LEVEL_ENV_VAR}={trace_level} is not one of {TRACE_LEVELS}")
+    return trace_level
+
+
+@dataclass(frozen=True)
+class StreamingTrack:
+    pid: int
+    tid: int
+    name: str
+
+
+def _open_trace_file(file_name: str, mode: str) -> TextIO:
+    if Path(file_name).suffix == ".gz":
+        return gzip.open(file_name, mode, encoding="utf-8")
+    return open(file_name, mode, encoding="utf-8")
+
+
+class StreamingTraceWriter:
+    def __init__(self, file_name: str, ns_per_cycle: float = 1.0, chunk_size: int = 4096):
+        if not file_name:
+            raise ValueError("file_name must be a non-empty string")
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be >= 1, got {chunk_size}")
+        self.file_name = file_name
+        self.ns_per_cycle = ns_per_cycle
+        self.chunk_size = chunk_size
+
+        self._file: Optional[TextIO] = _open_trace_file(file_name, "wt")
+        self._file.write(_TRACE_HEADER)
+        # 尚未写盘的事件（已序列化）；攒满 chunk_size 条后一次写出
+        self._chunk: list[str] = []
+        self._next_pid = 1
+        self._next_tid = 1
+
+        # 流式写出后不再保留事件本身，只保留计数
+        self.event_count = 0
+        self.complete_event_count = 0
+        self.complete_event_count_by_category: Counter[str] = Counter()
+        self.flushed_event_count = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._file is None
+
+    def register_module(self, name: str) -> int:
+        pid = self._next_pid
+        self._next_pid += 1
+        self._emit({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}})
+        return pid
+
+    def register_track(self, name: str, module: int) -> StreamingTrack:
+        track = StreamingTrack(pid=module, tid=self._next_tid, name=name)
+        self._next_tid += 1
+        self._emit(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": track.pid,
+                "tid": track.tid,
+                "args": {"name": name},
+            }
+        )
+        return track
+
+    def complete_event(
+        self,
+        track: StreamingTrack,
+        start_ts: float,
+        end_ts: float,
+        name: str,
+        category: str,
+        args: Optional[dict] = None,
+    ) -> None:
+        if end_ts < start_ts:
+            raise ValueError(f"end_ts must be >= start_ts, got {start_ts} -> {end_ts}")
+        # Chrome trace 的 ts / dur 以 us 为单位
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": self._cycle_to_us(start_ts),
+            "dur": self._cycle_to_us(end_ts - start_ts),
+            "pid": track.pid,
+            "tid": track.tid,
+        }
+        if args:
+            event["args"] = args
+        self._emit(event)
+        self.complete_event_count += 1
+        self.complete_event_count_by_category[category] += 1
+
+    def flush(self) -> None:
+        if self._file is None or not self._chunk:
+            return
+        text = ",\n".join(self._chunk)
+        if self.flushed_event_count > 0:
+            text = ",\n" + text
+        self._file.write(text)
+        self.flushed_event_count += len(self._chunk)
+        self._chunk.clear()
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self.flush()
+        self._file.write(_TRACE_FOOTER)
+        self._file.close()
+        self._file = None
+
+    def save(self, file_name: str) -> None:
+        # 事件已经写在 self.file_name 中；另给路径时收尾后移动过去
+        self.close()
+        if Path(file_name) != Path(self.file_name):
+            shutil.move(self.file_name, file_name)
+            self.file_name = file_name
+
+    def _cycle_to_us(self, cycle: float) -> float:
+        return cycle * self.ns_per_cycle / 1000.0
+
+    def _emit(self, event: dict) -> None:
+        if self._file is None:
+            raise RuntimeError(f"Trace file {self.file_name} is already closed")
+        self._chunk.append(json.dumps(event, separators=(",", ":")))
+        self.event_count += 1
+        if len(self._chunk) >= self.chunk_size:
+            self.flush()
+
+
+def iter_trace_events(file_name: str) -> Iterator[dict]:
+    """Yield the events of a trace written by `StreamingTraceWriter` one at a time."""
+    with _open_trace_file(file_name, "rt") as trace_file:
+        if trace_file.readline() != _TRACE_HEADER:
+            raise ValueError(f"{file_name} was not written by StreamingTraceWriter")
+        for line in trace_file:
+            line = line.strip()
+            if not line:
+                continue
+            if line == "]}":
+                return
+            yield json.loads(line.rstrip(","))
+    raise ValueError(f"{file_name} ends before the trace footer; was the writer closed?")
+
+
+@dataclass
+class OpTraceStats:
+    count: int = 0
+    total_ns: float = 0.0
+    min_ns: float = math.inf
+    max_ns: float = 0.0
+    # 桶 b 统计单次耗时落在 [2^(b-1), 2^b) ns 的 op，桶 0 统计不足 1ns 的 op
+    histogram: Counter[int] = field(default_factory=Counter)
+
+    def add(self, duration_ns: float, repeat_count: int = 1) -> None:
+        # 合并的迭代按平均单次耗时计入，计数为 repeat_count
+        per_op_ns = duration_ns / repeat_count
+        self.count += repeat_count
+        self.total_ns += duration_ns
+        self.min_ns = min(self.min_ns, per_op_ns)
+        self.max_ns = max(self.max_ns, per_op_ns)
+        self.histogram[int(per_op_ns).bit_length()] += repeat_count
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ns": self.total_ns,
+            "mean_ns": self.total_ns / self.count,
+            "min_ns": self.min_ns,
+            "max_ns": self.max_ns,
+            "histogram_ns": {
+                f"[{0 if bucket == 0 else 2 ** (bucket - 1)}, {2 ** bucket})": count
+                for bucket, count in sorted(self.histogram.items())
+            },
+        }
+
+
+class TraceAggregator:
+    def __init__(self, shape_formatter: Callable[[MacroOp], str], ns_per_cycle: float = 1.0):
+        self.shape_formatter = shape_formatter
+        self.ns_per_cycle = ns_per_cycle
+        self.module_names: list[str] = []
+        self.track_names: list[str] = []
+        # (engine, op 签名) -> 统计；同一签名只保留一个 op，生成摘要时才格式化其形状
+        self._stats: dict[tuple[str, Hashable], OpTraceStats] = {}
+        self._representative_ops: dict[tuple[str, Hashable], MacroOp] = {}
+        # 直接调用 complete_event 的非 macro op 事件按 (engine, 事件名) 聚合
+        self._event_stats: dict[tuple[str, str], OpTraceStats] = {}
+
+        self.event_count = 0
+        self.complete_event_count = 0
+        self.complete_event_count_by_category: Counter[str] = Counter()
+
+    def register_module(self, name: str) -> str:
+        self.module_names.append(name)
+        return name
+
+    def register_track(self, name: str, module: str) -> str:
+        # track 就是 engine 名；同一 xPU 内各 engine 的 track 名互不相同
+        self.track_names.append(name)
+        return name
+
+    def record_macro_op(
+        self,
+        track: str,
+        macro_op: MacroOp,
+        start_ts: float,
+        end_ts: float,
+        category: str,
+        repeat_count: int = 1,
+    ) -> None:
+        key = (track, macro_op_signature(macro_op))
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = OpTraceStats()
+            self._representative_ops[key] = macro_op
+        stats.add((end_ts - start_ts) * self.ns_per_cycle, repeat_count)
+        self._count_event(category)
+
+    def complete_event(
+        self,
+        track: str,
+        start_ts: float,
+        end_ts: float,
+        name: str,
+        category: str,
+        args: Optional[dict] = None,
+    ) -> None:
+        key = (track, name)
+        stats = self._event_stats.get(key)
+        if stats is None:
+            stats = self._event_stats[key] = OpTraceStats()
+        stats.add((end_ts - start_ts) * self.ns_per_cycle)
+        self._count_event(category)
+
+    def summary(self) -> dict:
+        engines = {
+            track_name: {"busy_time_ns": 0.0, "op_count": 0} for track_name in self.track_names
+        }
+        ops = []
+        for key, stats in self._stats.items():
+            macro_op = self._representative_ops[key]
+            ops.append(
+                {
+                    "engine": key[0],
+                    "op_class": type(macro_op).__name__,
+                    "shape": self.shape_formatter(macro_op),
+                    **stats.to_dict(),
+                }
+            )
+        for (track, name), stats in self._event_stats.items():
+            ops.append({"engine": track, "op_class": name, "shape": "", **stats.to_dict()})
+        for op in ops:
+            engines[op["engine"]]["busy_time_ns"] += op["total_ns"]
+            engines[op["engine"]]["op_count"] += op["count"]
+        ops.sort(key=lambda op: (op["engine"], -op["total_ns"], op["op_class"], op["shape"]))
+        return {
+            "trace_level": "aggregate",
+            "complete_event_count": self.complete_event_count,
+            "engines": engines,
+            "ops": ops,
+        }
+
+    def save(self, file_name: str) -> None:
+        with open(file_name, "w", encoding="utf-8") as summary_file:
+            json.dump(self.summary(), summary_file, indent=2)
+
+    def _count_event(self, category: str) -> None:
+        self.event_count += 1
+        self.complete_event_count += 1
+        self.complete_event_count_by_category[category] += 1
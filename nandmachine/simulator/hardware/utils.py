@@ -8,17 +8,28 @@ from nandmachine.commands.macro import MacroOp
 
 T = TypeVar('T')
 
-@dataclass
+@dataclass(slots=True)
 class DepSlot(Generic[T]):
 
     # Used by hardware components to maintain dependencies between instructions
     payload: T
 
     is_finished: bool = False
-    finish_event: Event = field(default_factory=Event)
 
-    input_slots: list[DepSlot[T]] = field(default_factory=list,init=False)
+    # 大于 1 时表示该 slot 代表连续 repeat_count 次相同迭代中的最后一次，
+    # 前面 repeat_count - 1 次由 engine 按稳态周期解析累加（见 hardware/repeat.py）
+    repeat_count: int = 1
+
+    # engine 完成该 slot 时的仿真时间 (ns)；load 时即完成的 slot 保持 None
+    finish_cycle: Optional[int] = None
 
+    input_slots: list[DepSlot[T]] = field(default_factory=list,init=False)
 
+    _finish_event: Optional[Event] = field(default=None, init=False, repr=False)
 
-    
\ No newline at end of file
+    @property
+    def finish_event(self) -> Event:
+        # 第一次被等待或通知时才创建：load 时即完成的 slot、走解析快速路径的程序不创建 Event
+        if self._finish_event is None:
+            self._finish_event = Event()
+        return self._finish_event
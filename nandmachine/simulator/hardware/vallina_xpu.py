@@ -3,6 +3,7 @@ from __future__ import annotations
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
 from Desim import SimModule, SimTime
 from perf_tracer import PerfettoTracer
 from perf_tracer.tracer import TrackInfo
@@ -13,18 +14,21 @@ from nandmachine.commands.macro import (
     MacroOp,
     MatMulOp,
     SramPrefetch,
-    SramPrefetchRelease,
     VectorOp,
 )
 from nandmachine.config.config import NandConfig
+from nandmachine.simulator.hardware.op_cost import get_op_cost_worker_count
+from nandmachine.simulator.hardware.program import CompactProgram, OpKind
+from nandmachine.simulator.hardware.trace_writer import StreamingTraceWriter, TraceAggregator
 from nandmachine.simulator.hardware.utils import DepSlot
 from nandmachine.simulator.hardware.xpu import (
     ComputeEngine,
-    TRANSFER_OP_TYPES,
     TransferEngine,
+    _create_tracer,
     _get_current_sim_cycle,
     _normalize_time_ns,
     _record_macro_op_trace,
+    _resolve_trace_level,
     _validate_trace_binding,
     xPU,
 )
@@ -89,24 +93,11 @@ class VallinaComputeEngine(ComputeEngine):
                     SimModule.wait(input_slot.finish_event)
             
             start_cycle = _get_current_sim_cycle()
+            wait_time_ns = self._estimate_execute_time_ns(
+                macro_op_slot.payload, flash_op_index, flash_op_count
+            )
             if isinstance(macro_op_slot.payload, FlashAttnOp):
-                qk_bmm_time_ns, softmax_time_ns, sv_bmm_time_ns = (
-                    self._estimate_flashattn_component_times_ns(macro_op_slot.payload)
-                )
-                is_last_flash_op = flash_op_index == flash_op_count - 1
-
-                # Pair every flash op with the next one and hide softmax behind
-                # the longer SV stage. Only the last tail op keeps serial softmax.
-                if flash_op_count % 2 == 1 and is_last_flash_op:
-                    execute_time_ns = qk_bmm_time_ns + softmax_time_ns + sv_bmm_time_ns
-                else:
-                    execute_time_ns = qk_bmm_time_ns + max(softmax_time_ns, sv_bmm_time_ns)
                 flash_op_index += 1
-            else:
-                execute_time_ns = self.execute_macro_op(macro_op_slot.payload)
-            if not isinstance(macro_op_slot.payload,VectorOp):
-                execute_time_ns += self.config.tRead
-            wait_time_ns = _normalize_time_ns(execute_time_ns, "execute_time_ns")
             SimModule.wait_time(SimTime(wait_time_ns))
             end_cycle = _get_current_sim_cycle()
             _record_macro_op_trace(
@@ -123,6 +114,31 @@ class VallinaComputeEngine(ComputeEngine):
 
             print(macro_op_slot.payload)
 
+    def _estimate_execute_time_ns(
+        self,
+        macro_op: MacroOp,
+        flash_op_index: int,
+        flash_op_count: int,
+    ) -> int:
+        if isinstance(macro_op, FlashAttnOp):
+            qk_bmm_time_ns, softmax_time_ns, sv_bmm_time_ns = (
+                self._estimate_flashattn_component_times_ns(macro_op)
+            )
+            is_last_flash_op = flash_op_index == flash_op_count - 1
+
+            # Pair every flash op with the next one and hide softmax behind
+            # the longer SV stage. Only the last tail op keeps serial softmax.
+            if flash_op_count % 2 == 1 and is_last_flash_op:
+                execute_time_ns = qk_bmm_time_ns + softmax_time_ns + sv_bmm_time_ns
+            else:
+                execute_time_ns = qk_bmm_time_ns + max(softmax_time_ns, sv_bmm_time_ns)
+        else:
+            execute_time_ns = self.execute_macro_op(macro_op)
+        # 非 vector op 额外计入一次 NAND tRead
+        if not isinstance(macro_op, VectorOp):
+            execute_time_ns += self.config.tRead
+        return _normalize_time_ns(execute_time_ns, "execute_time_ns")
+
 
 class VallinaXPU(xPU):
     def __init__(
@@ -133,6 +149,9 @@ class VallinaXPU(xPU):
         device_name: str = "A100_80GB",
         compile_mode: str = "heuristic-GPU",
         enable_trace: bool = False,
+        trace_level: Optional[str] = None,
+        trace_stream_path: Optional[str] = None,
+        op_cost_workers: Optional[int] = None,
     ):
         SimModule.__init__(self)
 
@@ -141,15 +160,23 @@ class VallinaXPU(xPU):
         self.device_name = device_name
         self.compile_mode = compile_mode
         self.enable_trace = enable_trace
-
-        self.tracer: Optional[PerfettoTracer] = None
+        self.trace_level = _resolve_trace_level(enable_trace, trace_level, trace_stream_path)
+        if op_cost_workers is None:
+            op_cost_workers = get_op_cost_worker_count()
+        if op_cost_workers < 1:
+            raise ValueError(f"op_cost_workers must be >= 1, got {op_cost_workers}")
+        self.op_cost_workers = op_cost_workers
+        # macro op id -> DepSlot，按 command list 的顺序排列
+        self.command_slots: dict[int, DepSlot[MacroOp]] = {}
+
+        self.tracer: Optional[PerfettoTracer | StreamingTraceWriter | TraceAggregator] = None
         self.trace_module_name: Optional[str] = None
         self.prefetch_trace_track: Optional[TrackInfo] = None
         self.compute_trace_track: Optional[TrackInfo] = None
         self.transfer_trace_track: Optional[TrackInfo] = None
 
         if self.enable_trace:
-            self.tracer = PerfettoTracer(ns_per_cycle=1.0)
+            self.tracer = _create_tracer(self.trace_level, trace_stream_path)
             self.trace_module_name = f"{self.__class__.__name__}:{id(self)}"
             trace_module = self.tracer.register_module(self.trace_module_name)
             self.prefetch_trace_track = self.tracer.register_track("prefetch_engine", trace_module)
@@ -186,54 +213,27 @@ class VallinaXPU(xPU):
         return str(output_path)
 
     def load_command(self, command_list: list[MacroOp]):
-        prefetch_engine_slot_list: list[DepSlot[MacroOp]] = []
-        compute_engine_slot_list: list[DepSlot[MacroOp]] = []
-        transfer_engine_slot_list: list[DepSlot[MacroOp]] = []
-
-        slot_map: dict[int, DepSlot[MacroOp]] = {}
-        release_ids = {
-            command.id for command in command_list if isinstance(command, SramPrefetchRelease)
-        }
-
-        for command in command_list:
-            if command.id in slot_map:
-                raise ValueError(f"Duplicate macro op id detected: {command.id}")
-            slot_map[command.id] = DepSlot(command)
-
-        for command in command_list:
-            if any(input_op.id in release_ids for input_op in command.input_ops):
-                raise NotImplementedError(
-                    "SramPrefetchRelease cannot be used as a dependency yet"
-                )
-
-        for command in command_list:
-            input_slots: list[DepSlot[MacroOp]] = []
-            for input_op in command.input_ops:
-                if input_op.id not in slot_map:
-                    raise KeyError(
-                        f"Input macro op id {input_op.id} was not provided to VallinaXPU.load_command"
-                    )
-                input_slots.append(slot_map[input_op.id])
-            slot_map[command.id].input_slots = input_slots
-
-        for command in command_list:
-            slot = slot_map[command.id]
-
-            if isinstance(command, SramPrefetch):
-                prefetch_engine_slot_list.append(slot)
-                continue
-            if isinstance(command, SramPrefetchRelease):
-                slot.is_finished = True
-                continue
-            if isinstance(command, TRANSFER_OP_TYPES):
-                transfer_engine_slot_list.append(slot)
-                continue
-            compute_engine_slot_list.append(slot)
-
-        self.prefetch_engine.load_command_queue(prefetch_engine_slot_list)
-        self.transfer_engine.load_command_queue(transfer_engine_slot_list)
-        self.compute_engine.load_command_queue(compute_engine_slot_list)
+        self.load_program(CompactProgram.from_macro_ops(command_list))
+
+    def load_program(self, program: CompactProgram):
+        positions = np.arange(len(program))
+        slots = program.build_slots(positions)
+
+        for position in positions[
+            (program.kinds == OpKind.RELEASE) | (program.kinds == OpKind.KV_APPEND)
+        ].tolist():
+            # vallina xPU 不建模 SRAM 释放与 NAND 写入，KV 追加视为没有开销
+            slots[position].is_finished = True
+
+        def engine_slot_list(kind: OpKind) -> list[DepSlot[MacroOp]]:
+            return [slots[position] for position in np.flatnonzero(program.kinds == kind).tolist()]
+
+        self.command_slots = dict(zip(program.op_ids.tolist(), slots))
+        self._precompute_op_costs(program)
 
+        self.prefetch_engine.load_command_queue(engine_slot_list(OpKind.PREFETCH))
+        self.transfer_engine.load_command_queue(engine_slot_list(OpKind.TRANSFER))
+        self.compute_engine.load_command_queue(engine_slot_list(OpKind.COMPUTE))
 
 __all__ = [
     "VallinaPrefetchEngine",
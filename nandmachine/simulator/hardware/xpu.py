@@ -1,8 +1,12 @@
+import dataclasses
+import functools
 import math
+from collections import deque
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Hashable, Optional
 
-from Desim import SimModule, SimSession, SimTime
+import numpy as np
+from Desim import EventQueue, SimModule, SimSession, SimTime
 from perf_tracer import PerfettoTracer
 from perf_tracer.tracer import TrackInfo
 
@@ -12,11 +16,11 @@ from nandmachine.commands.macro import (
     AllReduceOp,
     FlashAttnOp,
     FlashMLAOp,
+    KVCacheAppend,
     MacroOp,
     MatMulOp,
     ReduceScatterOp,
     SramPrefetch,
-    SramPrefetchRelease,
     VectorOp,
 )
 from nandmachine.config.config import NandConfig
@@ -25,7 +29,30 @@ from nandmachine.config.interconnect_config import (
     TopologyType,
     get_interconnect_for_device_or_raise,
 )
+from nandmachine.simulator.hardware.collective import CollectiveBarrier
+from nandmachine.simulator.hardware.memory_bandwidth import MemoryBandwidthArbiter
 from nandmachine.simulator.hardware.nand import NandController
+from nandmachine.simulator.hardware.op_cost import (
+    get_op_cost_worker_count,
+    lookup_op_cost,
+    precompute_op_costs,
+)
+from nandmachine.simulator.hardware.program import (
+    TRANSFER_OP_TYPES,
+    CompactProgram,
+    OpKind,
+    op_kind,
+)
+from nandmachine.simulator.hardware.repeat import (
+    REPEAT_SIMULATED_ITERATIONS,
+    get_des_repeat_mode,
+)
+from nandmachine.simulator.hardware.trace_writer import (
+    TRACE_LEVELS,
+    StreamingTraceWriter,
+    TraceAggregator,
+    get_trace_level,
+)
 from nandmachine.simulator.hardware.utils import DepSlot
 from nandmachine.simulator.software.communication_primitives_of_dense import (
     AllReduceSimulation,
@@ -41,9 +68,6 @@ from nandmachine.simulator.software.flash_attention import (
 from nandmachine.simulator.software.matmul import MatMul_Simulation
 
 
-TRANSFER_OP_TYPES = (AllReduceOp, AllGatherOp, ReduceScatterOp, All2AllOp)
-
-
 def _validate_trace_binding(
     tracer: Optional[PerfettoTracer],
     trace_track: Optional[TrackInfo],
@@ -55,6 +79,34 @@ def _validate_trace_binding(
         )
 
 
+def _resolve_trace_level(
+    enable_trace: bool,
+    trace_level: Optional[str],
+    trace_stream_path: Optional[str],
+) -> str:
+    # None 表示跟随 NANDMACHINE_TRACE_LEVEL
+    if trace_level is None:
+        trace_level = get_trace_level() if enable_trace else "timeline"
+    if trace_level not in TRACE_LEVELS:
+        raise ValueError(f"trace_level must be one of {TRACE_LEVELS}, got {trace_level}")
+    if not enable_trace and (trace_level != "timeline" or trace_stream_path is not None):
+        raise ValueError("trace_level and trace_stream_path require enable_trace=True")
+    if trace_level == "aggregate" and trace_stream_path is not None:
+        raise ValueError("trace_stream_path is only supported with trace_level='timeline'")
+    return trace_level
+
+
+def _create_tracer(
+    trace_level: str,
+    trace_stream_path: Optional[str],
+) -> PerfettoTracer | StreamingTraceWriter | TraceAggregator:
+    if trace_level == "aggregate":
+        return TraceAggregator(_format_macro_op_shape, ns_per_cycle=1.0)
+    if trace_stream_path is None:
+        return PerfettoTracer(ns_per_cycle=1.0)
+    return StreamingTraceWriter(trace_stream_path, ns_per_cycle=1.0)
+
+
 def _get_current_sim_cycle() -> int:
     return SimSession.sim_time.cycle
 
@@ -109,6 +161,9 @@ def _format_macro_op_trace_name(macro_op: MacroOp) -> str:
     if isinstance(macro_op, SramPrefetch):
         return f"SramPrefetch[id={macro_op.id},pages={macro_op.num_prefetch_pages}]"
 
+    if isinstance(macro_op, KVCacheAppend):
+        return f"KVCacheAppend[id={macro_op.id},pages={macro_op.num_write_pages}]"
+
     if isinstance(macro_op, AllReduceOp):
         return (
             f"AllReduce[id={macro_op.id},ranks={macro_op.num_ranks},"
@@ -132,6 +187,11 @@ def _format_macro_op_trace_name(macro_op: MacroOp) -> str:
     raise TypeError(f"Unsupported macro op type for trace formatting: {type(macro_op).__name__}")
 
 
+def _format_macro_op_shape(macro_op: MacroOp) -> str:
+    # 聚合 trace 中按形状归类，不带 op id
+    return _format_macro_op_trace_name(macro_op).replace(f"id={macro_op.id},", "", 1)
+
+
 def _record_macro_op_trace(
     tracer: Optional[PerfettoTracer],
     trace_track: Optional[TrackInfo],
@@ -139,16 +199,31 @@ def _record_macro_op_trace(
     start_cycle: int,
     end_cycle: int,
     category: str,
+    repeat_count: int = 1,
 ) -> None:
     if tracer is None:
         return
     if trace_track is None:
         raise ValueError("trace_track must be set when tracer is enabled")
+    if isinstance(tracer, TraceAggregator):
+        # 聚合模式只累加统计，不生成单个事件，也不格式化事件名
+        tracer.record_macro_op(
+            trace_track,
+            macro_op,
+            start_ts=float(start_cycle),
+            end_ts=float(end_cycle),
+            category=category,
+            repeat_count=repeat_count,
+        )
+        return
+    name = _format_macro_op_trace_name(macro_op)
+    if repeat_count > 1:
+        name = f"{name}x{repeat_count}"
     tracer.complete_event(
         trace_track,
         start_ts=float(start_cycle),
         end_ts=float(end_cycle),
-        name=_format_macro_op_trace_name(macro_op),
+        name=name,
         category=category,
     )
 
@@ -159,6 +234,17 @@ def _cycle_count_to_time_ns(cycle_count: float, device: Device) -> int:
     return max(1, math.ceil(cycle_count * 1e9 / device.compute_module.clock_freq))
 
 
+def _wait_for_nand_request(nand_request_slot: DepSlot[int]) -> None:
+    # controller 处理请求时写入 finish_cycle；之前 finish_event 不可能已经触发，
+    # 之后则按 finish_cycle 等待，避免等待一个已经触发过的 event
+    if nand_request_slot.finish_cycle is None:
+        SimModule.wait(nand_request_slot.finish_event)
+        return
+    remaining_ns = nand_request_slot.finish_cycle - _get_current_sim_cycle()
+    if remaining_ns > 0:
+        SimModule.wait_time(SimTime(remaining_ns))
+
+
 def _normalize_time_ns(time_ns: float, name: str) -> int:
     if not math.isfinite(time_ns) or time_ns <= 0:
         raise ValueError(f"{name} must be finite and > 0, got {time_ns}")
@@ -170,11 +256,19 @@ class PerfetchEngine(SimModule):
         self,
         nand_controller: NandController,
         *,
+        skip_first_prefetch: bool = True,
+        sram_capacity_pages: Optional[int] = None,
+        lookahead_depth: int = 1,
         tracer: Optional[PerfettoTracer] = None,
         trace_track: Optional[TrackInfo] = None,
     ):
         super().__init__()
 
+        if sram_capacity_pages is not None and sram_capacity_pages <= 0:
+            raise ValueError(f"sram_capacity_pages must be > 0, got {sram_capacity_pages}")
+        if lookahead_depth < 1:
+            raise ValueError(f"lookahead_depth must be >= 1, got {lookahead_depth}")
+
         # 负责处理发射 SramPrefetch 和 Release 请求
         # 向Nand Controller 发射细粒度的请求
 
@@ -188,10 +282,36 @@ class PerfetchEngine(SimModule):
         self.release_command_queue:list[DepSlot] = []
 
         # special function to skip first prefetch in long pipeline
-        self.is_first_prefetch = True
+        # 多层仿真时上一层的重叠已被显式建模，不再跳过
+        self.is_first_prefetch = skip_first_prefetch
+
+        # 稳态迭代从可以发射到下一次可以发射的间隔，用于推进被合并的重复迭代
+        self.last_prefetch_period_ns: Optional[int] = None
+
+        # SRAM 按 page 计占用；capacity 为 None 时不限制容量，只统计占用
+        self.sram_capacity_pages = sram_capacity_pages
+        self.sram_occupied_pages = 0
+        self.sram_peak_pages = 0
+        self.sram_stall_time_ns = 0
+        # id(prefetch slot) -> 仍驻留在 SRAM 中的 page 数；tile 出的程序各副本共享 payload，不能按 op id 区分
+        self.sram_resident_pages: dict[int, int] = {}
+        self.sram_release_event_queue: EventQueue = EventQueue()
+        self.is_waiting_for_sram = False
+
+
+        # 同时在途的 NAND 请求数上限；按发射顺序组成有界窗口
+        self.lookahead_depth = lookahead_depth
+        self.outstanding_requests: deque[DepSlot[int]] = deque()
+        # id(prefetch slot) -> (NAND 请求, trace 起始时间)，由 process_completion 按序完成
+        self.issued_requests: dict[int, tuple[DepSlot[int], int]] = {}
+        self.issue_event_queue: EventQueue = EventQueue()
+        self.is_completion_waiting = False
+        self.last_ready_cycle: Optional[int] = None
 
 
         self.register_coroutine(self.process)
+        self.register_coroutine(self.process_completion)
+        self.register_coroutine(self.process_release)
 
     def process(self):
         
@@ -199,10 +319,7 @@ class PerfetchEngine(SimModule):
         # 首先从队列中拿出请求
         # 转换为 micro op
         # 一次性发射到 nand controller 中 
-        # 执行结束，调用 runtime 中的函数，改写相关的参数
-        
-        # TODO
-        # 暂时忽略 release 指令的执行 
+        # 请求的完成由 process_completion 处理，release 指令由 process_release 处理
 
 
         for macro_op_slot in self.prefetch_command_queue:
@@ -216,18 +333,66 @@ class PerfetchEngine(SimModule):
             # special function to skip first prefetch in long pipeline
             if self.is_first_prefetch:
                 macro_op_slot.is_finished=True
+                macro_op_slot.finish_cycle = _get_current_sim_cycle()
                 macro_op_slot.finish_event.notify(SimTime(1))
                 self.is_first_prefetch = False
+                self._notify_completion()
                 continue
 
+            # 窗口已满时等待最早发射的请求完成
+            while len(self.outstanding_requests) >= self.lookahead_depth:
+                _wait_for_nand_request(self.outstanding_requests.popleft())
+
+            ready_cycle = _get_current_sim_cycle()
+            if macro_op_slot.repeat_count > 1:
+                # 被合并的迭代与上一次稳态迭代相同：按稳态迭代的发射间隔直接推进时间
+                if self.last_ready_cycle is None:
+                    raise RuntimeError(
+                        "Collapsed prefetch slot requires a simulated steady-state iteration"
+                    )
+                self.last_prefetch_period_ns = ready_cycle - self.last_ready_cycle
+                if self.last_prefetch_period_ns > 0:
+                    SimModule.wait_time(
+                        SimTime((macro_op_slot.repeat_count - 1) * self.last_prefetch_period_ns)
+                    )
+            self.last_ready_cycle = ready_cycle
+
+            # SRAM 空间不足时阻塞，直到之前的 release 退休
+            stall_start_cycle = _get_current_sim_cycle()
+            num_pages = macro_op_slot.payload.num_prefetch_pages
+            while not self._can_allocate_sram(num_pages):
+                self.is_waiting_for_sram = True
+                SimModule.wait(self.sram_release_event_queue.event)
+            self.is_waiting_for_sram = False
+            self.sram_stall_time_ns += _get_current_sim_cycle() - stall_start_cycle
+            self._allocate_sram(id(macro_op_slot), num_pages)
 
             # 开始执行
             start_cycle = _get_current_sim_cycle()
+            if macro_op_slot.repeat_count > 1:
+                start_cycle = ready_cycle
             nand_request_slot = DepSlot(macro_op_slot.payload.num_prefetch_pages)
 
             self.nand_controller.handle_request(nand_request_slot)
+            self.outstanding_requests.append(nand_request_slot)
+            self.issued_requests[id(macro_op_slot)] = (nand_request_slot, start_cycle)
+            self._notify_completion()
+
+    def process_completion(self):
+        # 按发射顺序完成 prefetch：NAND 请求结束后标记 slot 并通知下游
+        for macro_op_slot in self.prefetch_command_queue:
+            while (
+                id(macro_op_slot) not in self.issued_requests
+                and not macro_op_slot.is_finished
+            ):
+                self.is_completion_waiting = True
+                SimModule.wait(self.issue_event_queue.event)
+            self.is_completion_waiting = False
+            if macro_op_slot.is_finished:
+                continue
 
-            SimModule.wait(nand_request_slot.finish_event)
+            nand_request_slot, start_cycle = self.issued_requests.pop(id(macro_op_slot))
+            _wait_for_nand_request(nand_request_slot)
             end_cycle = _get_current_sim_cycle()
             _record_macro_op_trace(
                 self.tracer,
@@ -236,17 +401,110 @@ class PerfetchEngine(SimModule):
                 start_cycle,
                 end_cycle,
                 "prefetch",
+                macro_op_slot.repeat_count,
             )
 
             macro_op_slot.is_finished = True
+            macro_op_slot.finish_cycle = end_cycle
             macro_op_slot.finish_event.notify(SimTime(1))
 
-    
+    def _notify_completion(self) -> None:
+        if self.is_completion_waiting:
+            self.issue_event_queue.next_notify(SimTime(1))
+
+    def process_release(self):
+        # release 在其 compute op 完成后释放对应 prefetch 占用的 SRAM
+        for release_slot in self.release_command_queue:
+            for input_slot in release_slot.input_slots:
+                if not input_slot.is_finished:
+                    SimModule.wait(input_slot.finish_event)
+
+            for input_slot in release_slot.input_slots:
+                for prefetch_slot in input_slot.input_slots:
+                    self._free_sram(id(prefetch_slot))
+
+            release_slot.is_finished = True
+            release_slot.finish_cycle = _get_current_sim_cycle()
+            # 只有 prefetch 正在等待空间时才通知，避免在仿真末尾多推进时间
+            if self.is_waiting_for_sram:
+                self.sram_release_event_queue.next_notify(SimTime(1))
+
+    def _can_allocate_sram(self, num_pages: int) -> bool:
+        # SRAM 为空时总是允许，单个 prefetch 超过容量也不会死锁
+        if self.sram_capacity_pages is None or self.sram_occupied_pages == 0:
+            return True
+        return self.sram_occupied_pages + num_pages <= self.sram_capacity_pages
+
+    def _allocate_sram(self, prefetch_key: int, num_pages: int) -> None:
+        self.sram_resident_pages[prefetch_key] = num_pages
+        self.sram_occupied_pages += num_pages
+        self.sram_peak_pages = max(self.sram_peak_pages, self.sram_occupied_pages)
+
+    def _free_sram(self, prefetch_key: int) -> None:
+        # 被跳过的第一个 prefetch 没有占用 SRAM；同一个 prefetch 只释放一次
+        num_pages = self.sram_resident_pages.pop(prefetch_key, 0)
+        self.sram_occupied_pages -= num_pages
                 
-    def load_command_queue(self,command_queue:list[DepSlot]):
+    def load_command_queue(
+        self,
+        command_queue:list[DepSlot],
+        release_command_queue: Optional[list[DepSlot]] = None,
+    ):
 
         self.prefetch_command_queue = command_queue
+        self.release_command_queue = release_command_queue or []
+
+
+
+class NandWriteEngine(SimModule):
+    def __init__(
+        self,
+        nand_controller: NandController,
+        *,
+        tracer: Optional[PerfettoTracer] = None,
+        trace_track: Optional[TrackInfo] = None,
+    ):
+        super().__init__()
+
+        # 负责把 KVCacheAppend 写回 NAND，写入与 prefetch 共享 plane，不阻塞计算
+        self.nand_controller = nand_controller
+        self.tracer = tracer
+        self.trace_track = trace_track
+        _validate_trace_binding(self.tracer, self.trace_track, self.__class__.__name__)
 
+        self.write_command_queue:list[DepSlot[MacroOp]] = []
+
+
+        self.register_coroutine(self.process)
+
+    def process(self):
+        for macro_op_slot in self.write_command_queue:
+            for input_slot in macro_op_slot.input_slots:
+                if not input_slot.is_finished:
+                    SimModule.wait(input_slot.finish_event)
+
+            assert isinstance(macro_op_slot.payload, KVCacheAppend)
+            start_cycle = _get_current_sim_cycle()
+            nand_request_slot = DepSlot(macro_op_slot.payload.num_write_pages)
+            self.nand_controller.handle_write_request(nand_request_slot)
+            _wait_for_nand_request(nand_request_slot)
+            end_cycle = _get_current_sim_cycle()
+            _record_macro_op_trace(
+                self.tracer,
+                self.trace_track,
+                macro_op_slot.payload,
+                start_cycle,
+                end_cycle,
+                "write",
+            )
+
+            macro_op_slot.is_finished = True
+            macro_op_slot.finish_cycle = end_cycle
+            macro_op_slot.finish_event.notify(SimTime(1))
+
+    def load_command_queue(self,command_queue:list[DepSlot[MacroOp]]):
+
+        self.write_command_queue = command_queue
 
 
 class ComputeEngine(SimModule):
@@ -257,6 +515,8 @@ class ComputeEngine(SimModule):
         hbm_bandwidth_bytes_per_sec: float,
         device_name: str = "A100_80GB",
         compile_mode: str = "heuristic-GPU",
+        issue_window: int = 1,
+        memory_arbiter: Optional[MemoryBandwidthArbiter] = None,
         tracer: Optional[PerfettoTracer] = None,
         trace_track: Optional[TrackInfo] = None,
     ):
@@ -278,8 +538,27 @@ class ComputeEngine(SimModule):
 
         
         self.command_queue:list[DepSlot[MacroOp]] = []
+        # macro_op_signature -> 代价，由 xPU.load_command 的并行预计算填充
+        self.op_cost_table: dict[Hashable, object] = {}
+
+        # 在程序顺序的前 issue_window 个 op 中发射最老的就绪 op，1 表示严格按序执行；
+        # 执行单元仍只有一个，重排只改变发射顺序
+        if issue_window < 1:
+            raise ValueError(f"issue_window must be >= 1, got {issue_window}")
+        self.issue_window = issue_window
+        # 越过更老的未就绪 op 先发射的次数
+        self.reordered_op_count = 0
+
+        # core 数 -> 只保留这么多 core 的 device，多 stream 分区时按需创建
+        self._partitioned_devices: dict[int, Device] = {}
+        # 非空时与 NAND 请求共享 HBF 带宽；HBF 带宽份额 -> 对应的 NandConfig
+        self.memory_arbiter = memory_arbiter
+        self._shared_nand_configs: dict[float, NandConfig] = {}
 
 
+        self._register_coroutines()
+
+    def _register_coroutines(self) -> None:
         self.register_coroutine(self.process)
 
 
@@ -287,33 +566,50 @@ class ComputeEngine(SimModule):
         # Count flash attention ops once so the simplified pipeline rule can
         # identify whether the last flash op must keep the serial softmax tail.
         flash_op_count = sum(
-            1 for macro_op_slot in self.command_queue if isinstance(macro_op_slot.payload, FlashAttnOp)
+            macro_op_slot.repeat_count
+            for macro_op_slot in self.command_queue
+            if isinstance(macro_op_slot.payload, FlashAttnOp)
         )
         flash_op_index = 0
+        # 已经等到 finish event 的输入；产生它的协程可能还没在同一时刻标记 is_finished
+        arrived_slot_ids: set[int] = set()
+        window: list[DepSlot[MacroOp]] = []
+        next_queue_index = 0
 
         # 做好相关的同步 
-        for macro_op_slot in self.command_queue:
-            for input_slot in macro_op_slot.input_slots:
-                if not input_slot.is_finished:
-                    SimModule.wait(input_slot.finish_event)
+        while next_queue_index < len(self.command_queue) or window:
+            while len(window) < self.issue_window and next_queue_index < len(self.command_queue):
+                window.append(self.command_queue[next_queue_index])
+                next_queue_index += 1
+            window_index = self._wait_for_issuable_slot(window, arrived_slot_ids)
+            macro_op_slot = window.pop(window_index)
+            if window_index > 0:
+                self.reordered_op_count += 1
+
+            collapsed_start_cycle = _get_current_sim_cycle()
+            if macro_op_slot.repeat_count > 1:
+                # 被合并的迭代在稳态下背靠背执行，每次还包含 1ns 的完成通知；
+                # 之后再等待最后一次迭代的输入，与逐次仿真的 max-plus 递推一致
+                collapsed_count = macro_op_slot.repeat_count - 1
+                collapsed_time_ns = self._estimate_execute_time_ns(
+                    macro_op_slot.payload, flash_op_index, flash_op_count
+                )
+                if isinstance(macro_op_slot.payload, FlashAttnOp):
+                    flash_op_index += collapsed_count
+                SimModule.wait_time(SimTime(collapsed_count * (collapsed_time_ns + 1)))
+
+                for input_slot in macro_op_slot.input_slots:
+                    if not input_slot.is_finished and id(input_slot) not in arrived_slot_ids:
+                        SimModule.wait(input_slot.finish_event)
             
             start_cycle = _get_current_sim_cycle()
+            if macro_op_slot.repeat_count > 1:
+                start_cycle = collapsed_start_cycle
+            wait_time_ns = self._estimate_shared_execute_time_ns(
+                macro_op_slot.payload, flash_op_index, flash_op_count
+            )
             if isinstance(macro_op_slot.payload, FlashAttnOp):
-                qk_bmm_time_ns, softmax_time_ns, sv_bmm_time_ns = (
-                    self._estimate_flashattn_component_times_ns(macro_op_slot.payload)
-                )
-                is_last_flash_op = flash_op_index == flash_op_count - 1
-
-                # Pair every flash op with the next one and hide softmax behind
-                # the longer SV stage. Only the last tail op keeps serial softmax.
-                if flash_op_count % 2 == 1 and is_last_flash_op:
-                    execute_time_ns = qk_bmm_time_ns + softmax_time_ns + sv_bmm_time_ns
-                else:
-                    execute_time_ns = qk_bmm_time_ns + max(softmax_time_ns, sv_bmm_time_ns)
                 flash_op_index += 1
-            else:
-                execute_time_ns = self.execute_macro_op(macro_op_slot.payload)
-            wait_time_ns = _normalize_time_ns(execute_time_ns, "execute_time_ns")
             SimModule.wait_time(SimTime(wait_time_ns))
             end_cycle = _get_current_sim_cycle()
             _record_macro_op_trace(
@@ -323,14 +619,125 @@ class ComputeEngine(SimModule):
                 start_cycle,
                 end_cycle,
                 "compute",
+                macro_op_slot.repeat_count,
             )
             macro_op_slot.finish_event.notify(SimTime(1))
             SimModule.wait(macro_op_slot.finish_event)
             macro_op_slot.is_finished = True
+            macro_op_slot.finish_cycle = _get_current_sim_cycle()
 
             print(macro_op_slot.payload)
 
-            
+    def _wait_for_issuable_slot(
+        self,
+        window: list[DepSlot[MacroOp]],
+        arrived_slot_ids: set[int],
+    ) -> int:
+        # 返回窗口中最老的可发射 op 的下标；issue_window 为 1 时与逐个等待输入的顺序执行一致
+        while True:
+            for window_index, macro_op_slot in enumerate(window):
+                if macro_op_slot.repeat_count > 1:
+                    # 合并的重复迭代要先推进前导时间再检查输入，只在成为最老的 op 时按序发射，
+                    # 更年轻的 op 也不能越过它
+                    if window_index == 0:
+                        return 0
+                    break
+                if all(
+                    input_slot.is_finished or id(input_slot) in arrived_slot_ids
+                    for input_slot in macro_op_slot.input_slots
+                ):
+                    return window_index
+
+            # 没有就绪的 op：等待最老 op 第一个未完成的输入后重新检查。
+            # prefetch 按发射顺序完成，最老 op 的输入通常最先到达
+            waiting_slot = next(
+                input_slot
+                for input_slot in window[0].input_slots
+                if not input_slot.is_finished and id(input_slot) not in arrived_slot_ids
+            )
+            SimModule.wait(waiting_slot.finish_event)
+            arrived_slot_ids.add(id(waiting_slot))
+
+    def _estimate_execute_time_ns(
+        self,
+        macro_op: MacroOp,
+        flash_op_index: int,
+        flash_op_count: int,
+        core_count: Optional[int] = None,
+        hbf_bandwidth_share: float = 1.0,
+    ) -> int:
+        # 只传入非默认的资源划分，按整卡、独占带宽估算时调用方式不变
+        cost_kwargs: dict[str, object] = {}
+        if core_count is not None:
+            cost_kwargs["core_count"] = core_count
+        if hbf_bandwidth_share != 1.0:
+            cost_kwargs["hbf_bandwidth_share"] = hbf_bandwidth_share
+        if isinstance(macro_op, FlashAttnOp):
+            qk_bmm_time_ns, softmax_time_ns, sv_bmm_time_ns = (
+                self._estimate_flashattn_component_times_ns(macro_op, **cost_kwargs)
+            )
+            is_last_flash_op = flash_op_index == flash_op_count - 1
+
+            # Pair every flash op with the next one and hide softmax behind
+            # the longer SV stage. Only the last tail op keeps serial softmax.
+            if flash_op_count % 2 == 1 and is_last_flash_op:
+                execute_time_ns = qk_bmm_time_ns + softmax_time_ns + sv_bmm_time_ns
+            else:
+                execute_time_ns = qk_bmm_time_ns + max(softmax_time_ns, sv_bmm_time_ns)
+        else:
+            execute_time_ns = self.execute_macro_op(macro_op, **cost_kwargs)
+        return _normalize_time_ns(execute_time_ns, "execute_time_ns")
+
+    def _estimate_shared_execute_time_ns(
+        self,
+        macro_op: MacroOp,
+        flash_op_index: int,
+        flash_op_count: int,
+        core_count: Optional[int] = None,
+    ) -> int:
+        # 有 NAND 请求在途时按 arbiter 分到的 HBF 带宽重新估算，并登记本 op 的占用
+        execute_time_ns = self._estimate_execute_time_ns(
+            macro_op, flash_op_index, flash_op_count, core_count
+        )
+        if self.memory_arbiter is None:
+            return execute_time_ns
+        current_cycle = _get_current_sim_cycle()
+        hbf_bandwidth_share = self.memory_arbiter.share("compute", current_cycle)
+        shared_execute_time_ns = execute_time_ns
+        if hbf_bandwidth_share < 1.0:
+            shared_execute_time_ns = self._estimate_execute_time_ns(
+                macro_op, flash_op_index, flash_op_count, core_count, hbf_bandwidth_share
+            )
+        self.memory_arbiter.reserve(
+            "compute", current_cycle + shared_execute_time_ns, current_cycle + execute_time_ns
+        )
+        return shared_execute_time_ns
+
+    def _nand_config_for_hbf_share(self, hbf_bandwidth_share: float) -> NandConfig:
+        # 代价模型的 HBF 带宽为 channel * plane * page / tRead，放大 tRead 即按比例缩小带宽
+        if hbf_bandwidth_share == 1.0:
+            return self.config
+        if not 0.0 < hbf_bandwidth_share < 1.0:
+            raise ValueError(
+                f"hbf_bandwidth_share must be in (0, 1], got {hbf_bandwidth_share}"
+            )
+        nand_config = self._shared_nand_configs.get(hbf_bandwidth_share)
+        if nand_config is None:
+            nand_config = self._shared_nand_configs[hbf_bandwidth_share] = dataclasses.replace(
+                self.config, tRead=self.config.tRead / hbf_bandwidth_share
+            )
+        return nand_config
+
+    def _device_for_core_count(self, core_count: Optional[int]) -> Device:
+        # None 或整卡 core 数时用原 device，op 代价表只对整卡有效
+        if core_count is None or core_count == self.device.compute_module.core_count:
+            return self.device
+        device = self._partitioned_devices.get(core_count)
+        if device is None:
+            device = self._partitioned_devices[core_count] = self.device.with_core_count(
+                core_count
+            )
+        return device
 
     def _validate_flashattn_shapes(self, macro_op: FlashAttnOp) -> None: # flashattn中的矩阵shape合法性检查
         qk_b, qk_m, qk_k, qk_n = macro_op.qk_bmm_input_shape
@@ -437,14 +844,18 @@ class ComputeEngine(SimModule):
         if shape_errors:
             raise ValueError("FlashMLAOp shape mismatch: " + "; ".join(shape_errors))
 
-    def _estimate_vector_cycles(self, macro_op: VectorOp) -> float:
+    def _estimate_vector_cycles(
+        self, macro_op: VectorOp, device: Optional[Device] = None
+    ) -> float:
         self._validate_vector_shape(macro_op)
+        if device is None:
+            device = self.device
 
         total_elements = math.prod(macro_op.vector_shape)
-        vector_flops_per_cycle = self.device.compute_module.get_total_vector_flops_per_cycle(
+        vector_flops_per_cycle = device.compute_module.get_total_vector_flops_per_cycle(
             macro_op.weight_bits
         )
-        exp_flops = self.device.compute_module.core.vector_unit.flops_per_exp
+        exp_flops = device.compute_module.core.vector_unit.flops_per_exp
 
         if macro_op.vector_op_type == "rms_norm":
             total_flops = total_elements * 8
@@ -470,8 +881,17 @@ class ComputeEngine(SimModule):
         return weight_bits // 8
 
     def _estimate_flashattn_component_times_ns(
-        self, macro_op: FlashAttnOp
+        self,
+        macro_op: FlashAttnOp,
+        core_count: Optional[int] = None,
+        hbf_bandwidth_share: float = 1.0,
     ) -> tuple[int, int, int]:
+        device = self._device_for_core_count(core_count)
+        nand_config = self._nand_config_for_hbf_share(hbf_bandwidth_share)
+        if device is self.device and nand_config is self.config:
+            component_times_ns = lookup_op_cost(self.op_cost_table, macro_op)
+            if component_times_ns is not None:
+                return component_times_ns
         self._validate_flashattn_shapes(macro_op)
 
         qk_bmm_sim = FlashAttn_BatchedMatMul_Simulation.get_instance(
@@ -480,8 +900,8 @@ class ComputeEngine(SimModule):
             weight_bits=macro_op.weight_bits,
         )
         qk_bmm_time_ns = qk_bmm_sim.compile_and_simulate(
-            pcb_module=self.device,
-            nand_config=self.config,
+            pcb_module=device,
+            nand_config=nand_config,
             hbm_bandwidth_bytes_per_sec=self.hbm_bandwidth_bytes_per_sec,
             compile_mode=self.compile_mode,
             return_unit="time_ns",
@@ -492,7 +912,7 @@ class ComputeEngine(SimModule):
             weight_bits=macro_op.weight_bits,
         )
         softmax_time_ns = softmax_sim.compile_and_simulate(
-            pcb_module=self.device,
+            pcb_module=device,
             compile_mode=self.compile_mode,
             return_unit="time_ns",
         )
@@ -502,8 +922,8 @@ class ComputeEngine(SimModule):
             weight_bits=macro_op.weight_bits,
         )
         sv_bmm_time_ns = sv_bmm_sim.compile_and_simulate(
-            pcb_module=self.device,
-            nand_config=self.config,
+            pcb_module=device,
+            nand_config=nand_config,
             hbm_bandwidth_bytes_per_sec=self.hbm_bandwidth_bytes_per_sec,
             compile_mode=self.compile_mode,
             return_unit="time_ns",
@@ -515,15 +935,47 @@ class ComputeEngine(SimModule):
             _normalize_time_ns(sv_bmm_time_ns, "sv_bmm_time_ns"),
         )
 
-    def execute_macro_op(self,macro_op:MacroOp)->float:
+    def estimate_op_cost(self, macro_op: MacroOp) -> object:
+        # FlashAttn 缓存三段组件时间，流水配对后的时间取决于 op 在程序中的位置
+        if isinstance(macro_op, FlashAttnOp):
+            return self._estimate_flashattn_component_times_ns(macro_op)
+        return self.execute_macro_op(macro_op)
+
+    def cost_model_kwargs(self) -> dict:
+        # 预计算的 worker 用这些参数重建 engine
+        return dict(
+            nand_config=self.config,
+            hbm_bandwidth_bytes_per_sec=self.hbm_bandwidth_bytes_per_sec,
+            device_name=self.device_name,
+            compile_mode=self.compile_mode,
+        )
+
+    def execute_macro_op(
+        self,
+        macro_op: MacroOp,
+        core_count: Optional[int] = None,
+        hbf_bandwidth_share: float = 1.0,
+    ) -> float:
+        # 默认按整卡、独占 HBF 带宽估算；多 stream 分区或带宽仲裁时按分到的资源重新走代价模型
+        device = self._device_for_core_count(core_count)
+        nand_config = self._nand_config_for_hbf_share(hbf_bandwidth_share)
+        if (
+            device is self.device
+            and nand_config is self.config
+            and not isinstance(macro_op, (FlashAttnOp, VectorOp))
+        ):
+            op_cost = lookup_op_cost(self.op_cost_table, macro_op)
+            if op_cost is not None:
+                return op_cost
+
         if isinstance(macro_op, MatMulOp):
             matmul_sim = MatMul_Simulation.get_instance(
                 dim=macro_op.shape,
                 weight_bits=macro_op.weight_bits,
             )
             matmul_time_ns = matmul_sim.compile_and_simulate(
-                pcb_module=self.device,
-                nand_config=self.config,
+                pcb_module=device,
+                nand_config=nand_config,
                 hbm_bandwidth_bytes_per_sec=self.hbm_bandwidth_bytes_per_sec,
                 compile_mode=self.compile_mode,
                 return_unit="time_ns",
@@ -532,7 +984,9 @@ class ComputeEngine(SimModule):
 
         if isinstance(macro_op, FlashAttnOp):
             qk_bmm_time_ns, softmax_time_ns, sv_bmm_time_ns = (
-                self._estimate_flashattn_component_times_ns(macro_op)
+                self._estimate_flashattn_component_times_ns(
+                    macro_op, core_count, hbf_bandwidth_share
+                )
             )
             flashattn_time_ns = qk_bmm_time_ns + softmax_time_ns + sv_bmm_time_ns
             return _normalize_time_ns(flashattn_time_ns, "flashattn_time_ns")
@@ -548,8 +1002,8 @@ class ComputeEngine(SimModule):
                 weight_bits=macro_op.weight_bits,
             )
             flashmla_time_ns = flashmla_sim.compile_and_simulate(
-                pcb_module=self.device,
-                nand_config=self.config,
+                pcb_module=device,
+                nand_config=nand_config,
                 hbm_bandwidth_bytes_per_sec=self.hbm_bandwidth_bytes_per_sec,
                 compile_mode=self.compile_mode,
                 return_unit="time_ns",
@@ -557,8 +1011,8 @@ class ComputeEngine(SimModule):
             return _normalize_time_ns(flashmla_time_ns, "flashmla_time_ns")
 
         if isinstance(macro_op, VectorOp):
-            vector_cycles = self._estimate_vector_cycles(macro_op)
-            vector_time_ns = _cycle_count_to_time_ns(vector_cycles, self.device)
+            vector_cycles = self._estimate_vector_cycles(macro_op, device)
+            vector_time_ns = _cycle_count_to_time_ns(vector_cycles, device)
             return vector_time_ns
 
         raise TypeError(f"Unsupported macro op type: {type(macro_op).__name__}")
@@ -571,6 +1025,184 @@ class ComputeEngine(SimModule):
 
 
 
+class MultiStreamComputeEngine(ComputeEngine):
+    """Compute engine that runs several streams of ops concurrently.
+
+    Every op runs on the stream in its `MacroOp.stream`, and each stream keeps
+    program order. When an op is ready, it takes an equal share of
+    `Device.compute_module.core_count` among the streams that are running an
+    op or whose next op has all its inputs finished. Its cost is then
+    re-estimated for that core count. Cores stay with the op until it
+    finishes, so a stream whose share is not free waits for a running op to
+    release its cores.
+    """
+
+    def __init__(
+        self,
+        nand_config: NandConfig,
+        *,
+        num_streams: int,
+        hbm_bandwidth_bytes_per_sec: float,
+        device_name: str = "A100_80GB",
+        compile_mode: str = "heuristic-GPU",
+        memory_arbiter: Optional[MemoryBandwidthArbiter] = None,
+        tracer: Optional[PerfettoTracer] = None,
+        stream_trace_tracks: Optional[list[TrackInfo]] = None,
+    ):
+        if num_streams < 1:
+            raise ValueError(f"num_streams must be >= 1, got {num_streams}")
+        if stream_trace_tracks is not None and len(stream_trace_tracks) != num_streams:
+            raise ValueError(
+                f"Expected {num_streams} stream trace tracks, got {len(stream_trace_tracks)}"
+            )
+        # 注册协程时就要知道 stream 数
+        self.num_streams = num_streams
+        self.stream_trace_tracks = stream_trace_tracks
+        super().__init__(
+            nand_config,
+            hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+            device_name=device_name,
+            compile_mode=compile_mode,
+            memory_arbiter=memory_arbiter,
+            tracer=tracer,
+            trace_track=None if stream_trace_tracks is None else stream_trace_tracks[0],
+        )
+
+        self.stream_command_queues: list[list[DepSlot[MacroOp]]] = [
+            [] for _ in range(num_streams)
+        ]
+        self.total_core_count = self.device.compute_module.core_count
+        self.free_core_count = self.total_core_count
+        self.core_release_event_queue: EventQueue = EventQueue()
+        # 每个 stream 正在等待或执行的 slot，stream 执行完后为 None
+        self._stream_heads: list[Optional[DepSlot[MacroOp]]] = [None] * num_streams
+        self._running_streams: set[int] = set()
+
+        # 统计：就绪的 op 等待空闲 core 的累计时间，以及同时执行的 op 数峰值
+        self.core_wait_time_ns = 0
+        self.peak_concurrent_op_count = 0
+
+    def cost_model_kwargs(self) -> dict:
+        return dict(super().cost_model_kwargs(), num_streams=self.num_streams)
+
+    def _register_coroutines(self) -> None:
+        for stream in range(self.num_streams):
+            self.register_coroutine(functools.partial(self._process_stream, stream))
+
+    def load_command_queue(self, command_queue: list[DepSlot[MacroOp]]):
+        stream_command_queues: list[list[DepSlot[MacroOp]]] = [
+            [] for _ in range(self.num_streams)
+        ]
+        for macro_op_slot in command_queue:
+            stream = macro_op_slot.payload.stream
+            if stream >= self.num_streams:
+                raise ValueError(
+                    f"Macro op id {macro_op_slot.payload.id} is assigned to stream {stream}, "
+                    f"but the compute engine has {self.num_streams} streams"
+                )
+            stream_command_queues[stream].append(macro_op_slot)
+        self.command_queue = command_queue
+        self.stream_command_queues = stream_command_queues
+        self._stream_heads = [
+            stream_command_queue[0] if stream_command_queue else None
+            for stream_command_queue in stream_command_queues
+        ]
+
+    def _process_stream(self, stream: int):
+        command_queue = self.stream_command_queues[stream]
+        trace_track = None if self.stream_trace_tracks is None else self.stream_trace_tracks[stream]
+        # flash attention 的配对规则在每个 stream 内单独计算
+        flash_op_count = sum(
+            macro_op_slot.repeat_count
+            for macro_op_slot in command_queue
+            if isinstance(macro_op_slot.payload, FlashAttnOp)
+        )
+        flash_op_index = 0
+
+        for queue_index, macro_op_slot in enumerate(command_queue):
+            self._stream_heads[stream] = macro_op_slot
+            collapsed_start_cycle = _get_current_sim_cycle()
+            if macro_op_slot.repeat_count > 1:
+                # 与 ComputeEngine 相同，被合并的迭代先背靠背执行，再等待最后一次迭代的输入
+                collapsed_count = macro_op_slot.repeat_count - 1
+                core_count = self._acquire_cores(stream)
+                collapsed_time_ns = self._estimate_execute_time_ns(
+                    macro_op_slot.payload, flash_op_index, flash_op_count, core_count
+                )
+                if isinstance(macro_op_slot.payload, FlashAttnOp):
+                    flash_op_index += collapsed_count
+                SimModule.wait_time(SimTime(collapsed_count * (collapsed_time_ns + 1)))
+                self._release_cores(stream, core_count)
+
+            for input_slot in macro_op_slot.input_slots:
+                if not input_slot.is_finished:
+                    SimModule.wait(input_slot.finish_event)
+
+            core_count = self._acquire_cores(stream)
+            start_cycle = _get_current_sim_cycle()
+            if macro_op_slot.repeat_count > 1:
+                start_cycle = collapsed_start_cycle
+            wait_time_ns = self._estimate_shared_execute_time_ns(
+                macro_op_slot.payload, flash_op_index, flash_op_count, core_count
+            )
+            if isinstance(macro_op_slot.payload, FlashAttnOp):
+                flash_op_index += 1
+            SimModule.wait_time(SimTime(wait_time_ns))
+            end_cycle = _get_current_sim_cycle()
+            _record_macro_op_trace(
+                self.tracer,
+                trace_track,
+                macro_op_slot.payload,
+                start_cycle,
+                end_cycle,
+                "compute",
+                macro_op_slot.repeat_count,
+            )
+            # 下一个 op 先成为 stream 的 head 再释放 core，同一时刻就绪的 stream 都能被计入份额
+            self._stream_heads[stream] = (
+                command_queue[queue_index + 1] if queue_index + 1 < len(command_queue) else None
+            )
+            self._release_cores(stream, core_count)
+            macro_op_slot.finish_event.notify(SimTime(1))
+            SimModule.wait(macro_op_slot.finish_event)
+            macro_op_slot.is_finished = True
+            macro_op_slot.finish_cycle = _get_current_sim_cycle()
+
+    def _count_contending_streams(self, stream: int) -> int:
+        # 自己，加上正在执行 op 或下一个 op 的输入都已完成的其他 stream
+        contending_stream_count = 1
+        for other_stream, head_slot in enumerate(self._stream_heads):
+            if other_stream == stream or head_slot is None:
+                continue
+            if other_stream in self._running_streams or all(
+                input_slot.is_finished for input_slot in head_slot.input_slots
+            ):
+                contending_stream_count += 1
+        return contending_stream_count
+
+    def _acquire_cores(self, stream: int) -> int:
+        # 份额在 op 开始时确定，执行过程中不再调整
+        wait_start_cycle = _get_current_sim_cycle()
+        while True:
+            core_share = max(1, self.total_core_count // self._count_contending_streams(stream))
+            if self.free_core_count >= core_share:
+                break
+            SimModule.wait(self.core_release_event_queue.event)
+        self.core_wait_time_ns += _get_current_sim_cycle() - wait_start_cycle
+
+        self.free_core_count -= core_share
+        self._running_streams.add(stream)
+        self.peak_concurrent_op_count = max(
+            self.peak_concurrent_op_count, len(self._running_streams)
+        )
+        return core_share
+
+    def _release_cores(self, stream: int, core_count: int) -> None:
+        self.free_core_count += core_count
+        self._running_streams.discard(stream)
+        self.core_release_event_queue.next_notify(SimTime(1))
+
+
 class TransferEngine(SimModule):
     def __init__(
         self,
@@ -578,6 +1210,7 @@ class TransferEngine(SimModule):
         device_name: str = "A100_80GB",
         interconnect_topology: TopologyType = TopologyType.FC,
         compile_mode: str = "heuristic-GPU",
+        collective_barrier: Optional[CollectiveBarrier] = None,
         tracer: Optional[PerfettoTracer] = None,
         trace_track: Optional[TrackInfo] = None,
     ):
@@ -594,16 +1227,30 @@ class TransferEngine(SimModule):
         self.trace_track = trace_track
         _validate_trace_binding(self.tracer, self.trace_track, self.__class__.__name__)
         self.transfer_command_queue:list[DepSlot[MacroOp]] = []
+        # macro_op_signature -> 代价，由 xPU.load_command 的并行预计算填充
+        self.op_cost_table: dict[Hashable, object] = {}
+
+        # 多 rank 仿真时，第 k 个通信指令要等所有 rank 都到达后才开始
+        self.collective_barrier = collective_barrier
+        self.collective_wait_time_ns = 0
 
 
         self.register_coroutine(self.process)
     
     def process(self):
-        for macro_op_slot in self.transfer_command_queue:
+        for collective_index, macro_op_slot in enumerate(self.transfer_command_queue):
             for input_slot in macro_op_slot.input_slots:
                 if not input_slot.is_finished:
                     SimModule.wait(input_slot.finish_event)
 
+            if self.collective_barrier is not None:
+                arrive_cycle = _get_current_sim_cycle()
+                self.collective_barrier.arrive_and_wait(collective_index)
+                # 只统计等待其他 rank 的时间，不含唤醒的 1ns
+                self.collective_wait_time_ns += (
+                    self.collective_barrier.release_cycles[collective_index] - arrive_cycle
+                )
+
             start_cycle = _get_current_sim_cycle()
             execute_time_ns = self.execute_macro_op(macro_op_slot.payload)
             wait_time_ns = _normalize_time_ns(execute_time_ns, "execute_time_ns")
@@ -620,6 +1267,7 @@ class TransferEngine(SimModule):
             macro_op_slot.finish_event.notify(SimTime(1))
             SimModule.wait(macro_op_slot.finish_event)
             macro_op_slot.is_finished = True
+            macro_op_slot.finish_cycle = _get_current_sim_cycle()
 
     def _bytes_per_value(self, weight_bits: int) -> int:
         supported_weight_bits = {8, 16}
@@ -694,8 +1342,23 @@ class TransferEngine(SimModule):
 
         return _normalize_time_ns(all2all_time_ns, "all2all_time_ns")
 
+    def estimate_op_cost(self, macro_op: MacroOp) -> object:
+        return self.execute_macro_op(macro_op)
+
+    def cost_model_kwargs(self) -> dict:
+        # 预计算的 worker 用这些参数重建 engine，不需要 collective barrier
+        return dict(
+            device_name=self.device_name,
+            interconnect_topology=self.interconnect_topology,
+            compile_mode=self.compile_mode,
+        )
+
     def execute_macro_op(self,macro_op:MacroOp)->float:
         # 使用 llm compass 的模拟器，实现基础通信原语的时间仿真，返回 ns
+        op_cost = lookup_op_cost(self.op_cost_table, macro_op)
+        if op_cost is not None:
+            return op_cost
+
         if isinstance(macro_op, AllReduceOp):
             return self._estimate_allreduce_time_ns(macro_op)
 
@@ -714,6 +1377,53 @@ class TransferEngine(SimModule):
     
 
 
+# 合并重复迭代与 analytic 快速路径都无法建模的特性：(原因, 判断函数)。
+# 两者都假设迭代周期只取决于本 xPU 按程序顺序执行的各 engine；
+# 新增会打破这一假设的特性时在这里登记，两条路径一起回退
+UNSUPPORTED_FEATURES: tuple[tuple[str, Callable[["xPU"], bool]], ...] = (
+    (
+        "collectives synchronize several ranks",
+        lambda sim_xpu: sim_xpu.transfer_engine.collective_barrier is not None,
+    ),
+    (
+        # 写入占用的 plane 时间落在哪次迭代里，就会被乘以 repeat_count
+        "KVCacheAppend writes share NAND planes with prefetches",
+        lambda sim_xpu: sim_xpu.has_kv_append_writes,
+    ),
+    (
+        # 被跳过的第一个 prefetch 不占 SRAM，测量周期的两次迭代里不会出现 SRAM 阻塞
+        "SRAM capacity is limited",
+        lambda sim_xpu: sim_xpu.prefetch_engine.sram_capacity_pages is not None,
+    ),
+    (
+        "prefetch lookahead depth is larger than 1",
+        lambda sim_xpu: sim_xpu.prefetch_engine.lookahead_depth != 1,
+    ),
+    (
+        # 合并的 slot 代表多次迭代却只占一个窗口位置，窗口覆盖的 op 与逐次仿真不同
+        "compute issue window is larger than 1",
+        lambda sim_xpu: sim_xpu.compute_engine.issue_window != 1,
+    ),
+    (
+        # 合并的 slot 一次占住分到的 core 执行 N 次迭代，其他 stream 的 core 划分随之改变
+        "compute engine runs multiple streams",
+        lambda sim_xpu: isinstance(sim_xpu.compute_engine, MultiStreamComputeEngine),
+    ),
+    (
+        # 共享带宽取决于另一方当时是否在忙，合并的迭代无法逐次登记占用
+        "HBF bandwidth is arbitrated between engines",
+        lambda sim_xpu: sim_xpu.memory_arbiter is not None,
+    ),
+)
+
+
+def find_unsupported_feature(sim_xpu: "xPU") -> Optional[str]:
+    for reason, is_used in UNSUPPORTED_FEATURES:
+        if is_used(sim_xpu):
+            return reason
+    return None
+
+
 class xPU(SimModule):
     def __init__(
         self,
@@ -723,6 +1433,17 @@ class xPU(SimModule):
         interconnect_topology: TopologyType = TopologyType.FC,
         compile_mode: str = "heuristic-GPU",
         enable_trace: bool = False,
+        trace_level: Optional[str] = None,
+        trace_stream_path: Optional[str] = None,
+        collapse_repeats: Optional[bool] = None,
+        skip_first_prefetch: bool = True,
+        limit_sram_capacity: bool = False,
+        prefetch_lookahead_depth: int = 1,
+        compute_issue_window: int = 1,
+        compute_streams: int = 1,
+        memory_arbitration: Optional[str] = None,
+        collective_barrier: Optional[CollectiveBarrier] = None,
+        op_cost_workers: Optional[int] = None,
     ):
         super().__init__()
 
@@ -732,46 +1453,116 @@ class xPU(SimModule):
         self.interconnect_topology = interconnect_topology
         self.compile_mode = compile_mode
         self.enable_trace = enable_trace
-
-        self.tracer: Optional[PerfettoTracer] = None
+        # timeline 逐个 op 记录 Perfetto 事件；aggregate 只按 (engine, op 类型, 形状) 累加统计
+        self.trace_level = _resolve_trace_level(enable_trace, trace_level, trace_stream_path)
+
+        # None 表示跟随 NANDMACHINE_DES_REPEAT_MODE / set_des_repeat_mode
+        if collapse_repeats is None:
+            collapse_repeats = get_des_repeat_mode() == "collapse"
+        self.collapse_repeats = collapse_repeats
+        # None 表示跟随 NANDMACHINE_OP_COST_WORKERS；大于 1 时在 load_command 中并行预计算代价
+        if op_cost_workers is None:
+            op_cost_workers = get_op_cost_worker_count()
+        if op_cost_workers < 1:
+            raise ValueError(f"op_cost_workers must be >= 1, got {op_cost_workers}")
+        self.op_cost_workers = op_cost_workers
+        # 被解析累加、没有逐次进入 DES 的迭代数
+        self.collapsed_iteration_count = 0
+        # 打开了 collapse_repeats、但当前配置不满足稳态周期恒定的假设而逐次仿真时记录原因
+        self.collapse_fallback_reason: Optional[str] = None
+        # 当前装载的程序是否包含 KVCacheAppend 写入
+        self.has_kv_append_writes = False
+        # macro op id -> DepSlot，仿真结束后可按 op 查询完成时间；被合并掉的迭代没有 slot
+        self.command_slots: dict[int, DepSlot[MacroOp]] = {}
+
+        self.tracer: Optional[PerfettoTracer | StreamingTraceWriter | TraceAggregator] = None
         self.trace_module_name: Optional[str] = None
+        self.trace_module = None
         self.prefetch_trace_track: Optional[TrackInfo] = None
         self.compute_trace_track: Optional[TrackInfo] = None
+        # 多 stream 时每个 stream 一个 track，第一个即 compute_trace_track
+        self.compute_stream_trace_tracks: Optional[list[TrackInfo]] = None
         self.transfer_trace_track: Optional[TrackInfo] = None
+        self.write_trace_track: Optional[TrackInfo] = None
+
+        if compute_streams < 1:
+            raise ValueError(f"compute_streams must be >= 1, got {compute_streams}")
+        if compute_streams > 1 and compute_issue_window != 1:
+            raise ValueError("compute_issue_window cannot be combined with compute_streams > 1")
 
         if self.enable_trace:
-            self.tracer = PerfettoTracer(ns_per_cycle=1.0)
+            # 给定 trace_stream_path 时边仿真边分块写盘，内存占用与 trace 长度无关
+            self.tracer = _create_tracer(self.trace_level, trace_stream_path)
             self.trace_module_name = f"{self.__class__.__name__}:{id(self)}"
             trace_module = self.tracer.register_module(self.trace_module_name)
+            self.trace_module = trace_module
             self.prefetch_trace_track = self.tracer.register_track("prefetch_engine", trace_module)
             self.compute_trace_track = self.tracer.register_track("compute_engine", trace_module)
+            if compute_streams > 1:
+                self.compute_stream_trace_tracks = [self.compute_trace_track] + [
+                    self.tracer.register_track(f"compute_engine.stream{stream}", trace_module)
+                    for stream in range(1, compute_streams)
+                ]
             self.transfer_trace_track = self.tracer.register_track("transfer_engine", trace_module)
 
+        # None 表示 compute op 与 NAND 请求都按独占 HBF 带宽计时；否则按该策略仲裁
+        self.memory_arbiter: Optional[MemoryBandwidthArbiter] = None
+        if memory_arbitration is not None:
+            self.memory_arbiter = MemoryBandwidthArbiter(memory_arbitration)
+
         # 在这里初始化 nand controller
-        self.nand_controller = NandController(self.nand_config)
+        self.nand_controller = NandController(self.nand_config, memory_arbiter=self.memory_arbiter)
 
 
         # 异步执行的 engine
-        self.compute_engine = ComputeEngine(
-            self.nand_config,
-            hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
-            device_name=device_name,
-            compile_mode=compile_mode,
-            tracer=self.tracer,
-            trace_track=self.compute_trace_track,
-        )
+        if compute_streams > 1:
+            self.compute_engine = MultiStreamComputeEngine(
+                self.nand_config,
+                num_streams=compute_streams,
+                hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+                device_name=device_name,
+                compile_mode=compile_mode,
+                memory_arbiter=self.memory_arbiter,
+                tracer=self.tracer,
+                stream_trace_tracks=self.compute_stream_trace_tracks,
+            )
+        else:
+            self.compute_engine = ComputeEngine(
+                self.nand_config,
+                hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+                device_name=device_name,
+                compile_mode=compile_mode,
+                issue_window=compute_issue_window,
+                memory_arbiter=self.memory_arbiter,
+                tracer=self.tracer,
+                trace_track=self.compute_trace_track,
+            )
         self.transfer_engine = TransferEngine(
             device_name=device_name,
             interconnect_topology=interconnect_topology,
             compile_mode=compile_mode,
+            collective_barrier=collective_barrier,
             tracer=self.tracer,
             trace_track=self.transfer_trace_track,
         )
+        # 打开后 SRAM 容量取 NandConfig.sram_threshold，prefetch 深度受其限制
+        self.limit_sram_capacity = limit_sram_capacity
+        sram_capacity_pages: Optional[int] = None
+        if limit_sram_capacity:
+            sram_capacity_pages = max(
+                1,
+                self.nand_config.sram_threshold * 1024 // self.nand_config.page_size_bytes,
+            )
         self.prefetch_engine = PerfetchEngine(
             self.nand_controller,
+            skip_first_prefetch=skip_first_prefetch,
+            sram_capacity_pages=sram_capacity_pages,
+            lookahead_depth=prefetch_lookahead_depth,
             tracer=self.tracer,
             trace_track=self.prefetch_trace_track,
         )
+        # write engine 的 trace track 在第一次装载写指令时才注册，没有写入时 trace 不出现空 track
+        self.write_engine = NandWriteEngine(self.nand_controller)
 
     def save_trace_file(self, file_name: str) -> str:
         if self.tracer is None:
@@ -787,56 +1578,94 @@ class xPU(SimModule):
     def load_command(self,command_list:list[MacroOp]):
         # 这里要求 command list 里面 command 的顺序一定是 拓扑序的
         # 现阶段不要求 command list 里面的指令能构建成图，都是顺序发射执行的 (MacroOp 本身支持构件图)
-        
+        self.load_program(CompactProgram.from_macro_ops(command_list))
+
+    def load_program(self, program: CompactProgram):
         # 首先构建 dep slot 
         # 然后分发到不同的 Engine 中去执行
-
-        prefetch_engine_slot_list:list[DepSlot[MacroOp]] = []
-        transfer_engine_slot_list:list[DepSlot[MacroOp]] = []
-        compute_engine_slot_list:list[DepSlot[MacroOp]] = []
-
-        slot_map:dict[int,DepSlot[MacroOp]] = {}
-        release_ids = {
-            command.id for command in command_list if isinstance(command, SramPrefetchRelease)
+        kept_positions, repeat_counts = np.arange(len(program)), None
+        self.has_kv_append_writes = bool(np.any(program.kinds == OpKind.KV_APPEND))
+        if self.collapse_repeats:
+            # 被合并的迭代按前两次迭代测得的稳态周期累加，周期可能在 run 中变化时逐次仿真
+            self.collapse_fallback_reason = find_unsupported_feature(self)
+            if self.collapse_fallback_reason is None:
+                kept_positions, repeat_counts = self._collapse_repeated_triples(program)
+        slots = program.build_slots(kept_positions, repeat_counts)
+
+        # 分发到不同的 engine 中，engine 内保持程序顺序
+        kept_kinds = program.kinds[kept_positions]
+
+        def engine_slot_list(kind: OpKind) -> list[DepSlot[MacroOp]]:
+            return [slots[position] for position in kept_positions[kept_kinds == kind].tolist()]
+
+        prefetch_engine_slot_list = engine_slot_list(OpKind.PREFETCH)
+        release_slot_list = engine_slot_list(OpKind.RELEASE)
+        write_engine_slot_list = engine_slot_list(OpKind.KV_APPEND)
+        transfer_engine_slot_list = engine_slot_list(OpKind.TRANSFER)
+        compute_engine_slot_list = engine_slot_list(OpKind.COMPUTE)
+
+        self.command_slots = {
+            op_id: slots[position]
+            for position, op_id in zip(
+                kept_positions.tolist(), program.op_ids[kept_positions].tolist()
+            )
         }
 
-        for command in command_list:
-            if command.id in slot_map:
-                raise ValueError(f"Duplicate macro op id detected: {command.id}")
-            slot = DepSlot(command)
-            slot_map[command.id] = slot
-
-        for command in command_list:
-            if any(input_op.id in release_ids for input_op in command.input_ops):
-                raise NotImplementedError(
-                    "SramPrefetchRelease cannot be used as a dependency yet"
-                )
+        self._precompute_op_costs(program)
 
-        for command in command_list:
-            input_slots: list[DepSlot[MacroOp]] = []
-            for input_op in command.input_ops:
-                if input_op.id not in slot_map:
-                    raise KeyError(
-                        f"Input macro op id {input_op.id} was not provided to xPU.load_command"
-                    )
-                input_slots.append(slot_map[input_op.id])
-            slot_map[command.id].input_slots = input_slots
-
-        for command in command_list:
-            slot = slot_map[command.id]
-
-            # 分发到不同的 engine 中 
-            if isinstance(command,SramPrefetch):
-                prefetch_engine_slot_list.append(slot)
-            elif isinstance(command,SramPrefetchRelease):
-                slot.is_finished = True
-                continue
-            elif isinstance(command,TRANSFER_OP_TYPES):
-                transfer_engine_slot_list.append(slot)
-            else:
-                compute_engine_slot_list.append(slot)
-        
         # 注入到不同的 engine 中
-        self.prefetch_engine.load_command_queue(prefetch_engine_slot_list)
+        self.prefetch_engine.load_command_queue(prefetch_engine_slot_list, release_slot_list)
         self.transfer_engine.load_command_queue(transfer_engine_slot_list)
         self.compute_engine.load_command_queue(compute_engine_slot_list)
+        self.write_engine.load_command_queue(write_engine_slot_list)
+        if self.tracer is not None and write_engine_slot_list and self.write_trace_track is None:
+            self.write_trace_track = self.tracer.register_track(
+                "write_engine", self.trace_module
+            )
+            self.write_engine.tracer = self.tracer
+            self.write_engine.trace_track = self.write_trace_track
+
+    def _precompute_op_costs(self, program: CompactProgram) -> None:
+        if self.op_cost_workers == 1:
+            return
+        # 每种形状只算一次；Vector op 是闭式估算，不值得发给 worker
+        shape_kinds = [op_kind(shape) for shape in program.shapes]
+        precompute_op_costs(
+            self.compute_engine,
+            [
+                shape
+                for shape, kind in zip(program.shapes, shape_kinds)
+                if kind == OpKind.COMPUTE and not isinstance(shape, VectorOp)
+            ],
+            max_workers=self.op_cost_workers,
+        )
+        precompute_op_costs(
+            self.transfer_engine,
+            [shape for shape, kind in zip(program.shapes, shape_kinds) if kind == OpKind.TRANSFER],
+            max_workers=self.op_cost_workers,
+        )
+
+    def _collapse_repeated_triples(
+        self, program: CompactProgram
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # 每个重复 run 只保留前若干次迭代和最后一次迭代，
+        # 最后一次迭代的 prefetch / compute slot 代表其余所有迭代
+        simulated_iterations = REPEAT_SIMULATED_ITERATIONS
+        kept_ranges: list[np.ndarray] = []
+        repeat_counts = np.ones(len(program), dtype=np.int64)
+        next_index = 0
+        for run in program.find_repeated_triple_runs(
+            min_repeat_count=simulated_iterations + 2
+        ):
+            simulated_stop_index = run.start_index + 3 * simulated_iterations
+            kept_ranges.append(np.arange(next_index, simulated_stop_index))
+            kept_ranges.append(np.arange(run.stop_index - 3, run.stop_index))
+
+            repeat_count = run.repeat_count - simulated_iterations
+            repeat_counts[run.stop_index - 3] = repeat_count
+            repeat_counts[run.stop_index - 2] = repeat_count
+            self.collapsed_iteration_count += repeat_count - 1
+            next_index = run.stop_index
+
+        kept_ranges.append(np.arange(next_index, len(program)))
+        return np.concatenate(kept_ranges), repeat_counts
@@ -0,0 +1,185 @@
+"""On-disk, content-addressed store for cost-model compile results.
+
+`_compile_and_simulate_result` of the GEMM / flash-attention / softmax
+simulators is only memoized in-process. This store persists the results so
+that every sweep worker (and every later sweep run) can reuse mappings that
+were already searched.
+
+Layout: `<root>/v<COST_MODEL_VERSION>/<sha[:2]>/<sha>.pkl`, one file per key.
+Entries are written to a temp file in the same directory and published with
+`os.replace`, so concurrent workers never observe partially written entries;
+two workers racing on the same key simply write identical content.
+
+Bump `COST_MODEL_VERSION` whenever the cost model changes so stale entries are
+no longer addressed.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional, TypeVar
+
+COMPILE_RESULT_STORE_DIR_ENV_VAR = "NANDMACHINE_COMPILE_RESULT_STORE_DIR"
+COST_MODEL_VERSION = 1
+
+T = TypeVar("T")
+
+
+def _describe_for_key(value: object) -> object:
+    # 把 Device / BandwidthConfigKey 等对象展开成可稳定序列化的结构
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (tuple, list)):
+        return [_describe_for_key(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _describe_for_key(item) for key, item in value.items()}
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        fields = {
+            field.name: getattr(value, field.name)
+            for field in dataclasses.fields(value)
+        }
+        return {"__class__": type(value).__name__, **_describe_for_key(fields)}
+    if hasattr(value, "__dict__"):
+        return {"__class__": type(value).__name__, **_describe_for_key(vars(value))}
+    raise TypeError(
+        f"Unsupported value in compile result key: {type(value).__name__}"
+    )
+
+
+def build_compile_result_key(
+    op_kind: str,
+    *,
+    shape: tuple[int, ...],
+    weight_bits: int,
+    matmul_type: Optional[str],
+    pcb_module: object,
+    bandwidth_config_key: Optional[object],
+    compile_mode: Optional[str],
+    lut_policy: Optional[str],
+) -> str:
+    payload = {
+        "version": COST_MODEL_VERSION,
+        "op_kind": op_kind,
+        "shape": _describe_for_key(shape),
+        "weight_bits": weight_bits,
+        "matmul_type": matmul_type,
+        "device": _describe_for_key(pcb_module),
+        "bandwidth": _describe_for_key(bandwidth_config_key),
+        "compile_mode": compile_mode,
+        "lut_policy": lut_policy,
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class CompileResultStore:
+    def __init__(self, root_dir: str | Path, *, version: int = COST_MODEL_VERSION):
+        if version <= 0:
+            raise ValueError(f"version must be > 0, got {version}")
+        self.root_dir = Path(root_dir)
+        self.version = version
+        self.version_dir = self.root_dir / f"v{version}"
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _entry_path(self, key: str) -> Path:
+        return self.version_dir / key[:2] / f"{key}.pkl"
+
+    def get(self, key: str) -> Optional[object]:
+        try:
+            with self._entry_path(key).open("rb") as entry_file:
+                result = pickle.load(entry_file)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # 损坏或类定义已变化的条目视为未命中，随后会被覆盖
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result: object) -> None:
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(
+            dir=entry_path.parent, prefix=f".{key[:8]}-", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                pickle.dump(result, temp_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, entry_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        self.writes += 1
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+
+_store: Optional[CompileResultStore] = None
+_store_is_explicit = False
+
+
+def set_compile_result_store(
+    root_dir: Optional[str | Path],
+) -> Optional[CompileResultStore]:
+    # 显式配置优先于环境变量；传 None 关闭磁盘缓存
+    global _store, _store_is_explicit
+    _store = None if root_dir is None else CompileResultStore(root_dir)
+    _store_is_explicit = True
+    return _store
+
+
+def get_compile_result_store() -> Optional[CompileResultStore]:
+    global _store
+    if _store_is_explicit:
+        return _store
+    root_dir = os.environ.get(COMPILE_RESULT_STORE_DIR_ENV_VAR)
+    if not root_dir:
+        return None
+    if _store is None or _store.root_dir != Path(root_dir):
+        _store = CompileResultStore(root_dir)
+    return _store
+
+
+def load_or_build_compile_result(
+    op_kind: str,
+    build_result: Callable[[], T],
+    *,
+    shape: tuple[int, ...],
+    weight_bits: int,
+    matmul_type: Optional[str],
+    pcb_module: object,
+    bandwidth_config_key: Optional[object],
+    compile_mode: Optional[str],
+    lut_policy: Optional[str],
+) -> T:
+    store = get_compile_result_store()
+    if store is None:
+        return build_result()
+
+    key = build_compile_result_key(
+        op_kind,
+        shape=shape,
+        weight_bits=weight_bits,
+        matmul_type=matmul_type,
+        pcb_module=pcb_module,
+        bandwidth_config_key=bandwidth_config_key,
+        compile_mode=compile_mode,
+        lut_policy=lut_policy,
+    )
+    result = store.get(key)
+    if result is None:
+        result = build_result()
+        store.put(key, result)
+    return result
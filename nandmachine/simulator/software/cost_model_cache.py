@@ -0,0 +1,241 @@
+"""Value-keyed in-process caches for the cost-model simulators.
+
+The GEMM / flash-attention / softmax simulators used to memoize compile
+results with `lru_cache` on a method, which makes the simulator instance part
+of the key: once an instance fell out of the 256-entry instance cache its
+results were lost. The caches here are keyed by the values a result actually
+depends on (op kind, shape, precision, matmul type, device, bandwidth, compile
+mode, systolic LUT policy), so any instance with the same shape reuses them.
+
+Each cache is an LRU bounded by an entry count and, optionally, by the total
+pickled size of its values; values are only pickled while a byte limit is set. The limits come from `set_cost_model_cache_limits`
+or the `NANDMACHINE_COST_MODEL_CACHE_MAX_ENTRIES` /
+`NANDMACHINE_COST_MODEL_CACHE_MAX_BYTES` environment variables and apply to
+every cache. Hit/miss/eviction counters are returned by `cache_info` and by the
+simulators' `clear_caches`.
+"""
+
+from __future__ import annotations
+
+import os
+import pickle
+import weakref
+from collections import OrderedDict
+from typing import Callable, Hashable, NamedTuple, Optional, TypeVar
+
+COST_MODEL_CACHE_MAX_ENTRIES_ENV_VAR = "NANDMACHINE_COST_MODEL_CACHE_MAX_ENTRIES"
+COST_MODEL_CACHE_MAX_BYTES_ENV_VAR = "NANDMACHINE_COST_MODEL_CACHE_MAX_BYTES"
+DEFAULT_COST_MODEL_CACHE_MAX_ENTRIES = 4096
+
+T = TypeVar("T")
+
+
+class CostModelCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
+    max_bytes: Optional[int]
+    current_bytes: int
+
+
+def _freeze_for_key(value: object) -> Hashable:
+    # 把 Device 等按身份哈希的对象展开成按值比较的嵌套元组
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (tuple, list)):
+        return tuple(_freeze_for_key(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(
+            sorted((str(key), _freeze_for_key(item)) for key, item in value.items())
+        )
+    if hasattr(value, "__dict__"):
+        return (type(value).__name__, _freeze_for_key(vars(value)))
+    raise TypeError(f"Unsupported value in cost model cache key: {type(value).__name__}")
+
+
+# 设备对象构造后不再修改，按对象缓存其展开结果；弱引用不延长临时设备的生命周期
+_device_keys: "weakref.WeakKeyDictionary[object, Hashable]" = weakref.WeakKeyDictionary()
+
+
+def _device_key(pcb_module: object) -> Hashable:
+    device_key = _device_keys.get(pcb_module)
+    if device_key is None:
+        device_key = _freeze_for_key(pcb_module)
+        _device_keys[pcb_module] = device_key
+    return device_key
+
+
+def build_cost_model_cache_key(
+    op_kind: str,
+    *,
+    shape: tuple[int, ...],
+    weight_bits: int,
+    matmul_type: Optional[str],
+    pcb_module: object,
+    bandwidth_config_key: Optional[Hashable],
+    compile_mode: Optional[str],
+    lut_policy: Optional[str],
+) -> Hashable:
+    return (
+        op_kind,
+        tuple(shape),
+        weight_bits,
+        matmul_type,
+        _device_key(pcb_module),
+        bandwidth_config_key,
+        compile_mode,
+        lut_policy,
+    )
+
+
+def _parse_limit_or_raise(env_var: str, default: Optional[int]) -> Optional[int]:
+    raw_value = os.environ.get(env_var)
+    if not raw_value:
+        return default
+    return int(raw_value)
+
+
+def _validate_limits_or_raise(max_entries: int, max_bytes: Optional[int]) -> None:
+    if max_entries < 1:
+        raise ValueError(f"max_entries must be >= 1, got {max_entries}")
+    if max_bytes is not None and max_bytes < 1:
+        raise ValueError(f"max_bytes must be >= 1, got {max_bytes}")
+
+
+_limits: Optional[tuple[int, Optional[int]]] = None
+_caches: list["CostModelCache"] = []
+
+
+def set_cost_model_cache_limits(
+    max_entries: Optional[int],
+    max_bytes: Optional[int] = None,
+) -> None:
+    # 显式配置优先于环境变量；max_entries 传 None 恢复为读取环境变量
+    global _limits
+    if max_entries is None:
+        _limits = None
+    else:
+        _validate_limits_or_raise(max_entries, max_bytes)
+        _limits = (max_entries, max_bytes)
+    for cache in _caches:
+        cache.evict_to_limits()
+
+
+def get_cost_model_cache_limits() -> tuple[int, Optional[int]]:
+    if _limits is not None:
+        return _limits
+    max_entries = _parse_limit_or_raise(
+        COST_MODEL_CACHE_MAX_ENTRIES_ENV_VAR, DEFAULT_COST_MODEL_CACHE_MAX_ENTRIES
+    )
+    max_bytes = _parse_limit_or_raise(COST_MODEL_CACHE_MAX_BYTES_ENV_VAR, None)
+    _validate_limits_or_raise(max_entries, max_bytes)
+    return max_entries, max_bytes
+
+
+def _pickled_size(value: object) -> int:
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class CostModelCache:
+    """LRU cache bounded by entry count and, optionally, by value size.
+
+    `size_of` measures a value in bytes; caches of objects that cannot be
+    pickled (simulator instances) pass `size_of=None` and are bounded by the
+    entry count only.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        size_of: Optional[Callable[[object], int]] = _pickled_size,
+    ):
+        self.name = name
+        self.size_of = size_of
+        # 未设字节上限时插入的条目不测大小（记为 None），设上限后再补测
+        self._entries: OrderedDict[Hashable, tuple[object, Optional[int]]] = OrderedDict()
+        self._unsized_count = 0
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _caches.append(self)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get_limits(self) -> tuple[int, Optional[int]]:
+        # 每次插入时读取，使进程启动后设置的环境变量或显式配置也能生效
+        max_entries, max_bytes = get_cost_model_cache_limits()
+        return max_entries, None if self.size_of is None else max_bytes
+
+    def get_or_build(self, key: Hashable, build_value: Callable[[], T]) -> T:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        value = build_value()
+        _, max_bytes = self._get_limits()
+        if max_bytes is None:
+            self._entries[key] = (value, None)
+            self._unsized_count += 1
+            self.evict_to_limits()
+            return value
+        size = self.size_of(value)
+        if size > max_bytes:
+            # 单个值就超过容量时不缓存，避免把其他条目全部挤出
+            self.evictions += 1
+            return value
+        self._entries[key] = (value, size)
+        self.current_bytes += size
+        self.evict_to_limits()
+        return value
+
+    def _measure_unsized_entries(self) -> None:
+        for key, (value, size) in list(self._entries.items()):
+            if size is None:
+                size = self.size_of(value)
+                self._entries[key] = (value, size)
+                self.current_bytes += size
+        self._unsized_count = 0
+
+    def evict_to_limits(self) -> None:
+        # 按最近最少使用的顺序淘汰，直到条目数与总字节数都不超过上限
+        max_entries, max_bytes = self._get_limits()
+        if max_bytes is not None and self._unsized_count:
+            self._measure_unsized_entries()
+        while len(self._entries) > max_entries or (
+            max_bytes is not None and self.current_bytes > max_bytes
+        ):
+            _, (_, size) = self._entries.popitem(last=False)
+            if size is None:
+                self._unsized_count -= 1
+            else:
+                self.current_bytes -= size
+            self.evictions += 1
+
+    def cache_info(self) -> CostModelCacheInfo:
+        max_entries, max_bytes = self._get_limits()
+        return CostModelCacheInfo(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            maxsize=max_entries,
+            currsize=len(self._entries),
+            max_bytes=max_bytes,
+            current_bytes=self.current_bytes,
+        )
+
+    def cache_clear(self) -> CostModelCacheInfo:
+        # 返回清空前的计数，便于按sweep统计后再重置
+        cache_info = self.cache_info()
+        self._entries.clear()
+        self._unsized_count = 0
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        return cache_info
@@ -1,4 +1,3 @@
-from functools import lru_cache
 from dataclasses import dataclass
 import os
 import sys
@@ -7,25 +6,28 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-SYSTOLIC_ARRAY_MODEL_DIR = os.path.join(
-    PROJECT_ROOT, "nandmachine", "simulator", "systolic_array_model"
-)
-SYSTOLIC_TEMP_DIR = os.path.join(SYSTOLIC_ARRAY_MODEL_DIR, "temp")
-
 from nandmachine.config.config import NandConfig
 from nandmachine.config.hardware_config import Device
 from math import ceil, log2, floor
 import time
 import numpy as np
-import pandas as pd
 from typing import Literal
-from scalesim.scale_sim import scalesim
 import copy
-from nandmachine.simulator.software.scalesim_runtime_patch import (
-    apply_scalesim_total_cycles_patch,
+from nandmachine.simulator.software.compile_result_store import (
+    load_or_build_compile_result,
+)
+from nandmachine.simulator.software.cost_model_cache import (
+    CostModelCache,
+    CostModelCacheInfo,
+    build_cost_model_cache_key,
+)
+from nandmachine.simulator.software.systolic_lut import (
+    LookUpTableKey,
+    SystolicLookUpTable,
+    SystolicShapeRecorder,
+    get_systolic_look_up_table,
+    get_systolic_lut_policy,
 )
-
-apply_scalesim_total_cycles_patch()
 
 MatmulType = Literal["QK", "SV", "MLA_QK", "MLA_SV"]
 ReturnUnit = Literal["cycle", "time_ns"]
@@ -318,6 +320,10 @@ class FlashAttn_BatchedMatMul_Simulation:
         self.best_latency = None
         self.latency = None
 
+    # 实例缓存只为复用对象；编译结果按值缓存，实例被淘汰后结果仍然有效
+    _instance_cache = CostModelCache("flashattn_bmm_instance", size_of=None)
+    _compile_result_cache = CostModelCache("flashattn_bmm_compile_result")
+
     @classmethod
     def get_instance(
         cls,
@@ -325,25 +331,20 @@ class FlashAttn_BatchedMatMul_Simulation:
         weight_bits: int = 16,
         matmul_type: MatmulType = "QK",
     ) -> "FlashAttn_BatchedMatMul_Simulation":
-        return cls._get_cached_instance(cls, dim, weight_bits, matmul_type)
+        return cls._instance_cache.get_or_build(
+            (cls, tuple(dim), weight_bits, matmul_type),
+            lambda: cls(dim=dim, weight_bits=weight_bits, matmul_type=matmul_type),
+        )
 
     @classmethod
-    def clear_caches(cls) -> None:
-        cls._get_cached_instance.cache_clear()
-        cls._compile_and_simulate_result.cache_clear()
+    def clear_caches(cls) -> dict[str, CostModelCacheInfo]:
+        # 返回清空前各缓存的命中/未命中/淘汰计数
+        return {
+            "instance": cls._instance_cache.cache_clear(),
+            "compile_result": cls._compile_result_cache.cache_clear(),
+        }
 
-    @staticmethod
-    @lru_cache(maxsize=256)
-    def _get_cached_instance(
-        cls: type["FlashAttn_BatchedMatMul_Simulation"],
-        dim: tuple[int, int, int, int],
-        weight_bits: int,
-        matmul_type: MatmulType,
-    ) -> "FlashAttn_BatchedMatMul_Simulation":
-        return cls(dim=dim, weight_bits=weight_bits, matmul_type=matmul_type)
-
-    @lru_cache(maxsize=256)
-    def _compile_and_simulate_result(
+    def _build_compile_result(
         self,
         pcb_module: Device,
         bandwidth_config_key: BandwidthConfigKey,
@@ -395,6 +396,35 @@ class FlashAttn_BatchedMatMul_Simulation:
             best_time_ns=_cycle_count_to_time_ns(best_cycle_count, pcb_module),
         )
 
+    def _compile_and_simulate_result(
+        self,
+        pcb_module: Device,
+        bandwidth_config_key: BandwidthConfigKey,
+        compile_mode: str = "exhaustive",
+    ) -> "FlashAttn_BatchedMatMul_Simulation.CompileResult":
+        key_fields = dict(
+            shape=(self.B, self.M, self.K, self.N),
+            weight_bits=self.weight_bits,
+            matmul_type=self.matmul_type,
+            pcb_module=pcb_module,
+            bandwidth_config_key=bandwidth_config_key,
+            compile_mode=compile_mode,
+            # 代理模型估算的结果不能与 ScaleSim 精确结果共用缓存条目
+            lut_policy=get_systolic_lut_policy(),
+        )
+        return self._compile_result_cache.get_or_build(
+            build_cost_model_cache_key("flashattn_bmm", **key_fields),
+            lambda: load_or_build_compile_result(
+                "flashattn_bmm",
+                lambda: self._build_compile_result(
+                    pcb_module=pcb_module,
+                    bandwidth_config_key=bandwidth_config_key,
+                    compile_mode=compile_mode,
+                ),
+                **key_fields,
+            ),
+        )
+
     def compile_and_simulate(self,
         pcb_module: Device,
         nand_config: NandConfig,
@@ -422,9 +452,28 @@ class FlashAttn_BatchedMatMul_Simulation:
             return result.best_time_ns
         raise ValueError(f"Unsupported return_unit: {return_unit}")
 
-    compile_and_simulate.cache_info = _compile_and_simulate_result.cache_info
-    compile_and_simulate.cache_clear = _compile_and_simulate_result.cache_clear
+    compile_and_simulate.cache_info = _compile_result_cache.cache_info
+    compile_and_simulate.cache_clear = _compile_result_cache.cache_clear
 
+    def collect_systolic_look_up_table_keys(
+        self,
+        pcb_module: Device,
+        nand_config: NandConfig,
+        hbm_bandwidth_bytes_per_sec: float,
+        compile_mode: str = "exhaustive",
+    ) -> set[LookUpTableKey]:
+        # 与_build_compile_result一致：逐batch与合并batch两种方案都会编译
+        keys: set[LookUpTableKey] = set()
+        for K in (self.K, self.K * self.B):
+            keys |= MatMul_Simulation(
+                self.M, K, self.N, self.weight_bits, self.matmul_type
+            ).collect_systolic_look_up_table_keys(
+                pcb_module=pcb_module,
+                nand_config=nand_config,
+                hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+                compile_mode=compile_mode,
+            )
+        return keys
 
 class FlashMLA_BatchedMatMul_Simulation:
     @dataclass(frozen=True)
@@ -539,6 +588,20 @@ class FlashMLA_BatchedMatMul_Simulation:
         # return qk_latent_time + qk_rope_time + sv_latent_time // 2
         return qk_latent_time + qk_rope_time
 
+    def _iter_chunks(self):
+        # 逐个给出每个chunk的(chunk_b, softmax_dim)；不需要分块时只有一个chunk
+        chunk_plan = self._build_chunk_plan_or_none()
+        if chunk_plan is None:
+            yield self.qk_latent_dim[0], self.softmax_dim
+            return
+
+        remaining_blocks = self.qk_latent_dim[0]
+        _, softmax_n = self.softmax_dim
+        while remaining_blocks > 0:
+            chunk_b = min(chunk_plan.blocks_per_chunk, remaining_blocks)
+            yield chunk_b, (chunk_b, softmax_n)
+            remaining_blocks -= chunk_b
+
     def compile_and_simulate(
         self,
         pcb_module: Device,
@@ -547,35 +610,46 @@ class FlashMLA_BatchedMatMul_Simulation:
         compile_mode: str = "exhaustive",
         return_unit: ReturnUnit = "cycle",
     ) -> int:
-        chunk_plan = self._build_chunk_plan_or_none()
-        if chunk_plan is None:
-            return self._simulate_single_chunk(
-                chunk_b=self.qk_latent_dim[0],
-                softmax_dim=self.softmax_dim,
-                pcb_module=pcb_module,
-                nand_config=nand_config,
-                hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
-                compile_mode=compile_mode,
-                return_unit=return_unit,
-            )
-
         total_time = 0
-        remaining_blocks = self.qk_latent_dim[0]
-        _, softmax_n = self.softmax_dim
-        while remaining_blocks > 0:
-            chunk_b = min(chunk_plan.blocks_per_chunk, remaining_blocks)
+        for chunk_b, softmax_dim in self._iter_chunks():
             total_time += self._simulate_single_chunk(
                 chunk_b=chunk_b,
-                softmax_dim=(chunk_b, softmax_n),
+                softmax_dim=softmax_dim,
                 pcb_module=pcb_module,
                 nand_config=nand_config,
                 hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
                 compile_mode=compile_mode,
                 return_unit=return_unit,
             )
-            remaining_blocks -= chunk_b
         return total_time
 
+    def collect_systolic_look_up_table_keys(
+        self,
+        pcb_module: Device,
+        nand_config: NandConfig,
+        hbm_bandwidth_bytes_per_sec: float,
+        compile_mode: str = "exhaustive",
+    ) -> set[LookUpTableKey]:
+        # 与_simulate_single_chunk一致：SV的时间虽未计入结果，但同样会编译
+        keys: set[LookUpTableKey] = set()
+        for chunk_b, _ in self._iter_chunks():
+            for dim, matmul_type in (
+                (self.qk_latent_dim, "MLA_QK"),
+                (self.qk_rope_dim, "MLA_QK"),
+                (self.sv_latent_dim, "MLA_SV"),
+            ):
+                keys |= FlashAttn_BatchedMatMul_Simulation(
+                    dim=self._replace_batch_dim(dim, chunk_b),
+                    weight_bits=self.weight_bits,
+                    matmul_type=matmul_type,
+                ).collect_systolic_look_up_table_keys(
+                    pcb_module=pcb_module,
+                    nand_config=nand_config,
+                    hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+                    compile_mode=compile_mode,
+                )
+        return keys
+
 class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N的矩阵
     @dataclass(frozen=True)
     class PrecisionContext:
@@ -1108,6 +1182,32 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             return result.best_time_ns
         raise ValueError(f"Unsupported return_unit: {return_unit}")
 
+    def collect_systolic_look_up_table_keys(
+        self,
+        pcb_module: Device,
+        nand_config: NandConfig,
+        hbm_bandwidth_bytes_per_sec: float,
+        compile_mode: str = "exhaustive",
+    ) -> set[LookUpTableKey]:
+        # 用记录器代替查找表跑一遍编译，得到会查询的全部脉动阵列形状；
+        # 这里的搜索不剪枝，候选mapping与查到的cycle无关，一遍即可收集完整
+        bandwidth_config_key = _build_bandwidth_config_key_or_raise(
+            nand_config,
+            hbm_bandwidth_bytes_per_sec,
+        )
+        recorder = SystolicShapeRecorder()
+        look_up_table = self.look_up_table
+        self.look_up_table = recorder
+        try:
+            self._build_compile_result(
+                pcb_module=pcb_module,
+                bandwidth_config_key=bandwidth_config_key,
+                compile_mode=compile_mode,
+            )
+        finally:
+            self.look_up_table = look_up_table
+        return recorder.keys
+
     def simulate(
         self,
         computational_graph: ComputationalGraph,
@@ -1116,48 +1216,10 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
         bandwidth_config_key: BandwidthConfigKey,
     ) -> int: # 注解，表明返回值是int
         if self.look_up_table is None: # None表示表格未加载，需要初始化读取表格
-            # 懒加载脉动阵列查找表
-            column_names = [
-                "M",
-                "N",
-                "K",
-                "ArrayHeight",
-                "ArrayWidth",
-                "Dataflow",
-                "cycle_count",
-                "util_rate",
-            ]
-            lut_path = (
-                f"./systolic_array_model/look_up_table_"
-                f"{pcb_module.compute_module.core.systolic_array.array_height}_"
-                f"{pcb_module.compute_module.core.systolic_array.array_width}.csv"
-            )
-            if not os.path.exists(lut_path):
-                os.makedirs(os.path.dirname(lut_path), exist_ok=True)
-                pd.DataFrame(columns=column_names).to_csv(
-                    lut_path, header=False, index=False
-                )
-            try:
-                self.look_up_table = pd.read_csv(
-                    lut_path,
-                    header=None,
-                    names=column_names,
-                )
-            except pd.errors.EmptyDataError:
-                self.look_up_table = pd.DataFrame(columns=column_names)
-            self.look_up_table.drop_duplicates(
-                inplace=True,
-                subset=["M", "N", "K", "ArrayHeight", "ArrayWidth", "Dataflow"],
-            )
-            # self.look_up_table.reset_index(drop=True, inplace=True)
-            # self.look_up_table.to_csv(
-            #     f"./systolic_array_model/look_up_table_{pcb_module.compute_module.core.systolic_array.array_height}_{pcb_module.compute_module.core.systolic_array.array_width}.csv",
-            #     header=False,
-            #     index=False,
-            # )
-            self.look_up_table.set_index(
-                ["M", "N", "K", "ArrayHeight", "ArrayWidth", "Dataflow"],
-                inplace=True,
+            # 脉动阵列查找表由进程内共享的查表服务维护
+            self.look_up_table = get_systolic_look_up_table(
+                pcb_module.compute_module.core.systolic_array.array_height,
+                pcb_module.compute_module.core.systolic_array.array_width,
             )
         # print(self.look_up_table)
         # print(self.look_up_table.loc[(32, 16, 256, 16, 16, 'os'), "cycle_count"
@@ -1374,7 +1436,7 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             mapping: "MatMul_Simulation.Mapping",
             pcb_module: Device,
             bandwidth_config_key: BandwidthConfigKey,
-            look_up_table: pd.DataFrame,
+            look_up_table: SystolicLookUpTable,
         ):
             # print(f'L2 tile: {M} {N} {K}')
             # L2 tile统计IO与计算cycle
@@ -1438,7 +1500,7 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             precision: "MatMul_Simulation.PrecisionContext",
             mapping: "MatMul_Simulation.Mapping",
             chiplet_module: Device,
-            look_up_table: pd.DataFrame,
+            look_up_table: SystolicLookUpTable,
         ) -> int:
             word_size = precision.word_size
             effective_vector_flops_per_cycle = (
@@ -1735,7 +1797,7 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             precision: "MatMul_Simulation.PrecisionContext",
             mapping: "MatMul_Simulation.Mapping",
             chiplet_module: Device,
-            look_up_table: pd.DataFrame,
+            look_up_table: SystolicLookUpTable,
         ):
             # print(f'L1 tile: {M} {N} {K}')
             self.M = M
@@ -1754,7 +1816,7 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             precision: "MatMul_Simulation.PrecisionContext",
             mapping: "MatMul_Simulation.Mapping",
             chiplet_module: Device,
-            look_up_table: pd.DataFrame,
+            look_up_table: SystolicLookUpTable,
         ):
             word_size = precision.word_size
             effective_vector_flops_per_cycle = (
@@ -1801,7 +1863,7 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
 
     @staticmethod
     def simulate_systolic_array_cycle_count(
-        look_up_table: pd.DataFrame,
+        look_up_table: SystolicLookUpTable,
         M,
         N,
         K,
@@ -1848,111 +1910,14 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                     M * N * K / array_height / array_width / mac_per_clock / util_rate
                 )
         # print('start look up table')
-        def _parse_cycle_count(value) -> int:
-            if isinstance(value, pd.Series):
-                value = value.iloc[0]
-            if hasattr(value, "item"):
-                return int(value.item())
-            return int(value)
-
-        try:
-            cycle_count = _parse_cycle_count(
-                look_up_table.loc[
-                    (M, N, K, array_height, array_width, dataflow), "cycle_count"
-                ]
+        cycle_count = look_up_table.lookup(
+            M, N, K, array_height, array_width, dataflow
+        )
+        if cycle_count is None:
+            # 查表未命中：由查表服务去重后调用ScaleSim，并把结果共享给所有worker
+            cycle_count = look_up_table.get_or_simulate(
+                M, N, K, array_height, array_width, dataflow
             )
-        except KeyError:
-            try:
-                cycle_count = _parse_cycle_count(
-                    look_up_table.loc[
-                        (N, M, K, array_height, array_width, dataflow), "cycle_count"
-                    ]
-                )
-            except KeyError:
-                # print('not found in look up table')
-                # 查表未命中则调用ScaleSim
-                os.makedirs(SYSTOLIC_TEMP_DIR, exist_ok=True)
-                config = os.path.join(
-                    SYSTOLIC_TEMP_DIR,
-                    f"systolic_array_{os.getpid()}.cfg",
-                )
-                with open(config, "w") as f:
-                    f.writelines("[general]\n")
-                    f.writelines("run_name = systolic_array\n\n")
-                    f.writelines("[architecture_presets]\n")
-                    f.writelines("ArrayHeight:    " + str(array_height) + "\n")
-                    f.writelines("ArrayWidth:     " + str(array_width) + "\n")
-                    f.writelines("IfmapSramSzkB:    " + str(1024) + "\n")
-                    f.writelines("FilterSramSzkB:   " + str(1024) + "\n")
-                    f.writelines("OfmapSramSzkB:    " + str(1024) + "\n")
-                    f.writelines("IfmapOffset:    0\n")
-                    f.writelines("FilterOffset:   10000000\n")
-                    f.writelines("OfmapOffset:    20000000\n")
-                    f.writelines("Dataflow : " + dataflow + "\n")
-                    f.writelines("Bandwidth : " + "100" + "\n")
-                    f.writelines("MemoryBanks: 1\n")
-                    f.writelines("ReadRequestBuffer: 60\n")
-                    f.writelines("WriteRequestBuffer: 60\n\n")
-                    f.writelines("[run_presets]\n")
-                    f.writelines("InterfaceBandwidth: CALC\n")
-                    f.writelines("UseRamulatorTrace: False\n\n")
-                    f.writelines("[layout]\n")
-                    f.writelines("IfmapCustomLayout: False\n")
-                    f.writelines("FilterCustomLayout: False\n")
-                    f.writelines("IfmapSRAMBankBandwidth: 10\n")
-                    f.writelines("IfmapSRAMBankNum: 10\n")
-                    f.writelines("IfmapSRAMBankPort: 2\n")
-                    f.writelines("FilterSRAMBankBandwidth: 10\n")
-                    f.writelines("FilterSRAMBankNum: 10\n")
-                    f.writelines("FilterSRAMBankPort: 2\n\n")
-                    f.writelines("[sparsity]\n")
-                    f.writelines("SparsitySupport: False\n")
-
-                topology = os.path.join(
-                    SYSTOLIC_TEMP_DIR,
-                    f"matmul_{os.getpid()}.csv",
-                )
-                with open(topology, "w") as f:
-                    f.writelines("Layer, M, N, K\n")
-                    f.writelines(f"matmul1, {M}, {N}, {K},\n")
-
-                layout = os.path.join(
-                    SYSTOLIC_TEMP_DIR,
-                    f"layout_{os.getpid()}.csv",
-                )
-                with open(layout, "w") as f:
-                    f.writelines("Layer name,Layout,\n")
-                    f.writelines("matmul1," + ",".join(["1"] * 20) + ",\n")
-
-                logpath = SYSTOLIC_TEMP_DIR
-                s = scalesim(
-                    save_disk_space=True,
-                    verbose=False,
-                    config=config,
-                    topology=topology,
-                    layout=layout,
-                    input_type_gemm=True,
-                )
-                s.run_scale(top_path=logpath)
-
-                cycle_count = s.runner.single_layer_sim_object_list[0].total_cycles
-                util_rate = s.runner.single_layer_sim_object_list[0].overall_util
-                with open(
-                    os.path.join(
-                        SYSTOLIC_ARRAY_MODEL_DIR,
-                        f"look_up_table_{array_height}_{array_width}.csv",
-                    ),
-                    "a",
-                ) as f:
-                    f.writelines(
-                        f"{M},{N},{K},{array_height},{array_width},{dataflow},{cycle_count},{util_rate:.3f}\n"
-                    )
-                look_up_table.loc[(M, N, K, array_height, array_width, dataflow), :] = [
-                    cycle_count,
-                    util_rate,
-                ]
-                if len(look_up_table) % 10 == 0:
-                    look_up_table.sort_index(inplace=True)
         # if (
         #     dataflow == "os"
         # ):  # scalesim assumes collecting output is not on critical path in os
@@ -2005,27 +1970,28 @@ class Softmax_Simulation:
             self.M, self.N, self.precision
         )
 
+    # 实例缓存只为复用对象；编译结果按值缓存，实例被淘汰后结果仍然有效
+    _instance_cache = CostModelCache("softmax_instance", size_of=None)
+    _compile_result_cache = CostModelCache("softmax_compile_result")
+
     @classmethod
     def get_instance(
         cls,
         dim: tuple[int, int],
         weight_bits: int = 16,
     ) -> "Softmax_Simulation":
-        return cls._get_cached_instance(cls, dim, weight_bits)
+        return cls._instance_cache.get_or_build(
+            (cls, tuple(dim), weight_bits),
+            lambda: cls(dim=dim, weight_bits=weight_bits),
+        )
 
     @classmethod
-    def clear_caches(cls) -> None:
-        cls._get_cached_instance.cache_clear()
-        cls._compile_and_simulate_result.cache_clear()
-
-    @staticmethod
-    @lru_cache(maxsize=256)
-    def _get_cached_instance(
-        cls: type["Softmax_Simulation"],
-        dim: tuple[int, int],
-        weight_bits: int,
-    ) -> "Softmax_Simulation":
-        return cls(dim=dim, weight_bits=weight_bits)
+    def clear_caches(cls) -> dict[str, CostModelCacheInfo]:
+        # 返回清空前各缓存的命中/未命中/淘汰计数
+        return {
+            "instance": cls._instance_cache.cache_clear(),
+            "compile_result": cls._compile_result_cache.cache_clear(),
+        }
 
     def print_latency(self):
         print(f"{self.output_shape}, {self.latency_on_gpu*1e6}us")
@@ -2120,15 +2086,30 @@ class Softmax_Simulation:
             best_time_ns=_cycle_count_to_time_ns(min_cycle_count, pcb_module),
         )
 
-    @lru_cache(maxsize=256)
     def _compile_and_simulate_result(
         self,
         pcb_module: Device,
         compile_mode=None,
     ) -> "Softmax_Simulation.CompileResult":
-        return self._build_compile_result(
+        key_fields = dict(
+            shape=(self.M, self.N),
+            weight_bits=self.weight_bits,
+            matmul_type=None,
             pcb_module=pcb_module,
+            bandwidth_config_key=None,
             compile_mode=compile_mode,
+            lut_policy=None,
+        )
+        return self._compile_result_cache.get_or_build(
+            build_cost_model_cache_key("softmax", **key_fields),
+            lambda: load_or_build_compile_result(
+                "softmax",
+                lambda: self._build_compile_result(
+                    pcb_module=pcb_module,
+                    compile_mode=compile_mode,
+                ),
+                **key_fields,
+            ),
         )
 
     def compile_and_simulate(
@@ -2152,8 +2133,8 @@ class Softmax_Simulation:
             return result.best_time_ns
         raise ValueError(f"Unsupported return_unit: {return_unit}")
 
-    compile_and_simulate.cache_info = _compile_and_simulate_result.cache_info
-    compile_and_simulate.cache_clear = _compile_and_simulate_result.cache_clear
+    compile_and_simulate.cache_info = _compile_result_cache.cache_info
+    compile_and_simulate.cache_clear = _compile_result_cache.cache_clear
 
     def simulate(
         self,
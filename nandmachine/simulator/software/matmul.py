@@ -1,5 +1,7 @@
-from functools import lru_cache
 from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 import os
 import sys
 
@@ -7,28 +9,34 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-SYSTOLIC_ARRAY_MODEL_DIR = os.path.join(
-    PROJECT_ROOT, "nandmachine", "simulator", "systolic_array_model"
-)
-SYSTOLIC_TEMP_DIR = os.path.join(SYSTOLIC_ARRAY_MODEL_DIR, "temp")
-
 from nandmachine.config.config import NandConfig
 from nandmachine.config.hardware_config import Device
 from math import ceil, log2, floor
 import time
 import numpy as np
-import pandas as pd
-from typing import Literal
-from scalesim.scale_sim import scalesim
-import copy
-from nandmachine.simulator.software.scalesim_runtime_patch import (
-    apply_scalesim_total_cycles_patch,
+from typing import Iterable, Iterator, Literal, Optional
+from nandmachine.simulator.software.compile_result_store import (
+    load_or_build_compile_result,
+)
+from nandmachine.simulator.software.cost_model_cache import (
+    CostModelCache,
+    CostModelCacheInfo,
+    build_cost_model_cache_key,
+)
+from nandmachine.simulator.software.systolic_lut import (
+    LookUpTableKey,
+    SystolicLookUpTable,
+    SystolicShapeRecorder,
+    get_systolic_look_up_table,
+    get_systolic_lut_policy,
 )
-
-apply_scalesim_total_cycles_patch()
 
 ReturnUnit = Literal["cycle", "time_ns"]
 ENABLE_CLI_HBF_SRAM_BUFFER = True
+ENABLE_EXHAUSTIVE_SEARCH_PRUNING = True
+# 单次编译内mapping搜索使用的进程数，默认1即串行搜索
+MAPPING_SEARCH_WORKERS_ENV_VAR = "NANDMACHINE_MAPPING_SEARCH_WORKERS"
+MAPPING_SEARCH_CHUNK_SIZE = 256
 
 
 @dataclass(frozen=True)
@@ -222,17 +230,54 @@ def _simulate_main_memory_write_cycle_count(
     )
 
 
+def get_mapping_search_worker_count() -> int:
+    worker_count = int(os.environ.get(MAPPING_SEARCH_WORKERS_ENV_VAR, "1"))
+    if worker_count < 1:
+        raise ValueError(
+            f"{MAPPING_SEARCH_WORKERS_ENV_VAR} must be >= 1, got {worker_count}"
+        )
+    return worker_count
+
+
+def _evaluate_mapping_chunk(
+    dim: tuple[int, int, int],
+    weight_bits: int,
+    mappings: list,
+    pcb_module: Device,
+    bandwidth_config_key: BandwidthConfigKey,
+    is_pruning_enabled: bool,
+    min_cycle_count: int,
+) -> tuple:
+    # 进程池worker入口：在worker内复用缓存的实例与查找表
+    return MatMul_Simulation.get_instance(
+        dim=dim, weight_bits=weight_bits
+    )._evaluate_mapping_candidates(
+        mappings,
+        pcb_module,
+        bandwidth_config_key,
+        is_pruning_enabled,
+        min_cycle_count,
+    )
+
+
 class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N的矩阵
     @dataclass(frozen=True)
     class PrecisionContext:
         weight_bits: int
         word_size: int
 
+    @dataclass(frozen=True)
+    class MappingSearchReport:
+        candidate_count: int
+        simulated_count: int
+        pruned_count: int
+
     @dataclass(frozen=True)
     class CompileResult:
         best_mapping: object
         best_cycle_count: int
         best_time_ns: int
+        search_report: Optional["MatMul_Simulation.MappingSearchReport"] = None
 
     @staticmethod
     def _word_size_from_weight_bits(weight_bits: int) -> int:
@@ -278,27 +323,28 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
         self.flop_count = 2 * self.M * self.K * self.N
         self.io_count = self.M * self.K + self.K * self.N + self.M * self.N
 
+    # 实例缓存只为复用对象；编译结果按值缓存，实例被淘汰后结果仍然有效
+    _instance_cache = CostModelCache("matmul_instance", size_of=None)
+    _compile_result_cache = CostModelCache("matmul_compile_result")
+
     @classmethod
     def get_instance(
         cls,
         dim: tuple[int, int, int],
         weight_bits: int = 16,
     ) -> "MatMul_Simulation":
-        return cls._get_cached_instance(cls, dim, weight_bits)
+        return cls._instance_cache.get_or_build(
+            (cls, tuple(dim), weight_bits),
+            lambda: cls(dim=dim, weight_bits=weight_bits),
+        )
 
     @classmethod
-    def clear_caches(cls) -> None:
-        cls._get_cached_instance.cache_clear()
-        cls._compile_and_simulate_result.cache_clear()
-
-    @staticmethod
-    @lru_cache(maxsize=256)
-    def _get_cached_instance(
-        cls: type["MatMul_Simulation"],
-        dim: tuple[int, int, int],
-        weight_bits: int,
-    ) -> "MatMul_Simulation":
-        return cls(dim=dim, weight_bits=weight_bits)
+    def clear_caches(cls) -> dict[str, CostModelCacheInfo]:
+        # 返回清空前各缓存的命中/未命中/淘汰计数
+        return {
+            "instance": cls._instance_cache.cache_clear(),
+            "compile_result": cls._compile_result_cache.cache_clear(),
+        }
 
     def print_latency(self):
         print(
@@ -340,6 +386,17 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                     for n in range(loop_N):
                         yield m, n, k
 
+    @staticmethod
+    def generate_tile_index_arrays(
+        loop_M: int, loop_N: int, loop_K: int, loop_order: str
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]: # generate_tile_loops 的向量化版本，按完全相同的顺序一次性给出 m/n/k 下标数组
+        assert loop_order in ["mkn", "mnk", "nkm", "nmk", "knm", "kmn"]
+        loop_sizes = {"m": loop_M, "n": loop_N, "k": loop_K}
+        # loop_order 从外到内排列，C顺序展开即为循环顺序
+        grid = np.indices([loop_sizes[axis] for axis in loop_order]).reshape(3, -1)
+        m_index, n_index, k_index = (grid[loop_order.index(axis)] for axis in "mnk")
+        return m_index, n_index, k_index
+
     class ComputationalGraph:
         def __init__(
             self,
@@ -416,23 +473,17 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
 
         return list(permutations) # 最终返回所有满足 i * j * k = n 的正整数三元组，用于把并行资源分配到 M/N/K 三个方向。
 
-    @lru_cache(maxsize=256)
-    def _compile_and_simulate_result(
+    def _build_compile_result(
         self,
         pcb_module: Device,
         bandwidth_config_key: BandwidthConfigKey,
         compile_mode: str = "exhaustive",
     ) -> "MatMul_Simulation.CompileResult":
         # 搜索最优mapping对应最小cycle
-        min_cycle_count = 2**63 - 1
-        best_mapping = None
         M = self.computational_graph.M
         N = self.computational_graph.N
         K = self.computational_graph.K
-        if (M == 1 or N == 1) and (
-            compile_mode == "heuristic-GPU"
-            or compile_mode == "heuristic-our-throughput"
-        ): # GEMV场景的heuristic快速计算，默认GEMV几乎都是io bound，就不做复杂的计算建模
+        if self._is_gemv_heuristic(compile_mode): # GEMV场景的heuristic快速计算，默认GEMV几乎都是io bound，就不做复杂的计算建模
             total_flop_count = 2 * M * N * K
             effective_total_vector_flops_per_cycle = (
                 self._get_total_vector_flops_per_cycle(
@@ -463,6 +514,74 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                 best_cycle_count=best_cycle_count,
                 best_time_ns=_cycle_count_to_time_ns(best_cycle_count, pcb_module),
             )
+        if compile_mode not in ("exhaustive", "heuristic-our-throughput", "heuristic-GPU"):
+            raise ValueError(f"compile_mode {compile_mode} not supported")
+        # exhaustive开启剪枝时先算每个候选的cycle下界，下界不小于当前最优值的候选不可能严格更优
+        # （严格小于才替换），直接跳过；候选顺序不变，所以结果与完整穷举一致
+        best_mapping, min_cycle_count, search_report = self._search_best_mapping(
+            self._iter_candidate_mappings(pcb_module, compile_mode),
+            pcb_module,
+            bandwidth_config_key,
+            is_pruning_enabled=(
+                compile_mode == "exhaustive" and ENABLE_EXHAUSTIVE_SEARCH_PRUNING
+            ),
+        )
+        return self.CompileResult(
+            best_mapping=best_mapping,
+            best_cycle_count=min_cycle_count,
+            best_time_ns=_cycle_count_to_time_ns(min_cycle_count, pcb_module),
+            search_report=search_report,
+        )
+
+    def _is_gemv_heuristic(self, compile_mode: str) -> bool:
+        return (
+            self.computational_graph.M == 1 or self.computational_graph.N == 1
+        ) and compile_mode in ("heuristic-GPU", "heuristic-our-throughput")
+
+    def collect_systolic_look_up_table_keys(
+        self,
+        pcb_module: Device,
+        nand_config: NandConfig,
+        hbm_bandwidth_bytes_per_sec: float,
+        compile_mode: str = "exhaustive",
+    ) -> set[LookUpTableKey]:
+        # 用记录器代替查找表跑一遍候选mapping，得到编译时会查询的全部脉动阵列形状；
+        # 剪枝与编译一致，命中的形状取表中的值，未命中的取代理估计值，
+        # 所以只有全部命中时结果才与实际查询集合相同，预热需重复收集直到没有未命中
+        if self._is_gemv_heuristic(compile_mode):
+            return set()
+        if compile_mode not in ("exhaustive", "heuristic-our-throughput", "heuristic-GPU"):
+            raise ValueError(f"compile_mode {compile_mode} not supported")
+        bandwidth_config_key = _build_bandwidth_config_key_or_raise(
+            nand_config,
+            hbm_bandwidth_bytes_per_sec,
+        )
+        table = get_systolic_look_up_table(
+            pcb_module.compute_module.core.systolic_array.array_height,
+            pcb_module.compute_module.core.systolic_array.array_width,
+        )
+        table.refresh()
+        recorder = SystolicShapeRecorder(table)
+        look_up_table = self.look_up_table
+        self.look_up_table = recorder
+        try:
+            self._evaluate_mapping_candidates(
+                self._iter_candidate_mappings(pcb_module, compile_mode),
+                pcb_module,
+                bandwidth_config_key,
+                is_pruning_enabled=(
+                    compile_mode == "exhaustive" and ENABLE_EXHAUSTIVE_SEARCH_PRUNING
+                ),
+            )
+        finally:
+            self.look_up_table = look_up_table
+        return recorder.keys
+
+    def _iter_candidate_mappings(self, pcb_module: Device, compile_mode: str):
+        # 按各compile_mode的固定顺序逐个生成候选mapping，串行与并行搜索共用同一顺序
+        M = self.computational_graph.M
+        N = self.computational_graph.N
+        K = self.computational_graph.K
         if compile_mode == "exhaustive":
             # exhaustive: 全参数穷举
             for l2_tile_M_log2 in range(1, ceil(log2(self.computational_graph.M)) + 1):
@@ -547,18 +666,9 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                                                     l0_N_tiling_factor,
                                                     l0_K_tiling_factor,
                                                 )
-                                                cycle_count = self.simulate(
-                                                    self.computational_graph,
-                                                    mapping,
-                                                    pcb_module,
-                                                    bandwidth_config_key,
-                                                )
-                                                if cycle_count < min_cycle_count:
-                                                    min_cycle_count = cycle_count
-                                                    best_mapping = mapping
+                                                yield mapping
         elif compile_mode == "heuristic-our-throughput":
             # heuristic-our-throughput: 吞吐导向候选集
-            i = 0
             for l2_tile_M in [32, 64, 128, 256, 512, 1024, 2048, 4096]:
                 for l2_tile_N in [
                     l2_tile_M // 4,
@@ -640,8 +750,6 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                             # self.find_permutations(
                             #     pcb_module.compute_module.core.systolic_array_count
                             # ):
-                            i += 1
-                            # start = time.time()
                             mapping = self.Mapping(
                                 l2_tile_M,
                                 l2_tile_N,
@@ -656,21 +764,9 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                                 l0_N_tiling_factor,
                                 l0_K_tiling_factor,
                             )
-                            cycle_count = self.simulate(
-                                self.computational_graph,
-                                mapping,
-                                pcb_module,
-                                bandwidth_config_key,
-                            )
-                            # end = time.time()
-                            # if i % 1000 == 0:
-                            #     print(f"{i} simulation time: {end-start}")
-                            if cycle_count < min_cycle_count:
-                                min_cycle_count = cycle_count
-                                best_mapping = mapping
+                            yield mapping
         elif compile_mode == "heuristic-GPU":
             # heuristic-GPU: A100经验候选集
-            i = 0
             for l2_tile_M in [64, 128, 256, 512, 1024, 2048]:
                 for l2_tile_N in [l2_tile_M // 2, l2_tile_M, l2_tile_M * 2]:
                     if K <= 12288:
@@ -732,8 +828,6 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                                 ) in self.find_permutations(
                                     pcb_module.compute_module.core.systolic_array_count
                                 ):
-                                    i += 1
-                                    start = time.time()
                                     mapping = self.Mapping(
                                         l2_tile_M,
                                         l2_tile_N,
@@ -748,19 +842,7 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                                         l0_N_tiling_factor,
                                         l0_K_tiling_factor,
                                     )
-                                    cycle_count = self.simulate(
-                                        self.computational_graph,
-                                        mapping,
-                                        pcb_module,
-                                        bandwidth_config_key,
-                                    )
-                                    end = time.time()
-                                    # if i % 1000 == 0:
-                                    #     print(f"{i} simulation time: {end-start}")
-                                    if cycle_count < min_cycle_count:
-                                        min_cycle_count = cycle_count
-                                        best_mapping = mapping
-            # print("total dse times:", i)
+                                    yield mapping
 
             # heuristic-TPU-new: 新TPU候选集
             l2_tile_M = self.computational_graph.M
@@ -829,21 +911,159 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                                 l0_N_tiling_factor,
                                 l0_K_tiling_factor,
                             )
-                            cycle_count = self.simulate(
-                                self.computational_graph,
-                                mapping,
+                            yield mapping
+
+    def _evaluate_mapping_candidates(
+        self,
+        mappings: Iterable["MatMul_Simulation.Mapping"],
+        pcb_module: Device,
+        bandwidth_config_key: BandwidthConfigKey,
+        is_pruning_enabled: bool,
+        min_cycle_count: int = 2**63 - 1,
+    ) -> tuple[Optional["MatMul_Simulation.Mapping"], int, int, int]:
+        # 按顺序模拟候选，只有严格更小才替换，所以相同cycle时保留最早的候选；
+        # min_cycle_count 传入之前已知的最优值时，只返回严格优于它的候选
+        best_mapping = None
+        candidate_count = 0
+        pruned_count = 0
+        tile_key = None
+        lower_bound_cycle_counts = {}
+        for mapping in mappings:
+            candidate_count += 1
+            if is_pruning_enabled:
+                current_tile_key = (
+                    mapping.l2_tile_M,
+                    mapping.l2_tile_N,
+                    mapping.l2_tile_K,
+                    mapping.l1_tile_M,
+                    mapping.l1_tile_N,
+                    mapping.l1_tile_K,
+                )
+                if current_tile_key != tile_key: # 下界与l1_loop_order无关，同一组tile内按(l2_loop_order, l0切分)缓存
+                    tile_key = current_tile_key
+                    lower_bound_cycle_counts = {}
+                lower_bound_key = (
+                    mapping.l2_loop_order,
+                    mapping.l0_M_tiling_factor,
+                    mapping.l0_N_tiling_factor,
+                    mapping.l0_K_tiling_factor,
+                )
+                if lower_bound_key not in lower_bound_cycle_counts:
+                    lower_bound_cycle_counts[lower_bound_key] = self.simulate(
+                        self.computational_graph,
+                        mapping,
+                        pcb_module,
+                        bandwidth_config_key,
+                        is_lower_bound=True,
+                    )
+                if lower_bound_cycle_counts[lower_bound_key] >= min_cycle_count:
+                    pruned_count += 1
+                    continue
+            cycle_count = self.simulate(
+                self.computational_graph,
+                mapping,
+                pcb_module,
+                bandwidth_config_key,
+            )
+            if cycle_count < min_cycle_count:
+                min_cycle_count = cycle_count
+                best_mapping = mapping
+        return best_mapping, min_cycle_count, candidate_count, pruned_count
+
+    def _search_best_mapping(
+        self,
+        mappings: Iterator["MatMul_Simulation.Mapping"],
+        pcb_module: Device,
+        bandwidth_config_key: BandwidthConfigKey,
+        is_pruning_enabled: bool,
+    ) -> tuple[
+        Optional["MatMul_Simulation.Mapping"], int, "MatMul_Simulation.MappingSearchReport"
+    ]:
+        worker_count = get_mapping_search_worker_count()
+        first_chunk = list(islice(mappings, MAPPING_SEARCH_CHUNK_SIZE))
+        if worker_count == 1 or len(first_chunk) < MAPPING_SEARCH_CHUNK_SIZE:
+            # 单进程，或候选不足一个chunk时不值得启动进程池
+            best_mapping, min_cycle_count, candidate_count, pruned_count = (
+                self._evaluate_mapping_candidates(
+                    chain(first_chunk, mappings),
+                    pcb_module,
+                    bandwidth_config_key,
+                    is_pruning_enabled,
+                )
+            )
+        else:
+            # 候选按chunk分发给进程池，按提交顺序归约：只有严格更小才替换，保证与串行搜索的结果一致。
+            # 每个chunk提交时带上已归约出的最优值，供chunk内剪枝使用
+            best_mapping = None
+            min_cycle_count = 2**63 - 1
+            candidate_count = 0
+            pruned_count = 0
+            pending_chunks = deque()
+            chunk = first_chunk
+            with ProcessPoolExecutor(max_workers=worker_count) as executor:
+                while chunk or pending_chunks:
+                    while chunk and len(pending_chunks) < 2 * worker_count:
+                        pending_chunks.append(
+                            executor.submit(
+                                _evaluate_mapping_chunk,
+                                (self.M, self.K, self.N),
+                                self.weight_bits,
+                                chunk,
                                 pcb_module,
                                 bandwidth_config_key,
+                                is_pruning_enabled,
+                                min_cycle_count,
                             )
-                            if cycle_count < min_cycle_count:
-                                min_cycle_count = cycle_count
-                                best_mapping = mapping
-        else:
-            raise ValueError(f"compile_mode {compile_mode} not supported")
-        return self.CompileResult(
-            best_mapping=best_mapping,
-            best_cycle_count=min_cycle_count,
-            best_time_ns=_cycle_count_to_time_ns(min_cycle_count, pcb_module),
+                        )
+                        chunk = list(islice(mappings, MAPPING_SEARCH_CHUNK_SIZE))
+                    (
+                        chunk_best_mapping,
+                        chunk_min_cycle_count,
+                        chunk_candidate_count,
+                        chunk_pruned_count,
+                    ) = pending_chunks.popleft().result()
+                    candidate_count += chunk_candidate_count
+                    pruned_count += chunk_pruned_count
+                    if chunk_min_cycle_count < min_cycle_count:
+                        min_cycle_count = chunk_min_cycle_count
+                        best_mapping = chunk_best_mapping
+        return (
+            best_mapping,
+            min_cycle_count,
+            self.MappingSearchReport(
+                candidate_count=candidate_count,
+                simulated_count=candidate_count - pruned_count,
+                pruned_count=pruned_count,
+            ),
+        )
+
+    def _compile_and_simulate_result(
+        self,
+        pcb_module: Device,
+        bandwidth_config_key: BandwidthConfigKey,
+        compile_mode: str = "exhaustive",
+    ) -> "MatMul_Simulation.CompileResult":
+        key_fields = dict(
+            shape=(self.M, self.K, self.N),
+            weight_bits=self.weight_bits,
+            matmul_type=None,
+            pcb_module=pcb_module,
+            bandwidth_config_key=bandwidth_config_key,
+            compile_mode=compile_mode,
+            # 代理模型估算的结果不能与 ScaleSim 精确结果共用缓存条目
+            lut_policy=get_systolic_lut_policy(),
+        )
+        return self._compile_result_cache.get_or_build(
+            build_cost_model_cache_key("matmul", **key_fields),
+            lambda: load_or_build_compile_result(
+                "matmul",
+                lambda: self._build_compile_result(
+                    pcb_module=pcb_module,
+                    bandwidth_config_key=bandwidth_config_key,
+                    compile_mode=compile_mode,
+                ),
+                **key_fields,
+            ),
         )
 
     def compile_and_simulate(
@@ -866,6 +1086,7 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
         self.best_mapping = result.best_mapping
         self.best_cycle_count = result.best_cycle_count
         self.best_time_ns = result.best_time_ns
+        self.search_report = result.search_report
         self.best_latency = result.best_cycle_count / pcb_module.compute_module.clock_freq
         self.latency = self.best_latency
 
@@ -875,8 +1096,8 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             return result.best_time_ns
         raise ValueError(f"Unsupported return_unit: {return_unit}")
 
-    compile_and_simulate.cache_info = _compile_and_simulate_result.cache_info
-    compile_and_simulate.cache_clear = _compile_and_simulate_result.cache_clear
+    compile_and_simulate.cache_info = _compile_result_cache.cache_info
+    compile_and_simulate.cache_clear = _compile_result_cache.cache_clear
 
     def simulate(
         self,
@@ -884,50 +1105,13 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
         mapping: Mapping,
         pcb_module: Device,
         bandwidth_config_key: BandwidthConfigKey,
-    ) -> int: # 注解，表明返回值是int
+        is_lower_bound: bool = False,
+    ) -> int: # 注解，表明返回值是int；is_lower_bound为True时返回该mapping cycle的下界，供穷举剪枝使用
         if self.look_up_table is None: # None表示表格未加载，需要初始化读取表格
-            # 懒加载脉动阵列查找表
-            column_names = [
-                "M",
-                "N",
-                "K",
-                "ArrayHeight",
-                "ArrayWidth",
-                "Dataflow",
-                "cycle_count",
-                "util_rate",
-            ]
-            lut_path = (
-                f"./systolic_array_model/look_up_table_"
-                f"{pcb_module.compute_module.core.systolic_array.array_height}_"
-                f"{pcb_module.compute_module.core.systolic_array.array_width}.csv"
-            )
-            if not os.path.exists(lut_path):
-                os.makedirs(os.path.dirname(lut_path), exist_ok=True)
-                pd.DataFrame(columns=column_names).to_csv(
-                    lut_path, header=False, index=False
-                )
-            try:
-                self.look_up_table = pd.read_csv(
-                    lut_path,
-                    header=None,
-                    names=column_names,
-                )
-            except pd.errors.EmptyDataError:
-                self.look_up_table = pd.DataFrame(columns=column_names)
-            self.look_up_table.drop_duplicates(
-                inplace=True,
-                subset=["M", "N", "K", "ArrayHeight", "ArrayWidth", "Dataflow"],
-            )
-            # self.look_up_table.reset_index(drop=True, inplace=True)
-            # self.look_up_table.to_csv(
-            #     f"./systolic_array_model/look_up_table_{pcb_module.compute_module.core.systolic_array.array_height}_{pcb_module.compute_module.core.systolic_array.array_width}.csv",
-            #     header=False,
-            #     index=False,
-            # )
-            self.look_up_table.set_index(
-                ["M", "N", "K", "ArrayHeight", "ArrayWidth", "Dataflow"],
-                inplace=True,
+            # 脉动阵列查找表由进程内共享的查表服务维护
+            self.look_up_table = get_systolic_look_up_table(
+                pcb_module.compute_module.core.systolic_array.array_height,
+                pcb_module.compute_module.core.systolic_array.array_width,
             )
         # print(self.look_up_table)
         # print(self.look_up_table.loc[(32, 16, 256, 16, 16, 'os'), "cycle_count"
@@ -960,180 +1144,112 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
         M_remain = M % l2_tile_M
         N_remain = N % l2_tile_N
         K_remain = K % l2_tile_K
-        # 按mapping切分L2 tile网格
-        l2_tiles = np.empty(
-            [ceil(M / l2_tile_M), ceil(N / l2_tile_N), ceil(K / l2_tile_K)],
-            dtype=self.L2TileSimulator,
-        ) # 这里创建一个空的numpy数组，元素类型是L2TileSimulator实例
-        # print('-'*20)
-        # print(l2_tiles.shape)
-        if M_l2_t * N_l2_t * K_l2_t != 0:
-            l2_tiles[:M_l2_t, :N_l2_t, :K_l2_t] = self.L2TileSimulator(
-                l2_tile_M,
-                l2_tile_N,
-                l2_tile_K,
-                precision,
-                mapping,
-                pcb_module,
-                bandwidth_config_key,
-                self.look_up_table,
-            ) # 该切片（数组的子块）中的每个元素都变成一个 L2TileSimulator 实例（同一组参数）
-        if M_remain != 0:
-            l2_tiles[-1, :N_l2_t, :K_l2_t] = self.L2TileSimulator(
-                M_remain,
-                l2_tile_N,
-                l2_tile_K,
-                precision,
-                mapping,
-                pcb_module,
-                bandwidth_config_key,
-                self.look_up_table,
-            )
-        if N_remain != 0:
-            l2_tiles[:M_l2_t, -1, :K_l2_t] = self.L2TileSimulator(
-                l2_tile_M,
-                N_remain,
-                l2_tile_K,
-                precision,
-                mapping,
-                pcb_module,
-                bandwidth_config_key,
-                self.look_up_table,
-            )
-        if K_remain != 0:
-            l2_tiles[:M_l2_t, :N_l2_t, -1] = self.L2TileSimulator(
-                l2_tile_M,
-                l2_tile_N,
-                K_remain,
-                precision,
-                mapping,
-                pcb_module,
-                bandwidth_config_key,
-                self.look_up_table,
-            )
-        if M_remain * N_remain != 0:
-            l2_tiles[-1, -1, :K_l2_t] = self.L2TileSimulator(
-                M_remain,
-                N_remain,
-                l2_tile_K,
-                precision,
-                mapping,
-                pcb_module,
-                bandwidth_config_key,
-                self.look_up_table,
-            )
-        if M_remain * K_remain != 0:
-            l2_tiles[-1, :N_l2_t, -1] = self.L2TileSimulator(
-                M_remain,
-                l2_tile_N,
-                K_remain,
-                precision,
-                mapping,
-                pcb_module,
-                bandwidth_config_key,
-                self.look_up_table,
-            )
-        if N_remain * K_remain != 0:
-            l2_tiles[:M_l2_t, -1, -1] = self.L2TileSimulator(
-                l2_tile_M,
-                N_remain,
-                K_remain,
-                precision,
-                mapping,
-                pcb_module,
-                bandwidth_config_key,
-                self.look_up_table,
-            )
-        if M_remain * N_remain * K_remain != 0:
-            l2_tiles[-1, -1, -1] = self.L2TileSimulator(
-                M_remain,
-                N_remain,
-                K_remain,
+        # 按mapping切分L2 tile网格。网格中最多只有8类不同形状的tile（M/N/K每一维是否为余数块），
+        # tile类别编号为 is_M_remain*4 + is_N_remain*2 + is_K_remain，每类只构建一次 L2TileSimulator
+        compute_cycle_counts = np.zeros(8, dtype=np.int64)
+        K_reduction_cycle_counts = np.zeros(8, dtype=np.int64)
+        # 读cycle按 read_mk*4 + read_kn*2 + read_mn 编号，写cycle按 write_mn 编号
+        read_cycle_counts = np.zeros([8, 8], dtype=np.int64)
+        write_cycle_counts = np.zeros([8, 2], dtype=np.int64)
+        for tile_class in (0, 4, 2, 1, 6, 5, 3, 7): # 与原先逐块赋值的构建顺序一致
+            is_M_remain = tile_class & 4
+            is_N_remain = tile_class & 2
+            is_K_remain = tile_class & 1
+            if (
+                (M_remain if is_M_remain else M_l2_t)
+                * (N_remain if is_N_remain else N_l2_t)
+                * (K_remain if is_K_remain else K_l2_t)
+                == 0
+            ): # 该类别的tile在网格中不存在
+                continue
+            l2_tile = self.L2TileSimulator(
+                M_remain if is_M_remain else l2_tile_M,
+                N_remain if is_N_remain else l2_tile_N,
+                K_remain if is_K_remain else l2_tile_K,
                 precision,
                 mapping,
                 pcb_module,
                 bandwidth_config_key,
                 self.look_up_table,
+                is_lower_bound=is_lower_bound,
             )
+            compute_cycle_counts[tile_class] = l2_tile.compute_cycle_count
+            K_reduction_cycle_counts[tile_class] = l2_tile.K_reduction_cycle_count
+            for read_flags in range(8):
+                read_cycle_counts[tile_class, read_flags] = (
+                    l2_tile.get_main_memory_read_cycle_count(
+                        read_mk=bool(read_flags & 4),
+                        read_kn=bool(read_flags & 2),
+                        read_mn=bool(read_flags & 1),
+                    )
+                )
+            for write_flag in range(2):
+                write_cycle_counts[tile_class, write_flag] = (
+                    l2_tile.get_main_memory_write_cycle_count(write_mn=bool(write_flag))
+                )
 
-        total_cycle_count = l2_tiles[0, 0, 0].get_main_memory_read_cycle_count(
-            read_mk=True,
-            read_kn=True,
-            read_mn=False,
-        ) # 读取第一个矩阵的第一个tile和第二个矩阵的第一个tile
-
-        previous_m = 0 # 先前l2tiles中元素的index
-        previous_n = 0 # 先前l2tiles中元素的index
-        previous_k = 0 # 先前l2tiles中元素的index
-
-        for m, n, k in self.generate_tile_loops(
+        m_index, n_index, k_index = self.generate_tile_index_arrays(
             ceil(M / l2_tile_M),
             ceil(N / l2_tile_N),
             ceil(K / l2_tile_K),
             mapping.l2_loop_order,
-        ):
-            if m == 0 and n == 0 and k == 0:
-                continue
-
-            l2_tile = l2_tiles[m, n, k]
-            previous_l2_tile = l2_tiles[previous_m, previous_n, previous_k]
+        )
+        tile_classes = (
+            (m_index >= M_l2_t) * 4 + (n_index >= N_l2_t) * 2 + (k_index >= K_l2_t)
+        )
 
-            # current tile read latency
-            if m == previous_m and k == previous_k:
-                should_read_mk = False
-                should_read_kn = True
-            elif n == previous_n and k == previous_k:
-                should_read_mk = True
-                should_read_kn = False
-            else:
-                should_read_mk = True
-                should_read_kn = True
-            should_read_mn = k > 0 and not (
-                m == previous_m and n == previous_n
-            ) # not后确保只在切换输出矩阵mn tile的位置时才输出结果，把mn tile中间数据暂存于主存，mn不切换时只是累加。k>0要求只有非第一次计算该mn块时才从主存中读取中间数据
-            current_tile_read_cycle_count = l2_tile.get_main_memory_read_cycle_count(
-                read_mk=should_read_mk,
-                read_kn=should_read_kn,
-                read_mn=should_read_mn,
-            )
-            # previous tile compute latency
-            previous_tile_compute_cycle_count = previous_l2_tile.compute_cycle_count
-            if previous_k > 0:  # previous_k>0要求在非第一轮时要对mn块与主存中的中间数据进行按元素求和、读、写（三个部分的cycle）。原文是if k>0:
-                previous_tile_compute_cycle_count += (
-                    previous_l2_tile.K_reduction_cycle_count
+        total_cycle_count = int(read_cycle_counts[tile_classes[0], 0b110]) # 读取第一个矩阵的第一个tile和第二个矩阵的第一个tile
+
+        # 一次性计算所有相邻tile对：读当前tile、计算并写回前一个tile
+        current_m, previous_m = m_index[1:], m_index[:-1]
+        current_n, previous_n = n_index[1:], n_index[:-1]
+        current_k, previous_k = k_index[1:], k_index[:-1]
+        current_classes, previous_classes = tile_classes[1:], tile_classes[:-1]
+        same_mk = (current_m == previous_m) & (current_k == previous_k)
+        same_kn = (current_n == previous_n) & (current_k == previous_k)
+        same_mn = (current_m == previous_m) & (current_n == previous_n)
+
+        # current tile read latency
+        should_read_mk = ~same_mk
+        should_read_kn = same_mk | ~same_kn
+        should_read_mn = (current_k > 0) & ~same_mn # 只在切换mn tile且非第一次计算该mn块时才从主存中读取中间数据
+        current_tile_read_cycle_counts = read_cycle_counts[
+            current_classes,
+            should_read_mk * 4 + should_read_kn * 2 + should_read_mn,
+        ]
+        # previous tile compute latency, previous_k>0 时需要加上K归约
+        previous_tile_compute_cycle_counts = compute_cycle_counts[
+            previous_classes
+        ] + np.where(previous_k > 0, K_reduction_cycle_counts[previous_classes], 0)
+        # previous tile write latency
+        previous_tile_write_cycle_counts = write_cycle_counts[
+            previous_classes, (~same_mn).astype(np.intp)
+        ]
+
+        # read current tile, compute previous tile, write previous tile
+        if mapping.is_l2_double_buffering:  # pipelined
+            step_cycle_counts = (
+                np.maximum(
+                    current_tile_read_cycle_counts, previous_tile_compute_cycle_counts
                 )
-            # previous tile write latency
-            previous_tile_write_cycle_count = previous_l2_tile.get_main_memory_write_cycle_count(
-                write_mn=not (m == previous_m and n == previous_n)
+                + previous_tile_write_cycle_counts
             )
-
-            # read current tile, compute previous tile, write previous tile
-            if mapping.is_l2_double_buffering:  # pipelined
-                total_cycle_count += (
-                    max(
-                        current_tile_read_cycle_count, previous_tile_compute_cycle_count
-                    )
-                    + previous_tile_write_cycle_count
-                )
-            else:  # non-pipelined
-                total_cycle_count += (
-                    current_tile_read_cycle_count
-                    + previous_tile_compute_cycle_count
-                    + previous_tile_write_cycle_count
-                )
-
-            previous_m = m
-            previous_n = n
-            previous_k = k
+        else:  # non-pipelined
+            step_cycle_counts = (
+                current_tile_read_cycle_counts
+                + previous_tile_compute_cycle_counts
+                + previous_tile_write_cycle_counts
+            )
+        total_cycle_count += int(step_cycle_counts.sum())
 
         # compute and write last tile
-        total_cycle_count += (
-            l2_tiles[-1, -1, -1].get_main_memory_write_cycle_count(write_mn=True)
-            + l2_tiles[-1, -1, -1].compute_cycle_count
+        last_tile_class = tile_classes[-1]
+        total_cycle_count += int(
+            write_cycle_counts[last_tile_class, 1] + compute_cycle_counts[last_tile_class]
         )
 
-        if previous_k > 0: # 如果最后一个tile的k维不是0，说明还有一轮k维的累加没有进行，这时需要把累加的结果写回内存。收尾工作
-            total_cycle_count += ceil(l2_tiles[-1, -1, -1].K_reduction_cycle_count)
+        if k_index[-1] > 0: # 如果最后一个tile的k维不是0，说明还有一轮k维的累加没有进行，这时需要把累加的结果写回内存。收尾工作
+            total_cycle_count += int(K_reduction_cycle_counts[last_tile_class])
 
         return total_cycle_count #+ ceil(
         # pcb_module.io_module.latency * 2 * pcb_module.compute_module.clock_freq
@@ -1149,7 +1265,8 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             mapping: "MatMul_Simulation.Mapping",
             pcb_module: Device,
             bandwidth_config_key: BandwidthConfigKey,
-            look_up_table: pd.DataFrame,
+            look_up_table: SystolicLookUpTable,
+            is_lower_bound: bool = False,
         ):
             # print(f'L2 tile: {M} {N} {K}')
             # L2 tile统计IO与计算cycle
@@ -1177,9 +1294,17 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             self.mk_io_bytes = M * K * word_size
             self.kn_io_bytes = K * N * word_size
             self.mn_io_bytes = M * N * word_size
-            self.compute_cycle_count = self.simulate_l2_tile_compute_cycle_count(
-                M, N, K, precision, mapping, pcb_module, look_up_table
-            )
+            if is_lower_bound:
+                # 流水记账对计算cycle单调不减，代入计算cycle的下界得到的总cycle也是下界
+                self.compute_cycle_count = (
+                    self.estimate_l2_tile_compute_cycle_count_lower_bound(
+                        M, N, K, precision, mapping, pcb_module, look_up_table
+                    )
+                )
+            else:
+                self.compute_cycle_count = self.simulate_l2_tile_compute_cycle_count(
+                    M, N, K, precision, mapping, pcb_module, look_up_table
+                )
 
         def get_main_memory_read_cycle_count(
             self,
@@ -1207,6 +1332,78 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                 mn_write_bytes=self.mn_io_bytes if write_mn else 0,
             )
 
+        def estimate_l2_tile_compute_cycle_count_lower_bound(
+            self,
+            M: int,
+            N: int,
+            K: int,
+            precision: "MatMul_Simulation.PrecisionContext",
+            mapping: "MatMul_Simulation.Mapping",
+            chiplet_module: Device,
+            look_up_table: SystolicLookUpTable,
+        ) -> int:
+            # 逐batch记账在各batch计算cycle之和上只会再叠加IO，而每个batch最多core_count个L1 tile并行、
+            # 计算cycle取其中最大值，所以各batch之和不小于：全部L1 tile计算cycle之和除以核心数，
+            # 也不小于最慢的tile加上其余每个batch至少一个最快的tile
+            effective_vector_flops_per_cycle = (
+                MatMul_Simulation._get_core_vector_flops_per_cycle(
+                    chiplet_module, precision.weight_bits
+                )
+            )
+            l1_tile_M = mapping.l1_tile_M
+            l1_tile_N = mapping.l1_tile_N
+            l1_tile_K = mapping.l1_tile_K
+            M_l1_t = M // l1_tile_M
+            N_l1_t = N // l1_tile_N
+            K_l1_t = K // l1_tile_K
+            l1_tile_count = 0
+            total_l1_compute_cycle_count = 0
+            max_l1_compute_cycle_count = 0
+            min_l1_compute_cycle_count = None
+            for tile_M, count_M in ((l1_tile_M, M_l1_t), (M % l1_tile_M, 1)):
+                for tile_N, count_N in ((l1_tile_N, N_l1_t), (N % l1_tile_N, 1)):
+                    # (tile_K, 该类tile沿K的个数, 其中k>0需要额外累加部分和的个数)
+                    for tile_K, count_K, accumulate_count_K in (
+                        (l1_tile_K, K_l1_t, max(K_l1_t - 1, 0)),
+                        (K % l1_tile_K, 1, 1 if K_l1_t > 0 else 0),
+                    ):
+                        if tile_M * tile_N * tile_K * count_M * count_N * count_K == 0:
+                            continue
+                        l1_compute_cycle_count = MatMul_Simulation.L1TileSimulator(
+                            tile_M,
+                            tile_N,
+                            tile_K,
+                            precision,
+                            mapping,
+                            chiplet_module,
+                            look_up_table,
+                        ).compute_cycle_count
+                        accumulate_cycle_count = ceil(
+                            tile_M * tile_N / effective_vector_flops_per_cycle
+                        )
+                        l1_tile_count += count_M * count_N * count_K
+                        total_l1_compute_cycle_count += count_M * count_N * (
+                            count_K * l1_compute_cycle_count
+                            + accumulate_count_K * accumulate_cycle_count
+                        )
+                        max_l1_compute_cycle_count = max(
+                            max_l1_compute_cycle_count,
+                            l1_compute_cycle_count
+                            + (accumulate_cycle_count if accumulate_count_K > 0 else 0),
+                        )
+                        if (
+                            min_l1_compute_cycle_count is None
+                            or l1_compute_cycle_count < min_l1_compute_cycle_count
+                        ):
+                            min_l1_compute_cycle_count = l1_compute_cycle_count
+            core_count = chiplet_module.compute_module.core_count
+            batch_count = ceil(l1_tile_count / core_count)
+            return max(
+                ceil(total_l1_compute_cycle_count / core_count),
+                max_l1_compute_cycle_count
+                + (batch_count - 1) * min_l1_compute_cycle_count,
+            )
+
         def simulate_l2_tile_compute_cycle_count(
             self,
             M: int,
@@ -1215,7 +1412,7 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             precision: "MatMul_Simulation.PrecisionContext",
             mapping: "MatMul_Simulation.Mapping",
             chiplet_module: Device,
-            look_up_table: pd.DataFrame,
+            look_up_table: SystolicLookUpTable,
         ) -> int:
             word_size = precision.word_size
             effective_vector_flops_per_cycle = (
@@ -1353,32 +1550,40 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             if M_remain > 0 and N_remain > 0:
                 M_N_tile_size[-1, -1] = M_remain * N_remain
 
+            l1_loop_M = ceil(M / l1_tile_M)
+            l1_loop_N = ceil(N / l1_tile_N)
+            l1_loop_K = ceil(K / l1_tile_K)
+            # 下面按线性下标（m*loop_K+k 等）访问子块，先把“查表矩阵”展平
+            M_K_tile_size = M_K_tile_size.ravel()
+            K_N_tile_size = K_N_tile_size.ravel()
+            M_N_tile_size = M_N_tile_size.ravel()
+
             total_cycle_count = 0
-            previous_batch_Read_M_K = np.zeros(
-                [ceil(M / l1_tile_M), ceil(K / l1_tile_K)], dtype=bool
-            ) # “状态矩阵”，记录上一个batch中每个 (m_tile, k_tile) 位置的 MK 子块是否被读取过，bool值节省内存并且方便后续计算
-            previous_batch_Read_K_N = np.zeros(
-                [ceil(K / l1_tile_K), ceil(N / l1_tile_N)], dtype=bool
-            ) # “状态矩阵”，记录上一个batch中每个 (k_tile, n_tile) 位置的 KN 子块是否被读取过
-            previous_batch_Read_M_N = np.zeros(
-                [ceil(M / l1_tile_M), ceil(N / l1_tile_N)], dtype=bool
-            ) # “状态矩阵”，记录上一个batch中每个 (m_tile, n_tile) 位置的 MN 子块是否被读取过
-            previous_batch_Write_M_N = np.zeros(
-                [ceil(M / l1_tile_M), ceil(N / l1_tile_N)], dtype=bool
-            ) # “状态矩阵”，记录上一个batch中每个 (m_tile, n_tile) 位置的 MN 子块是否被写入过
+            # “状态矩阵”预分配两组，按batch奇偶轮流作为当前batch和上一batch，记录每个子块是否被读取/写入过
+            # 切换batch时只清除上上个batch置位过的位置，避免每个batch重新分配整张矩阵再深拷贝
+            batch_Read_M_K = np.zeros([2, l1_loop_M * l1_loop_K], dtype=bool)
+            batch_Read_K_N = np.zeros([2, l1_loop_K * l1_loop_N], dtype=bool)
+            batch_Read_M_N = np.zeros([2, l1_loop_M * l1_loop_N], dtype=bool)
+            batch_Write_M_N = np.zeros([2, l1_loop_M * l1_loop_N], dtype=bool)
+            # 每组状态矩阵中被置位的子块线性下标（已去重），MN 的读写共用同一组下标
+            batch_M_K_index = [np.empty(0, dtype=np.intp)] * 2
+            batch_K_N_index = [np.empty(0, dtype=np.intp)] * 2
+            batch_M_N_index = [np.empty(0, dtype=np.intp)] * 2
+            current_slot = 0
+            previous_slot = 1
             previous_batch_compute_cycle_count = 0
             active_l1_tile_list = [] # 当前一批并行执行的 L1 tile 队列
             for m, n, k in MatMul_Simulation.generate_tile_loops(
-                ceil(M / l1_tile_M),
-                ceil(N / l1_tile_N),
-                ceil(K / l1_tile_K),
+                l1_loop_M,
+                l1_loop_N,
+                l1_loop_K,
                 mapping.l1_loop_order,
             ): # 按 l1_loop_order 生成 L1 tile 执行顺序，并把 tile 按批（最多 core_count 个）打包做流水记账
                 active_l1_tile_list.append((m, n, k, l1_tiles[m, n, k]))
                 if (
-                    m == ceil(M / l1_tile_M) - 1
-                    and n == ceil(N / l1_tile_N) - 1
-                    and k == ceil(K / l1_tile_K) - 1
+                    m == l1_loop_M - 1
+                    and n == l1_loop_N - 1
+                    and k == l1_loop_K - 1
                 ): # 最后一个tile，结束当前batch的模拟
                     pass
                 elif (
@@ -1389,26 +1594,9 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                 assert (
                     len(active_l1_tile_list) <= chiplet_module.compute_module.core_count
                 ) # 活跃tile数量不应该超过核心数量上限
-                current_batch_Read_M_K = np.zeros(
-                    [ceil(M / l1_tile_M), ceil(K / l1_tile_K)], dtype=bool
-                ) # “状态矩阵”，记录当前batch中每个 (m_tile, k_tile) 位置的 MK 子块是否被读取过
-                current_batch_Read_K_N = np.zeros(
-                    [ceil(K / l1_tile_K), ceil(N / l1_tile_N)], dtype=bool
-                ) # “状态矩阵”，记录当前batch中每个 (k_tile, n_tile) 位置的 KN 子块是否被读取过
-                current_batch_Read_M_N = np.zeros(
-                    [ceil(M / l1_tile_M), ceil(N / l1_tile_N)], dtype=bool
-                ) # “状态矩阵”，记录当前batch中每个 (m_tile, n_tile) 位置的 MN 子块是否被读取过
-                current_batch_Write_M_N = np.zeros(
-                    [ceil(M / l1_tile_M), ceil(N / l1_tile_N)], dtype=bool
-                ) # “状态矩阵”，记录当前batch中每个 (m_tile, n_tile) 位置的 MN 子块是否被写入过
 
                 current_batch_compute_cycle_count = 0
-                for i in range(len(active_l1_tile_list)):
-                    temp_m, temp_n, temp_k, temp_l1_tile = active_l1_tile_list[i]
-                    current_batch_Read_M_K[temp_m, temp_k] = 1
-                    current_batch_Read_K_N[temp_k, temp_n] = 1
-                    current_batch_Read_M_N[temp_m, temp_n] = temp_k > 0
-                    current_batch_Write_M_N[temp_m, temp_n] = 1
+                for temp_m, temp_n, temp_k, temp_l1_tile in active_l1_tile_list:
                     temp_l1_tile_compute_cycle_count = temp_l1_tile.compute_cycle_count # 当前tile的计算cycle count
                     if temp_k > 0:
                         temp_l1_tile_compute_cycle_count += ceil(
@@ -1421,27 +1609,56 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                         temp_l1_tile_compute_cycle_count,
                     ) # 当前batch的计算cycle count取决于活跃tile中计算cycle count最多的那个tile，因为它们是并行执行的
 
+                # 清除上上个batch在当前这组状态矩阵中的置位
+                batch_Read_M_K[current_slot, batch_M_K_index[current_slot]] = False
+                batch_Read_K_N[current_slot, batch_K_N_index[current_slot]] = False
+                batch_Read_M_N[current_slot, batch_M_N_index[current_slot]] = False
+                batch_Write_M_N[current_slot, batch_M_N_index[current_slot]] = False
+
+                active_m, active_n, active_k = np.array(
+                    [tile[:3] for tile in active_l1_tile_list], dtype=np.intp
+                ).T
+                current_M_K_index = np.unique(active_m * l1_loop_K + active_k)
+                current_K_N_index = np.unique(active_k * l1_loop_N + active_n)
+                # 同一个 (m_tile, n_tile) 在batch中出现多次时，是否读取 MN 中间结果以最后出现的那个tile的k为准
+                current_M_N_index, last_position = np.unique(
+                    (active_m * l1_loop_N + active_n)[::-1], return_index=True
+                )
+                current_M_N_read = active_k[::-1][last_position] > 0
+                batch_Read_M_K[current_slot, current_M_K_index] = True
+                batch_Read_K_N[current_slot, current_K_N_index] = True
+                batch_Read_M_N[current_slot, current_M_N_index] = current_M_N_read
+                batch_Write_M_N[current_slot, current_M_N_index] = True
+                batch_M_K_index[current_slot] = current_M_K_index
+                batch_K_N_index[current_slot] = current_K_N_index
+                batch_M_N_index[current_slot] = current_M_N_index
+                previous_M_N_index = batch_M_N_index[previous_slot]
+
                 # if one output tile in this batch shares input/output with another output tile in the previous batch, assign them to the same core to avoid data movement
                 # note that of the three input matrix mk, kn, mn, at most one of them can be the same if we change m,n,k
+                # 只在当前batch（或上一batch）置位过的子块上求和，与整张状态矩阵相乘再求和的结果相同
                 current_batch_M_K_read_count = np.sum(
-                    (current_batch_Read_M_K * (~previous_batch_Read_M_K))
-                    * M_K_tile_size
+                    ~batch_Read_M_K[previous_slot, current_M_K_index]
+                    * M_K_tile_size[current_M_K_index]
                 )
                 current_batch_K_N_read_count = np.sum(
-                    (current_batch_Read_K_N * (~previous_batch_Read_K_N))
-                    * K_N_tile_size
+                    ~batch_Read_K_N[previous_slot, current_K_N_index]
+                    * K_N_tile_size[current_K_N_index]
                 )
                 current_batch_M_N_read_count = np.sum(
                     (
-                        current_batch_Read_M_N
-                        * (~(previous_batch_Read_M_N + previous_batch_Write_M_N))
+                        current_M_N_read
+                        & ~(
+                            batch_Read_M_N[previous_slot, current_M_N_index]
+                            | batch_Write_M_N[previous_slot, current_M_N_index]
+                        )
                     )
-                    * M_N_tile_size
+                    * M_N_tile_size[current_M_N_index]
                 )
                 previous_batch_M_N_write_count = np.sum(
-                    (previous_batch_Write_M_N * (~current_batch_Read_M_N))
-                    * M_N_tile_size
-                )
+                    ~batch_Read_M_N[current_slot, previous_M_N_index]
+                    * M_N_tile_size[previous_M_N_index]
+                ) # 上一batch写过的位置即 previous_M_N_index
 
                 # read current batch while compute and write previous batch. 先统计读写元素量，再按字节宽度和 L2 带宽折算成 IO 周期，供后面的流水重叠公式使用
                 current_batch_read_count = (
@@ -1469,16 +1686,14 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                 )
 
                 previous_batch_compute_cycle_count = current_batch_compute_cycle_count
-                previous_batch_Read_M_K = copy.deepcopy(current_batch_Read_M_K)
-                previous_batch_Read_K_N = copy.deepcopy(current_batch_Read_K_N)
-                previous_batch_Read_M_N = copy.deepcopy(current_batch_Read_M_N)
-                previous_batch_Write_M_N = copy.deepcopy(current_batch_Write_M_N)
+                current_slot, previous_slot = previous_slot, current_slot
 
                 active_l1_tile_list = []
 
             # last batch's compute and write. 最后一批的计算和写回通常无法和下一批的读取重叠，所以单独算cycle count
+            # 循环末尾已交换过，此时 previous_slot 指向最后一个batch
             total_cycle_count += previous_batch_compute_cycle_count + ceil(
-                np.sum(previous_batch_Write_M_N * M_N_tile_size)
+                np.sum(M_N_tile_size[batch_M_N_index[previous_slot]])
                 * word_size
                 / chiplet_module.compute_module.l2_bandwidth_per_cycle
             )
@@ -1494,7 +1709,7 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             precision: "MatMul_Simulation.PrecisionContext",
             mapping: "MatMul_Simulation.Mapping",
             chiplet_module: Device,
-            look_up_table: pd.DataFrame,
+            look_up_table: SystolicLookUpTable,
         ):
             # print(f'L1 tile: {M} {N} {K}')
             self.M = M
@@ -1513,7 +1728,7 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
             precision: "MatMul_Simulation.PrecisionContext",
             mapping: "MatMul_Simulation.Mapping",
             chiplet_module: Device,
-            look_up_table: pd.DataFrame,
+            look_up_table: SystolicLookUpTable,
         ):
             word_size = precision.word_size
             effective_vector_flops_per_cycle = (
@@ -1560,7 +1775,7 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
 
     @staticmethod
     def simulate_systolic_array_cycle_count(
-        look_up_table: pd.DataFrame,
+        look_up_table: SystolicLookUpTable,
         M,
         N,
         K,
@@ -1607,108 +1822,14 @@ class MatMul_Simulation: # MNK指M*K的矩阵与K*N的矩阵相乘，输出M*N
                     M * N * K / array_height / array_width / mac_per_clock / util_rate
                 )
         # print('start look up table')
-        def _parse_cycle_count(value) -> int:
-            if isinstance(value, pd.Series):
-                value = value.iloc[0]
-            if hasattr(value, "item"):
-                return int(value.item())
-            return int(value)
-
-        try:
-            cycle_count = _parse_cycle_count(
-                look_up_table.loc[
-                    (M, N, K, array_height, array_width, dataflow), "cycle_count"
-                ]
+        cycle_count = look_up_table.lookup(
+            M, N, K, array_height, array_width, dataflow
+        )
+        if cycle_count is None:
+            # 查表未命中：由查表服务去重后调用ScaleSim，并把结果共享给所有worker
+            cycle_count = look_up_table.get_or_simulate(
+                M, N, K, array_height, array_width, dataflow
             )
-        except KeyError:
-            try:
-                cycle_count = _parse_cycle_count(
-                    look_up_table.loc[
-                        (N, M, K, array_height, array_width, dataflow), "cycle_count"
-                    ]
-                )
-            except KeyError:
-                # print('not found in look up table')
-                # 查表未命中则调用ScaleSim
-                os.makedirs(SYSTOLIC_TEMP_DIR, exist_ok=True)
-                config = os.path.join(
-                    SYSTOLIC_TEMP_DIR,
-                    f"systolic_array_{os.getpid()}.cfg",
-                )
-                with open(config, "w") as f:
-                    f.writelines("[general]\n")
-                    f.writelines("run_name = systolic_array\n\n")
-                    f.writelines("[architecture_presets]\n")
-                    f.writelines("ArrayHeight:    " + str(array_height) + "\n")
-                    f.writelines("ArrayWidth:     " + str(array_width) + "\n")
-                    f.writelines("IfmapSramSzkB:    " + str(1024) + "\n")
-                    f.writelines("FilterSramSzkB:   " + str(1024) + "\n")
-                    f.writelines("OfmapSramSzkB:    " + str(1024) + "\n")
-                    f.writelines("IfmapOffset:    0\n")
-                    f.writelines("FilterOffset:   10000000\n")
-                    f.writelines("OfmapOffset:    20000000\n")
-                    f.writelines("Dataflow : " + dataflow + "\n")
-                    f.writelines("Bandwidth : " + "100" + "\n")
-                    f.writelines("MemoryBanks: 1\n")
-                    f.writelines("ReadRequestBuffer: 60\n")
-                    f.writelines("WriteRequestBuffer: 60\n\n")
-                    f.writelines("[run_presets]\n")
-                    f.writelines("InterfaceBandwidth: CALC\n")
-                    f.writelines("UseRamulatorTrace: False\n\n")
-                    f.writelines("[layout]\n")
-                    f.writelines("IfmapCustomLayout: False\n")
-                    f.writelines("FilterCustomLayout: False\n")
-                    f.writelines("IfmapSRAMBankBandwidth: 10\n")
-                    f.writelines("IfmapSRAMBankNum: 10\n")
-                    f.writelines("IfmapSRAMBankPort: 2\n")
-                    f.writelines("FilterSRAMBankBandwidth: 10\n")
-                    f.writelines("FilterSRAMBankNum: 10\n")
-                    f.writelines("FilterSRAMBankPort: 2\n\n")
-                    f.writelines("[sparsity]\n")
-                    f.writelines("SparsitySupport: False\n")
-
-                topology = os.path.join(
-                    SYSTOLIC_TEMP_DIR,
-                    f"matmul_{os.getpid()}.csv",
-                )
-                with open(topology, "w") as f:
-                    f.writelines("Layer, M, N, K\n")
-                    f.writelines(f"matmul1, {M}, {N}, {K},\n")
-
-                layout = os.path.join(
-                    SYSTOLIC_TEMP_DIR,
-                    f"layout_{os.getpid()}.csv",
-                )
-                with open(layout, "w") as f:
-                    f.writelines("Layer name,Layout,\n")
-                    f.writelines("matmul1," + ",".join(["1"] * 20) + ",\n")
-
-                logpath = SYSTOLIC_TEMP_DIR
-                s = scalesim(
-                    save_disk_space=True,
-                    verbose=False,
-                    config=config,
-                    topology=topology,
-                    layout=layout,
-                    input_type_gemm=True,
-                )
-                s.run_scale(top_path=logpath)
-
-                cycle_count = s.runner.single_layer_sim_object_list[0].total_cycles
-                util_rate = s.runner.single_layer_sim_object_list[0].overall_util
-                with open(
-                    f"./systolic_array_model/look_up_table_{array_height}_{array_width}.csv",
-                    "a",
-                ) as f:
-                    f.writelines(
-                        f"{M},{N},{K},{array_height},{array_width},{dataflow},{cycle_count},{util_rate:.3f}\n"
-                    )
-                look_up_table.loc[(M, N, K, array_height, array_width, dataflow), :] = [
-                    cycle_count,
-                    util_rate,
-                ]
-                if len(look_up_table) % 10 == 0:
-                    look_up_table.sort_index(inplace=True)
         # if (
         #     dataflow == "os"
         # ):  # scalesim assumes collecting output is not on critical path in os
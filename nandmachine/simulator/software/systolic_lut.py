@@ -0,0 +1,652 @@
+"""Process-shared systolic-array look-up tables backed by append-only CSV logs.
+
+On a miss the LUT policy either runs ScaleSim or returns a closed-form estimate.
+"""
+
+from __future__ import annotations
+
+import atexit
+import fcntl
+import glob
+import os
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from math import ceil
+from typing import Iterable, Iterator, Optional
+
+from scalesim.scale_sim import scalesim
+
+from nandmachine.simulator.software.scalesim_runtime_patch import (
+    apply_scalesim_total_cycles_patch,
+)
+
+apply_scalesim_total_cycles_patch()
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
+LOOK_UP_TABLE_DIR = "systolic_array_model"
+# 仓库自带的查找表：只追加新形状，不做压缩重写
+SHIPPED_LOOK_UP_TABLE_DIRS = (
+    os.path.join(PROJECT_ROOT, LOOK_UP_TABLE_DIR),
+    os.path.join(PROJECT_ROOT, "nandmachine", "simulator", LOOK_UP_TABLE_DIR),
+)
+
+# byte 0 of the lock file guards the CSV itself, the rest are in-flight slots
+_TABLE_LOCK_SLOT = 0
+_IN_FLIGHT_LOCK_SLOT_COUNT = 1 << 16
+
+LookUpTableKey = tuple[int, int, int, int, int, str]
+
+# 打包键的位宽：M/N/K各32位，阵列高宽各16位，数据流占最低2位
+_DIM_BITS = 32
+_ARRAY_BITS = 16
+_DATAFLOW_IDS = {"os": 0, "ws": 1, "is": 2}
+
+SYSTOLIC_LUT_POLICY_ENV_VAR = "NANDMACHINE_SYSTOLIC_LUT_POLICY"
+SYSTOLIC_LUT_POLICIES = ("exact", "surrogate", "surrogate-verify")
+SURROGATE_DATAFLOWS = ("os",)
+
+# ScaleSim 不保证线程安全，同一进程内的多个线程串行运行
+_scalesim_lock = threading.Lock()
+
+
+def get_look_up_table_path(array_height: int, array_width: int) -> str:
+    return os.path.join(
+        LOOK_UP_TABLE_DIR, f"look_up_table_{array_height}_{array_width}.csv"
+    )
+
+
+def pack_look_up_table_key(
+    M: int,
+    N: int,
+    K: int,
+    array_height: int,
+    array_width: int,
+    dataflow: str,
+) -> int:
+    if max(M, N, K) >> _DIM_BITS or max(array_height, array_width) >> _ARRAY_BITS:
+        raise ValueError(
+            f"Look-up table key out of range: {(M, N, K, array_height, array_width)}"
+        )
+    packed = M
+    packed = (packed << _DIM_BITS) | N
+    packed = (packed << _DIM_BITS) | K
+    packed = (packed << _ARRAY_BITS) | array_height
+    packed = (packed << _ARRAY_BITS) | array_width
+    return (packed << 2) | _DATAFLOW_IDS[dataflow]
+
+
+def _format_entry(key: LookUpTableKey, cycle_count: int, util_rate: float) -> str:
+    M, N, K, array_height, array_width, dataflow = key
+    return (
+        f"{M},{N},{K},{array_height},{array_width},{dataflow},"
+        f"{cycle_count},{util_rate:.3f}\n"
+    )
+
+
+def _parse_entry(line: str) -> Optional[tuple[LookUpTableKey, int, float]]:
+    fields = line.strip().split(",")
+    if len(fields) < 8:
+        return None
+    try:
+        key = (
+            int(fields[0]),
+            int(fields[1]),
+            int(fields[2]),
+            int(fields[3]),
+            int(fields[4]),
+            fields[5],
+        )
+        return key, int(float(fields[6])), float(fields[7])
+    except ValueError:
+        return None
+
+
+def estimate_systolic_array_cycle_count(
+    M: int,
+    N: int,
+    K: int,
+    array_height: int,
+    array_width: int,
+    dataflow: str,
+) -> tuple[int, float]:
+    # output stationary: 输出按阵列大小折叠，每个折叠先灌入/排空流水(h+w-2)再做K次累加
+    # 与仓库自带的8~128查找表中全部2,621个形状逐一相等（calibrate_surrogate_model可重新核对）；
+    # 其余数据流未校准，总是跑ScaleSim
+    if dataflow not in SURROGATE_DATAFLOWS:
+        raise ValueError(f"Surrogate model does not support dataflow {dataflow}")
+    fold_count = ceil(M / array_height) * ceil(N / array_width)
+    cycle_count = fold_count * (K + array_height + array_width - 2) - 1
+    util_rate = 100 * M * N * K / (array_height * array_width * cycle_count)
+    return cycle_count, util_rate
+
+
+@dataclass(frozen=True)
+class SurrogateCalibration:
+    shape_count: int
+    exact_match_count: int
+    max_relative_error: float
+    mean_relative_error: float
+
+
+def calibrate_surrogate_model(path: str) -> SurrogateCalibration:
+    # 用已有的ScaleSim查找表评估代理模型的误差；重复的行与查表一致只取第一行
+    seen_keys: set[LookUpTableKey] = set()
+    exact_match_count = 0
+    max_relative_error = 0.0
+    total_relative_error = 0.0
+    with open(path) as f:
+        for line in f:
+            entry = _parse_entry(line)
+            if entry is None or entry[0][5] not in SURROGATE_DATAFLOWS:
+                continue
+            key, cycle_count, _ = entry
+            if key in seen_keys:
+                continue
+            seen_keys.add(key)
+            estimated_cycle_count, _ = estimate_systolic_array_cycle_count(*key)
+            relative_error = abs(estimated_cycle_count - cycle_count) / cycle_count
+            exact_match_count += estimated_cycle_count == cycle_count
+            max_relative_error = max(max_relative_error, relative_error)
+            total_relative_error += relative_error
+    shape_count = len(seen_keys)
+    return SurrogateCalibration(
+        shape_count=shape_count,
+        exact_match_count=exact_match_count,
+        max_relative_error=max_relative_error,
+        mean_relative_error=total_relative_error / shape_count if shape_count else 0.0,
+    )
+
+
+_policy: Optional[str] = None
+
+
+def set_systolic_lut_policy(policy: Optional[str]) -> None:
+    # 显式配置优先于环境变量；传 None 恢复读取环境变量
+    # exact（默认）：未命中时跑ScaleSim并追加到表中
+    # surrogate：直接返回output stationary的闭式估计，不跑ScaleSim
+    # surrogate-verify：先返回估计，后台线程再跑ScaleSim，追加精确值并记录估计误差
+    global _policy
+    if policy is not None and policy not in SYSTOLIC_LUT_POLICIES:
+        raise ValueError(
+            f"Unsupported systolic LUT policy {policy}, "
+            f"expected one of {SYSTOLIC_LUT_POLICIES}"
+        )
+    _policy = policy
+
+
+def get_systolic_lut_policy() -> str:
+    if _policy is not None:
+        return _policy
+    policy = os.environ.get(SYSTOLIC_LUT_POLICY_ENV_VAR) or "exact"
+    if policy not in SYSTOLIC_LUT_POLICIES:
+        raise ValueError(
+            f"{SYSTOLIC_LUT_POLICY_ENV_VAR}={policy} is not one of {SYSTOLIC_LUT_POLICIES}"
+        )
+    return policy
+
+
+def run_scalesim_gemm(
+    M: int,
+    N: int,
+    K: int,
+    array_height: int,
+    array_width: int,
+    dataflow: str,
+) -> tuple[int, float]:
+    # 查表未命中则调用ScaleSim；配置与报告写到临时目录，运行结束即删除
+    with tempfile.TemporaryDirectory(prefix="nandmachine_scalesim_") as temp_dir:
+        return _run_scalesim_gemm_in_dir(
+            temp_dir, M, N, K, array_height, array_width, dataflow
+        )
+
+
+def _run_scalesim_gemm_in_dir(
+    temp_dir: str,
+    M: int,
+    N: int,
+    K: int,
+    array_height: int,
+    array_width: int,
+    dataflow: str,
+) -> tuple[int, float]:
+    config = os.path.join(temp_dir, "systolic_array.cfg")
+    with open(config, "w") as f:
+        f.writelines("[general]\n")
+        f.writelines("run_name = systolic_array\n\n")
+        f.writelines("[architecture_presets]\n")
+        f.writelines("ArrayHeight:    " + str(array_height) + "\n")
+        f.writelines("ArrayWidth:     " + str(array_width) + "\n")
+        f.writelines("IfmapSramSzkB:    " + str(1024) + "\n")
+        f.writelines("FilterSramSzkB:   " + str(1024) + "\n")
+        f.writelines("OfmapSramSzkB:    " + str(1024) + "\n")
+        f.writelines("IfmapOffset:    0\n")
+        f.writelines("FilterOffset:   10000000\n")
+        f.writelines("OfmapOffset:    20000000\n")
+        f.writelines("Dataflow : " + dataflow + "\n")
+        f.writelines("Bandwidth : " + "100" + "\n")
+        f.writelines("MemoryBanks: 1\n")
+        f.writelines("ReadRequestBuffer: 60\n")
+        f.writelines("WriteRequestBuffer: 60\n\n")
+        f.writelines("[run_presets]\n")
+        f.writelines("InterfaceBandwidth: CALC\n")
+        f.writelines("UseRamulatorTrace: False\n\n")
+        f.writelines("[layout]\n")
+        f.writelines("IfmapCustomLayout: False\n")
+        f.writelines("FilterCustomLayout: False\n")
+        f.writelines("IfmapSRAMBankBandwidth: 10\n")
+        f.writelines("IfmapSRAMBankNum: 10\n")
+        f.writelines("IfmapSRAMBankPort: 2\n")
+        f.writelines("FilterSRAMBankBandwidth: 10\n")
+        f.writelines("FilterSRAMBankNum: 10\n")
+        f.writelines("FilterSRAMBankPort: 2\n\n")
+        f.writelines("[sparsity]\n")
+        f.writelines("SparsitySupport: False\n")
+
+    topology = os.path.join(temp_dir, "matmul.csv")
+    with open(topology, "w") as f:
+        f.writelines("Layer, M, N, K\n")
+        f.writelines(f"matmul1, {M}, {N}, {K},\n")
+
+    layout = os.path.join(temp_dir, "layout.csv")
+    with open(layout, "w") as f:
+        f.writelines("Layer name,Layout,\n")
+        f.writelines("matmul1," + ",".join(["1"] * 20) + ",\n")
+
+    s = scalesim(
+        save_disk_space=True,
+        verbose=False,
+        config=config,
+        topology=topology,
+        layout=layout,
+        input_type_gemm=True,
+    )
+    s.run_scale(top_path=temp_dir)
+
+    cycle_count = s.runner.single_layer_sim_object_list[0].total_cycles
+    util_rate = s.runner.single_layer_sim_object_list[0].overall_util
+    return int(cycle_count), float(util_rate)
+
+
+class SystolicLookUpTable:
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # CSV中的条目，以及包含转置命中的查询结果，均以打包键索引
+        self._cycle_counts: dict[int, int] = {}
+        self._resolved_cycle_counts: dict[int, int] = {}
+        self.simulate_count = 0
+        self.append_count = 0
+        self._inode: Optional[int] = None
+        self._read_offset = 0
+        # 进程内只持有一个fd：POSIX记录锁在关闭该文件的任意fd时会全部释放
+        self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        # fcntl 锁不区分同一进程内的线程：表状态与每个锁槽位另用线程锁保护
+        self._state_lock = threading.Lock()
+        self._slot_locks: dict[int, threading.Lock] = {}
+        self._is_compact_registered = False
+        # surrogate-verify 策略：后台单线程逐个跑ScaleSim核对代理模型
+        self.surrogate_count = 0
+        self.verify_count = 0
+        self.verify_mismatch_count = 0
+        self.max_verify_relative_error = 0.0
+        self._verify_executor: Optional[ThreadPoolExecutor] = None
+        self._pending_verify_keys: set[int] = set()
+        self._verify_lock = threading.Lock()
+        self.refresh()
+
+    def __len__(self) -> int:
+        with self._state_lock:
+            return len(self._cycle_counts)
+
+    @contextmanager
+    def _locked(self, slot: int) -> Iterator[None]:
+        with self._state_lock:
+            slot_lock = self._slot_locks.setdefault(slot, threading.Lock())
+        with slot_lock:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, slot)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, slot)
+
+    def _in_flight_slot(self, key: LookUpTableKey) -> int:
+        M, N, K, array_height, array_width, dataflow = key
+        # (M, N) 与 (N, M) 互相可查，落到同一个槽位
+        canonical = f"{min(M, N)},{max(M, N)},{K},{array_height},{array_width},{dataflow}"
+        return 1 + zlib.crc32(canonical.encode()) % (_IN_FLIGHT_LOCK_SLOT_COUNT - 1)
+
+    def refresh(self) -> None:
+        # 读取其他进程追加的新行；文件被压缩替换（inode变化）时从头读取
+        with self._state_lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            if stat.st_ino != self._inode or stat.st_size < self._read_offset:
+                self._inode = stat.st_ino
+                self._read_offset = 0
+            if stat.st_size == self._read_offset:
+                return
+            with open(self.path, "rb") as f:
+                f.seek(self._read_offset)
+                data = f.read()
+            complete_length = data.rfind(b"\n") + 1 # 只消费完整的行，半行留到下次
+            for line in data[:complete_length].decode().splitlines():
+                entry = _parse_entry(line)
+                if entry is not None:
+                    key, cycle_count, _ = entry
+                    self._cycle_counts.setdefault(
+                        pack_look_up_table_key(*key), cycle_count
+                    )
+            self._read_offset += complete_length
+
+    def get(
+        self,
+        M: int,
+        N: int,
+        K: int,
+        array_height: int,
+        array_width: int,
+        dataflow: str,
+    ) -> Optional[int]:
+        packed_key = pack_look_up_table_key(M, N, K, array_height, array_width, dataflow)
+        with self._state_lock:
+            return self._cycle_counts.get(packed_key)
+
+    def lookup(
+        self,
+        M: int,
+        N: int,
+        K: int,
+        array_height: int,
+        array_width: int,
+        dataflow: str,
+    ) -> Optional[int]:
+        # 先查 (M, N)，未命中再查转置的 (N, M)，命中结果按请求的方向缓存
+        packed_key = pack_look_up_table_key(
+            M, N, K, array_height, array_width, dataflow
+        )
+        with self._state_lock:
+            cycle_count = self._resolved_cycle_counts.get(packed_key)
+            if cycle_count is not None:
+                return cycle_count
+            cycle_count = self._cycle_counts.get(packed_key)
+            if cycle_count is None:
+                cycle_count = self._cycle_counts.get(
+                    pack_look_up_table_key(N, M, K, array_height, array_width, dataflow)
+                )
+                if cycle_count is None:
+                    return None
+            self._resolved_cycle_counts[packed_key] = cycle_count
+            return cycle_count
+
+    def add(self, key: LookUpTableKey, cycle_count: int, util_rate: float) -> None:
+        with self._locked(_TABLE_LOCK_SLOT):
+            with open(self.path, "a") as f:
+                f.write(_format_entry(key, cycle_count, util_rate))
+        with self._state_lock:
+            self._cycle_counts.setdefault(pack_look_up_table_key(*key), cycle_count)
+            self.append_count += 1
+            if not self._is_compact_registered:
+                atexit.register(self.compact)
+                self._is_compact_registered = True
+
+    def get_or_simulate(
+        self,
+        M: int,
+        N: int,
+        K: int,
+        array_height: int,
+        array_width: int,
+        dataflow: str,
+    ) -> int:
+        key = (M, N, K, array_height, array_width, dataflow)
+        policy = get_systolic_lut_policy()
+        if policy == "exact" or dataflow not in SURROGATE_DATAFLOWS:
+            return self._get_or_run_scalesim(key)
+
+        cycle_count = self.lookup(*key)
+        if cycle_count is not None:
+            return cycle_count
+        cycle_count, _ = estimate_systolic_array_cycle_count(*key)
+        self.surrogate_count += 1
+        if policy == "surrogate-verify":
+            self._submit_verification(key, cycle_count)
+        return cycle_count
+
+    def _submit_verification(self, key: LookUpTableKey, estimated_cycle_count: int) -> None:
+        packed_key = pack_look_up_table_key(*key)
+        with self._verify_lock:
+            if packed_key in self._pending_verify_keys:
+                return
+            self._pending_verify_keys.add(packed_key)
+            if self._verify_executor is None:
+                self._verify_executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="systolic-lut-verify"
+                )
+        self._verify_executor.submit(self._verify_estimate, key, estimated_cycle_count)
+
+    def _verify_estimate(self, key: LookUpTableKey, estimated_cycle_count: int) -> None:
+        cycle_count = self._get_or_run_scalesim(key)
+        relative_error = abs(estimated_cycle_count - cycle_count) / cycle_count
+        with self._verify_lock:
+            self.verify_count += 1
+            if estimated_cycle_count != cycle_count:
+                self.verify_mismatch_count += 1
+            self.max_verify_relative_error = max(
+                self.max_verify_relative_error, relative_error
+            )
+
+    def wait_for_verification(self) -> None:
+        # 等待已提交的后台核对全部完成
+        with self._verify_lock:
+            executor = self._verify_executor
+            self._verify_executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _get_or_run_scalesim(self, key: LookUpTableKey) -> int:
+        M, N, K, array_height, array_width, dataflow = key
+        self.refresh()
+        cycle_count = self.lookup(*key)
+        if cycle_count is not None:
+            return cycle_count
+
+        # 同一形状的未命中先取按形状的锁，后到的worker等第一个算完后直接读取结果
+        with self._locked(self._in_flight_slot(key)):
+            # 等锁期间可能已有其他进程算完同一个形状
+            self.refresh()
+            cycle_count = self.lookup(*key)
+            if cycle_count is not None:
+                return cycle_count
+            with _scalesim_lock:
+                cycle_count, util_rate = run_scalesim_gemm(
+                    M, N, K, array_height, array_width, dataflow
+                )
+            with self._state_lock:
+                self.simulate_count += 1
+            self.add(key, cycle_count, util_rate)
+        return cycle_count
+
+    def compact(self) -> None:
+        # 持有表锁（追加也持有同一把锁）把CSV排序去重后原子替换，保留原文件权限；
+        # 本进程追加过的表在解释器退出时压缩，sweep在worker池关闭后调用compact_systolic_look_up_tables
+        if os.path.dirname(self.path) in SHIPPED_LOOK_UP_TABLE_DIRS:
+            return
+        with self._locked(_TABLE_LOCK_SLOT):
+            compact_look_up_table_file(self.path)
+        self.refresh()
+
+
+def compact_look_up_table_file(path: str) -> int:
+    # 调用方负责持有表锁；保留每个key最早出现的那一行，按key排序后原子替换
+    try:
+        file_mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0
+    entries: dict[LookUpTableKey, tuple[int, float]] = {}
+    with open(path) as f:
+        for line in f:
+            entry = _parse_entry(line)
+            if entry is not None:
+                key, cycle_count, util_rate = entry
+                entries.setdefault(key, (cycle_count, util_rate))
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            for key in sorted(entries):
+                f.write(_format_entry(key, *entries[key]))
+        # mkstemp 创建的文件权限为 0600，替换前恢复原文件的权限
+        os.chmod(temp_path, file_mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return len(entries)
+
+
+class SystolicShapeRecorder:
+    """Stands in for a `SystolicLookUpTable` and records every queried shape.
+
+    Lookups are answered from `look_up_table` when it is given, and each miss
+    returns a surrogate cycle count without running ScaleSim. Once every
+    recorded shape hits, a pruned mapping search driven by the recorder visits
+    exactly the candidates of a real one, so prewarming repeats collection
+    until no recorded shape misses.
+    """
+
+    def __init__(self, look_up_table: Optional[SystolicLookUpTable] = None):
+        self.look_up_table = look_up_table
+        self.keys: set[LookUpTableKey] = set()
+
+    def lookup(
+        self,
+        M: int,
+        N: int,
+        K: int,
+        array_height: int,
+        array_width: int,
+        dataflow: str,
+    ) -> Optional[int]:
+        self.keys.add((M, N, K, array_height, array_width, dataflow))
+        if self.look_up_table is None:
+            return None
+        return self.look_up_table.lookup(M, N, K, array_height, array_width, dataflow)
+
+    def get_or_simulate(
+        self,
+        M: int,
+        N: int,
+        K: int,
+        array_height: int,
+        array_width: int,
+        dataflow: str,
+    ) -> int:
+        key = (M, N, K, array_height, array_width, dataflow)
+        self.keys.add(key)
+        if dataflow not in SURROGATE_DATAFLOWS:
+            return M * N * K # 仅用于让搜索继续，数值不参与结果
+        cycle_count, _ = estimate_systolic_array_cycle_count(*key)
+        return cycle_count
+
+
+@dataclass(frozen=True)
+class LookUpTableCoverage:
+    shape_count: int
+    hit_count: int
+    miss_count: int
+
+
+_look_up_tables: dict[str, SystolicLookUpTable] = {}
+
+
+def get_systolic_look_up_table_for_path(path: str) -> SystolicLookUpTable:
+    path = os.path.abspath(path)
+    look_up_table = _look_up_tables.get(path)
+    if look_up_table is None:
+        look_up_table = SystolicLookUpTable(path)
+        _look_up_tables[path] = look_up_table
+    return look_up_table
+
+
+def get_systolic_look_up_table(
+    array_height: int, array_width: int
+) -> SystolicLookUpTable:
+    return get_systolic_look_up_table_for_path(
+        get_look_up_table_path(array_height, array_width)
+    )
+
+
+def compact_systolic_look_up_tables(directory: str = LOOK_UP_TABLE_DIR) -> None:
+    for path in sorted(glob.glob(os.path.join(directory, "look_up_table_*_*.csv"))):
+        get_systolic_look_up_table_for_path(path).compact()
+
+
+def measure_look_up_table_coverage(
+    keys: Iterable[LookUpTableKey],
+) -> LookUpTableCoverage:
+    # 与 MatMul_Simulation 查表方式一致：(M, N) 与 (N, M) 任一存在即算命中
+    keys = set(keys)
+    hit_count = 0
+    refreshed_tables: set[int] = set()
+    for key in keys:
+        look_up_table = get_systolic_look_up_table(key[3], key[4])
+        if id(look_up_table) not in refreshed_tables:
+            look_up_table.refresh()
+            refreshed_tables.add(id(look_up_table))
+        if look_up_table.lookup(*key) is not None:
+            hit_count += 1
+    return LookUpTableCoverage(
+        shape_count=len(keys),
+        hit_count=hit_count,
+        miss_count=len(keys) - hit_count,
+    )
+
+
+def _prewarm_look_up_table_entry(key: LookUpTableKey) -> int:
+    # 预热只写精确值，不受当前LUT策略影响
+    return get_systolic_look_up_table(key[3], key[4])._get_or_run_scalesim(key)
+
+
+def prewarm_systolic_look_up_tables(
+    keys: Iterable[LookUpTableKey],
+    max_workers: int = 1,
+) -> int:
+    """Run ScaleSim for every missing shape in `keys` and append the results.
+
+    Transposed shapes are filled once. Workers share the tables through the
+    per-shape in-flight locks, so concurrent sweeps or prewarms never simulate
+    a shape twice. Returns the number of shapes that were missing.
+    """
+    if max_workers < 1:
+        raise ValueError(f"max_workers must be >= 1, got {max_workers}")
+    missing_keys: dict[LookUpTableKey, LookUpTableKey] = {}
+    for key in sorted(set(keys)):
+        M, N, K, array_height, array_width, dataflow = key
+        look_up_table = get_systolic_look_up_table(array_height, array_width)
+        if look_up_table.lookup(*key) is not None:
+            continue
+        canonical_key = (min(M, N), max(M, N), K, array_height, array_width, dataflow)
+        missing_keys.setdefault(canonical_key, key)
+
+    if max_workers == 1 or len(missing_keys) <= 1:
+        for key in missing_keys.values():
+            _prewarm_look_up_table_entry(key)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # 逐个消费结果，使worker中的异常在主进程抛出
+            for _ in executor.map(_prewarm_look_up_table_entry, missing_keys.values()):
+                pass
+    # worker 进程退出时不会执行 atexit，由主进程统一压缩并重新读取查找表
+    for array_height, array_width in sorted(
+        {(key[3], key[4]) for key in missing_keys.values()}
+    ):
+        get_systolic_look_up_table(array_height, array_width).compact()
+    return len(missing_keys)
@@ -43,11 +43,19 @@ from nandmachine.frontend.core.passes.cod_gen import CodeGenPass
 from nandmachine.frontend.core.passes.normalize import NormalizePass
 from nandmachine.frontend.network.llama import LlamaDecoderLayer
 from nandmachine.frontend.utlis import build_kv_cache_state
+from nandmachine.simulator.hardware.trace_writer import get_trace_level
 from nandmachine.simulator.hardware.xpu import xPU
+from nandmachine.simulator.software.compile_result_store import (
+    COMPILE_RESULT_STORE_DIR_ENV_VAR,
+)
+from nandmachine.simulator.software.systolic_lut import (
+    compact_systolic_look_up_tables,
+)
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 MODEL_CARD_PATH = REPO_ROOT / "model_cards" / "llama-405B.json"
 TRACE_ROOT = REPO_ROOT / "trace" / "main"
+COMPILE_RESULT_STORE_ROOT = TRACE_ROOT.parent / "compile_cache"
 SWEEP_NAME = "llama_405b_sweep"
 FULL_TRACE_FILE_NAME = "full_simulation.json"
 CONFIG_FILE_NAME = "config.json"
@@ -113,6 +121,21 @@ class RuntimeSpec:
     normalized_architecture: dict[str, str | int]
 
 
+@dataclass(frozen=True)
+class CaseCodegen:
+    hardware_spec: HardwareSpec
+    model_config: LlamaModelConfig
+    parallel_config: DenseParallelConfig
+    inference_config: InferenceConfig
+    nand_config: NandConfig
+    runtime_spec: RuntimeSpec
+    macro_op_list: list[MacroOp]
+
+    @property
+    def device_name(self) -> str:
+        return self.hardware_spec.device_name
+
+
 @dataclass(frozen=True)
 class SequenceCaseConfig:
     input_sequence_length: int
@@ -556,6 +579,10 @@ def run_macro_ops_with_trace(
     SimSession.reset()
     SimSession.init()
 
+    # timeline 模式下 trace 边仿真边写入 trace_path，不在内存中保留事件；
+    # aggregate 模式不写 timeline，只把统计摘要写进 config.json
+    trace_level = get_trace_level()
+    trace_path.parent.mkdir(parents=True, exist_ok=True)
     sim_xpu = xPU(
         nand_config,
         hbm_bandwidth_bytes_per_sec=hbm_bandwidth_GBps * 10**9,
@@ -563,6 +590,8 @@ def run_macro_ops_with_trace(
         interconnect_topology=interconnect_topology,
         compile_mode=compile_mode,
         enable_trace=True,
+        trace_level=trace_level,
+        trace_stream_path=str(trace_path) if trace_level == "timeline" else None,
     )
     sim_xpu.load_command(commands)
     SimSession.scheduler.run()
@@ -571,23 +600,85 @@ def run_macro_ops_with_trace(
     device = get_device_or_raise(device_name)
     final_cycle = ceil(final_time_ns * device.compute_module.clock_freq / 1e9)
 
-    trace_path.parent.mkdir(parents=True, exist_ok=True)
-    saved_trace_path = Path(sim_xpu.save_trace_file(str(trace_path)))
-
     tracer = sim_xpu.tracer
     if tracer is None:
         raise RuntimeError("xPU tracer must be enabled")
-    complete_events = [event for event in tracer._events if event["ph"] == "X"]
+
+    saved_trace_path: Path | None = None
+    trace_summary: dict[str, object] | None = None
+    if trace_level == "timeline":
+        saved_trace_path = Path(sim_xpu.save_trace_file(str(trace_path)))
+    else:
+        trace_summary = tracer.summary()
 
     return {
         "cycle": final_cycle,
         "time_ns": final_time_ns,
-        "trace_path": str(saved_trace_path),
-        "trace_event_count": len(tracer._events),
-        "trace_complete_event_count": len(complete_events),
+        "trace_path": None if saved_trace_path is None else str(saved_trace_path),
+        "trace_event_count": tracer.event_count,
+        "trace_complete_event_count": tracer.complete_event_count,
+        "trace_summary": trace_summary,
     }
 
 
+def build_case_codegen(case: SweepCase) -> CaseCodegen:
+    # 只做codegen，不跑仿真；build_result_row 与 LUT 预热脚本共用
+    hardware_spec = get_hardware_spec_or_raise(case.hardware_type)
+    nand_config = build_nand_config(hardware_spec)
+    runtime_spec = build_runtime_spec(hardware_spec, nand_config)
+    return build_case_codegen_for_runtime(
+        case,
+        hardware_spec,
+        nand_config,
+        runtime_spec,
+    )
+
+
+def build_case_codegen_for_runtime(
+    case: SweepCase,
+    hardware_spec: HardwareSpec,
+    nand_config: NandConfig,
+    runtime_spec: RuntimeSpec,
+) -> CaseCodegen:
+    # CLI 堆叠扫描复用这里的codegen，只替换硬件、NAND与带宽配置
+    model_card = load_model_card_or_raise()
+    raw_model_config = build_raw_model_config(deepcopy(model_card))
+    model_config = LlamaModelConfig.from_dict(model_card)
+
+    if not isinstance(model_config.num_hidden_layers, int):
+        raise TypeError(
+            "model_config.num_hidden_layers must be an int, "
+            f"got {type(model_config.num_hidden_layers).__name__}"
+        )
+    if model_config.num_hidden_layers <= 0:
+        raise ValueError(
+            f"model_config.num_hidden_layers must be > 0, got {model_config.num_hidden_layers}"
+        )
+
+    parallel_config = build_parallel_config(case.num_ranks)
+    inference_config = build_inference_config(
+        case,
+        parallel_config,
+        hardware_spec.memory_backend,
+    )
+    macro_op_list = build_macro_op_list(
+        raw_model_config,
+        model_config,
+        nand_config,
+        inference_config,
+        parallel_config,
+    )
+    return CaseCodegen(
+        hardware_spec=hardware_spec,
+        model_config=model_config,
+        parallel_config=parallel_config,
+        inference_config=inference_config,
+        nand_config=nand_config,
+        runtime_spec=runtime_spec,
+        macro_op_list=macro_op_list,
+    )
+
+
 def build_trace_dir(case: SweepCase, run_tag: str) -> Path:
     slo_segment = "slo_none" if case.slo_ms is None else f"slo_{case.slo_ms}ms"
     return (
@@ -625,38 +716,16 @@ def build_result_row(
             f"got selected_case_count={selected_case_count}, total_case_count={total_case_count}"
         )
 
-    hardware_spec = get_hardware_spec_or_raise(case.hardware_type)
+    case_codegen = build_case_codegen(case)
+    hardware_spec = case_codegen.hardware_spec
+    model_config = case_codegen.model_config
+    parallel_config = case_codegen.parallel_config
+    inference_config = case_codegen.inference_config
+    nand_config = case_codegen.nand_config
+    runtime_spec = case_codegen.runtime_spec
+    macro_op_list = case_codegen.macro_op_list
     trace_root = build_trace_root(run_tag)
     summary_csv_path = build_summary_csv_path(run_tag)
-    model_card = load_model_card_or_raise()
-    raw_model_config = build_raw_model_config(deepcopy(model_card))
-    model_config = LlamaModelConfig.from_dict(model_card)
-
-    if not isinstance(model_config.num_hidden_layers, int):
-        raise TypeError(
-            "model_config.num_hidden_layers must be an int, "
-            f"got {type(model_config.num_hidden_layers).__name__}"
-        )
-    if model_config.num_hidden_layers <= 0:
-        raise ValueError(
-            f"model_config.num_hidden_layers must be > 0, got {model_config.num_hidden_layers}"
-        )
-
-    parallel_config = build_parallel_config(case.num_ranks)
-    nand_config = build_nand_config(hardware_spec)
-    runtime_spec = build_runtime_spec(hardware_spec, nand_config)
-    inference_config = build_inference_config(
-        case,
-        parallel_config,
-        hardware_spec.memory_backend,
-    )
-    macro_op_list = build_macro_op_list(
-        raw_model_config,
-        model_config,
-        nand_config,
-        inference_config,
-        parallel_config,
-    )
 
     trace_dir = build_trace_dir(case, run_tag)
     trace_path = trace_dir / FULL_TRACE_FILE_NAME
@@ -793,13 +862,15 @@ def build_result_row(
             "trace_path": sim_result["trace_path"],
             "trace_event_count": sim_result["trace_event_count"],
             "trace_complete_event_count": sim_result["trace_complete_event_count"],
+            "trace_summary": sim_result["trace_summary"],
         },
     }
     write_json_file(trace_dir / CONFIG_FILE_NAME, config_payload)
 
-    trace_file = Path(str(sim_result["trace_path"]))
-    if not trace_file.exists():
-        raise FileNotFoundError(f"Trace file not found: {trace_file}")
+    if sim_result["trace_path"] is not None:
+        trace_file = Path(str(sim_result["trace_path"]))
+        if not trace_file.exists():
+            raise FileNotFoundError(f"Trace file not found: {trace_file}")
 
     return row
 
@@ -909,7 +980,16 @@ def write_summary_csv(
             writer.writerow(row)
 
 
+def configure_compile_result_store() -> None:
+    # 所有 worker 继承该环境变量，共享同一个磁盘编译结果缓存
+    os.environ.setdefault(
+        COMPILE_RESULT_STORE_DIR_ENV_VAR,
+        str(COMPILE_RESULT_STORE_ROOT),
+    )
+
+
 def run_sweep(run_tag: str) -> list[dict[str, object]]:
+    configure_compile_result_store()
     rows: list[dict[str, object]] = []
     all_cases = build_sweep_cases()
     if not all_cases:
@@ -935,6 +1015,8 @@ def run_sweep(run_tag: str) -> list[dict[str, object]]:
         for future in as_completed(future_to_case):
             rows.append(future.result())
 
+    # worker 进程退出时不会执行 atexit，由主进程统一压缩查找表
+    compact_systolic_look_up_tables()
     rows.sort(
         key=lambda row: (
             str(row["hardware_type"]),
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import importlib
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from nandmachine.commands.macro import FlashAttnOp, FlashMLAOp, MacroOp, MatMulOp
+from nandmachine.config.config import NandConfig
+from nandmachine.config.hardware_config import get_device_or_raise
+from nandmachine.simulator.software.flash_attention import (
+    FlashAttn_BatchedMatMul_Simulation,
+    FlashMLA_BatchedMatMul_Simulation,
+)
+from nandmachine.simulator.software.matmul import MatMul_Simulation
+from nandmachine.simulator.software.systolic_lut import (
+    LookUpTableCoverage,
+    LookUpTableKey,
+    measure_look_up_table_coverage,
+    prewarm_systolic_look_up_tables,
+)
+
+USAGE = "usage: python -m scripts.prewarm_systolic_lut <sweep_module>"
+
+# (算子种类, 构造仿真对象的参数, 设备名, nand_config, HBM带宽)
+LookUpTableTask = tuple[str, tuple, str, NandConfig, float]
+
+
+def load_sweep_module_or_raise(sweep_name: str):
+    sweep_module = importlib.import_module(f"scripts.{sweep_name}")
+    if not hasattr(sweep_module, "build_case_codegen"):
+        raise ValueError(
+            f"scripts.{sweep_name} does not define build_case_codegen"
+        )
+    return sweep_module
+
+
+def build_simulation_specs(macro_op: MacroOp) -> list[tuple[str, tuple]]:
+    # 与 ComputeEngine.execute_macro_op 构造的仿真对象一一对应；其余算子不查脉动阵列表
+    if isinstance(macro_op, MatMulOp):
+        return [("matmul", (tuple(macro_op.shape), macro_op.weight_bits))]
+    if isinstance(macro_op, FlashAttnOp):
+        return [
+            (
+                "flashattn_bmm",
+                (tuple(macro_op.qk_bmm_input_shape), macro_op.weight_bits, "QK"),
+            ),
+            (
+                "flashattn_bmm",
+                (tuple(macro_op.sv_bmm_input_shape), macro_op.weight_bits, "SV"),
+            ),
+        ]
+    if isinstance(macro_op, FlashMLAOp):
+        return [
+            (
+                "flashmla",
+                (
+                    tuple(macro_op.qk_latent_bmm_input_shape),
+                    tuple(macro_op.qk_rope_bmm_input_shape),
+                    tuple(macro_op.sv_latent_bmm_input_shape),
+                    tuple(macro_op.softmax_input_shape),
+                    macro_op.weight_bits,
+                ),
+            )
+        ]
+    return []
+
+
+def build_simulation(kind: str, args: tuple):
+    if kind == "matmul":
+        dim, weight_bits = args
+        return MatMul_Simulation(dim=dim, weight_bits=weight_bits)
+    if kind == "flashattn_bmm":
+        dim, weight_bits, matmul_type = args
+        return FlashAttn_BatchedMatMul_Simulation(
+            dim=dim, weight_bits=weight_bits, matmul_type=matmul_type
+        )
+    if kind == "flashmla":
+        qk_latent_dim, qk_rope_dim, sv_latent_dim, softmax_dim, weight_bits = args
+        return FlashMLA_BatchedMatMul_Simulation(
+            qk_latent_dim=qk_latent_dim,
+            qk_rope_dim=qk_rope_dim,
+            sv_latent_dim=sv_latent_dim,
+            softmax_dim=softmax_dim,
+            weight_bits=weight_bits,
+        )
+    raise ValueError(f"Unsupported simulation kind: {kind}")
+
+
+def build_look_up_table_tasks(sweep_module) -> list[LookUpTableTask]:
+    all_cases = sweep_module.build_sweep_cases()
+    if not all_cases:
+        raise ValueError("Sweep cases must not be empty")
+    cases = all_cases[: sweep_module.resolve_case_limit(len(all_cases))]
+
+    tasks: dict[tuple[str, tuple, str], LookUpTableTask] = {}
+    for case in cases:
+        case_codegen = sweep_module.build_case_codegen(case)
+        for macro_op in case_codegen.macro_op_list:
+            for kind, args in build_simulation_specs(macro_op):
+                # 候选mapping与查询形状只取决于矩阵形状、精度和设备，与带宽无关
+                task_key = (kind, args, case_codegen.device_name)
+                tasks.setdefault(
+                    task_key,
+                    (
+                        *task_key,
+                        case_codegen.nand_config,
+                        case_codegen.runtime_spec.sim_hbm_bandwidth_GBps * 10**9,
+                    ),
+                )
+    return list(tasks.values())
+
+
+def collect_task_look_up_table_keys(
+    task: LookUpTableTask,
+    compile_mode: str,
+) -> set[LookUpTableKey]:
+    kind, args, device_name, nand_config, hbm_bandwidth_bytes_per_sec = task
+    return build_simulation(kind, args).collect_systolic_look_up_table_keys(
+        pcb_module=get_device_or_raise(device_name),
+        nand_config=nand_config,
+        hbm_bandwidth_bytes_per_sec=hbm_bandwidth_bytes_per_sec,
+        compile_mode=compile_mode,
+    )
+
+
+def collect_look_up_table_keys(
+    tasks: list[LookUpTableTask],
+    compile_mode: str,
+    max_workers: int,
+) -> set[LookUpTableKey]:
+    keys: set[LookUpTableKey] = set()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for task_keys in executor.map(
+            collect_task_look_up_table_keys,
+            tasks,
+            [compile_mode] * len(tasks),
+        ):
+            keys.update(task_keys)
+    return keys
+
+
+def print_coverage(label: str, coverage: LookUpTableCoverage) -> None:
+    print(
+        f"{label}: {coverage.shape_count} shapes, "
+        f"{coverage.hit_count} hits, {coverage.miss_count} misses"
+    )
+
+
+def prewarm_sweep(sweep_name: str) -> LookUpTableCoverage:
+    sweep_module = load_sweep_module_or_raise(sweep_name)
+    tasks = build_look_up_table_tasks(sweep_module)
+    print(f"{sweep_name}: {len(tasks)} unique systolic-array operators")
+    if not tasks:
+        return measure_look_up_table_coverage([])
+
+    max_workers = sweep_module.resolve_max_workers(len(tasks))
+    # 剪枝搜索访问哪些候选取决于已查到的cycle，补齐未命中的形状后重新收集，直到全部命中
+    round_index = 0
+    while True:
+        round_index += 1
+        keys = collect_look_up_table_keys(
+            tasks, sweep_module.COMPILE_MODE, max_workers
+        )
+        coverage = measure_look_up_table_coverage(keys)
+        print_coverage(f"systolic LUT round {round_index}", coverage)
+        if coverage.miss_count == 0:
+            return coverage
+        simulated_count = prewarm_systolic_look_up_tables(keys, max_workers=max_workers)
+        print(f"simulated {simulated_count} missing shapes with {max_workers} workers")
+
+
+def main() -> None:
+    if len(sys.argv) != 2:
+        raise SystemExit(USAGE)
+    prewarm_sweep(sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
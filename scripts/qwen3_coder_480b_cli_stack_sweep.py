@@ -4,7 +4,6 @@ import csv
 import json
 import os
 from concurrent.futures import ProcessPoolExecutor, as_completed
-from copy import deepcopy
 from dataclasses import asdict, dataclass
 from datetime import datetime
 from pathlib import Path
@@ -12,10 +11,15 @@ from pathlib import Path
 import scripts.qwen3_coder_480b_sweep as base_sweep
 import torch
 
+from nandmachine.simulator.software.systolic_lut import (
+    compact_systolic_look_up_tables,
+)
+
 
 HardwareSpec = base_sweep.HardwareSpec
 RuntimeSpec = base_sweep.RuntimeSpec
 SweepCase = base_sweep.SweepCase
+CaseCodegen = base_sweep.CaseCodegen
 
 MODEL_CARD_PATH = base_sweep.MODEL_CARD_PATH
 TRACE_ROOT = base_sweep.TRACE_ROOT
@@ -554,6 +558,19 @@ def build_runtime_spec(hardware_spec: HardwareSpec, nand_config) -> RuntimeSpec:
     return runtime_spec
 
 
+def build_case_codegen(case: SweepCase) -> CaseCodegen:
+    # 只做codegen，不跑仿真；build_result_row 与 LUT 预热脚本共用
+    hardware_spec = get_hardware_spec_or_raise(case.hardware_type)
+    nand_config = build_nand_config(hardware_spec)
+    runtime_spec = build_runtime_spec(hardware_spec, nand_config)
+    return base_sweep.build_case_codegen_for_runtime(
+        case,
+        hardware_spec,
+        nand_config,
+        runtime_spec,
+    )
+
+
 def build_trace_dir(case: SweepCase, run_tag: str) -> Path:
     return (
         build_trace_root(run_tag)
@@ -591,39 +608,17 @@ def build_result_row(
             f"got selected_case_count={selected_case_count}, total_case_count={total_case_count}"
         )
 
-    hardware_spec = get_hardware_spec_or_raise(case.hardware_type)
+    case_codegen = build_case_codegen(case)
+    hardware_spec = case_codegen.hardware_spec
+    model_config = case_codegen.model_config
+    parallel_config = case_codegen.parallel_config
+    inference_config = case_codegen.inference_config
+    nand_config = case_codegen.nand_config
+    runtime_spec = case_codegen.runtime_spec
+    macro_op_list = case_codegen.macro_op_list
     cli_ratio_spec = get_cli_ratio_spec_or_raise(case.hardware_type)
     trace_root = build_trace_root(run_tag)
     summary_csv_path = build_summary_csv_path(run_tag)
-    model_card = base_sweep.load_model_card_or_raise()
-    raw_model_config = base_sweep.build_raw_model_config(deepcopy(model_card))
-    model_config = base_sweep.Qwen3MoEModelConfig.from_config(raw_model_config)
-
-    if not isinstance(model_config.num_hidden_layers, int):
-        raise TypeError(
-            "model_config.num_hidden_layers must be an int, "
-            f"got {type(model_config.num_hidden_layers).__name__}"
-        )
-    if model_config.num_hidden_layers <= 0:
-        raise ValueError(
-            f"model_config.num_hidden_layers must be > 0, got {model_config.num_hidden_layers}"
-        )
-
-    parallel_config = base_sweep.build_parallel_config(case.num_ranks)
-    nand_config = build_nand_config(hardware_spec)
-    runtime_spec = build_runtime_spec(hardware_spec, nand_config)
-    inference_config = base_sweep.build_inference_config(
-        case,
-        parallel_config,
-        hardware_spec.memory_backend,
-    )
-    macro_op_list = base_sweep.build_macro_op_list(
-        raw_model_config,
-        model_config,
-        nand_config,
-        inference_config,
-        parallel_config,
-    )
 
     trace_dir = build_trace_dir(case, run_tag)
     trace_path = trace_dir / FULL_TRACE_FILE_NAME
@@ -761,13 +756,15 @@ def build_result_row(
             "trace_path": sim_result["trace_path"],
             "trace_event_count": sim_result["trace_event_count"],
             "trace_complete_event_count": sim_result["trace_complete_event_count"],
+            "trace_summary": sim_result["trace_summary"],
         },
     }
     write_json_file(trace_dir / CONFIG_FILE_NAME, config_payload)
 
-    trace_file = Path(str(sim_result["trace_path"]))
-    if not trace_file.exists():
-        raise FileNotFoundError(f"Trace file not found: {trace_file}")
+    if sim_result["trace_path"] is not None:
+        trace_file = Path(str(sim_result["trace_path"]))
+        if not trace_file.exists():
+            raise FileNotFoundError(f"Trace file not found: {trace_file}")
 
     return row
 
@@ -782,6 +779,7 @@ def write_summary_csv(rows: list[dict[str, object]], summary_csv_path: Path) ->
 
 
 def run_sweep(run_tag: str) -> list[dict[str, object]]:
+    base_sweep.configure_compile_result_store()
     rows: list[dict[str, object]] = []
     all_cases = build_sweep_cases()
     if not all_cases:
@@ -807,6 +805,8 @@ def run_sweep(run_tag: str) -> list[dict[str, object]]:
         for future in as_completed(future_to_case):
             rows.append(future.result())
 
+    # worker 进程退出时不会执行 atexit，由主进程统一压缩查找表
+    compact_systolic_look_up_tables()
     rows.sort(
         key=lambda row: (
             str(row["hardware_type"]),
@@ -49,10 +49,17 @@ from nandmachine.frontend.utlis import (
     build_kv_cache_state,
 )
 from nandmachine.simulator.entry_point import universe_run_sim
+from nandmachine.simulator.software.compile_result_store import (
+    COMPILE_RESULT_STORE_DIR_ENV_VAR,
+)
+from nandmachine.simulator.software.systolic_lut import (
+    compact_systolic_look_up_tables,
+)
 
 
 MODEL_CARD_PATH = Path("model_cards/qwen3-moe-235B.json")
 TRACE_ROOT = Path("trace/main")
+COMPILE_RESULT_STORE_ROOT = TRACE_ROOT.parent / "compile_cache"
 SWEEP_NAME = "qwen3_moe_ablation_sweep"
 CONFIG_FILE_NAME = "config.json"
 SUMMARY_FILE_SUFFIX = "summary"
@@ -111,6 +118,22 @@ class RuntimeSpec:
     normalized_architecture: dict[str, str | int]
 
 
+@dataclass(frozen=True)
+class CaseCodegen:
+    experiment_spec: ExperimentSpec
+    model_config: Qwen3MoEModelConfig
+    parallel_config: MoEParallelConfig
+    inference_config: InferenceConfig
+    nand_config: NandConfig
+    runtime_spec: RuntimeSpec
+    kv_cache_state: KVCacheState
+    macro_op_list: list[MacroOp]
+
+    @property
+    def device_name(self) -> str:
+        return self.experiment_spec.device_name
+
+
 EXPERIMENT_SPECS: tuple[ExperimentSpec, ...] = (
     ExperimentSpec(
         experiment_name="BaselineHBM",
@@ -509,6 +532,46 @@ def build_macro_op_list(
     return macro_op_list
 
 
+def build_case_codegen(case: AblationCase) -> CaseCodegen:
+    # 只做codegen，不跑仿真；build_result_row 与 LUT 预热脚本共用
+    experiment_spec = get_experiment_spec_or_raise(case.experiment_name)
+    model_card = load_model_card_or_raise()
+    raw_model_config = build_raw_model_config(deepcopy(model_card))
+    model_config = Qwen3MoEModelConfig.from_config(raw_model_config)
+    parallel_config = build_parallel_config(case.num_ranks)
+    nand_config = build_nand_config(experiment_spec)
+    runtime_spec = build_runtime_spec(experiment_spec, nand_config)
+    inference_config = build_inference_config(
+        case,
+        parallel_config,
+        experiment_spec.memory_backend,
+    )
+    kv_cache_state = resolve_kv_cache_state(
+        experiment_spec,
+        nand_config,
+        model_config,
+        inference_config,
+    )
+    macro_op_list = build_macro_op_list(
+        raw_model_config,
+        model_config,
+        nand_config,
+        inference_config,
+        parallel_config,
+        kv_cache_state,
+    )
+    return CaseCodegen(
+        experiment_spec=experiment_spec,
+        model_config=model_config,
+        parallel_config=parallel_config,
+        inference_config=inference_config,
+        nand_config=nand_config,
+        runtime_spec=runtime_spec,
+        kv_cache_state=kv_cache_state,
+        macro_op_list=macro_op_list,
+    )
+
+
 def write_json_file(path: Path, payload: dict[str, object]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text(json.dumps(payload, indent=2, sort_keys=True))
@@ -536,32 +599,15 @@ def build_result_row(
             f"total_case_count={total_case_count}"
         )
 
-    experiment_spec = get_experiment_spec_or_raise(case.experiment_name)
-    model_card = load_model_card_or_raise()
-    raw_model_config = build_raw_model_config(deepcopy(model_card))
-    model_config = Qwen3MoEModelConfig.from_config(raw_model_config)
-    parallel_config = build_parallel_config(case.num_ranks)
-    nand_config = build_nand_config(experiment_spec)
-    runtime_spec = build_runtime_spec(experiment_spec, nand_config)
-    inference_config = build_inference_config(
-        case,
-        parallel_config,
-        experiment_spec.memory_backend,
-    )
-    kv_cache_state = resolve_kv_cache_state(
-        experiment_spec,
-        nand_config,
-        model_config,
-        inference_config,
-    )
-    macro_op_list = build_macro_op_list(
-        raw_model_config,
-        model_config,
-        nand_config,
-        inference_config,
-        parallel_config,
-        kv_cache_state,
-    )
+    case_codegen = build_case_codegen(case)
+    experiment_spec = case_codegen.experiment_spec
+    model_config = case_codegen.model_config
+    parallel_config = case_codegen.parallel_config
+    inference_config = case_codegen.inference_config
+    nand_config = case_codegen.nand_config
+    runtime_spec = case_codegen.runtime_spec
+    kv_cache_state = case_codegen.kv_cache_state
+    macro_op_list = case_codegen.macro_op_list
 
     sim_result = universe_run_sim(
         nand_config,
@@ -696,7 +742,16 @@ def write_summary_csv(rows: list[dict[str, object]], summary_csv_path: Path) ->
             writer.writerow(row)
 
 
+def configure_compile_result_store() -> None:
+    # 所有 worker 继承该环境变量，共享同一个磁盘编译结果缓存
+    os.environ.setdefault(
+        COMPILE_RESULT_STORE_DIR_ENV_VAR,
+        str(COMPILE_RESULT_STORE_ROOT),
+    )
+
+
 def run_sweep(run_tag: str) -> list[dict[str, object]]:
+    configure_compile_result_store()
     rows: list[dict[str, object]] = []
     all_cases = build_sweep_cases()
     if not all_cases:
@@ -735,6 +790,8 @@ def run_sweep(run_tag: str) -> list[dict[str, object]]:
             for future in as_completed(future_to_case):
                 rows.append(future.result())
 
+        # worker 进程退出时不会执行 atexit，由主进程统一压缩查找表
+        compact_systolic_look_up_tables()
     experiment_order = {
         experiment_spec.experiment_name: index
         for index, experiment_spec in enumerate(EXPERIMENT_SPECS)